@@ -9,10 +9,6 @@ from datetime import datetime, timedelta
 import os
 import ssl
 
-# Simple in-memory cache for stock prices (5 minute TTL)
-_price_cache = {}
-_cache_ttl = 300  # 5 minutes
-
 class AlpacaService:
     def __init__(self):
         # Alpaca Credentials - Read from environment variables
@@ -69,73 +65,22 @@ class AlpacaService:
 
     def get_stock_price(self, symbol):
         """
-        Get current stock price for a symbol using Alpaca Market Data API.
-        Uses caching to avoid rate limits.
-        Falls back to free Yahoo Finance API if needed.
+        Get current stock price for a symbol.
+        Served by the shared quote service (Alpaca market data first, then the
+        other providers), so prices are cached and coalesced with
+        StockAPIManager's lookups.
         """
-        global _price_cache
-
-        # Check cache first
-        cache_key = symbol.upper()
-        if cache_key in _price_cache:
-            cached_data = _price_cache[cache_key]
-            if datetime.now().timestamp() - cached_data['timestamp'] < _cache_ttl:
-                return cached_data['price']
-
         try:
-            # Try Alpaca Market Data API first (free for Alpaca users)
-            url = f"https://data.alpaca.markets/v2/stocks/{symbol}/quotes/latest"
-            response = requests.get(url, headers=self.headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                if 'quote' in data and 'ap' in data['quote']:
-                    price = float(data['quote']['ap'])  # Ask price
-                    _price_cache[cache_key] = {'price': price, 'timestamp': datetime.now().timestamp()}
-                    return price
-
-            # Fallback: Try Alpaca bars endpoint
-            url = f"https://data.alpaca.markets/v2/stocks/{symbol}/bars/latest"
-            response = requests.get(url, headers=self.headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                if 'bar' in data and 'c' in data['bar']:
-                    price = float(data['bar']['c'])  # Close price
-                    _price_cache[cache_key] = {'price': price, 'timestamp': datetime.now().timestamp()}
-                    return price
-
-            # Fallback: Use Yahoo Finance (completely free)
-            price = self._get_yahoo_price(symbol)
+            from quote_service import get_quote_service
+            price = get_quote_service().get_price(symbol)
             if price:
-                _price_cache[cache_key] = {'price': price, 'timestamp': datetime.now().timestamp()}
                 return price
-
         except Exception as e:
             print(f"Error getting stock price for {symbol}: {e}")
 
         # Final fallback: estimated price based on common stocks
         return self._get_fallback_price(symbol)
 
-    def _get_yahoo_price(self, symbol):
-        """Get stock price from Yahoo Finance (free)"""
-        try:
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1d&range=1d"
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                result = data.get('chart', {}).get('result', [])
-                if result:
-                    meta = result[0].get('meta', {})
-                    price = meta.get('regularMarketPrice')
-                    if price:
-                        return float(price)
-        except Exception as e:
-            print(f"Yahoo Finance error for {symbol}: {e}")
-        return None
-
     def _get_fallback_price(self, symbol):
         """Fallback prices for common stocks when APIs fail"""
         fallback_prices = {
@@ -149,11 +94,14 @@ class AlpacaService:
         return fallback_prices.get(symbol.upper(), 100.00)
 
     def get_multiple_prices(self, symbols):
-        """Get prices for multiple symbols"""
-        prices = {}
-        for symbol in symbols:
-            prices[symbol] = self.get_stock_price(symbol)
-        return prices
+        """Get prices for multiple symbols in one batched lookup"""
+        try:
+            from quote_service import get_quote_service
+            quoted = get_quote_service().get_prices(symbols)
+        except Exception as e:
+            print(f"Error getting stock prices for {symbols}: {e}")
+            quoted = {}
+        return {symbol: quoted.get(symbol.upper()) or self._get_fallback_price(symbol) for symbol in symbols}
     
     def get_account(self):
         """Get account info (Trading API returns single account, Broker API returns list)"""
@@ -799,7 +747,7 @@ class AlpacaService:
             print(f"Exception getting positions: {e}")
             return []
     
-    def submit_order(self, account_id=None, symbol=None, qty=None, side="buy", order_type="market", time_in_force="day", notional=None):
+    def submit_order(self, account_id=None, symbol=None, qty=None, side="buy", order_type="market", time_in_force="day", notional=None, client_order_id=None):
         """
         Submit a stock order
 
@@ -811,6 +759,7 @@ class AlpacaService:
             order_type (str): 'market' or 'limit'
             time_in_force (str): 'day', 'gtc', etc.
             notional (float): Dollar amount for fractional shares (alternative to qty)
+            client_order_id (str): Idempotency key; Alpaca rejects a second order with the same id
         """
         try:
             order_data = {
@@ -825,6 +774,8 @@ class AlpacaService:
                 order_data["notional"] = str(notional)  # Dollar amount for fractional shares
             elif qty is not None:
                 order_data["qty"] = str(qty)  # Number of shares
+            if client_order_id:
+                order_data["client_order_id"] = client_order_id
 
             print(f"Submitting {self.api_type} order: {order_data}")
 
@@ -858,7 +809,7 @@ class AlpacaService:
             print(f"Exception submitting order: {e}")
             return None
     
-    def buy_fractional_shares(self, account_id=None, symbol=None, dollar_amount=None):
+    def buy_fractional_shares(self, account_id=None, symbol=None, dollar_amount=None, client_order_id=None):
         """
         Buy fractional shares for a specific dollar amount
 
@@ -866,6 +817,7 @@ class AlpacaService:
             account_id (str): Account ID (only needed for Broker API)
             symbol (str): Stock symbol (e.g., 'DIS')
             dollar_amount (float): Dollar amount to invest (e.g., 1.00)
+            client_order_id (str): Idempotency key passed through to submit_order
         """
         try:
             # Use 'notional' parameter for dollar-based orders (correct way for fractional shares)
@@ -875,11 +827,41 @@ class AlpacaService:
                 notional=dollar_amount,  # Use notional for dollar amount
                 side="buy",
                 order_type="market",
-                time_in_force="day"
+                time_in_force="day",
+                client_order_id=client_order_id
             )
         except Exception as e:
             print(f"Exception buying fractional shares: {e}")
             return None
+
+    def get_order_by_client_order_id(self, client_order_id, account_id=None):
+        """
+        Look up an order by the client_order_id it was submitted with
+
+        Returns None when no such order exists and raises when the lookup
+        itself fails, so callers can tell "never placed" from "unknown".
+        """
+        params = {"client_order_id": client_order_id}
+        if self.api_type == "trading":
+            response = requests.get(
+                f"{self.base_url}/v2/orders:by_client_order_id",
+                headers=self.headers,
+                params=params,
+                timeout=30
+            )
+        else:
+            response = requests.get(
+                f"{self.base_url}/v1/trading/accounts/{account_id}/orders:by_client_order_id",
+                headers=self.headers,
+                params=params,
+                verify=False,
+                timeout=30
+            )
+
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
     
     def test_connection(self):
         """Test the Alpaca connection"""
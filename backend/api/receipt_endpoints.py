@@ -15,13 +15,15 @@ import base64
 from services.receipt_processing_service import ReceiptProcessingService
 from services.round_up_allocation_service import RoundUpAllocationService
 from database_manager import db_manager
+from receipt_jobs import QueueFull, receipt_jobs, resolve_round_up_amount
+from utils.lazy_import import LazyObject
 
 logger = logging.getLogger(__name__)
 
 receipt_bp = Blueprint('receipts', __name__)
 
-# Initialize services
-receipt_service = ReceiptProcessingService()
+# Initialize services (the receipt service loads learned mappings, so build it on first use)
+receipt_service = LazyObject(ReceiptProcessingService)
 allocation_service = RoundUpAllocationService()
 
 # Upload configuration
@@ -94,21 +96,6 @@ def upload_receipt():
         conn = db_manager.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS receipts (
-                id TEXT PRIMARY KEY,
-                user_id INTEGER,
-                filename TEXT,
-                file_path TEXT,
-                status TEXT DEFAULT 'uploaded',
-                parsed_data TEXT,
-                round_up_amount DECIMAL(10,2),
-                allocation_data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        
         cursor.execute("""
             INSERT INTO receipts (id, user_id, filename, file_path, status)
             VALUES (?, ?, ?, ?, 'uploaded')
@@ -171,32 +158,25 @@ def process_receipt(receipt_id):
         # Get raw text from request if provided, otherwise extract from image using OCR
         raw_text = request.json.get('raw_text', '') if request.is_json else ''
         
-        # If no raw text provided, try to extract from image using OCR
+        # No raw text: OCR runs on the job queue; the client polls the job instead of holding this request open
         if not raw_text and file_path:
+            conn.close()
+            allocate = bool(request.json.get('allocate')) if request.is_json else False
             try:
-                raw_text = receipt_service.extract_text_from_image(file_path)
-                logger.info(f"OCR extracted text from {file_path}: {len(raw_text)} characters")
-                
-                # If OCR returned empty, try alternative approach
-                if not raw_text or len(raw_text.strip()) < 10:
-                    logger.warning(f"OCR returned minimal text ({len(raw_text)} chars). Trying alternative OCR settings...")
-                    # Try with different PSM mode (single uniform block)
-                    try:
-                        from PIL import Image
-                        import pytesseract
-                        image = Image.open(file_path)
-                        # Try different PSM modes
-                        for psm in [6, 11, 12]:  # 6=block, 11=sparse, 12=line
-                            custom_config = f'--oem 3 --psm {psm}'
-                            alt_text = pytesseract.image_to_string(image, config=custom_config)
-                            if len(alt_text.strip()) > len(raw_text.strip()):
-                                raw_text = alt_text
-                                logger.info(f"Better OCR result with PSM {psm}: {len(raw_text)} characters")
-                    except Exception as e2:
-                        logger.warning(f"Alternative OCR attempt failed: {str(e2)}")
-            except Exception as e:
-                logger.error(f"OCR extraction failed: {str(e)}")
-                raw_text = ""
+                job = receipt_jobs.enqueue(receipt_id, user.get('id'), file_path, allocate=allocate)
+            except QueueFull as e:
+                response = jsonify({'success': False, 'error': str(e)})
+                response.status_code = 503
+                response.headers.add('Retry-After', '5')
+                response.headers.add('Access-Control-Allow-Origin', '*')
+                return response
+            logger.info(f"Queued receipt {receipt_id} as job {job['jobId']} (allocate={allocate})")
+            response = jsonify(dict(job, success=True, pollUrl=f"/api/receipts/jobs/{job['jobId']}"))
+            response.status_code = 202
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+            response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+            return response
         
         # Process receipt (optimized: skip LLM enhancement during initial processing for speed)
         # LLM enhancement can be done on-demand when user edits
@@ -248,6 +228,38 @@ def process_receipt(receipt_id):
         return response
 
 
+@receipt_bp.route('/api/receipts/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+def get_receipt_job(job_id):
+    """Poll a queued receipt job: status, per-stage timings and, once done, the result"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response
+    
+    try:
+        user = get_auth_user()
+        if not user:
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        
+        job = receipt_jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        if job['userId'] != user.get('id'):
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+        
+        response = jsonify({'success': True, 'job': job})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        logger.error(f"Error reading receipt job {job_id}: {str(e)}")
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+
 @receipt_bp.route('/api/receipts/<receipt_id>/allocate', methods=['POST', 'OPTIONS'])
 def allocate_round_up(receipt_id):
     """Calculate round-up allocation for processed receipt"""
@@ -288,61 +300,12 @@ def allocate_round_up(receipt_id):
         parsed_data = json.loads(receipt[2]) if receipt[2] else {}
         existing_round_up = receipt[3] if receipt[3] else None
         
-        # Get total amount from parsed data
-        total_amount = parsed_data.get('totalAmount', 0.0)
-        
-        # Get user's configured round-up amount from database (default $1.00)
-        user_id = user.get('id')
-        user_round_up_amount = 1.00  # Default
-        
-        try:
-            # Try to get round_up_amount column - handle case where column might not exist
-            cursor.execute("SELECT round_up_amount FROM users WHERE id = ?", (user_id,))
-            user_row = cursor.fetchone()
-            if user_row and user_row[0] is not None:
-                user_round_up_amount = float(user_row[0])
-        except Exception as e:
-            logger.warning(f"Could not get round_up_amount from users table: {e}. Using default $1.00")
-            # If column doesn't exist, use default
-            user_round_up_amount = 1.00
-        
         # Use user's configured round-up amount (not calculated from transaction)
-        # Only use existing_round_up if it was explicitly set, otherwise use user setting
-        if existing_round_up is not None and float(existing_round_up) > 0:
-            round_up_amount = float(existing_round_up)
-        else:
-            round_up_amount = user_round_up_amount
-        
-        logger.info(f"Round-up amount for receipt {receipt_id}: ${round_up_amount} (user setting: ${user_round_up_amount})")
-        
-        # Prepare transaction data
-        # Ensure items have brand information with confidence scores
-        items_for_allocation = []
-        for item in parsed_data.get('items', []):
-            # Make sure brand_confidence is set if brand exists
-            if item.get('brand') and not item.get('brand_confidence'):
-                # If brand exists but no confidence, set default high confidence
-                item['brand_confidence'] = 0.95
-                logger.info(f"Item '{item.get('name')}' has brand but no confidence - setting to 0.95")
-            items_for_allocation.append(item)
-        
-        transaction = {
-            'items': items_for_allocation,
-            'retailer': parsed_data.get('retailer'),
-            'totalAmount': total_amount,
-            'roundUpAmount': round_up_amount
-        }
-        
-        # Log item brands for debugging
-        for item in items_for_allocation:
-            if item.get('brand'):
-                logger.info(f"Item '{item.get('name')}' → Brand: {item.get('brand')}, Confidence: {item.get('brand_confidence', 'N/A')}")
-        
-        # Calculate allocation
-        logger.info(f"Transaction data for allocation: items={len(transaction['items'])}, retailer={transaction['retailer']}, roundUpAmount=${round_up_amount}")
+        round_up_amount = resolve_round_up_amount(conn, user.get('id'), existing_round_up)
+        logger.info(f"Round-up amount for receipt {receipt_id}: ${round_up_amount}")
         
         try:
-            result = allocation_service.calculate_allocation(transaction)
+            result = allocation_service.allocate_receipt(parsed_data, round_up_amount)
             logger.info(f"Allocation result: success={result.get('success')}, allocations={len(result.get('allocations', []))}")
         except Exception as e:
             logger.error(f"Allocation calculation error: {str(e)}")
@@ -430,29 +393,6 @@ def create_transaction_from_receipt():
         user_id = int(user.get('id'))
         logger.info(f"[TRANSACTION CREATE] Creating transaction for user_id={user_id} (type: {type(user_id)})")
         
-        # Create transaction record
-        # Note: db_manager.add_transaction opens its own connection, so we'll handle schema updates separately
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if round_up_amount column exists, if not add it
-        # Note: database_manager uses 'round_up', but we also support 'round_up_amount' for receipt transactions
-        try:
-            cursor.execute("PRAGMA table_info(transactions)")
-            columns = [row[1] for row in cursor.fetchall()]
-            if 'round_up_amount' not in columns:
-                logger.info("Adding round_up_amount column to transactions table")
-                cursor.execute("ALTER TABLE transactions ADD COLUMN round_up_amount REAL DEFAULT 0")
-                conn.commit()
-            if 'receipt_id' not in columns:
-                logger.info("Adding receipt_id column to transactions table")
-                cursor.execute("ALTER TABLE transactions ADD COLUMN receipt_id TEXT")
-                conn.commit()
-        except Exception as e:
-            logger.warning(f"Could not check/add columns: {e}")
-        finally:
-            conn.close()
-        
         # Use database_manager to add transaction (it handles the correct table structure)
         from datetime import datetime
         round_up_amount = allocation.get('totalRoundUp', 0.0)
@@ -491,36 +431,18 @@ def create_transaction_from_receipt():
             
             logger.info(f"[TRANSACTION CREATE] Verified transaction {transaction_id} exists: user_id={verify[1]}, merchant={verify[2]}, amount={verify[3]}")
             
-            # Update receipt_id if it exists (using a separate connection)
-            receipt_id_value = receipt_data.get('receipt_id')
-            if receipt_id_value:
-                try:
-                    update_conn = db_manager.get_connection()
-                    update_cursor = update_conn.cursor()
-                    update_cursor.execute("PRAGMA table_info(transactions)")
-                    columns = [row[1] for row in update_cursor.fetchall()]
-                    if 'receipt_id' in columns:
-                        update_cursor.execute("UPDATE transactions SET receipt_id = ? WHERE id = ?", (receipt_id_value, transaction_id))
-                        update_conn.commit()
-                        logger.info(f"[TRANSACTION CREATE] Updated receipt_id={receipt_id_value} for transaction {transaction_id}")
-                    update_conn.close()
-                except Exception as e:
-                    logger.warning(f"Could not update receipt_id: {e}")
-            
-            # Also update round_up_amount if it exists in the schema
+            # Link the receipt and record round_up_amount (columns added by schema migration 5)
             try:
                 update_conn = db_manager.get_connection()
                 update_cursor = update_conn.cursor()
-                update_cursor.execute("PRAGMA table_info(transactions)")
-                columns = [row[1] for row in update_cursor.fetchall()]
-                if 'round_up_amount' in columns:
-                    round_up = allocation.get('totalRoundUp', 0.0)
-                    update_cursor.execute("UPDATE transactions SET round_up_amount = ? WHERE id = ?", (round_up, transaction_id))
-                    update_conn.commit()
-                    logger.info(f"[TRANSACTION CREATE] Updated round_up_amount={round_up} for transaction {transaction_id}")
+                round_up = allocation.get('totalRoundUp', 0.0)
+                update_cursor.execute("UPDATE transactions SET receipt_id = COALESCE(?, receipt_id), round_up_amount = ? WHERE id = ?",
+                                      (receipt_data.get('receipt_id'), round_up, transaction_id))
+                update_conn.commit()
                 update_conn.close()
+                logger.info(f"[TRANSACTION CREATE] Updated receipt_id/round_up_amount={round_up} for transaction {transaction_id}")
             except Exception as e:
-                logger.warning(f"Could not update round_up_amount: {e}")
+                logger.warning(f"Could not update receipt_id/round_up_amount: {e}")
         except Exception as txn_error:
             logger.error(f"[TRANSACTION CREATE] Failed to create transaction: {txn_error}")
             import traceback
@@ -534,18 +456,6 @@ def create_transaction_from_receipt():
                 alloc_conn = db_manager.get_connection()
                 alloc_cursor = alloc_conn.cursor()
                 
-                alloc_cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS round_up_allocations (
-                        id TEXT PRIMARY KEY,
-                        transaction_id TEXT,
-                        stock_symbol VARCHAR(10),
-                        allocation_amount DECIMAL(10,2),
-                        allocation_percentage DECIMAL(5,2),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (transaction_id) REFERENCES transactions(id)
-                    )
-                """)
-                
                 for alloc in allocations:
                     try:
                         alloc_id = str(uuid.uuid4())
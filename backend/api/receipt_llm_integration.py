@@ -118,56 +118,8 @@ def submit_receipt_to_llm():
             'has_user_corrections': bool(corrections and (corrections.get('retailer') or corrections.get('items') or corrections.get('totalAmount')))
         }
         
-        # Ensure llm_mappings table exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS llm_mappings (
-                id TEXT PRIMARY KEY,
-                user_id INTEGER,
-                merchant_name TEXT,
-                ticker TEXT,
-                company_name TEXT,
-                category TEXT,
-                confidence REAL DEFAULT 0.8,
-                status TEXT DEFAULT 'pending',
-                admin_approved INTEGER DEFAULT 0,
-                admin_reviewed INTEGER DEFAULT 0,
-                user_feedback TEXT,
-                source_type TEXT DEFAULT 'receipt_processing',
-                receipt_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (receipt_id) REFERENCES receipts(id)
-            )
-        """)
-        
-        # Check columns and add missing ones
-        cursor.execute("PRAGMA table_info(llm_mappings)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        # Check and add source_type column
-        has_source_type = 'source_type' in columns
-        if not has_source_type:
-            logger.info("Adding source_type column to llm_mappings table")
-            cursor.execute("ALTER TABLE llm_mappings ADD COLUMN source_type TEXT DEFAULT 'receipt_processing'")
-            conn.commit()
-            has_source_type = True
-        
-        # Check and add receipt_id column
-        has_receipt_id = 'receipt_id' in columns
-        if not has_receipt_id:
-            logger.info("Adding receipt_id column to llm_mappings table")
-            cursor.execute("ALTER TABLE llm_mappings ADD COLUMN receipt_id TEXT")
-            conn.commit()
-            has_receipt_id = True
-        
-        # Check and add mapping_data column
-        has_mapping_data = 'mapping_data' in columns
-        if not has_mapping_data:
-            logger.info("Adding mapping_data column to llm_mappings table")
-            cursor.execute("ALTER TABLE llm_mappings ADD COLUMN mapping_data TEXT")
-            conn.commit()
-            has_mapping_data = True
+        # Column set is fixed by schema migrations and cached by db_manager
+        has_mapping_data = 'mapping_data' in db_manager.table_columns('llm_mappings')
         
         # Insert mapping
         # For receipt processing, we create mappings for:
@@ -596,22 +548,7 @@ def get_receipt_llm_mappings():
         
         logger.info(f"[RECEIPT_MAPPINGS] Final is_admin value: {is_admin}, will show {'all' if is_admin else 'user-specific'} mappings for user_id={user.get('id')}")
         
-        # Create indexes for better performance
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_mappings_source_receipt ON llm_mappings(source_type, receipt_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_mappings_user_id ON llm_mappings(user_id)")
-            conn.commit()
-        except Exception as e:
-            logger.warning(f"Could not create indexes: {e}")
-        
-        # Check if updated_at column exists (cache this check to avoid repeated PRAGMA calls)
-        # Use a simpler approach - try to select updated_at and catch if it doesn't exist
-        has_updated_at = False
-        try:
-            cursor.execute("SELECT updated_at FROM llm_mappings LIMIT 1")
-            has_updated_at = True
-        except:
-            has_updated_at = False
+        has_updated_at = 'updated_at' in db_manager.table_columns('llm_mappings')
         
         # Get count first (before fetching rows)
         # Only return mappings that have a receipt_id (user-submitted through receipt processing)
@@ -111,43 +111,7 @@ def create_payment_entry():
         }), 500
 
 
-@subscription_accounting_bp.route('/api/admin/subscriptions/process-daily-recognition', methods=['POST'])
-def process_daily_recognition():
-    """
-    Process daily revenue recognition for all active subscriptions
-    Should be called by a scheduled job (cron) daily
-    """
-    try:
-        data = request.get_json() or {}
-        recognition_date = data.get('recognition_date')
-        
-        if recognition_date:
-            recognition_date = datetime.fromisoformat(recognition_date).date()
-        
-        # Fetch all active subscriptions from database
-        # subscriptions = db.get_active_subscriptions()
-        
-        # Process daily recognition
-        # entries = accounting_service.process_daily_revenue_recognition(
-        #     subscriptions=subscriptions,
-        #     recognition_date=recognition_date
-        # )
-        
-        return jsonify({
-            'success': True,
-            'message': 'Daily recognition processed (placeholder - integrate with service)',
-            'data': {
-                'entries_created': 0,  # len(entries),
-                'recognition_date': recognition_date.isoformat() if recognition_date else datetime.now().date().isoformat()
-            }
-        })
-        
-    except Exception as e:
-        logger.error(f"Error processing daily recognition: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+# process-daily-recognition is served by app.py (admin only, bounded date range)
 
 
 @subscription_accounting_bp.route('/api/admin/subscriptions/create-renewal-entry', methods=['POST'])
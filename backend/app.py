@@ -12,6 +12,7 @@ import base64
 import uuid
 import csv
 import io
+import hmac
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -50,6 +51,10 @@ import threading
 from functools import lru_cache
 
 from database_manager import db_manager, _ensure_db_manager
+from utils.auth_cache import principal_cache, jwt_decode_cache
+from utils.log import get_logger, ProgressLogger
+from request_metrics import request_metrics
+from query_trace import query_tracer
 
 # Import ticker company lookup for validation
 try:
@@ -259,9 +264,89 @@ if APSCHEDULER_AVAILABLE:
         replace_existing=True
     )
     
+    # Mark positions to market from local price history every 5 minutes
+    # (the first run also backfills positions from transactions after an upgrade)
+    def mark_positions_to_market():
+        try:
+            from positions import position_store
+            position_store.ensure_backfilled()
+            result = position_store.mark_to_market()
+            print(f"[SCHEDULER] Marked {result['priced']}/{result['tickers']} position tickers to market")
+        except Exception as e:
+            print(f"[SCHEDULER] Error marking positions to market: {e}")
+    
+    scheduler.add_job(
+        mark_positions_to_market,
+        trigger=CronTrigger(minute='*/5'),
+        id='mark_positions_to_market',
+        name='Mark Positions to Market',
+        # First run (and any backfill) waits until the worker is serving requests
+        next_run_time=datetime.now() + timedelta(seconds=int(os.getenv('SCHEDULER_STARTUP_DELAY_SECONDS', '30'))),
+        replace_existing=True
+    )
+    
+    def run_daily_revenue_recognition():
+        """Recognize subscription revenue for every day since the last run (idempotent)"""
+        try:
+            from services.subscription_accounting_service import SubscriptionAccountingService
+            result = SubscriptionAccountingService(db_manager).recognize_revenue()
+            print(f"[SCHEDULER] Recognized {result['entries_created']} subscription revenue entries "
+                  f"({result['start_date']}..{result['end_date']})")
+        except Exception as e:
+            print(f"[SCHEDULER] Error running daily revenue recognition: {e}")
+    
+    scheduler.add_job(
+        run_daily_revenue_recognition,
+        trigger=CronTrigger(hour=23, minute=59),
+        id='daily_revenue_recognition',
+        name='Daily Subscription Revenue Recognition',
+        replace_existing=True
+    )
+    
+    def close_accounting_period():
+        """Snapshot account balances for the month that just ended"""
+        try:
+            from period_balances import period_balances
+            result = period_balances.close_period()
+            print(f"[SCHEDULER] Closed accounting periods {result['periods_closed']} "
+                  f"(last closed {result['last_closed_period']})")
+        except Exception as e:
+            print(f"[SCHEDULER] Error closing accounting period: {e}")
+    
+    # After the month's amortization (00:01) and last revenue recognition (23:59)
+    scheduler.add_job(
+        close_accounting_period,
+        trigger=CronTrigger(day=1, hour=0, minute=30),
+        id='close_accounting_period',
+        name='Monthly Account Balance Close',
+        replace_existing=True
+    )
+    
+    def check_ledger_consistency():
+        """Re-verify the journal months whose partition checksums changed"""
+        try:
+            from ledger_consistency import ledger_consistency
+            result = ledger_consistency.run()
+            if result['periods_verified']:
+                print(f"[SCHEDULER] Verified ledger months {result['periods_verified']} "
+                      f"({len(result['invalid_periods'])} invalid)")
+        except Exception as e:
+            print(f"[SCHEDULER] Error checking ledger consistency: {e}")
+    
+    scheduler.add_job(
+        check_ledger_consistency,
+        trigger=CronTrigger(minute='*/5'),
+        id='check_ledger_consistency',
+        name='Ledger Consistency Check',
+        replace_existing=True
+    )
+    
     scheduler.start()
     print("[SCHEDULER] Monthly LLM amortization scheduler started (runs on 1st of each month at 00:01)")
     print("[SCHEDULER] LLM mappings summary updater started (runs every 5 minutes)")
+    print("[SCHEDULER] Daily subscription revenue recognition started (runs at 23:59)")
+    print("[SCHEDULER] Monthly account balance close started (runs on 1st of each month at 00:30)")
+    print("[SCHEDULER] Ledger consistency checker started (runs every 5 minutes)")
 
 # Simple cache for LLM Center dashboard
 llm_dashboard_cache = {}
@@ -332,6 +417,13 @@ app.register_blueprint(api_usage_bp)
 app.register_blueprint(llm_processing_bp)
 app.register_blueprint(ai_recommendations_bp)
 
+# Receipt jobs a restart left queued or mid-pipeline would otherwise never finish
+try:
+    from receipt_jobs import receipt_jobs
+    receipt_jobs.recover_stranded()
+except Exception as e:
+    print(f"[RECEIPTS] Could not recover stranded receipt jobs: {e}")
+
 # New modular blueprints (Phase 2 refactor)
 # Note: These routes will coexist with existing routes during migration
 # Once verified, remove the old routes from app.py
@@ -341,6 +433,10 @@ app.register_blueprint(family_bp)
 app.register_blueprint(business_bp)
 app.register_blueprint(admin_bp)
 
+# Per-route latency/byte/error metrics (registered before the preflight handler so OPTIONS is timed too)
+request_metrics.init_app(app)
+query_tracer.init_app(app)
+
 # Global OPTIONS handler for CORS preflight requests
 @app.before_request
 def handle_preflight():
@@ -585,17 +681,13 @@ def parse_bearer_token_user_id() -> int | None:
         if not token or token == 'null' or token == 'undefined' or token == '':
             return None
         
-        print(f"[AUTH] parse_bearer_token_user_id: Token format check - '{token[:30]}...'")
-        
         # Handle token_<user_id> format
         if token.startswith('token_'):
             uid_str = token.split('token_', 1)[1]
             try:
                 user_id = int(uid_str)
-                print(f"[AUTH] Found token_ format, user_id: {user_id}")
                 return user_id
             except ValueError:
-                print(f"[AUTH] Error: Could not parse user_id from token_ format: '{uid_str}'")
                 return None
         
         # Handle family_token_<user_id> format
@@ -603,10 +695,8 @@ def parse_bearer_token_user_id() -> int | None:
             uid_str = token.split('family_token_', 1)[1]
             try:
                 user_id = int(uid_str)
-                print(f"[AUTH] Found family_token_ format, user_id: {user_id}")
                 return user_id
             except ValueError:
-                print(f"[AUTH] Error: Could not parse user_id from family_token_ format: '{uid_str}'")
                 return None
         
         # Handle user_token_<user_id> format
@@ -614,10 +704,8 @@ def parse_bearer_token_user_id() -> int | None:
             uid_str = token.split('user_token_', 1)[1]
             try:
                 user_id = int(uid_str)
-                print(f"[AUTH] Found user_token_ format, user_id: {user_id}")
                 return user_id
             except ValueError:
-                print(f"[AUTH] Error: Could not parse user_id from user_token_ format: '{uid_str}'")
                 return None
         
         # Handle business_token_<user_id> format
@@ -625,16 +713,12 @@ def parse_bearer_token_user_id() -> int | None:
             uid_str = token.split('business_token_', 1)[1]
             try:
                 user_id = int(uid_str)
-                print(f"[AUTH] Found business_token_ format, user_id: {user_id}")
                 return user_id
             except ValueError:
-                print(f"[AUTH] Error: Could not parse user_id from business_token_ format: '{uid_str}'")
                 return None
         
-        print(f"[AUTH] Token format not recognized: '{token[:30]}...'")
         return None
     except Exception as e:
-        print(f"[AUTH] Exception in parse_bearer_token_user_id: {e}")
         return None
 
 def get_user_id_from_token(token: str) -> int | None:
@@ -686,36 +770,34 @@ def get_user_id_from_token(token: str) -> int | None:
         return None
 
 def get_auth_user():
-    """Return authenticated user dict from token or None"""
+    """Return authenticated user dict from token or None
+
+    Verified principals are cached by token hash (utils.auth_cache), so a
+    repeat request costs a dictionary lookup instead of a DB round trip.
+    """
     try:
-        # Proceed with normal auth
         auth = request.headers.get('Authorization', '')
-        print(f"[AUTH] Authorization header present: {bool(auth)}, length: {len(auth)}")
         if not auth.startswith('Bearer '):
-            print(f"[AUTH] No Bearer token found. Header: '{auth[:50]}...'")
             return None
     except Exception as e:
-        import traceback
         print(f"[AUTH] ERROR: Exception at start of get_auth_user: {e}")
-        print(f"[AUTH] Traceback: {traceback.format_exc()}")
         return None
     
     token = auth.split(' ', 1)[1].strip()
-    print(f"[AUTH] Extracted token: '{token}' (length: {len(token) if token else 0})")
     
     # Handle null/undefined tokens (from localStorage)
     if not token or token == 'null' or token == 'undefined' or token == '' or token.lower() == 'none':
-        print(f"[AUTH] ERROR: Token is null, undefined, empty, or 'none'. Token value: '{token}'")
-        print(f"[AUTH] This usually means localStorage.getItem('kamioi_user_token') returned null")
         return None
     
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+    
     # Check if it's an admin token
     if token.startswith('admin_token_'):
         try:
             admin_id = int(token.split('admin_token_', 1)[1])
-            print(f"DEBUG: Admin ID extracted: {admin_id}")
         except (ValueError, IndexError):
-            print("DEBUG: Failed to extract admin ID from token")
             return None
         
         try:
@@ -741,7 +823,6 @@ def get_auth_user():
                     row = cur.fetchone()
                     conn.close()
                 
-                print(f"DEBUG: Admin query result: {row}")
                 if row:
                     user_data = {
                         'id': row[0],
@@ -751,10 +832,9 @@ def get_auth_user():
                         'dashboard': 'admin',
                         'permissions': row[4] if row[4] else '{}'
                     }
-                    print(f"DEBUG: Returning user data: {user_data}")
+                    principal_cache.put(token, user_data, kind='admin')
                     return user_data
                 else:
-                    print("DEBUG: No admin found with this ID")
                     return None
             except Exception as db_error:
                 # Make sure to close/release connection on error
@@ -775,23 +855,18 @@ def get_auth_user():
     
     # Handle regular user tokens
     user_id = parse_bearer_token_user_id()
-    print(f"[AUTH] Parsed user_id from token: {user_id}")
     if not user_id:
-        print(f"[AUTH] Failed to parse user_id from token: '{token}'")
         # Try to extract as plain number as fallback
         try:
             if token and token.isdigit():
                 user_id = int(token)
-                print(f"[AUTH] Token is plain number, extracted user_id: {user_id}")
             else:
                 # Try to extract any number from token
                 import re
                 numbers = re.findall(r'\d+', token)
                 if numbers:
                     user_id = int(numbers[0])
-                    print(f"[AUTH] Extracted user_id from token using regex: {user_id}")
                 else:
-                    print(f"[AUTH] ERROR: No user_id found in token format. Token: '{token}'")
                     return None
         except (ValueError, AttributeError) as e:
             print(f"[AUTH] ERROR: Could not extract user_id from token: {e}")
@@ -831,27 +906,25 @@ def get_auth_user():
                 pass
             raise db_error
         
-        print(f"[AUTH] User query result for id {user_id}: {row}")
-        
         if not row:
             # For local users, return a basic user object
             # This allows local users to authenticate even if not in database
-            print(f"[AUTH] User {user_id} not in database, creating basic user object")
-            return {
+            user_data = {
                 'id': user_id, 
                 'email': f'user{user_id}@kamioi.com', 
                 'name': f'User {user_id}', 
                 'role': 'user', 
                 'dashboard': 'user'
             }
-        user_data = {'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3], 'dashboard': row[3], 'account_number': row[4]}
-        print(f"[AUTH] SUCCESS: Returning user data: {user_data}")
+        else:
+            user_data = {'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3], 'dashboard': row[3], 'account_number': row[4]}
+        principal_cache.put(token, user_data, kind='user')
         return user_data
     except Exception as e:
         import traceback
         print(f"[AUTH] ERROR: Exception in get_auth_user for user_id {user_id}: {e}")
         print(f"[AUTH] Traceback: {traceback.format_exc()}")
-        # For local users, return a basic user object even if database fails
+        # For local users, return a basic user object even if database fails (not cached)
         return {
             'id': user_id, 
             'email': f'user{user_id}@kamioi.com', 
@@ -1022,8 +1095,15 @@ def user_login():
     except Exception as e:
         return jsonify({'success': False, 'error': 'Login failed'}), 500
 
+def _bearer_token():
+    auth = request.headers.get('Authorization', '')
+    return auth.split(' ', 1)[1].strip() if auth.startswith('Bearer ') else None
+
 @app.route('/api/user/auth/logout', methods=['POST'])
 def user_logout():
+    token = _bearer_token()
+    if token:
+        principal_cache.invalidate_token(token)
     return jsonify({'success': True, 'message': 'Logged out successfully'})
 
 @app.route('/api/user/auth/me')
@@ -1155,6 +1235,7 @@ def reset_password():
         
         conn.commit()
         conn.close()
+        principal_cache.invalidate('user', email=email)
         
         return jsonify({
             'success': True,
@@ -1552,23 +1633,6 @@ def user_transactions():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID not found'}), 400
         
-        # Fix transactions: update status to 'mapped' if they have a ticker but status is still 'pending'
-        try:
-            conn = db_manager.get_connection()
-            cur = conn.cursor()
-            cur.execute('''
-                UPDATE transactions 
-                SET status = 'mapped' 
-                WHERE user_id = ? AND ticker IS NOT NULL AND status = 'pending'
-            ''', (user_id,))
-            fixed_count = cur.rowcount
-            if fixed_count > 0:
-                conn.commit()
-                print(f"✅ Fixed {fixed_count} transactions for user {user_id}: updated status from 'pending' to 'mapped'")
-            conn.close()
-        except Exception as e:
-            print(f"Warning: Could not fix transaction statuses for user {user_id}: {e}")
-        
         # Fetch transactions from database
         print(f"[USER TRANSACTIONS] Fetching transactions for user_id: {user_id} (type: {type(user_id)}, is_demo: {user.get('is_demo', False)})")
         transactions = db_manager.get_user_transactions(user_id, limit=100, offset=0)
@@ -2522,37 +2586,6 @@ def family_transactions():
                 print(f"[ERROR] Failed to create mock transactions: {str(e)}")
                 print(f"[ERROR] Traceback: {traceback.format_exc()}")
         
-        # Fix transactions: update status to 'mapped' if they have a ticker but status is still 'pending'
-        try:
-            conn = db_manager.get_connection()
-            
-            if db_manager._use_postgresql:
-                from sqlalchemy import text
-                result = conn.execute(text('''
-                    UPDATE transactions 
-                    SET status = 'mapped' 
-                    WHERE user_id = :user_id AND ticker IS NOT NULL AND status = 'pending'
-                '''), {'user_id': user_id})
-                fixed_count = result.rowcount
-                if fixed_count > 0:
-                    conn.commit()
-                    print(f"✅ Fixed {fixed_count} family transactions for user {user_id}")
-                db_manager.release_connection(conn)
-            else:
-                cur = conn.cursor()
-                cur.execute('''
-                    UPDATE transactions 
-                    SET status = 'mapped' 
-                    WHERE user_id = ? AND ticker IS NOT NULL AND status = 'pending'
-                ''', (user_id,))
-                fixed_count = cur.rowcount
-                if fixed_count > 0:
-                    conn.commit()
-                    print(f"✅ Fixed {fixed_count} family transactions for user {user_id}")
-                conn.close()
-        except Exception as e:
-            print(f"Warning: Could not fix family transaction statuses: {e}")
-        
         # Fetch transactions from database
         transactions = db_manager.get_user_transactions(user_id, limit=100, offset=0)
         
@@ -4242,6 +4275,7 @@ def user_profile():
                 print(f"[PROFILE-PUT] No fields to update")
             
             db_manager.release_connection(conn)
+            principal_cache.invalidate('user', principal_id=user['id'])
             return jsonify({'success': True, 'message': 'Profile updated successfully'})
 
         # Get user profile data from database
@@ -4674,6 +4708,9 @@ def admin_login():
 
 @app.route('/api/admin/auth/logout', methods=['POST'])
 def admin_logout():
+    token = _bearer_token()
+    if token:
+        principal_cache.invalidate_token(token)
     return jsonify({'success': True, 'message': 'Admin logged out successfully'})
 
 @app.route('/api/admin/auth/me')
@@ -4935,37 +4972,6 @@ def admin_transactions():
     sys.stdout.flush()
     
     try:
-        # Fix transactions: update status to 'mapped' if they have a ticker but status is still 'pending'
-        try:
-            conn = db_manager.get_connection()
-            
-            if db_manager._use_postgresql:
-                from sqlalchemy import text
-                result = conn.execute(text('''
-                    UPDATE transactions 
-                    SET status = 'mapped' 
-                    WHERE ticker IS NOT NULL AND status = 'pending'
-                '''))
-                fixed_count = result.rowcount
-                if fixed_count > 0:
-                    conn.commit()
-                    print(f"✅ Fixed {fixed_count} transactions: updated status from 'pending' to 'mapped'")
-                db_manager.release_connection(conn)
-            else:
-                cur = conn.cursor()
-                cur.execute('''
-                    UPDATE transactions 
-                    SET status = 'mapped' 
-                    WHERE ticker IS NOT NULL AND status = 'pending'
-                ''')
-                fixed_count = cur.rowcount
-                if fixed_count > 0:
-                    conn.commit()
-                    print(f"✅ Fixed {fixed_count} transactions: updated status from 'pending' to 'mapped'")
-                conn.close()
-        except Exception as e:
-            print(f"Warning: Could not fix transaction statuses: {e}")
-        
         # CRITICAL: Add pagination to prevent loading billions of records
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 100, type=int), 1000)  # Max 1000 per page
@@ -5572,6 +5578,10 @@ def admin_delete_transactions():
         deleted_count = 0
         
         try:
+            # Purchases leave the users' positions with their transactions
+            from positions import position_store
+            position_store.reverse_fills(conn, '1 = 1')
+            
             if db_manager._use_postgresql:
                 from sqlalchemy import text
                 result = conn.execute(text('DELETE FROM transactions'))
@@ -5749,6 +5759,10 @@ def admin_delete_by_type():
                 if data_type == 'users':
                     result = conn.execute(text('DELETE FROM users WHERE account_type = :account_type'), {'account_type': account_type})
                 elif data_type == 'transactions':
+                    from positions import position_store
+                    position_store.reverse_fills(
+                        conn, 'user_id IN (SELECT id FROM users WHERE account_type = :account_type)',
+                        {'account_type': account_type})
                     result = conn.execute(text('''
                         DELETE FROM transactions 
                         WHERE user_id IN (SELECT id FROM users WHERE account_type = :account_type)
@@ -5789,6 +5803,10 @@ def admin_delete_by_type():
                 if data_type == 'users':
                     cursor.execute('DELETE FROM users WHERE account_type = ?', (account_type,))
                 elif data_type == 'transactions':
+                    from positions import position_store
+                    position_store.reverse_fills(
+                        conn, 'user_id IN (SELECT id FROM users WHERE account_type = :account_type)',
+                        {'account_type': account_type})
                     cursor.execute('''
                         DELETE FROM transactions 
                         WHERE user_id IN (SELECT id FROM users WHERE account_type = ?)
@@ -6024,6 +6042,8 @@ def admin_cleanup_test_data():
         
         # Delete transactions from other users (this is the slowest operation)
         print(f"[CLEANUP] Deleting {transactions_to_delete} transactions...")
+        from positions import position_store
+        position_store.reverse_fills(conn, 'user_id != :keep_user_id', {'keep_user_id': keep_user_id})
         cur.execute('DELETE FROM transactions WHERE user_id != ?', (keep_user_id,))
         deleted_transactions = cur.rowcount
         print(f"[CLEANUP] Deleted {deleted_transactions} transactions")
@@ -6754,7 +6774,7 @@ def admin_dashboard_overview():
                     SELECT 
                         COUNT(DISTINCT t.id) as totalTransactions,
                         COALESCE(SUM(t.round_up), 0) as totalRoundUps,
-                        COALESCE(SUM(CASE WHEN t.ticker IS NOT NULL THEN t.shares * COALESCE(t.stock_price, t.price_per_share, 0) ELSE 0 END), 0) as portfolioValue,
+                        (SELECT COALESCE(SUM(p.market_value), 0) FROM positions p WHERE p.user_id != 2) as portfolioValue,
                         COUNT(DISTINCT u.id) as activeUsers,
                         COUNT(DISTINCT CASE WHEN t.ticker IS NOT NULL THEN t.id END) as mappedTransactions
                     FROM transactions t
@@ -6797,7 +6817,7 @@ def admin_dashboard_overview():
                 SELECT 
                     COUNT(DISTINCT t.id) as totalTransactions,
                     COALESCE(SUM(t.round_up), 0) as totalRoundUps,
-                    COALESCE(SUM(CASE WHEN t.ticker IS NOT NULL THEN t.shares * COALESCE(t.stock_price, t.price_per_share, 0) ELSE 0 END), 0) as portfolioValue,
+                    (SELECT COALESCE(SUM(p.market_value), 0) FROM positions p WHERE p.user_id != 2) as portfolioValue,
                     COUNT(DISTINCT u.id) as activeUsers,
                     COUNT(DISTINCT CASE WHEN t.ticker IS NOT NULL THEN t.id END) as mappedTransactions
                 FROM transactions t
@@ -7063,34 +7083,35 @@ def admin_financial_analytics():
             # Combined query for all metrics
             result = conn.execute(text('''
                 SELECT 
-                    COALESCE(SUM(amount), 0) as total_revenue,
                     COUNT(*) as transaction_count,
                     COALESCE(AVG(amount), 0) as avg_transaction
                 FROM transactions 
                 WHERE amount > 0
             '''))
             row = result.fetchone()
-            total_revenue = float(row[0]) if row[0] else 0
-            transaction_count = row[1] or 0
-            avg_transaction = float(row[2]) if row[2] else 0
+            transaction_count = row[0] or 0
+            avg_transaction = float(row[1]) if row[1] else 0
             db_manager.release_connection(conn)
         else:
             # Combined query for all metrics (SQLite)
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT 
-                    COALESCE(SUM(amount), 0) as total_revenue,
                     COUNT(*) as transaction_count,
                     COALESCE(AVG(amount), 0) as avg_transaction
                 FROM transactions 
                 WHERE amount > 0
             ''')
             row = cursor.fetchone()
-            total_revenue = float(row[0]) if row[0] else 0
-            transaction_count = row[1] or 0
-            avg_transaction = float(row[2]) if row[2] else 0
+            transaction_count = row[0] or 0
+            avg_transaction = float(row[1]) if row[1] else 0
             conn.close()
         
+        # GL balances: last month-end snapshot plus the open period
+        from period_balances import period_balances
+        balances = period_balances.balances()
+        total_revenue = round(sum(b['balance'] for b in balances if b['account_type'] == 'Revenue'), 2)
+        
         query_time = time_module.time() - query_start_time
         sys.stdout.write(f"[Financial Analytics] Queries completed in {query_time:.2f}s\n")
         sys.stdout.flush()
@@ -7104,41 +7125,14 @@ def admin_financial_analytics():
             'data': {
                 'gl_accounts': [
                     {
-                        'id': 1,
-                        'code': '1000',
-                        'account_number': '1000',
-                        'account_name': 'Cash',
-                        'account_type': 'Asset',
-                        'balance': total_revenue,
-                        'description': 'Cash and cash equivalents'
-                    },
-                    {
-                        'id': 2,
-                        'code': '2000',
-                        'account_number': '2000',
-                        'account_name': 'Accounts Receivable',
-                        'account_type': 'Asset',
-                        'balance': transaction_count * 100,
-                        'description': 'Amounts owed by customers'
-                    },
-                    {
-                        'id': 3,
-                        'code': '3000',
-                        'account_number': '3000',
-                        'account_name': 'Revenue',
-                        'account_type': 'Revenue',
-                        'balance': total_revenue,
-                        'description': 'Total revenue from transactions'
-                    },
-                    {
-                        'id': 4,
-                        'code': '15200',
-                        'account_number': '15200',
-                        'account_name': 'LLM Data Assets',
-                        'account_type': 'Asset',
-                        'balance': total_revenue * 0.1,
-                        'description': 'LLM Data Assets balance'
-                    }
+                        'id': index,
+                        'code': b['account_code'],
+                        'account_number': b['account_code'],
+                        'account_name': b['account_name'],
+                        'account_type': b['account_type'],
+                        'balance': b['balance'],
+                        'description': f"{b['account_name']} balance"
+                    } for index, b in enumerate(balances, start=1)
                 ],
                 'total_revenue': total_revenue,
                 'transaction_count': transaction_count,
@@ -8135,17 +8129,6 @@ def admin_llm_automation_realtime():
         
         if db_manager._use_postgresql:
             from sqlalchemy import text
-            # Fix existing transactions: if they have a ticker but status is still 'pending', update to 'mapped'
-            result = conn.execute(text('''
-                UPDATE transactions 
-                SET status = 'mapped' 
-                WHERE ticker IS NOT NULL AND status = 'pending'
-            '''))
-            fixed_count = result.rowcount
-            if fixed_count > 0:
-                conn.commit()
-                print(f"✅ Fixed {fixed_count} transactions: updated status from 'pending' to 'mapped'")
-            
             # Get pending transactions count (these are in the queue for processing)
             result = conn.execute(text('SELECT COUNT(*) FROM transactions WHERE status = :status'), {'status': 'pending'})
             pending_transactions = result.scalar() or 0
@@ -8163,17 +8146,6 @@ def admin_llm_automation_realtime():
             total_processed = result.scalar() or 0
         else:
             cur = conn.cursor()
-            # Fix existing transactions: if they have a ticker but status is still 'pending', update to 'mapped'
-            cur.execute('''
-                UPDATE transactions 
-                SET status = 'mapped' 
-                WHERE ticker IS NOT NULL AND status = 'pending'
-            ''')
-            fixed_count = cur.rowcount
-            if fixed_count > 0:
-                conn.commit()
-                print(f"✅ Fixed {fixed_count} transactions: updated status from 'pending' to 'mapped'")
-            
             # Get pending transactions count (these are in the queue for processing)
             cur.execute('SELECT COUNT(*) FROM transactions WHERE status = ?', ('pending',))
             pending_transactions = cur.fetchone()[0] or 0
@@ -8674,47 +8646,32 @@ def financial_analytics():
 
 @app.route('/api/financial/cash-flow')
 def financial_cash_flow():
-    """Cash flow analytics endpoint"""
+    """Cash flow analytics endpoint (monthly movements of the cash accounts)"""
     try:
-        conn = db_manager.get_connection()
-        cur = conn.cursor()
-        
-        # Get cash flow data from transactions
-        cur.execute("""
-            SELECT 
-                DATE(created_at) as date,
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as inflows,
-                SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as outflows,
-                SUM(amount) as net_flow
-            FROM transactions
-            WHERE created_at >= date('now', '-30 days')
-            GROUP BY DATE(created_at)
-            ORDER BY date DESC
-        """)
-        cash_flow_data = cur.fetchall()
+        from period_balances import period_balances, CASH_ACCOUNT_PREFIX
+        months = max(1, min(int(request.args.get('periods', 12)), 120))
+        cash_flow_data = period_balances.movements(CASH_ACCOUNT_PREFIX, months)
         
-        # Calculate totals
-        total_inflows = sum(row[1] for row in cash_flow_data)
-        total_outflows = sum(row[2] for row in cash_flow_data)
+        # Debits to cash are inflows, credits outflows
+        total_inflows = sum(row['debit'] for row in cash_flow_data)
+        total_outflows = sum(row['credit'] for row in cash_flow_data)
         net_cash_flow = total_inflows - total_outflows
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'data': {
                 'cash_flow': [
                     {
-                        'date': row[0],
-                        'inflows': float(row[1]),
-                        'outflows': float(row[2]),
-                        'net_flow': float(row[3])
+                        'date': row['period'],
+                        'inflows': row['debit'],
+                        'outflows': row['credit'],
+                        'net_flow': round(row['debit'] - row['credit'], 2)
                     } for row in cash_flow_data
                 ],
                 'summary': {
-                    'total_inflows': float(total_inflows),
-                    'total_outflows': float(total_outflows),
-                    'net_cash_flow': float(net_cash_flow)
+                    'total_inflows': round(total_inflows, 2),
+                    'total_outflows': round(total_outflows, 2),
+                    'net_cash_flow': round(net_cash_flow, 2)
                 }
             }
         })
@@ -8723,45 +8680,48 @@ def financial_cash_flow():
 
 @app.route('/api/financial/balance-sheet')
 def financial_balance_sheet():
-    """Balance sheet analytics endpoint"""
-    try:
-        conn = db_manager.get_connection()
-        cur = conn.cursor()
-        
-        # Get balance sheet data
-        cur.execute("""
-            SELECT 
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as total_assets,
-                SUM(CASE WHEN amount < 0 THEN ABS(amount) ELSE 0 END) as total_liabilities,
-                COUNT(DISTINCT user_id) as total_users
-            FROM transactions
-        """)
-        balance_data = cur.fetchone()
-        
-        # Calculate equity
-        total_assets = balance_data[0] or 0
-        total_liabilities = balance_data[1] or 0
-        equity = total_assets - total_liabilities
-        
-        conn.close()
+    """Balance sheet analytics endpoint (last month-end snapshot plus the open period)"""
+    try:
+        from period_balances import period_balances, CASH_ACCOUNT_PREFIX
+        balances = period_balances.balances()
+        
+        def total(account_type, prefix=''):
+            return round(sum(b['balance'] for b in balances
+                             if b['account_type'] == account_type and b['account_code'].startswith(prefix)), 2)
+        
+        total_assets = total('Asset')
+        total_liabilities = total('Liability')
+        # Revenue and expenses not yet closed into retained earnings
+        current_earnings = round(sum(b['balance'] if b['normal_balance'] == 'Credit' else -b['balance']
+                                     for b in balances
+                                     if b['account_type'] not in ('Asset', 'Liability', 'Equity')), 2)
+        paid_in_capital = total('Equity', '30')
+        retained_earnings = round(total('Equity') - paid_in_capital + current_earnings, 2)
+        cash = total('Asset', CASH_ACCOUNT_PREFIX)
+        investments = total('Asset', '13')
+        accounts_payable = total('Liability', '20')
+        deferred_revenue = total('Liability', '23')
         
         return jsonify({
             'success': True,
             'data': {
+                'as_of_period': balances[0]['as_of_period'] if balances else None,
                 'assets': {
-                    'total_assets': float(total_assets),
-                    'cash': float(total_assets * 0.8),  # Assume 80% cash
-                    'investments': float(total_assets * 0.2)  # Assume 20% investments
+                    'total_assets': total_assets,
+                    'cash': cash,
+                    'investments': investments,
+                    'other_assets': round(total_assets - cash - investments, 2)
                 },
                 'liabilities': {
-                    'total_liabilities': float(total_liabilities),
-                    'accounts_payable': float(total_liabilities * 0.6),  # Assume 60% AP
-                    'debt': float(total_liabilities * 0.4)  # Assume 40% debt
+                    'total_liabilities': total_liabilities,
+                    'accounts_payable': accounts_payable,
+                    'deferred_revenue': deferred_revenue,
+                    'other_liabilities': round(total_liabilities - accounts_payable - deferred_revenue, 2)
                 },
                 'equity': {
-                    'total_equity': float(equity),
-                    'retained_earnings': float(equity * 0.7),  # Assume 70% retained earnings
-                    'paid_in_capital': float(equity * 0.3)  # Assume 30% paid-in capital
+                    'total_equity': round(paid_in_capital + retained_earnings, 2),
+                    'retained_earnings': retained_earnings,
+                    'paid_in_capital': paid_in_capital
                 }
             }
         })
@@ -9492,17 +9452,94 @@ def admin_settings_fees():
 
 @app.route('/api/admin/business-stress-test/status')
 def admin_business_stress_test():
+    """Current run progress, or the last run's results"""
     ok, res = require_role('admin')
     if ok is False:
         return res
-    return jsonify({'success': True, 'data': {'status': 'idle'}})
+    from stress_test import stress_test_runner
+    return jsonify({'success': True, 'data': stress_test_runner.status()})
 
 @app.route('/api/admin/business-stress-test/categories')
 def admin_business_stress_test_categories():
+    """Available scenarios with the latest result for each"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+    from stress_test import stress_test_runner
+    return jsonify({'success': True, 'data': {'categories': stress_test_runner.category_summary()}})
+
+@app.route('/api/admin/business-stress-test/run', methods=['POST'])
+def admin_business_stress_test_run():
+    """Start a stress test: {scenario, users, duration_seconds, mode, base_url, think_time_ms}"""
     ok, res = require_role('admin')
     if ok is False:
         return res
-    return jsonify({'success': True, 'data': {'categories': []}})
+    from stress_test import StressTestConfig, stress_test_runner
+
+    data = request.get_json() or {}
+    try:
+        config = StressTestConfig(
+            scenario=data.get('scenario', 'dashboard_reads'),
+            users=int(data.get('users', 4)),
+            duration_seconds=float(data.get('duration_seconds', 10)),
+            mode=data.get('mode', 'inprocess'),
+            base_url=data.get('base_url'),
+            think_time_ms=float(data.get('think_time_ms', 0)),
+            seed=int(data.get('seed', 1)),
+            admin_id=res.get('id'),
+            cleanup=bool(data.get('cleanup', True))
+        )
+        return jsonify({'success': True, 'data': stress_test_runner.start(config)}), 202
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+
+@app.route('/api/admin/business-stress-test/stop', methods=['POST'])
+def admin_business_stress_test_stop():
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+    from stress_test import stress_test_runner
+    stress_test_runner.stop()
+    return jsonify({'success': True, 'data': stress_test_runner.status()})
+
+@app.route('/api/admin/business-stress-test/history')
+def admin_business_stress_test_history():
+    """Stored runs, newest first, optionally for one scenario"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+    from stress_test import stress_test_runner
+    runs = stress_test_runner.history(scenario=request.args.get('scenario'),
+                                      limit=request.args.get('limit', 20, type=int))
+    return jsonify({'success': True, 'data': {'runs': runs}})
+
+@app.route('/api/admin/perf')
+def admin_perf():
+    """Per-route p50/p95/p99 latency, error rates and bytes, plus SQL counts, N+1 flags and slow queries"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+
+    sort = request.args.get('sort', 'p95')
+    limit = request.args.get('limit', type=int)
+    data = request_metrics.snapshot(sort=sort, limit=limit)
+    data['queries'] = query_tracer.snapshot()  # This worker only
+    return jsonify({'success': True, 'data': data})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of request metrics (requires Bearer METRICS_TOKEN)"""
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if not metrics_token:
+        # Route names, traffic and error rates are not public: no token configured, no scrape
+        return jsonify({'success': False, 'error': 'Metrics are disabled (METRICS_TOKEN is not set)'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {metrics_token}'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    response = make_response(request_metrics.render_prometheus())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
 
 # Missing endpoints that are causing 404 errors
 
@@ -10951,109 +10988,52 @@ def business_reports():
         
         if db_manager._use_postgresql:
             from sqlalchemy import text
-            # Check if business_reports table exists
             result = conn.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' AND table_name = 'business_reports'
-                )
-            """))
-            table_exists = result.scalar()
-            
-            if table_exists:
-                result = conn.execute(text("""
-                    SELECT id, name, type, format, period, period_type, status, file_path, download_url, created_at
-                    FROM business_reports
-                    WHERE business_user_id = :user_id
-                    ORDER BY created_at DESC
-                """), {'user_id': user_id})
-                reports = []
-                for row in result:
-                    reports.append({
-                        'id': row[0],
-                        'name': row[1],
-                        'type': row[2],
-                        'format': row[3],
-                        'period': row[4],
-                        'period_type': row[5],
-                        'status': row[6],
-                        'file_path': row[7],
-                        'download_url': row[8],
-                        'created_at': str(row[9]) if row[9] else None
-                    })
-            else:
-                # Create table if it doesn't exist
-                conn.execute(text("""
-                    CREATE TABLE IF NOT EXISTS business_reports (
-                        id SERIAL PRIMARY KEY,
-                        business_user_id INTEGER NOT NULL,
-                        name TEXT NOT NULL,
-                        type TEXT NOT NULL,
-                        format TEXT DEFAULT 'PDF',
-                        period TEXT,
-                        period_type TEXT,
-                        status TEXT DEFAULT 'pending',
-                        file_path TEXT,
-                        download_url TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (business_user_id) REFERENCES users(id)
-                    )
-                """))
-                conn.commit()
-                reports = []
+                SELECT id, name, type, format, period, period_type, status, file_path, download_url, created_at
+                FROM business_reports
+                WHERE business_user_id = :user_id
+                ORDER BY created_at DESC
+            """), {'user_id': user_id})
+            reports = []
+            for row in result:
+                reports.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'type': row[2],
+                    'format': row[3],
+                    'period': row[4],
+                    'period_type': row[5],
+                    'status': row[6],
+                    'file_path': row[7],
+                    'download_url': row[8],
+                    'created_at': str(row[9]) if row[9] else None
+                })
             
             db_manager.release_connection(conn)
         else:
             # SQLite
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='business_reports'
-            """)
-            table_exists = cursor.fetchone()
-            
-            if table_exists:
-                cursor.execute("""
-                    SELECT id, name, type, format, period, period_type, status, file_path, download_url, created_at
-                    FROM business_reports
-                    WHERE business_user_id = ?
-                    ORDER BY created_at DESC
-                """, (user_id,))
-                rows = cursor.fetchall()
-                reports = []
-                for row in rows:
-                    reports.append({
-                        'id': row[0],
-                        'name': row[1],
-                        'type': row[2],
-                        'format': row[3],
-                        'period': row[4],
-                        'period_type': row[5],
-                        'status': row[6],
-                        'file_path': row[7],
-                        'download_url': row[8],
-                        'created_at': row[9]
-                    })
-            else:
-                # Create table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS business_reports (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        business_user_id INTEGER NOT NULL,
-                        name TEXT NOT NULL,
-                        type TEXT NOT NULL,
-                        format TEXT DEFAULT 'PDF',
-                        period TEXT,
-                        period_type TEXT,
-                        status TEXT DEFAULT 'pending',
-                        file_path TEXT,
-                        download_url TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (business_user_id) REFERENCES users(id)
-                    )
-                """)
-                conn.commit()
-                reports = []
+                SELECT id, name, type, format, period, period_type, status, file_path, download_url, created_at
+                FROM business_reports
+                WHERE business_user_id = ?
+                ORDER BY created_at DESC
+            """, (user_id,))
+            rows = cursor.fetchall()
+            reports = []
+            for row in rows:
+                reports.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'type': row[2],
+                    'format': row[3],
+                    'period': row[4],
+                    'period_type': row[5],
+                    'status': row[6],
+                    'file_path': row[7],
+                    'download_url': row[8],
+                    'created_at': row[9]
+                })
             
             conn.close()
         
@@ -11101,25 +11081,6 @@ def business_reports_generate():
         
         if db_manager._use_postgresql:
             from sqlalchemy import text
-            # Create table if it doesn't exist
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS business_reports (
-                    id SERIAL PRIMARY KEY,
-                    business_user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    type TEXT NOT NULL,
-                    format TEXT DEFAULT 'PDF',
-                    period TEXT,
-                    period_type TEXT,
-                    status TEXT DEFAULT 'pending',
-                    file_path TEXT,
-                    download_url TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (business_user_id) REFERENCES users(id)
-                )
-            """))
-            conn.commit()
-            
             # Get count of existing reports for this user
             result = conn.execute(text('SELECT COUNT(*) FROM business_reports WHERE business_user_id = :user_id'), {'user_id': user_id})
             count = result.scalar()
@@ -11148,23 +11109,6 @@ def business_reports_generate():
         else:
             # SQLite
             cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS business_reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    business_user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    type TEXT NOT NULL,
-                    format TEXT DEFAULT 'PDF',
-                    period TEXT,
-                    period_type TEXT,
-                    status TEXT DEFAULT 'pending',
-                    file_path TEXT,
-                    download_url TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (business_user_id) REFERENCES users(id)
-                )
-            """)
-            
             # Get count of existing reports for this user
             cursor.execute('SELECT COUNT(*) FROM business_reports WHERE business_user_id = ?', (user_id,))
             count_result = cursor.fetchone()
@@ -12766,16 +12710,99 @@ def admin_roundup_stats():
 @app.route('/api/admin/roundup/ledger')
 def admin_roundup_ledger():
     try:
-        conn = db_manager.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM roundup_ledger ORDER BY created_at DESC")
-        cols = [d[0] for d in cur.description]
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-        conn.close()
+        from roundup_engine import roundup_engine
+        user_id = request.args.get('user_id')
+        status = request.args.get('status')
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        offset = request.args.get('offset', 0, type=int)
+        rows = roundup_engine.get_ledger_entries(user_id, status, limit=limit, offset=offset)
         return jsonify({'success': True, 'data': rows})
     except Exception:
         return jsonify({'success': False, 'data': []}), 500
 
+@app.route('/api/admin/roundup/sweep-all', methods=['POST'])
+def admin_sweep_all_roundups():
+    """Sweep every user's pending round-ups and net the buys into one order per ticker"""
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+    
+    try:
+        from roundup_engine import roundup_engine
+        from order_netting import order_netting_engine
+        
+        data = request.get_json(silent=True) or {}
+        
+        # Outside market hours the swept buys wait in market_queue for the
+        # next drain; during market hours they go out as one order per ticker
+        execute = data.get('execute')
+        if execute is None:
+            try:
+                from smart_llm_processor import smart_llm_processor
+                execute = smart_llm_processor.is_market_open()
+            except ImportError:
+                execute = False
+        
+        result = order_netting_engine.sweep_roundups(roundup_engine, execute=bool(execute))
+        sweep_results = result['sweeps']
+        
+        return jsonify({
+            'success': True,
+            'message': f'Swept round-ups for {len(sweep_results)} users',
+            'data': sweep_results,
+            'queued_orders': result['queued_orders'],
+            'execution': result['execution']
+        })
+    except Exception as e:
+        print(f"Error sweeping all round-ups: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/subscriptions/process-daily-recognition', methods=['POST'])
+def admin_process_daily_recognition():
+    """
+    Recognize subscription revenue for one day or a bounded range (idempotent)
+    
+    Body (all optional): recognition_date for a single day, or start_date /
+    end_date to backfill a range of at most REVENUE_RECOGNITION_MAX_RANGE_DAYS;
+    without dates the run resumes after the last recognized day
+    """
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+    
+    try:
+        from services.subscription_accounting_service import SubscriptionAccountingService
+        
+        data = request.get_json(silent=True) or {}
+        recognition_date = data.get('recognition_date')
+        start_date = data.get('start_date') or recognition_date
+        end_date = data.get('end_date') or recognition_date
+        try:
+            start_date = datetime.fromisoformat(start_date).date() if start_date else None
+            end_date = datetime.fromisoformat(end_date).date() if end_date else None
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Dates must be ISO formatted (YYYY-MM-DD)'}), 400
+        
+        if start_date:
+            max_days = int(os.getenv('REVENUE_RECOGNITION_MAX_RANGE_DAYS', '92'))
+            last_day = end_date or datetime.now().date()
+            if start_date > last_day:
+                return jsonify({'success': False, 'error': 'start_date must not be after end_date'}), 400
+            if (last_day - start_date).days + 1 > max_days:
+                return jsonify({'success': False,
+                                'error': f'Date range is limited to {max_days} days per request'}), 400
+        
+        result = SubscriptionAccountingService(db_manager).recognize_revenue(start_date=start_date, end_date=end_date)
+        
+        return jsonify({
+            'success': True,
+            'message': f"Daily recognition processed: {result['entries_created']} entries",
+            'data': dict(result, recognition_date=result['end_date'])
+        })
+    except Exception as e:
+        print(f"Error processing daily recognition: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Admin Advertisement Management
 @app.route('/api/admin/advertisements', methods=['GET'])
 def admin_get_advertisements():
@@ -13193,6 +13220,7 @@ def admin_delete_user(user_id):
         success = db_manager.delete_user(user_id)
 
         if success:
+            principal_cache.invalidate('user', principal_id=user_id)
             return jsonify({
                 'success': True,
                 'message': f'User {user[1]} ({user[2]}) deleted successfully'
@@ -13388,12 +13416,20 @@ def admin_database_data_quality():
         
         conn.close()
         
+        # Journal ledger: the last persisted consistency results (kept current by the scheduler)
+        from ledger_consistency import ledger_consistency
+        ledger = ledger_consistency.report()
+        if ledger['invalid_periods']:
+            quality_issues.append(f"{len(ledger['invalid_periods'])} journal ledger months failed consistency checks")
+        
         return jsonify({
             'success': True,
             'data_quality': {
                 'total_users': total_users,
                 'total_transactions': total_transactions,
                 'total_mappings': total_mappings,
+                'ledger_invalid_periods': ledger['invalid_periods'],
+                'ledger_pending_partitions': ledger['pending_partitions'],
                 'quality_issues': quality_issues,
                 'quality_score': max(0, 100 - len(quality_issues) * 10)  # Simple scoring
             }
@@ -13460,61 +13496,62 @@ def admin_database_performance():
 
 @app.route('/api/admin/ledger/consistency', methods=['GET'])
 def admin_ledger_consistency():
-    """Check ledger consistency and financial data integrity"""
+    """Check ledger consistency: transactions sanity checks, re-verify the journal months that changed, report every month"""
     ok, res = require_role('admin')
     if ok is False:
         return res
     
     try:
-        conn = db_manager.get_connection()
-        cur = conn.cursor()
-        
-        consistency_issues = []
-        
-        # Check for negative balances (if applicable)
-        cur.execute("SELECT COUNT(*) FROM transactions WHERE amount < 0")
-        negative_transactions = cur.fetchone()[0]
-        if negative_transactions > 0:
-            consistency_issues.append(f"{negative_transactions} transactions with negative amounts")
+        from ledger_consistency import ledger_consistency
+        ledger_consistency.run()
+        report = ledger_consistency.report()
+        transactions = ledger_consistency.transaction_checks()
         
-        # Check for duplicate transactions
-        cur.execute("""
-            SELECT description, amount, date, COUNT(*) as count
-            FROM transactions 
-            GROUP BY description, amount, date 
-            HAVING COUNT(*) > 1
-        """)
-        duplicates = cur.fetchall()
-        if duplicates:
-            consistency_issues.append(f"{len(duplicates)} potential duplicate transactions")
-        
-        # Check for future-dated transactions
-        cur.execute("SELECT COUNT(*) FROM transactions WHERE date > date('now')")
-        future_transactions = cur.fetchone()[0]
-        if future_transactions > 0:
-            consistency_issues.append(f"{future_transactions} transactions with future dates")
-        
-        # Get financial summary
-        cur.execute("SELECT SUM(amount) FROM transactions WHERE amount > 0")
-        total_income = cur.fetchone()[0] or 0
-        
-        cur.execute("SELECT SUM(amount) FROM transactions WHERE amount < 0")
-        total_expenses = cur.fetchone()[0] or 0
-        
-        cur.execute("SELECT COUNT(*) FROM transactions")
-        total_transactions = cur.fetchone()[0]
-        
-        conn.close()
+        consistency_issues = transactions['issues'] + [
+            f"{period['period'] or 'No journal entry'}: {issue['message']}"
+            for period in report['periods'] for issue in period['issues']
+        ]
         
         return jsonify({
             'success': True,
             'ledger_consistency': {
-                'total_transactions': total_transactions,
-                'total_income': total_income,
-                'total_expenses': total_expenses,
-                'net_balance': total_income + total_expenses,  # expenses are negative
+                'total_transactions': transactions['total_transactions'],
+                'total_income': transactions['total_income'],
+                'total_expenses': transactions['total_expenses'],
+                'total_lines': report['total_lines'],
+                'total_debits': report['total_debits'],
+                'total_credits': report['total_credits'],
+                'net_balance': round(report['total_debits'] - report['total_credits'], 2),
+                'periods_checked': len(report['periods']),
+                'invalid_periods': report['invalid_periods'],
+                'last_checked_at': report['last_checked_at'],
                 'consistency_issues': consistency_issues,
                 'consistency_score': max(0, 100 - len(consistency_issues) * 15)
+            },
+            'data': {
+                'consistency_checks': [
+                    {
+                        'id': 'transactions',
+                        'name': 'Transactions',
+                        'type': 'transactions',
+                        'description': f"{transactions['total_transactions']} transactions: negative amounts, "
+                                       f"duplicates, future dates",
+                        'status': 'invalid' if transactions['issues'] else 'valid',
+                        'result': '; '.join(transactions['issues']) or 'All checks passed',
+                        'lastRun': datetime.now().isoformat()
+                    }
+                ] + [
+                    {
+                        'id': period['period'] or 'orphans',
+                        'name': f"Journal {period['period'] or '(no entry)'}",
+                        'type': 'partition',
+                        'description': f"{period['line_count']} lines, debits {period['debit_total']:.2f}, "
+                                       f"credits {period['credit_total']:.2f}",
+                        'status': period['status'],
+                        'result': '; '.join(issue['message'] for issue in period['issues']) or 'All checks passed',
+                        'lastRun': period['checked_at']
+                    } for period in report['periods']
+                ]
             }
         })
     except Exception as e:
@@ -14050,7 +14087,7 @@ def admin_llm_approve():
         conn = db_manager.get_connection()
         cur = conn.cursor()
         cur.execute('''
-            SELECT * FROM llm_mappings WHERE id = ?
+            SELECT id, transaction_id, ticker FROM llm_mappings WHERE id = ?
         ''', (mapping_id,))
         mapping = cur.fetchone()
         
@@ -14058,7 +14095,7 @@ def admin_llm_approve():
             return jsonify({'success': False, 'error': 'Mapping not found'}), 404
         
         # Get transaction details
-        transaction_id = mapping[2]  # transaction_id column
+        transaction_id = mapping[1]  # transaction_id column
         cur.execute('''
             SELECT * FROM transactions WHERE id = ?
         ''', (transaction_id,))
@@ -14075,16 +14112,22 @@ def admin_llm_approve():
         platform_fee = 0.25  # Default $0.25
         
         # Calculate investment details
-        ticker = mapping[4]  # ticker column
+        ticker = mapping[2]  # ticker column
         total_investment = round_up_amount + platform_fee
         
+        # Price the purchase from local price history; without a price nothing has filled yet
+        from price_history import price_history_store
+        price = next(iter(price_history_store.get_latest_prices([ticker]).values()), None) if ticker else None
+        shares = round(round_up_amount / float(price), 6) if price else None
+        
         # Update mapping status
         db_manager.update_llm_mapping_status(int(mapping_id), 'approved', admin_approved=True)
         
-        # Update transaction with investment details
+        # Unpriced purchases stay 'mapped' and go to the netting queue; the
+        # fill marks them completed and books the position (order_netting.py)
         cur.execute('''
             UPDATE transactions 
-            SET status = 'completed',
+            SET status = ?,
                 ticker = ?,
                 investable = ?,
                 round_up = ?,
@@ -14095,66 +14138,71 @@ def admin_llm_approve():
                 stock_price = ?
             WHERE id = ?
         ''', (
+            'completed' if shares else 'mapped',
             ticker,
             round_up_amount,
             round_up_amount,
             platform_fee,
             total_investment,
-            round_up_amount,  # shares = investable amount for fractional shares
-            round_up_amount,  # price_per_share = investable amount
-            round_up_amount,  # stock_price = investable amount
+            shares,  # fractional shares bought with the investable amount
+            price,
+            price,
             transaction_id
         ))
         
-        # Execute stock purchase via Alpaca (placeholder - would integrate with Alpaca API)
-        # For now, we'll simulate the purchase
-        purchase_result = {
-            'success': True,
-            'order_id': f'ALPACA_{transaction_id}_{datetime.now().strftime("%Y%m%d%H%M%S")}',
-            'shares_purchased': round_up_amount,
-            'price_per_share': 1.00,  # Would get real price from Alpaca
-            'total_cost': total_investment
-        }
-        
-        # Create notification for user
-        notification_data = {
-            'user_id': user_id,
-            'type': 'investment_success',
-            'title': 'Stock Purchase Successful',
-            'message': f'Purchased ${round_up_amount:.2f} of {ticker} stock',
-            'data': {
-                'ticker': ticker,
-                'amount': round_up_amount,
-                'shares': round_up_amount,
-                'order_id': purchase_result['order_id']
+        if shares:
+            # Add the purchase to the user's position in the same transaction
+            from positions import position_store
+            position_store.apply_fill(conn, user_id, ticker, shares, round_up_amount, float(price))
+            order_id = f'ALPACA_{transaction_id}_{datetime.now().strftime("%Y%m%d%H%M%S")}'
+            notification_data = {
+                'user_id': user_id,
+                'type': 'investment_success',
+                'title': 'Stock Purchase Successful',
+                'message': f'Purchased ${round_up_amount:.2f} of {ticker} stock ({shares} shares, order {order_id})'
+            }
+        else:
+            order_id = None
+            notification_data = {
+                'user_id': user_id,
+                'type': 'investment_pending',
+                'title': 'Stock Purchase Queued',
+                'message': f'Your ${round_up_amount:.2f} purchase of {ticker} stock is queued for the next order'
             }
-        }
         
         # Add notification to database
         cur.execute('''
-            INSERT INTO notifications (user_id, type, title, message, data, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO notifications (user_id, type, title, message, created_at)
+            VALUES (?, ?, ?, ?, ?)
         ''', (
             user_id,
             notification_data['type'],
             notification_data['title'],
             notification_data['message'],
-            json.dumps(notification_data['data']),
             datetime.now().isoformat()
         ))
         
         conn.commit()
         conn.close()
         
+        if not shares:
+            from order_netting import order_netting_engine
+            order_netting_engine.enqueue([{'transaction_id': transaction_id, 'user_id': user_id,
+                                           'ticker': ticker, 'amount': round_up_amount}])
+        
         return jsonify({
             'success': True, 
-            'message': 'Mapping approved and investment executed successfully',
+            'message': ('Mapping approved and investment executed successfully' if shares else
+                        'Mapping approved; investment queued until the order fills'),
             'investment_details': {
                 'ticker': ticker,
+                'status': 'completed' if shares else 'pending',
                 'amount_invested': round_up_amount,
                 'platform_fee': platform_fee,
                 'total_cost': total_investment,
-                'order_id': purchase_result['order_id']
+                'shares': shares,
+                'price_per_share': price,
+                'order_id': order_id
             }
         })
         
@@ -15329,13 +15377,6 @@ def admin_get_employees():
 
         if db_manager._use_postgresql:
             from sqlalchemy import text
-            # First ensure is_active column exists
-            try:
-                conn.execute(text("ALTER TABLE admins ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE"))
-                conn.commit()
-            except Exception:
-                pass
-
             result = conn.execute(text("""
                 SELECT id, email, name, role, permissions,
                        COALESCE(is_active, TRUE) as is_active, created_at
@@ -15345,17 +15386,6 @@ def admin_get_employees():
             rows = result.fetchall()
         else:
             cur = conn.cursor()
-            # SQLite - check if is_active column exists
-            cur.execute("PRAGMA table_info(admins)")
-            columns = [col[1] for col in cur.fetchall()]
-
-            if 'is_active' not in columns:
-                try:
-                    cur.execute("ALTER TABLE admins ADD COLUMN is_active INTEGER DEFAULT 1")
-                    conn.commit()
-                except Exception:
-                    pass
-
             cur.execute("""
                 SELECT id, email, name, role, permissions,
                        COALESCE(is_active, 1) as is_active, created_at
@@ -15545,6 +15575,7 @@ def admin_update_employee(employee_id):
             conn.commit()
             cur.close()
 
+        principal_cache.invalidate('admin', principal_id=employee_id)
         return jsonify({'success': True, 'message': 'Employee updated successfully'})
     except Exception as e:
         import traceback
@@ -15601,6 +15632,7 @@ def admin_delete_employee(employee_id):
             conn.commit()
             cur.close()
 
+        principal_cache.invalidate('admin', principal_id=employee_id)
         return jsonify({'success': True, 'message': 'Employee deleted successfully'})
     except Exception as e:
         import traceback
@@ -15746,84 +15778,37 @@ def create_journal_entry():
 @app.route('/api/admin/journal-entries', methods=['GET'])
 @cross_origin()
 def get_journal_entries():
-    """Get all journal entries"""
+    """
+    Get journal entries, newest first, one page at a time
+    
+    Query params: limit (default 100, max 1000), cursor (pagination.next_cursor
+    of the previous page), date_from / date_to (YYYY-MM-DD), account
+    """
+    ok, res = require_role('admin')
+    if ok is False:
+        return res
+    
     try:
-        # Get auth token
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'success': False, 'error': 'Authorization header required'}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        # Verify admin token (admin_token_<id> format)
-        if not token.startswith('admin_token_'):
-            return jsonify({'success': False, 'error': 'Invalid admin token format'}), 401
-        
+        from journal_ledger import JournalLedger, InvalidCursor, DEFAULT_PAGE_SIZE
         try:
-            admin_id = int(token.split('admin_token_', 1)[1])
-        except (ValueError, IndexError):
-            return jsonify({'success': False, 'error': 'Invalid admin token format'}), 401
-        
-        # Verify admin exists
-        conn = sqlite3.connect('kamioi.db')
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM admins WHERE id = ? AND is_active = 1", (admin_id,))
-        admin = cur.fetchone()
-        
-        if not admin:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Invalid admin token'}), 401
-        
-        # Get journal entries with their lines
-        cur.execute("""
-            SELECT je.id, je.date, je.reference, je.description, je.transaction_type, 
-                   je.amount, je.from_account, je.to_account, je.vendor_name, je.customer_name,
-                   je.status, je.created_at, je.location, je.department,
-                   GROUP_CONCAT(jel.account_code || ':' || jel.debit || ':' || jel.credit || ':' || jel.description, '|') as lines
-            FROM journal_entries je
-            LEFT JOIN journal_entry_lines jel ON je.id = jel.journal_entry_id
-            GROUP BY je.id
-            ORDER BY je.created_at DESC
-        """)
-        
-        entries = []
-        for row in cur.fetchall():
-            # Parse journal entry lines
-            lines_data = []
-            if row[14]:  # lines data
-                for line_str in row[14].split('|'):
-                    parts = line_str.split(':')
-                    if len(parts) >= 3:
-                        lines_data.append({
-                            'account_code': parts[0],
-                            'debit': float(parts[1]) if parts[1] else 0,
-                            'credit': float(parts[2]) if parts[2] else 0,
-                            'description': parts[3] if len(parts) > 3 else ''
-                        })
-            
-            entries.append({
-                'id': row[0],
-                'date': row[1],
-                'reference': row[2],
-                'description': row[3],
-                'transaction_type': row[4],
-                'amount': row[5],
-                'from_account': row[6],
-                'to_account': row[7],
-                'vendor_name': row[8],
-                'customer_name': row[9],
-                'status': row[10],
-                'created_at': row[11],
-                'location': row[12],
-                'department': row[13],
-                'lines': lines_data
-            })
-        
-        conn.close()
+            page = JournalLedger(db_manager).list_entries(
+                limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+                cursor=request.args.get('cursor'),
+                date_from=request.args.get('date_from'),
+                date_to=request.args.get('date_to'),
+                account=request.args.get('account')
+            )
+        except InvalidCursor as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'data': entries
+            'data': page['entries'],
+            'pagination': {
+                'limit': page['limit'],
+                'next_cursor': page['next_cursor'],
+                'has_more': page['has_more']
+            }
         })
         
     except Exception as e:
@@ -16201,38 +16186,12 @@ def admin_delete_content(content_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # SEO Settings
-def _ensure_seo_settings_table(conn, use_postgresql):
-    """Create seo_settings table if it doesn't exist"""
-    if use_postgresql:
-        from sqlalchemy import text
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS seo_settings (
-                id SERIAL PRIMARY KEY,
-                setting_key VARCHAR(255) UNIQUE NOT NULL,
-                setting_value TEXT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        conn.commit()
-    else:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS seo_settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                setting_key TEXT UNIQUE NOT NULL,
-                setting_value TEXT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-
 @app.route('/api/seo-settings', methods=['GET'])
 def get_public_seo_settings():
     """Get SEO settings (public endpoint for frontend)"""
     try:
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_seo_settings_table(conn, use_postgresql)
 
         # Default settings
         settings = {
@@ -16284,7 +16243,6 @@ def admin_get_seo_settings():
     try:
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_seo_settings_table(conn, use_postgresql)
 
         # Default settings
         settings = {
@@ -16333,7 +16291,6 @@ def admin_update_seo_settings():
         data = request.get_json()
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_seo_settings_table(conn, use_postgresql)
 
         # Settings to save
         settings_to_save = [
@@ -16381,51 +16338,6 @@ def admin_update_seo_settings():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Demo Requests Management
-def _ensure_demo_requests_table(conn, use_postgresql):
-    """Create demo_requests table if it doesn't exist"""
-    if use_postgresql:
-        from sqlalchemy import text
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS demo_requests (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                email VARCHAR(255) NOT NULL,
-                phone VARCHAR(50),
-                address TEXT,
-                interest_type VARCHAR(100),
-                heard_from VARCHAR(100),
-                experience_level VARCHAR(100),
-                memo TEXT,
-                status VARCHAR(50) DEFAULT 'pending',
-                demo_code VARCHAR(100),
-                admin_notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        conn.commit()
-    else:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS demo_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL,
-                phone TEXT,
-                address TEXT,
-                interest_type TEXT,
-                heard_from TEXT,
-                experience_level TEXT,
-                memo TEXT,
-                status TEXT DEFAULT 'pending',
-                demo_code TEXT,
-                admin_notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-
 @app.route('/api/demo-requests', methods=['POST'])
 def submit_demo_request():
     """Submit a new demo request (public endpoint)"""
@@ -16438,7 +16350,6 @@ def submit_demo_request():
 
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_demo_requests_table(conn, use_postgresql)
 
         if use_postgresql:
             from sqlalchemy import text
@@ -16498,7 +16409,6 @@ def admin_get_demo_requests():
     try:
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_demo_requests_table(conn, use_postgresql)
 
         # Get filter parameters
         status_filter = request.args.get('status', '')
@@ -16576,7 +16486,6 @@ def admin_get_pending_demo_requests_count():
     try:
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_demo_requests_table(conn, use_postgresql)
 
         if use_postgresql:
             from sqlalchemy import text
@@ -16742,49 +16651,6 @@ def admin_delete_demo_request(request_id):
 
 # ===== CONTACT MESSAGES =====
 
-def _ensure_contact_messages_table(conn, use_postgresql):
-    """Create contact_messages table if it doesn't exist"""
-    if use_postgresql:
-        from sqlalchemy import text
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS contact_messages (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                email VARCHAR(255) NOT NULL,
-                subject VARCHAR(500) NOT NULL,
-                message TEXT NOT NULL,
-                status VARCHAR(50) DEFAULT 'unread',
-                admin_notes TEXT,
-                admin_reply TEXT,
-                replied_at TIMESTAMP,
-                ip_address VARCHAR(50),
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        conn.commit()
-    else:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS contact_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                message TEXT NOT NULL,
-                status TEXT DEFAULT 'unread',
-                admin_notes TEXT,
-                admin_reply TEXT,
-                replied_at TIMESTAMP,
-                ip_address TEXT,
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-
 @app.route('/api/contact', methods=['POST'])
 def submit_contact_message():
     """Submit a contact message (public endpoint)"""
@@ -16806,7 +16672,6 @@ def submit_contact_message():
 
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_contact_messages_table(conn, use_postgresql)
 
         ip_address = request.remote_addr or ''
         user_agent = request.headers.get('User-Agent', '')
@@ -16888,7 +16753,6 @@ def admin_get_contact_messages():
     try:
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_contact_messages_table(conn, use_postgresql)
 
         status_filter = request.args.get('status', '')
 
@@ -16963,7 +16827,6 @@ def admin_get_unread_contact_messages_count():
     try:
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
-        _ensure_contact_messages_table(conn, use_postgresql)
 
         if use_postgresql:
             from sqlalchemy import text
@@ -17091,22 +16954,8 @@ def admin_get_frontend_content():
         conn = db_manager.get_connection()
         use_postgresql = getattr(db_manager, '_use_postgresql', False)
         
-        # Create table if it doesn't exist
         if use_postgresql:
             from sqlalchemy import text
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS frontend_content (
-                    id SERIAL PRIMARY KEY,
-                    section_key VARCHAR(255) UNIQUE NOT NULL,
-                    section_name VARCHAR(255) NOT NULL,
-                    content_type VARCHAR(50) NOT NULL,
-                    content_data TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            conn.commit()
             result = conn.execute(text("SELECT * FROM frontend_content ORDER BY section_key"))
             rows = result.fetchall()
             db_manager.release_connection(conn)
@@ -17124,19 +16973,6 @@ def admin_get_frontend_content():
                 })
         else:
             cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS frontend_content (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    section_key TEXT UNIQUE NOT NULL,
-                    section_name TEXT NOT NULL,
-                    content_type TEXT NOT NULL,
-                    content_data TEXT NOT NULL,
-                    is_active INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
             cursor.execute("SELECT * FROM frontend_content ORDER BY section_key")
             rows = cursor.fetchall()
             conn.close()
@@ -18158,29 +17994,7 @@ def user_register():
                 conn.close()
                 return jsonify({'success': False, 'error': 'User already exists'}), 409
 
-            # Check and add missing columns to users table if needed
-            cursor.execute("PRAGMA table_info(users)")
-            columns_info = cursor.fetchall()
-            column_names = [col[1] for col in columns_info]
-
-            # Add missing columns dynamically
-            missing_columns = {
-                'first_name': 'TEXT', 'last_name': 'TEXT', 'address': 'TEXT',
-                'annual_income': 'TEXT', 'employment_status': 'TEXT', 'employer': 'TEXT',
-                'occupation': 'TEXT', 'round_up_amount': 'REAL', 'risk_tolerance': 'TEXT',
-                'date_of_birth': 'TEXT', 'ssn_last4': 'TEXT', 'country': 'TEXT',
-                'timezone': 'TEXT', 'subscription_plan_id': 'INTEGER',
-                'billing_cycle': 'TEXT', 'promo_code': 'TEXT'
-            }
-
-            for col_name, col_type in missing_columns.items():
-                if col_name not in column_names:
-                    try:
-                        cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}")
-                        conn.commit()
-                        column_names.append(col_name)
-                    except sqlite3.OperationalError:
-                        pass
+            column_names = db_manager.table_columns('users')
 
             print(f"[REGISTER] SQLite - Creating user with email: {data['email']}")
 
@@ -19435,10 +19249,7 @@ def business_account_settings():
             conn = db_manager.get_connection()
             cursor = conn.cursor()
             
-            # Check which columns exist in users table
-            cursor.execute("PRAGMA table_info(users)")
-            columns_info = cursor.fetchall()
-            column_names = [col[1] for col in columns_info]
+            column_names = db_manager.table_columns('users')
             
             # Build SELECT query based on available columns
             select_fields = ['name', 'email']
@@ -19500,34 +19311,9 @@ def business_account_settings():
             conn = db_manager.get_connection()
             cursor = conn.cursor()
             
-            # Check which columns exist in users table
-            cursor.execute("PRAGMA table_info(users)")
-            columns_info = cursor.fetchall()
-            column_names = [col[1] for col in columns_info]
+            column_names = db_manager.table_columns('users')
             
             # Build UPDATE query based on available columns
-            # Create missing columns if they don't exist
-            if 'company_name' not in column_names:
-                try:
-                    cursor.execute("ALTER TABLE users ADD COLUMN company_name TEXT")
-                    column_names.append('company_name')
-                except sqlite3.OperationalError:
-                    pass  # Column might already exist
-            
-            if 'phone' not in column_names:
-                try:
-                    cursor.execute("ALTER TABLE users ADD COLUMN phone TEXT")
-                    column_names.append('phone')
-                except sqlite3.OperationalError:
-                    pass  # Column might already exist
-            
-            if 'address' not in column_names:
-                try:
-                    cursor.execute("ALTER TABLE users ADD COLUMN address TEXT")
-                    column_names.append('address')
-                except sqlite3.OperationalError:
-                    pass  # Column might already exist
-            
             # Now build the UPDATE query with all columns
             update_fields = ['name = ?', 'email = ?']
             update_values = [name, email]
@@ -19961,25 +19747,6 @@ def business_bank_connections():
         
         if db_manager._use_postgresql:
             from sqlalchemy import text
-            # Create table if it doesn't exist
-            conn.execute(text('''
-                CREATE TABLE IF NOT EXISTS business_bank_connections (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER NOT NULL,
-                    institution_name TEXT NOT NULL,
-                    bank_name TEXT,
-                    account_name TEXT,
-                    account_type TEXT,
-                    account_id TEXT,
-                    member_guid TEXT,
-                    user_guid TEXT,
-                    status TEXT DEFAULT 'connected',
-                    connected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            '''))
-            conn.commit()
-            
             if request.method == 'GET':
                 print(f"[DEBUG] Business Bank Connection GET - User ID: {user_id}")
                 result = conn.execute(text('''
@@ -20096,24 +19863,6 @@ def business_bank_connections():
         else:
             # SQLite
             cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS business_bank_connections (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    institution_name TEXT NOT NULL,
-                    bank_name TEXT,
-                    account_name TEXT,
-                    account_type TEXT,
-                    account_id TEXT,
-                    member_guid TEXT,
-                    user_guid TEXT,
-                    status TEXT DEFAULT 'connected',
-                    connected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            ''')
-            conn.commit()
-            
             if request.method == 'GET':
                 print(f"[DEBUG] Business Bank Connection GET - User ID: {user_id}")
                 cursor.execute('''
@@ -20294,20 +20043,19 @@ def business_bank_connection_delete(connection_id):
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+upload_log = get_logger('upload')
+
 @app.route('/api/business/upload-bank-file', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def business_upload_bank_file():
     """Upload and process business bank statement file (CSV or Excel)"""
     import time
-    import sys
     
-    # Force flush to ensure logs appear immediately
-    print(f"[BUSINESS BANK UPLOAD] ===== REQUEST RECEIVED at {time.strftime('%Y-%m-%d %H:%M:%S')} =====", flush=True)
-    sys.stdout.flush()
+    upload_log.info(f"===== REQUEST RECEIVED at {time.strftime('%Y-%m-%d %H:%M:%S')} =====")
     
     # Handle OPTIONS preflight
     if request.method == 'OPTIONS':
-        print(f"[BUSINESS BANK UPLOAD] OPTIONS preflight request", flush=True)
+        upload_log.debug("OPTIONS preflight request")
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
@@ -20315,16 +20063,13 @@ def business_upload_bank_file():
         return response
     
     start_time = time.time()
-    print(f"[BUSINESS BANK UPLOAD] Processing POST request...", flush=True)
-    sys.stdout.flush()
+    upload_log.debug("Processing POST request...")
     
     user = get_auth_user()
-    print(f"[BUSINESS BANK UPLOAD] get_auth_user() returned: {user is not None}", flush=True)
-    sys.stdout.flush()
+    upload_log.debug(f"get_auth_user() returned: {user is not None}")
     
     if not user:
-        print(f"[BUSINESS BANK UPLOAD] ERROR: Unauthorized - no user found", flush=True)
-        sys.stdout.flush()
+        upload_log.error("Unauthorized - no user found")
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
     try:
@@ -20332,15 +20077,15 @@ def business_upload_bank_file():
         user_role = user.get('role', '')
         user_dashboard = user.get('dashboard', '')
         
-        print(f"[BUSINESS BANK UPLOAD] Processing file for user_id={user_id}, role={user_role}, dashboard={user_dashboard}")
-        print(f"[BUSINESS BANK UPLOAD] Request method: {request.method}")
-        print(f"[BUSINESS BANK UPLOAD] Has files: {'file' in request.files}")
+        upload_log.info(f"Processing file for user_id={user_id}, role={user_role}, dashboard={user_dashboard}")
+        upload_log.debug(f"Request method: {request.method}")
+        upload_log.debug(f"Has files: {'file' in request.files}")
         if 'file' in request.files:
-            print(f"[BUSINESS BANK UPLOAD] File name: {request.files['file'].filename}")
+            upload_log.info(f"File name: {request.files['file'].filename}")
         
         # CRITICAL: Reject admin tokens - business uploads must be from business users
         if user_role == 'admin' or user_dashboard == 'admin':
-            print(f"[BUSINESS BANK UPLOAD] ERROR: Admin user {user_id} attempted business file upload")
+            upload_log.error(f"Admin user {user_id} attempted business file upload")
             return jsonify({
                 'success': False,
                 'error': 'Admin accounts cannot upload business transactions. Please log in as a business user.'
@@ -20360,13 +20105,13 @@ def business_upload_bank_file():
             
             if not user_row:
                 db_manager.release_connection(conn_check) if db_manager._use_postgresql else conn_check.close()
-                print(f"[BUSINESS BANK UPLOAD] ERROR: User {user_id} does not exist in database!")
+                upload_log.error(f"User {user_id} does not exist in database!")
                 return jsonify({
                     'success': False,
                     'error': f'User {user_id} not found in database. Cannot process transactions.'
                 }), 404
             
-            print(f"[BUSINESS BANK UPLOAD] Verified user exists: ID={user_row[0]}, Email={user_row[1]}, Name={user_row[2]}, Account={user_row[3] if len(user_row) > 3 else 'N/A'}")
+            upload_log.info(f"Verified user exists: ID={user_row[0]}, Email={user_row[1]}, Name={user_row[2]}, Account={user_row[3] if len(user_row) > 3 else 'N/A'}")
         finally:
             if db_manager._use_postgresql:
                 db_manager.release_connection(conn_check)
@@ -20385,38 +20130,32 @@ def business_upload_bank_file():
             return jsonify({'success': False, 'error': 'File must be CSV or Excel (.csv, .xlsx, .xls)'}), 400
         
         # Read and parse the file
-        print(f"[BUSINESS BANK UPLOAD] Starting file parsing...")
+        upload_log.info("Starting file parsing...")
         transactions = []
         errors = []
         
         if file.filename.endswith('.csv'):
-            print(f"[BUSINESS BANK UPLOAD] Detected CSV file, parsing...", flush=True)
-            sys.stdout.flush()
+            upload_log.info("Detected CSV file, parsing...")
             # Parse CSV file
             encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1', 'windows-1252']
             rows = None
             
             for encoding in encodings_to_try:
                 try:
-                    print(f"[BUSINESS BANK UPLOAD] Trying encoding: {encoding}", flush=True)
-                    sys.stdout.flush()
+                    upload_log.debug(f"Trying encoding: {encoding}")
                     file.seek(0)
                     content = file.read().decode(encoding)
-                    print(f"[BUSINESS BANK UPLOAD] File decoded, creating CSV reader...", flush=True)
-                    sys.stdout.flush()
+                    upload_log.debug("File decoded, creating CSV reader...")
                     csv_reader = csv.DictReader(io.StringIO(content))
                     rows = list(csv_reader)
-                    print(f"[BUSINESS BANK UPLOAD] Successfully read CSV with encoding: {encoding}, {len(rows)} rows", flush=True)
-                    print(f"[BUSINESS BANK UPLOAD] CSV columns found: {list(rows[0].keys()) if rows else 'No rows'}", flush=True)
-                    sys.stdout.flush()
+                    upload_log.info(f"Successfully read CSV with encoding: {encoding}, {len(rows)} rows")
+                    upload_log.debug(f"CSV columns found: {list(rows[0].keys()) if rows else 'No rows'}")
                     break
                 except (UnicodeDecodeError, UnicodeError):
-                    print(f"[BUSINESS BANK UPLOAD] Encoding {encoding} failed, trying next...", flush=True)
-                    sys.stdout.flush()
+                    upload_log.debug(f"Encoding {encoding} failed, trying next...")
                     continue
                 except Exception as e:
-                    print(f"[BUSINESS BANK UPLOAD] Error reading CSV with encoding {encoding}: {e}", flush=True)
-                    sys.stdout.flush()
+                    upload_log.error(f"Error reading CSV with encoding {encoding}: {e}")
                     continue
             
             if rows is None:
@@ -20426,7 +20165,7 @@ def business_upload_bank_file():
                     content = file.read().decode('utf-8', errors='replace')
                     csv_reader = csv.DictReader(io.StringIO(content))
                     rows = list(csv_reader)
-                    print(f"[BUSINESS BANK UPLOAD] Using utf-8 with error replacement, {len(rows)} rows")
+                    upload_log.warning(f"Using utf-8 with error replacement, {len(rows)} rows")
                 except Exception as e:
                     return jsonify({'success': False, 'error': f'Could not read CSV file: {str(e)}'}), 400
         else:
@@ -20436,7 +20175,7 @@ def business_upload_bank_file():
                 file.seek(0)
                 df = pd.read_excel(io.BytesIO(file.read()))
                 rows = df.to_dict('records')
-                print(f"[BUSINESS BANK UPLOAD] Successfully read Excel file, {len(rows)} rows")
+                upload_log.info(f"Successfully read Excel file, {len(rows)} rows")
             except ImportError:
                 return jsonify({
                     'success': False,
@@ -20512,20 +20251,19 @@ def business_upload_bank_file():
                 'error': f'Missing description/merchant column. Found: {", ".join(available_columns)}'
             }), 400
         
-        print(f"[BUSINESS BANK UPLOAD] Using columns - Date: {date_col}, Amount: {amount_col}, Description: {description_col}, Merchant: {merchant_col}, Category: {category_col}")
+        upload_log.info(f"Using columns - Date: {date_col}, Amount: {amount_col}, Description: {description_col}, Merchant: {merchant_col}, Category: {category_col}")
         
         # Parse transactions
-        print(f"[BUSINESS BANK UPLOAD] Getting database connection...")
+        upload_log.debug("Getting database connection...")
         conn = db_manager.get_connection()
-        print(f"[BUSINESS BANK UPLOAD] Database connection obtained")
+        upload_log.debug("Database connection obtained")
         processed_count = 0
         total_rows = len(rows)
-        print(f"[BUSINESS BANK UPLOAD] Starting to process {total_rows} rows...")
+        upload_log.info(f"Starting to process {total_rows} rows...")
         
         # ===== BATCH PROCESSING OPTIMIZATION =====
         # Step 1: Pre-fetch LLM mappings into memory for fast lookups (LIMITED to avoid slow loading)
-        print(f"[BUSINESS BANK UPLOAD] Pre-loading LLM mappings into memory for batch processing...", flush=True)
-        sys.stdout.flush()
+        upload_log.info("Pre-loading LLM mappings into memory for batch processing...")
         llm_mapping_cache = {}  # {merchant_name_lower: (ticker, category)}
         normalized_mapping_cache = {}  # {normalized_merchant_lower: (ticker, category)}
         
@@ -20582,11 +20320,9 @@ def business_upload_bank_file():
                         normalized_mapping_cache[normalized] = (ticker, category)
                 cursor_cache.close()
             
-            print(f"[BUSINESS BANK UPLOAD] Loaded {len(llm_mapping_cache)} LLM mappings into memory cache (limited to 10k for performance)", flush=True)
-            sys.stdout.flush()
+            upload_log.info(f"Loaded {len(llm_mapping_cache)} LLM mappings into memory cache (limited to 10k for performance)")
         except Exception as cache_err:
-            print(f"[BUSINESS BANK UPLOAD] Warning: Could not load LLM mapping cache: {cache_err}", flush=True)
-            sys.stdout.flush()
+            upload_log.warning(f"Could not load LLM mapping cache: {cache_err}")
             # Continue without cache - will use per-transaction queries as fallback
         
         # Prepare batch data structures
@@ -20626,11 +20362,8 @@ def business_upload_bank_file():
             except:
                 return 0.0
         
+        progress = ProgressLogger(upload_log, 'Processed transactions', total=total_rows)
         for i, row in enumerate(rows):
-            # Log progress every 10 rows
-            if i % 10 == 0 and i > 0:
-                print(f"[BUSINESS BANK UPLOAD] Processing row {i+1}/{total_rows}...")
-            
             try:
                 # Extract transaction data
                 date_str = row.get(date_col, '')
@@ -20745,7 +20478,7 @@ def business_upload_bank_file():
                         transaction_data['needs_mapping_record'] = False
                     
                 except Exception as mapping_lookup_err:
-                    print(f"[BUSINESS BANK UPLOAD] Error in mapping lookup for '{merchant_name}': {mapping_lookup_err}")
+                    upload_log.error(f"Error in mapping lookup for '{merchant_name}': {mapping_lookup_err}")
                     transaction_data['status'] = 'pending'
                     transaction_data['ticker'] = None
                     transaction_data['needs_mapping_record'] = False
@@ -20754,8 +20487,7 @@ def business_upload_bank_file():
                 transactions_to_insert.append(transaction_data)
                 
                 processed_count += 1
-                if processed_count % 5 == 0:
-                    print(f"[BUSINESS BANK UPLOAD] Processed {processed_count}/{total_rows} transactions...")
+                progress.update()
                 
             except Exception as e:
                 import traceback
@@ -20772,15 +20504,16 @@ def business_upload_bank_file():
                     error_msg = f"Row {i + 2}: {error_details}"
                 
                 errors.append(error_msg)
-                print(f"[BUSINESS BANK UPLOAD] Error processing row {i + 2}: {e}")
-                print(f"[BUSINESS BANK UPLOAD] Row data: {dict(row) if 'row' in locals() else 'N/A'}")
+                upload_log.error(f"Error processing row {i + 2}: {e}")
+                upload_log.debug("Row data: %s", dict(row) if 'row' in locals() else 'N/A')
                 if len(errors) <= 5:  # Only print full traceback for first few errors
-                    print(f"[BUSINESS BANK UPLOAD] Traceback: {traceback.format_exc()}")
+                    upload_log.error(f"Traceback: {traceback.format_exc()}")
                 continue
         
+        progress.done()
+        
         # ===== BATCH PROCESSING: Bulk Insert All Transactions =====
-        print(f"[BUSINESS BANK UPLOAD] Starting bulk insert of {len(transactions_to_insert)} transactions...", flush=True)
-        sys.stdout.flush()
+        upload_log.info(f"Starting bulk insert of {len(transactions_to_insert)} transactions...")
         
         transaction_ids_map = {}  # {index: transaction_id} for mapping updates
         
@@ -20837,16 +20570,14 @@ def business_upload_bank_file():
                         '''), chunk_params)
                         chunk_ids = [row[0] for row in result]
                         all_inserted_ids.extend(chunk_ids)
-                        print(f"[BUSINESS BANK UPLOAD] Bulk inserted chunk {chunk_start//chunk_size + 1} ({len(chunk)} transactions)", flush=True)
-                        sys.stdout.flush()
+                        upload_log.info(f"Bulk inserted chunk {chunk_start//chunk_size + 1} ({len(chunk)} transactions)")
                     
                     # Map transaction indices to IDs
                     for idx, tx_id in enumerate(all_inserted_ids):
                         transaction_ids_map[idx] = tx_id
                         transactions_to_insert[idx]['id'] = tx_id
                     
-                    print(f"[BUSINESS BANK UPLOAD] Bulk insert complete: {len(all_inserted_ids)} transactions inserted", flush=True)
-                    sys.stdout.flush()
+                    upload_log.info(f"Bulk insert complete: {len(all_inserted_ids)} transactions inserted")
             else:
                 # SQLite bulk insert - need to insert one at a time to get IDs, or use last_insert_rowid()
                 if transactions_to_insert:
@@ -20867,14 +20598,12 @@ def business_upload_bank_file():
                         transactions_to_insert[idx]['id'] = tx_id
                     
                     cursor_bulk.close()
-                    print(f"[BUSINESS BANK UPLOAD] Bulk insert complete: {len(transactions_to_insert)} transactions inserted", flush=True)
-                    sys.stdout.flush()
+                    upload_log.info(f"Bulk insert complete: {len(transactions_to_insert)} transactions inserted")
             
             # ===== BATCH UPDATE: Update mapped transactions with tickers =====
             mapped_transactions = [tx for tx in transactions_to_insert if tx.get('status') == 'mapped' and tx.get('ticker')]
             if mapped_transactions:
-                print(f"[BUSINESS BANK UPLOAD] Bulk updating {len(mapped_transactions)} mapped transactions...", flush=True)
-                sys.stdout.flush()
+                upload_log.info(f"Bulk updating {len(mapped_transactions)} mapped transactions...")
                 
                 if db_manager._use_postgresql:
                     from sqlalchemy import text
@@ -20901,8 +20630,7 @@ def business_upload_bank_file():
                     ''', update_data)
                     cursor_update.close()
                 
-                print(f"[BUSINESS BANK UPLOAD] Bulk update complete: {len(mapped_transactions)} transactions mapped", flush=True)
-                sys.stdout.flush()
+                upload_log.info(f"Bulk update complete: {len(mapped_transactions)} transactions mapped")
             
             # ===== BATCH INSERT: Create LLM mapping records =====
             mappings_to_create = []
@@ -20930,8 +20658,7 @@ def business_upload_bank_file():
                         })
             
             if mappings_to_create:
-                print(f"[BUSINESS BANK UPLOAD] Bulk inserting {len(mappings_to_create)} LLM mapping records...", flush=True)
-                sys.stdout.flush()
+                upload_log.info(f"Bulk inserting {len(mappings_to_create)} LLM mapping records...")
                 
                 if db_manager._use_postgresql:
                     from sqlalchemy import text
@@ -20945,7 +20672,7 @@ def business_upload_bank_file():
                         except Exception as mapping_insert_err:
                             # Ignore duplicate key errors
                             if 'unique' not in str(mapping_insert_err).lower() and 'duplicate' not in str(mapping_insert_err).lower():
-                                print(f"[BUSINESS BANK UPLOAD] Warning: Could not create mapping record: {mapping_insert_err}")
+                                upload_log.warning(f"Could not create mapping record: {mapping_insert_err}")
                 else:
                     cursor_mapping = conn.cursor()
                     mapping_data = [(
@@ -20961,11 +20688,10 @@ def business_upload_bank_file():
                     except Exception as mapping_insert_err:
                         # Ignore duplicate key errors
                         if 'unique' not in str(mapping_insert_err).lower() and 'duplicate' not in str(mapping_insert_err).lower():
-                            print(f"[BUSINESS BANK UPLOAD] Warning: Could not create mapping records: {mapping_insert_err}")
+                            upload_log.warning(f"Could not create mapping records: {mapping_insert_err}")
                     cursor_mapping.close()
                 
-                print(f"[BUSINESS BANK UPLOAD] Bulk LLM mapping insert complete: {len(mappings_to_create)} records", flush=True)
-                sys.stdout.flush()
+                upload_log.info(f"Bulk LLM mapping insert complete: {len(mappings_to_create)} records")
             
             # ===== COMMIT ALL CHANGES WITH VERIFICATION =====
             # Get count before commit for verification
@@ -20980,8 +20706,7 @@ def business_upload_bank_file():
             
             # Commit transaction
             conn.commit()
-            print(f"[BUSINESS BANK UPLOAD] Committed {len(transactions_to_insert)} transactions to database (bulk operation)", flush=True)
-            sys.stdout.flush()
+            upload_log.info(f"Committed {len(transactions_to_insert)} transactions to database (bulk operation)")
             
             # CRITICAL: Verify transactions were actually saved using FRESH connection
             verify_conn = db_manager.get_connection()
@@ -20999,14 +20724,13 @@ def business_upload_bank_file():
                 expected_count = count_before + len(transactions_to_insert)
                 
                 if saved_count != expected_count:
-                    print(f"[BUSINESS BANK UPLOAD] ⚠️  WARNING: Count mismatch!", flush=True)
-                    print(f"[BUSINESS BANK UPLOAD] Expected {expected_count} transactions, but database has {saved_count}", flush=True)
-                    print(f"[BUSINESS BANK UPLOAD] Before: {count_before}, Inserted: {len(transactions_to_insert)}, After: {saved_count}", flush=True)
+                    upload_log.warning("Count mismatch!")
+                    upload_log.warning(f"Expected {expected_count} transactions, but database has {saved_count}")
+                    upload_log.warning(f"Before: {count_before}, Inserted: {len(transactions_to_insert)}, After: {saved_count}")
                 else:
-                    print(f"[BUSINESS BANK UPLOAD] ✅ Verification PASSED: {saved_count} total transactions for user {user_id} (expected {expected_count})", flush=True)
+                    upload_log.info(f"✅ Verification PASSED: {saved_count} total transactions for user {user_id} (expected {expected_count})")
                 
-                print(f"[BUSINESS BANK UPLOAD] Verification: {saved_count} total transactions now in database for user {user_id}", flush=True)
-                sys.stdout.flush()
+                upload_log.info(f"Verification: {saved_count} total transactions now in database for user {user_id}")
             finally:
                 if db_manager._use_postgresql:
                     db_manager.release_connection(verify_conn)
@@ -21020,8 +20744,8 @@ def business_upload_bank_file():
                 conn.close()
         except Exception as commit_err:
             import traceback
-            print(f"[BUSINESS BANK UPLOAD] CRITICAL ERROR during commit: {commit_err}")
-            print(f"[BUSINESS BANK UPLOAD] Traceback: {traceback.format_exc()}")
+            upload_log.error(f"CRITICAL ERROR during commit: {commit_err}")
+            upload_log.error(f"Traceback: {traceback.format_exc()}")
             if db_manager._use_postgresql:
                 conn.rollback()
                 db_manager.release_connection(conn)
@@ -21035,10 +20759,9 @@ def business_upload_bank_file():
         
         elapsed_time = time.time() - start_time
         actual_processed = len(transactions_to_insert)
-        print(f"[BUSINESS BANK UPLOAD] ===== PROCESSING COMPLETE in {elapsed_time:.2f} seconds =====")
-        print(f"[BUSINESS BANK UPLOAD] Processed {actual_processed} transactions, {len(errors)} errors")
-        print(f"[BUSINESS BANK UPLOAD] Performance: {actual_processed/elapsed_time:.1f} transactions/second", flush=True)
-        sys.stdout.flush()
+        upload_log.info(f"===== PROCESSING COMPLETE in {elapsed_time:.2f} seconds =====")
+        upload_log.info(f"Processed {actual_processed} transactions, {len(errors)} errors")
+        upload_log.info(f"Performance: {actual_processed/elapsed_time:.1f} transactions/second")
         
         return jsonify({
             'success': True,
@@ -21055,8 +20778,8 @@ def business_upload_bank_file():
     
     except Exception as e:
         import traceback
-        print(f"[ERROR] Failed to process business bank file: {str(e)}")
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        upload_log.error(f"Failed to process business bank file: {str(e)}")
+        upload_log.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'success': False, 'error': f'Failed to process file: {str(e)}'}), 500
 
 @app.route('/api/mx/connect', methods=['POST'])
@@ -21617,7 +21340,7 @@ def validate_messaging_connection():
         
         # Verify token and get current user
         try:
-            decoded = jwt.decode(token, 'kamioi_secret_key', algorithms=['HS256'])
+            decoded = jwt_decode_cache.decode(token, 'kamioi_secret_key', algorithms=['HS256'])
             current_user_id = decoded.get('user_id')
         except jwt.InvalidTokenError:
             return jsonify({'success': False, 'error': 'Invalid token'}), 401
@@ -21645,18 +21368,6 @@ def validate_messaging_connection():
         conn = db_manager.get_connection()
         cursor = conn.cursor()
         
-        # Check if users table has invite_code column, if not create it
-        cursor.execute("PRAGMA table_info(users)")
-        columns_info = cursor.fetchall()
-        column_names = [col[1] for col in columns_info]
-        
-        if 'invite_code' not in column_names:
-            try:
-                cursor.execute("ALTER TABLE users ADD COLUMN invite_code TEXT")
-                conn.commit()
-            except sqlite3.OperationalError:
-                pass  # Column might already exist
-        
         # Query user by ID, email, and invite_code
         query = "SELECT id, name, email, account_number, dashboard FROM users WHERE id = ? AND email = ? AND invite_code = ?"
         cursor.execute(query, (target_user_id, target_email, invite_code))
@@ -0,0 +1,194 @@
+"""
+Daily Behaviour Rollup
+Per-day transaction aggregates for MarketMonitor, maintained incrementally.
+
+MarketMonitor used to rescan the last 30 days of transactions on every
+update_market_conditions call. Here each day is summarised once into
+daily_behavior_rollup (schema migration 9), and the monitor reads at most
+a month of rollup rows however many transactions there are.
+
+- a watermark (the highest transaction id already rolled up) is kept in
+  behavior_rollup_state; each refresh recomputes only the days touched by
+  newer transactions, plus today so late edits to today's rows are seen
+- days are recomputed from the raw rows, not patched, so a refresh is
+  idempotent and concurrent refreshes cannot double count
+- sums of squares are stored next to the sums, so the fee and amount
+  volatility over any window is exact, not an average of daily figures
+- edits or deletes of older transactions are not tracked by the
+  watermark; rebuild() recomputes every day from scratch
+"""
+
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import sqlite_db_path
+from utils.log import get_logger
+
+log = get_logger('behavior_rollup')
+
+ROLLUP_COLUMNS = ('day', 'active_users', 'transaction_count', 'roundup_volume', 'amount_total', 'amount_count',
+                  'amount_nonzero_count', 'amount_sq_total', 'fee_total', 'fee_count', 'fee_nonzero_count',
+                  'fee_sq_total')
+
+# One row per day; the COUNT(x) / SUM(x) pairs mirror what AVG(x) and the
+# "truthy values only" filters of the old Python loops saw
+_DAY_AGGREGATE = """
+    SELECT DATE(created_at) AS day,
+           COUNT(DISTINCT user_id),
+           COUNT(*),
+           COALESCE(SUM(round_up), 0),
+           COALESCE(SUM(amount), 0),
+           COUNT(amount),
+           COUNT(CASE WHEN amount != 0 THEN 1 END),
+           COALESCE(SUM(amount * amount), 0),
+           COALESCE(SUM(fee), 0),
+           COUNT(fee),
+           COUNT(CASE WHEN fee != 0 THEN 1 END),
+           COALESCE(SUM(fee * fee), 0)
+    FROM transactions
+    WHERE created_at >= ? AND created_at < ?
+    GROUP BY DATE(created_at)
+"""
+
+
+class BehaviorRollup:
+    """
+    Incrementally maintained daily transaction rollup.
+
+    Example:
+        rollup = BehaviorRollup('kamioi.db')
+        rollup.refresh()              # roll up transactions added since the last run
+        series = rollup.series(30)    # NumPy arrays, one entry per day with activity
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or sqlite_db_path()
+
+    def refresh(self, today: Optional[date] = None) -> Dict:
+        """Recompute the days touched since the watermark; returns what was done"""
+        today = today or _utc_today()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            watermark = self._watermark(conn)
+            high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+            days = {row[0] for row in conn.execute(
+                "SELECT DISTINCT DATE(created_at) FROM transactions WHERE id > ? AND id <= ?",
+                (watermark, high)) if row[0]}
+            days.add(today.isoformat())
+            for day in sorted(days):
+                self._recompute_day(conn, day)
+            self._set_watermark(conn, high)
+            conn.commit()
+        finally:
+            conn.close()
+        return {'days_recomputed': len(days), 'watermark': high}
+
+    def rebuild(self) -> Dict:
+        """Drop every rollup row and recompute all days from the raw transactions"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("DELETE FROM daily_behavior_rollup")
+            conn.execute("DELETE FROM behavior_rollup_state")
+            conn.commit()
+        finally:
+            conn.close()
+        return self.refresh()
+
+    def series(self, days: int = 30, today: Optional[date] = None) -> Dict[str, np.ndarray]:
+        """Rollup columns for days on or after today - `days`, oldest first"""
+        since = ((today or _utc_today()) - timedelta(days=days)).isoformat()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(f"""
+                SELECT {', '.join(ROLLUP_COLUMNS)} FROM daily_behavior_rollup
+                WHERE day >= ?
+                ORDER BY day
+            """, (since,)).fetchall()
+        finally:
+            conn.close()
+        columns = list(zip(*rows)) if rows else [()] * len(ROLLUP_COLUMNS)
+        series = {'day': list(columns[0])}
+        for name, values in zip(ROLLUP_COLUMNS[1:], columns[1:]):
+            series[name] = np.asarray(values, dtype=float)
+        return series
+
+    def _recompute_day(self, conn, day: str):
+        start = datetime.strptime(day, '%Y-%m-%d').date()
+        rows = conn.execute(_DAY_AGGREGATE, (day, (start + timedelta(days=1)).isoformat())).fetchall()
+        # Only rows whose DATE() is this day belong to its rollup row
+        rows = [row for row in rows if row[0] == day]
+        if not rows:
+            conn.execute("DELETE FROM daily_behavior_rollup WHERE day = ?", (day,))
+            return
+        conn.execute(f"""
+            INSERT OR REPLACE INTO daily_behavior_rollup ({', '.join(ROLLUP_COLUMNS)}, updated_at)
+            VALUES ({', '.join('?' * len(ROLLUP_COLUMNS))}, CURRENT_TIMESTAMP)
+        """, rows[0])
+
+    @staticmethod
+    def _watermark(conn) -> int:
+        row = conn.execute("SELECT last_transaction_id FROM behavior_rollup_state WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _set_watermark(conn, transaction_id: int):
+        conn.execute("""
+            INSERT OR REPLACE INTO behavior_rollup_state (id, last_transaction_id, updated_at)
+            VALUES (1, ?, CURRENT_TIMESTAMP)
+        """, (transaction_id,))
+
+
+def _utc_today() -> date:
+    """Same day as SQLite's date('now'), which the old 30-day window used"""
+    return datetime.utcnow().date()
+
+
+def pooled_volatility(count: np.ndarray, total: np.ndarray, sq_total: np.ndarray) -> Optional[float]:
+    """Coefficient of variation (population std / mean) of all values behind the daily sums"""
+    n = count.sum()
+    if n < 2:
+        return None
+    mean = total.sum() / n
+    if mean <= 0:
+        return None
+    variance = max(0.0, sq_total.sum() / n - mean * mean)
+    return float(np.sqrt(variance) / mean)
+
+
+def growth_rate(values: np.ndarray) -> float:
+    """Relative change of the mean of the second half of the series over the first half"""
+    if len(values) < 2:
+        return 0.0
+    half = len(values) // 2
+    first_avg = values[:half].mean()
+    if first_avg == 0:
+        return 0.0
+    return float((values[half:].mean() - first_avg) / first_avg)
+
+
+def behavior_volatility(counts: np.ndarray) -> float:
+    """Coefficient of variation of the daily transaction counts, clamped to [0, 1]"""
+    if len(counts) < 3:
+        return 0.5
+    mean_count = counts.mean()
+    volatility = counts.std() / mean_count if mean_count > 0 else 0.5
+    return float(min(1.0, max(0.0, volatility)))
+
+
+def main(argv: List[str] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Refresh the daily behaviour rollup')
+    parser.add_argument('--db', default='kamioi.db')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute every day from scratch')
+    args = parser.parse_args(argv)
+    rollup = BehaviorRollup(args.db)
+    result = rollup.rebuild() if args.rebuild else rollup.refresh()
+    log.info("Behaviour rollup: %d days recomputed, watermark %d", result['days_recomputed'], result['watermark'])
+    print(f"Recomputed {result['days_recomputed']} days (watermark {result['watermark']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""
+Benchmark suite for Kamioi Platform
+
+Deterministic synthetic data plus micro/macro benchmarks whose results are
+written as JSON and compared against a stored baseline:
+
+    cd backend
+    python -m benchmarks --scale 10k --output results.json
+    python -m benchmarks --scale 10k --baseline benchmarks/baseline.json   # exit 1 on regression
+    python -m benchmarks --scale 10k --update-baseline benchmarks/baseline.json
+    python -m benchmarks.startup                       # import-time profile, time to first request
+
+Scales: 10k (CI), 1m and 10m (users/transactions/llm_mappings written to a
+temporary SQLite file; 10m needs several GB of disk and a few minutes).
+"""
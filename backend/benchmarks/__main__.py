@@ -0,0 +1,85 @@
+"""
+Run the benchmark suite:
+
+    python -m benchmarks --scale 10k [--suite micro] [--only micro.map_merchant]
+                         [--output results.json] [--baseline benchmarks/baseline.json]
+                         [--update-baseline benchmarks/baseline.json] [--keep-db DIR]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Kamioi benchmark suite')
+    parser.add_argument('--scale', default='10k', choices=['10k', '1m', '10m'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--suite', action='append', choices=['micro', 'macro'],
+                        help='Suites to run (default: both)')
+    parser.add_argument('--only', action='append', help='Only run benchmarks whose name starts with this')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Compare against this results JSON; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed median slowdown (fraction)')
+    parser.add_argument('--update-baseline', metavar='PATH', help='Write results as the new baseline')
+    parser.add_argument('--keep-db', metavar='DIR', help='Keep the synthetic database in DIR')
+    args = parser.parse_args(argv)
+
+    workdir = args.keep_db or tempfile.mkdtemp(prefix='kamioi-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, f'bench_{args.scale}_{args.seed}.db')
+
+    # Must be set before anything imports database_manager (its global instance reads them)
+    os.environ['DB_TYPE'] = 'sqlite'
+    os.environ['KAMIOI_DB_PATH'] = db_path
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from benchmarks import harness, macro, micro, synthetic
+
+    try:
+        sizes = synthetic.SCALES[args.scale]
+        if not os.path.exists(db_path):
+            started = time.perf_counter()
+            print(f"[BENCH] Generating {args.scale} dataset (seed {args.seed}) at {db_path}")
+            synthetic.generate(db_path, scale=args.scale, seed=args.seed)
+            print(f"[BENCH] Dataset ready in {time.perf_counter() - started:.1f}s")
+        context = {'db_path': db_path, 'scale': args.scale, 'seed': args.seed, 'sizes': sizes}
+
+        benchmarks = []
+        for name, module in (('micro', micro), ('macro', macro)):
+            if not args.suite or name in args.suite:
+                benchmarks.extend(module.build(context))
+        results = harness.run_all(benchmarks, only=args.only)
+        report = harness.build_report(results, {'scale': args.scale, 'seed': args.seed, 'sizes': sizes})
+
+        if args.output:
+            harness.write_report(report, args.output)
+            print(f"[BENCH] Results written to {args.output}")
+        if args.update_baseline:
+            harness.write_report(report, args.update_baseline)
+            print(f"[BENCH] Baseline updated: {args.update_baseline}")
+
+        failed = [name for name, result in results.items() if 'error' in result]
+        if args.baseline:
+            comparison = harness.compare(report, harness.load_report(args.baseline), tolerance=args.tolerance)
+            for entry in comparison['regressions']:
+                print(f"[REGRESSION] {entry['name']}: {entry['baseline_ms']:.3f} -> {entry['current_ms']:.3f} ms "
+                      f"({entry['change']:+.0%})")
+            for entry in comparison['improvements']:
+                print(f"[IMPROVED]   {entry['name']}: {entry['baseline_ms']:.3f} -> {entry['current_ms']:.3f} ms "
+                      f"({entry['change']:+.0%})")
+            for name in comparison['missing']:
+                print(f"[NO BASELINE] {name}")
+            if comparison['regressions']:
+                return 1
+        return 1 if failed else 0
+    finally:
+        if not args.keep_db:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Timing, result files and baseline comparison for the benchmark suite.
+
+Each benchmark is a zero-argument callable (optionally built by a setup
+function) timed `repeat` times after `warmup` untimed runs; the median is
+what baselines compare, since it is the statistic least disturbed by a
+noisy neighbour.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], object]
+    repeat: int = 5
+    warmup: int = 1
+    number: int = 1  # calls per timed sample; per-call time is reported
+
+
+def run_benchmark(bench: Benchmark) -> Dict:
+    for _ in range(bench.warmup):
+        bench.func()
+    samples = []
+    for _ in range(bench.repeat):
+        started = time.perf_counter()
+        for _ in range(bench.number):
+            bench.func()
+        samples.append((time.perf_counter() - started) * 1000.0 / bench.number)
+    samples.sort()
+    p95_index = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+    return {
+        'median_ms': round(statistics.median(samples), 4),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'min_ms': round(samples[0], 4),
+        'p95_ms': round(samples[p95_index], 4),
+        'stdev_ms': round(statistics.stdev(samples), 4) if len(samples) > 1 else 0.0,
+        'repeat': bench.repeat,
+        'number': bench.number
+    }
+
+
+def run_all(benchmarks: List[Benchmark], only: Optional[List[str]] = None, log=print) -> Dict[str, Dict]:
+    results = {}
+    for bench in benchmarks:
+        if only and not any(bench.name.startswith(prefix) for prefix in only):
+            continue
+        try:
+            results[bench.name] = run_benchmark(bench)
+            log(f"[BENCH] {bench.name:<45} median {results[bench.name]['median_ms']:>10.3f} ms")
+        except Exception as e:
+            results[bench.name] = {'error': f"{type(e).__name__}: {e}"}
+            log(f"[BENCH] {bench.name:<45} FAILED: {e}")
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def build_report(results: Dict[str, Dict], meta: Dict) -> Dict:
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'git_commit': _git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            **meta
+        },
+        'results': results
+    }
+
+
+def write_report(report: Dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_report(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = 0.20, min_delta_ms: float = 0.05) -> Dict:
+    """
+    Compare medians against a baseline report.
+
+    A benchmark regresses when it is more than `tolerance` (fractional) slower
+    and the absolute difference exceeds `min_delta_ms`, which keeps
+    sub-microsecond noise on tiny benchmarks from failing a deploy.
+    """
+    regressions, improvements, unchanged, missing = [], [], [], []
+    base_results = baseline.get('results', {})
+    for name, result in current.get('results', {}).items():
+        base = base_results.get(name)
+        if not base or 'median_ms' not in base or 'median_ms' not in result:
+            missing.append(name)
+            continue
+        before, after = base['median_ms'], result['median_ms']
+        change = (after - before) / before if before else 0.0
+        entry = {'name': name, 'baseline_ms': before, 'current_ms': after, 'change': round(change, 4)}
+        if change > tolerance and after - before > min_delta_ms:
+            regressions.append(entry)
+        elif change < -tolerance and before - after > min_delta_ms:
+            improvements.append(entry)
+        else:
+            unchanged.append(entry)
+    if baseline.get('meta', {}).get('scale') != current.get('meta', {}).get('scale'):
+        missing.append('(baseline recorded at a different scale)')
+    return {'regressions': regressions, 'improvements': improvements, 'unchanged': unchanged,
+            'missing': missing, 'tolerance': tolerance}
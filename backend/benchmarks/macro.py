@@ -0,0 +1,64 @@
+"""
+Macrobenchmarks: upload and dashboard endpoints through the Flask test
+client against the synthetic database. Upload benchmarks insert rows on
+every run, so later samples see a slightly larger table; keep `repeat` small.
+"""
+
+import io
+from typing import Dict, List
+
+from benchmarks.harness import Benchmark
+from benchmarks.synthetic import BENCH_ADMIN_ID, bank_statement_csv, mapping_upload_csv
+
+BUSINESS_USER_ID = 3  # synthetic.generate always makes user 3 a business account
+INDIVIDUAL_USER_ID = 4
+
+DASHBOARD_ENDPOINTS = [
+    ('admin', '/api/admin/dashboard/overview'),
+    ('admin', '/api/admin/transactions?limit=100'),
+    ('admin', '/api/admin/llm-center/dashboard'),
+    ('admin', '/api/admin/financial-analytics'),
+    ('user', '/api/user/transactions'),
+    ('user', '/api/user/portfolio'),
+    ('business', '/api/business/dashboard/overview'),
+    ('business', '/api/business/portfolio'),
+]
+
+
+def _checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def build(context: Dict) -> List[Benchmark]:
+    import app as app_module
+
+    app_module.app.testing = True
+    client = app_module.app.test_client()
+    tokens = {
+        'admin': f'admin_token_{BENCH_ADMIN_ID}',
+        'user': f'user_token_{INDIVIDUAL_USER_ID}',
+        'business': f'business_token_{BUSINESS_USER_ID}',
+    }
+
+    def get(kind, path):
+        return lambda: _checked(client.get(path, headers={'Authorization': f'Bearer {tokens[kind]}'}))
+
+    def post_file(kind, path, payload, filename):
+        return lambda: _checked(client.post(
+            path, headers={'Authorization': f'Bearer {tokens[kind]}'},
+            data={'file': (io.BytesIO(payload), filename)}, content_type='multipart/form-data'))
+
+    mappings_csv = mapping_upload_csv(1000, seed=context['seed'])
+    bank_csv = bank_statement_csv(200, seed=context['seed'])
+
+    benchmarks = [
+        Benchmark('macro.admin_bulk_upload[1000]',
+                  post_file('admin', '/api/admin/bulk-upload', mappings_csv, 'mappings.csv'), repeat=3),
+        Benchmark('macro.business_upload_bank_file[200]',
+                  post_file('business', '/api/business/upload-bank-file', bank_csv, 'statement.csv'), repeat=3),
+    ]
+    for kind, path in DASHBOARD_ENDPOINTS:
+        benchmarks.append(Benchmark(f"macro.GET {path.split('?')[0]}", get(kind, path), repeat=5))
+    return benchmarks
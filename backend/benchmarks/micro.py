@@ -0,0 +1,47 @@
+"""
+Microbenchmarks: merchant mapping, company-name normalization, RAG search
+and the paginated mapping query. Each sample processes a fixed batch, so the
+reported time is per batch.
+"""
+
+import random
+from typing import Dict, List
+
+from benchmarks.harness import Benchmark
+from benchmarks.synthetic import BRANDS, UNKNOWN_MERCHANTS, noisy_merchant
+
+RAG_QUERIES = ['how is the roundup fee calculated', 'llm data assets amortization', 'auto invest',
+               'which api endpoints are expensive', 'system architecture database', 'family dashboard goals']
+
+
+def build(context: Dict) -> List[Benchmark]:
+    from auto_mapping_pipeline import AutoMappingPipeline
+    from database_manager import DatabaseManager
+    from rag_system import KamioiRAGSystem
+    from ticker_company_lookup import get_ticker_from_company_name, validate_ticker_company_match
+
+    rng = random.Random(context['seed'])
+    known = [noisy_merchant(rng, rng.choice(BRANDS)[0]) for _ in range(1000)]
+    unknown = [noisy_merchant(rng, rng.choice(UNKNOWN_MERCHANTS)) for _ in range(200)]
+    companies = [rng.choice(BRANDS)[3] for _ in range(1000)]
+    pairs = [(brand[1], brand[3] if rng.random() < 0.5 else brand[0]) for brand in
+             (rng.choice(BRANDS) for _ in range(1000))]
+
+    pipeline = AutoMappingPipeline()
+    rag = KamioiRAGSystem(context['db_path'])
+    db = DatabaseManager(db_path=context['db_path'])
+
+    return [
+        Benchmark('micro.map_merchant.known[1000]', lambda: [pipeline.map_merchant(m) for m in known]),
+        Benchmark('micro.map_merchant.unknown[200]', lambda: [pipeline.map_merchant(m) for m in unknown]),
+        Benchmark('micro.normalize.ticker_from_company[1000]',
+                  lambda: [get_ticker_from_company_name(c) for c in companies]),
+        Benchmark('micro.normalize.validate_ticker_company[1000]',
+                  lambda: [validate_ticker_company_match(t, c) for t, c in pairs]),
+        Benchmark('micro.rag.search[6]', lambda: [rag.search(q) for q in RAG_QUERIES], repeat=10),
+        Benchmark('micro.db.llm_mappings_paginated.first_page',
+                  lambda: db.get_llm_mappings_paginated(status='approved', limit=50), repeat=10),
+        Benchmark('micro.db.llm_mappings_paginated.deep_page',
+                  lambda: db.get_llm_mappings_paginated(limit=50, offset=context['sizes']['llm_mappings'] // 2),
+                  repeat=5),
+    ]
@@ -0,0 +1,141 @@
+"""
+Cold-start profile: import-time report and time to first request.
+
+Runs the app in fresh interpreters (so nothing is already imported), using
+`python -X importtime` for the per-module breakdown:
+
+    cd backend
+    python -m benchmarks.startup                    # top modules + time to first request
+    python -m benchmarks.startup --top 40 --json startup.json
+    python -m benchmarks.startup --fail-on-heavy    # exit 1 if a heavy optional module loads eagerly
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Optional dependencies that should only load when a request actually needs them
+HEAVY_MODULES = ('numpy', 'pandas', 'stripe', 'pytesseract', 'PIL', 'alpaca_trade_api', 'requests', 'openai')
+
+_FIRST_REQUEST_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+from utils.lazy_import import is_loaded
+print(json.dumps({'import_ms': (imported - started) * 1000, 'first_request_ms': (finished - imported) * 1000,
+                  'status': response.status_code, 'loaded': [m for m in sys.argv[2:] if is_loaded(m)]}))
+"""
+
+
+def _env(db_path: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({'DB_TYPE': 'sqlite', 'KAMIOI_DB_PATH': db_path, 'LOG_LEVEL': 'WARNING'})
+    return env
+
+
+def parse_importtime(text: str) -> List[Dict]:
+    """Parse `-X importtime` stderr into [{module, self_ms, cumulative_ms, depth}] in import order"""
+    modules = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+            modules.append({'module': name.strip(), 'self_ms': int(self_us) / 1000.0,
+                            'cumulative_ms': int(cumulative_us) / 1000.0, 'depth': depth})
+        except ValueError:
+            continue
+    return modules
+
+
+def profile_imports(target: str = 'app', db_path: str = None) -> List[Dict]:
+    db_path = db_path or os.path.join(tempfile.mkdtemp(prefix='kamioi-startup-'), 'startup.db')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {target}'], cwd=BACKEND_DIR,
+                          env=_env(db_path), capture_output=True, text=True, timeout=300)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def time_to_first_request(path: str = '/api/health', runs: int = 3, db_path: str = None) -> Dict:
+    """Process start -> app imported -> first response, median over `runs` fresh interpreters"""
+    db_path = db_path or os.path.join(tempfile.mkdtemp(prefix='kamioi-startup-'), 'startup.db')
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', _FIRST_REQUEST_SNIPPET, path, *HEAVY_MODULES],
+                              cwd=BACKEND_DIR, env=_env(db_path), capture_output=True, text=True, timeout=300)
+        wall_ms = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            raise RuntimeError(f"first request failed:\n{proc.stderr[-2000:]}")
+        sample = json.loads(proc.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = wall_ms
+        samples.append(sample)
+    return {
+        'path': path,
+        'runs': runs,
+        'status': samples[-1]['status'],
+        'process_ms': round(statistics.median(s['process_ms'] for s in samples), 1),
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'first_request_ms': round(statistics.median(s['first_request_ms'] for s in samples), 1),
+        'heavy_modules_loaded': samples[-1]['loaded']
+    }
+
+
+def summarize(modules: List[Dict], top: int = 25) -> Dict:
+    by_cumulative = sorted(modules, key=lambda m: m['cumulative_ms'], reverse=True)
+    by_self = sorted(modules, key=lambda m: m['self_ms'], reverse=True)
+    roots = [m for m in modules if m['depth'] == 0]
+    return {
+        'modules': len(modules),
+        'total_ms': round(sum(m['cumulative_ms'] for m in roots), 1),
+        'top_cumulative': by_cumulative[:top],
+        'top_self': by_self[:top]
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Import-time profile and time to first request')
+    parser.add_argument('--target', default='app', help='Module to import (default: app)')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--path', default='/api/health', help='Route for the first request')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--json', metavar='PATH', help='Also write the report as JSON')
+    parser.add_argument('--fail-on-heavy', action='store_true',
+                        help=f"Exit 1 if any of {', '.join(HEAVY_MODULES)} is loaded by startup")
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='kamioi-startup-'), 'startup.db')
+    report = summarize(profile_imports(args.target, db_path), top=args.top)
+    report['first_request'] = time_to_first_request(args.path, args.runs, db_path)
+
+    print(f"[STARTUP] {report['modules']} modules imported in {report['total_ms']:.1f} ms (importtime)")
+    print(f"[STARTUP] {'module':<50} {'cumulative':>11} {'self':>9}")
+    for entry in report['top_cumulative']:
+        print(f"[STARTUP] {'  ' * min(entry['depth'], 6) + entry['module']:<50} "
+              f"{entry['cumulative_ms']:>9.1f}ms {entry['self_ms']:>7.1f}ms")
+    first = report['first_request']
+    print(f"[STARTUP] Time to first request ({first['path']} -> {first['status']}): {first['process_ms']:.0f} ms "
+          f"(import {first['import_ms']:.0f} ms, request {first['first_request_ms']:.0f} ms, median of {first['runs']})")
+    print(f"[STARTUP] Heavy modules loaded at startup: {', '.join(first['heavy_modules_loaded']) or 'none'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if args.fail_on_heavy and first['heavy_modules_loaded'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+The same (scale, seed) always yields byte-identical rows, so timings from
+different commits are comparable. Rows are generated in chunks and written
+with executemany, so 10M-row datasets never sit in memory at once.
+"""
+
+import csv
+import io
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+SCALES = {
+    '10k': {'users': 200, 'transactions': 10_000, 'llm_mappings': 10_000},
+    '1m': {'users': 5_000, 'transactions': 1_000_000, 'llm_mappings': 1_000_000},
+    '10m': {'users': 50_000, 'transactions': 10_000_000, 'llm_mappings': 10_000_000},
+}
+
+# (merchant, ticker, category, company) - mirrors the brands the mapping pipeline knows
+BRANDS = [
+    ('Starbucks', 'SBUX', 'Food & Dining', 'Starbucks Corporation'),
+    ("McDonald's", 'MCD', 'Food & Dining', "McDonald's Corporation"),
+    ('Chipotle', 'CMG', 'Food & Dining', 'Chipotle Mexican Grill'),
+    ("Domino's", 'DPZ', 'Food & Dining', "Domino's Pizza"),
+    ('Taco Bell', 'YUM', 'Food & Dining', 'Yum! Brands'),
+    ('Amazon', 'AMZN', 'Shopping', 'Amazon.com Inc.'),
+    ('Target', 'TGT', 'Shopping', 'Target Corporation'),
+    ('Walmart', 'WMT', 'Shopping', 'Walmart Inc.'),
+    ('Costco', 'COST', 'Shopping', 'Costco Wholesale'),
+    ('Home Depot', 'HD', 'Shopping', 'The Home Depot'),
+    ("Lowe's", 'LOW', 'Shopping', "Lowe's Companies"),
+    ('Best Buy', 'BBY', 'Electronics', 'Best Buy Co.'),
+    ('Apple Store', 'AAPL', 'Electronics', 'Apple Inc.'),
+    ('Netflix', 'NFLX', 'Entertainment', 'Netflix Inc.'),
+    ('Spotify', 'SPOT', 'Entertainment', 'Spotify Technology'),
+    ('Disney Plus', 'DIS', 'Entertainment', 'The Walt Disney Company'),
+    ('Uber', 'UBER', 'Transportation', 'Uber Technologies'),
+    ('Lyft', 'LYFT', 'Transportation', 'Lyft Inc.'),
+    ('Shell', 'SHEL', 'Gas', 'Shell plc'),
+    ('Exxon', 'XOM', 'Gas', 'Exxon Mobil'),
+    ('Chevron', 'CVX', 'Gas', 'Chevron Corporation'),
+    ('CVS Pharmacy', 'CVS', 'Health', 'CVS Health'),
+    ('Walgreens', 'WBA', 'Health', 'Walgreens Boots Alliance'),
+    ('Nike', 'NKE', 'Clothing', 'Nike Inc.'),
+    ('Dollar Tree', 'DLTR', 'Shopping', 'Dollar Tree Inc.'),
+    ('Kroger', 'KR', 'Groceries', 'The Kroger Co.'),
+    ('Microsoft', 'MSFT', 'Technology', 'Microsoft Corporation'),
+    ('Google', 'GOOGL', 'Technology', 'Alphabet Inc.'),
+    ('Delta Air Lines', 'DAL', 'Travel', 'Delta Air Lines'),
+    ('Marriott', 'MAR', 'Travel', 'Marriott International'),
+]
+UNKNOWN_MERCHANTS = ['Joes Diner', 'Corner Market', 'City Parking', 'Main St Laundry', 'Local Hardware',
+                     'Farmers Market', 'Bobs Auto Repair', 'Sunrise Bakery']
+CITIES = [('SEATTLE', 'WA'), ('AUSTIN', 'TX'), ('DENVER', 'CO'), ('MIAMI', 'FL'), ('BOSTON', 'MA'),
+          ('CHICAGO', 'IL'), ('PORTLAND', 'OR'), ('ATLANTA', 'GA')]
+ACCOUNT_TYPES = ['individual'] * 7 + ['family'] * 2 + ['business']
+
+BENCH_ADMIN_ID = 1
+BULK_UPLOAD_USER_ID = 2  # llm_mappings.user_id used by admin bulk uploads
+BASE_DATE = datetime(2025, 1, 1)
+
+
+def noisy_merchant(rng: random.Random, name: str) -> str:
+    """A bank-statement style descriptor, e.g. 'STARBUCKS STORE #1234 SEATTLE WA'"""
+    city, state = rng.choice(CITIES)
+    style = rng.randrange(4)
+    if style == 0:
+        return name
+    if style == 1:
+        return f"{name.upper()} #{rng.randrange(1, 9999):04d}"
+    if style == 2:
+        return f"{name.upper()} STORE {rng.randrange(1, 999)} {city} {state}"
+    return f"POS DEBIT {name.upper()} {city}"
+
+
+def merchant_sample(rng: random.Random, known_ratio: float = 0.85) -> Tuple[str, str, str, str]:
+    if rng.random() < known_ratio:
+        name, ticker, category, company = rng.choice(BRANDS)
+        return noisy_merchant(rng, name), ticker, category, company
+    name = rng.choice(UNKNOWN_MERCHANTS)
+    return noisy_merchant(rng, name), None, 'Other', None
+
+
+def _chunks(total: int, size: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _user_rows(rng: random.Random, count: int) -> List[Tuple]:
+    rows = []
+    for i in range(count):
+        user_id = i + 1
+        account_type = 'business' if user_id == 3 else rng.choice(ACCOUNT_TYPES)
+        city, state = rng.choice(CITIES)
+        rows.append((user_id, f"bench{user_id}@example.com", f"Bench User {user_id}", account_type,
+                     f"BM{user_id:08d}", 'benchmark', city.title(), state,
+                     (BASE_DATE - timedelta(days=rng.randrange(365))).isoformat()))
+    return rows
+
+
+def _transaction_rows(rng: random.Random, start: int, count: int, users: int) -> List[Tuple]:
+    rows = []
+    for i in range(start, start + count):
+        merchant, ticker, category, _ = merchant_sample(rng)
+        amount = round(rng.uniform(1.5, 250.0), 2)
+        date = (BASE_DATE + timedelta(minutes=i * 7 % (365 * 24 * 60))).isoformat()
+        roll = rng.random()
+        if ticker and roll < 0.6:
+            price = round(rng.uniform(20, 600), 2)
+            status, shares, price_per_share = 'completed', round(1.0 / price, 6), price
+        elif ticker and roll < 0.85:
+            status, shares, price_per_share = 'mapped', None, None
+        else:
+            status, ticker, shares, price_per_share = 'pending', None, None, None
+        rows.append((rng.randrange(3, users + 1) if users >= 3 else 1, date, merchant, amount, category,
+                     merchant, 1.0, 1.0, amount + 1.0, ticker, shares, price_per_share, price_per_share,
+                     status, 0.0, 'bank', date))
+    return rows
+
+
+def _mapping_rows(rng: random.Random, start: int, count: int, users: int) -> List[Tuple]:
+    rows = []
+    for i in range(start, start + count):
+        merchant, ticker, category, company = merchant_sample(rng, known_ratio=0.95)
+        if rng.random() < 0.9:
+            user_id, status, approved = BULK_UPLOAD_USER_ID, 'approved', 1
+        else:
+            user_id, status, approved = rng.randrange(3, users + 1) if users >= 3 else 1, \
+                rng.choice(['pending', 'approved', 'rejected']), 0
+        rows.append((i + 1, merchant, ticker, category, round(rng.uniform(50, 99), 1), status, approved, 1,
+                     company or merchant, str(user_id),
+                     (BASE_DATE + timedelta(seconds=i * 13)).isoformat()))
+    return rows
+
+
+def generate(db_path: str, scale: str = '10k', seed: int = 42, chunk_size: int = 50_000) -> Dict:
+    """Create the schema at db_path and fill it for the given scale; returns row counts"""
+    from database_manager import DatabaseManager
+    from positions import PositionStore
+
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    db = DatabaseManager(db_path=db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS admins (
+                id INTEGER PRIMARY KEY,
+                email TEXT UNIQUE NOT NULL,
+                name TEXT,
+                password TEXT NOT NULL,
+                role TEXT NOT NULL,
+                permissions TEXT,
+                is_active INTEGER DEFAULT 1
+            )
+        """)
+        conn.execute("INSERT OR REPLACE INTO admins (id, email, name, password, role, permissions, is_active) "
+                     "VALUES (?, 'bench-admin@example.com', 'Bench Admin', 'benchmark', 'admin', '{}', 1)",
+                     (BENCH_ADMIN_ID,))
+        conn.executemany("""
+            INSERT INTO users (id, email, name, account_type, account_number, password, city, state, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, _user_rows(rng, sizes['users']))
+        conn.commit()
+
+        for start, count in _chunks(sizes['transactions'], chunk_size):
+            conn.executemany("""
+                INSERT INTO transactions (user_id, date, merchant, amount, category, description, investable,
+                                          round_up, total_debit, ticker, shares, price_per_share, stock_price,
+                                          status, fee, transaction_type, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, _transaction_rows(rng, start, count, sizes['users']))
+            conn.commit()
+
+        for start, count in _chunks(sizes['llm_mappings'], chunk_size):
+            conn.executemany("""
+                INSERT INTO llm_mappings (transaction_id, merchant_name, ticker, category, confidence, status,
+                                          admin_approved, ai_processed, company_name, user_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, _mapping_rows(rng, start, count, sizes['users']))
+            conn.commit()
+
+        # Normally maintained by the scheduler (see optimize_large_dataset_performance.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_mappings_summary (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                total_mappings INTEGER,
+                approved_count INTEGER,
+                pending_count INTEGER,
+                rejected_count INTEGER,
+                daily_processed INTEGER,
+                avg_confidence REAL,
+                high_confidence_count INTEGER,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            INSERT INTO llm_mappings_summary (total_mappings, approved_count, pending_count, rejected_count,
+                                              daily_processed, avg_confidence, high_confidence_count)
+            SELECT COUNT(*), SUM(status = 'approved'), SUM(status = 'pending'), SUM(status = 'rejected'),
+                   0, AVG(confidence), SUM(confidence > 90)
+            FROM llm_mappings
+        """)
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+    positions = PositionStore(db_manager=db).rebuild()
+    return {**sizes, 'positions': positions, 'seed': seed, 'scale': scale}
+
+
+def bank_statement_csv(rows: int, seed: int = 7) -> bytes:
+    """A business bank export (Date, Description, Amount) for upload benchmarks"""
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['Date', 'Description', 'Amount', 'Category'])
+    for i in range(rows):
+        merchant, _, category, _ = merchant_sample(rng)
+        writer.writerow([(BASE_DATE + timedelta(hours=i)).strftime('%Y-%m-%d'), merchant,
+                         f"{-rng.uniform(2, 400):.2f}", category])
+    return out.getvalue().encode('utf-8')
+
+
+def mapping_upload_csv(rows: int, seed: int = 11) -> bytes:
+    """An admin bulk-upload sheet (merchant_name, ticker_symbol, category, confidence, notes)"""
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['merchant_name', 'ticker_symbol', 'category', 'confidence', 'notes'])
+    for _ in range(rows):
+        name, ticker, category, _ = rng.choice(BRANDS)
+        writer.writerow([noisy_merchant(rng, name), ticker, category, f"{rng.uniform(0.6, 0.99):.2f}", ''])
+    return out.getvalue().encode('utf-8')
@@ -19,6 +19,7 @@ from werkzeug.security import check_password_hash, generate_password_hash
 from . import admin_bp
 from database_manager import db_manager
 from blueprints.auth.helpers import get_auth_user, require_role
+from utils.auth_cache import principal_cache
 
 # 2FA imports
 try:
@@ -30,46 +31,6 @@ except ImportError:
     print("Warning: pyotp/qrcode not available - 2FA disabled")
 
 
-def ensure_2fa_columns():
-    """Ensure 2FA columns exist in admins table"""
-    try:
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            # Add totp_secret column if not exists
-            try:
-                conn.execute(text("ALTER TABLE admins ADD COLUMN IF NOT EXISTS totp_secret VARCHAR(64)"))
-                conn.commit()
-            except Exception:
-                pass
-            # Add totp_enabled column if not exists
-            try:
-                conn.execute(text("ALTER TABLE admins ADD COLUMN IF NOT EXISTS totp_enabled BOOLEAN DEFAULT FALSE"))
-                conn.commit()
-            except Exception:
-                pass
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-            # Check if columns exist for SQLite
-            cur.execute("PRAGMA table_info(admins)")
-            columns = [col[1] for col in cur.fetchall()]
-            if 'totp_secret' not in columns:
-                cur.execute("ALTER TABLE admins ADD COLUMN totp_secret TEXT")
-            if 'totp_enabled' not in columns:
-                cur.execute("ALTER TABLE admins ADD COLUMN totp_enabled INTEGER DEFAULT 0")
-            conn.commit()
-            conn.close()
-    except Exception as e:
-        print(f"Warning: Could not ensure 2FA columns: {e}")
-
-
-# Ensure 2FA columns exist on module load
-ensure_2fa_columns()
-
-
 # =============================================================================
 # Authentication Routes
 # =============================================================================
@@ -190,6 +151,9 @@ def admin_login():
 @admin_bp.route('/auth/logout', methods=['POST'])
 def admin_logout():
     """Admin logout endpoint"""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        principal_cache.invalidate_token(auth.split(' ', 1)[1].strip())
     return jsonify({'success': True, 'message': 'Admin logged out successfully'})
 
 
@@ -680,7 +644,7 @@ def admin_dashboard_overview():
                 SELECT
                     COUNT(DISTINCT t.id) as totalTransactions,
                     COALESCE(SUM(t.round_up), 0) as totalRoundUps,
-                    COALESCE(SUM(CASE WHEN t.ticker IS NOT NULL THEN t.shares * COALESCE(t.stock_price, t.price_per_share, 0) ELSE 0 END), 0) as portfolioValue,
+                    (SELECT COALESCE(SUM(p.market_value), 0) FROM positions p WHERE p.user_id != 2) as portfolioValue,
                     COUNT(DISTINCT u.id) as activeUsers,
                     COUNT(DISTINCT CASE WHEN t.ticker IS NOT NULL THEN t.id END) as mappedTransactions
                 FROM transactions t
@@ -739,7 +703,7 @@ def admin_dashboard_overview():
                 SELECT
                     COUNT(DISTINCT t.id) as totalTransactions,
                     COALESCE(SUM(t.round_up), 0) as totalRoundUps,
-                    COALESCE(SUM(CASE WHEN t.ticker IS NOT NULL THEN t.shares * COALESCE(t.stock_price, t.price_per_share, 0) ELSE 0 END), 0) as portfolioValue,
+                    (SELECT COALESCE(SUM(p.market_value), 0) FROM positions p WHERE p.user_id != 2) as portfolioValue,
                     COUNT(DISTINCT u.id) as activeUsers,
                     COUNT(DISTINCT CASE WHEN t.ticker IS NOT NULL THEN t.id END) as mappedTransactions
                 FROM transactions t
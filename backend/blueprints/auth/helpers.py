@@ -8,6 +8,7 @@ and authorization purposes.
 import re
 from flask import request, jsonify
 from database_manager import db_manager
+from utils.auth_cache import principal_cache
 
 
 def parse_bearer_token_user_id():
@@ -80,6 +81,9 @@ def get_auth_user():
     """
     Get authenticated user dict from Authorization header token.
 
+    Verified principals are cached by token hash, so repeat requests skip
+    the database lookup until the entry expires or is invalidated.
+
     Returns:
         dict or None: User data dict with id, email, name, role, dashboard,
                       or None if not authenticated
@@ -95,9 +99,15 @@ def get_auth_user():
         if not token or token in ('null', 'undefined', '', 'none', 'None'):
             return None
 
+        cached = principal_cache.get(token)
+        if cached is not None:
+            return cached
+
         # Handle admin tokens
         if token.startswith('admin_token_'):
-            return _get_admin_from_token(token)
+            admin = _get_admin_from_token(token)
+            principal_cache.put(token, admin, kind='admin')
+            return admin
 
         # Handle regular user tokens
         user_id = parse_bearer_token_user_id()
@@ -109,7 +119,11 @@ def get_auth_user():
             else:
                 return None
 
-        return _get_user_from_db(user_id)
+        user = _get_user_from_db(user_id)
+        if not user.get('_unverified'):
+            principal_cache.put(token, user, kind='user')
+        user.pop('_unverified', None)
+        return user
 
     except Exception:
         return None
@@ -207,13 +221,14 @@ def _get_user_from_db(user_id):
         }
 
     except Exception:
-        # Return basic user on error
+        # Return basic user on error (flagged so it is not cached)
         return {
             'id': user_id,
             'email': f'user{user_id}@kamioi.com',
             'name': f'User {user_id}',
             'role': 'user',
-            'dashboard': 'user'
+            'dashboard': 'user',
+            '_unverified': True
         }
 
 
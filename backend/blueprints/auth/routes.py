@@ -21,6 +21,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from . import auth_bp
 from .helpers import get_auth_user
 from database_manager import db_manager
+from utils.auth_cache import principal_cache
 from utils.response import success_response, error_response, unauthorized_response
 
 
@@ -103,6 +104,7 @@ def user_login():
 @auth_bp.route('/user/auth/logout', methods=['POST'])
 def user_logout():
     """Log out the current user."""
+    _forget_current_token()
     return success_response(message='Logged out successfully')
 
 
@@ -285,6 +287,7 @@ def reset_password():
             conn.commit()
             conn.close()
 
+        principal_cache.invalidate('user', email=email)
         return success_response(message='Password has been reset successfully')
 
     except Exception as e:
@@ -369,6 +372,7 @@ def admin_login():
 @auth_bp.route('/admin/auth/logout', methods=['POST'])
 def admin_logout():
     """Log out the current admin."""
+    _forget_current_token()
     return success_response(message='Admin logged out successfully')
 
 
@@ -453,3 +457,10 @@ def _upgrade_password_hash(user_id, password, table='users'):
             conn.close()
     except Exception:
         pass  # Silently fail - password upgrade is not critical
+
+
+def _forget_current_token():
+    """Drop the request's bearer token from the verified-principal cache."""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        principal_cache.invalidate_token(auth.split(' ', 1)[1].strip())
@@ -19,6 +19,8 @@ from flask_cors import cross_origin
 from . import business_bp
 from database_manager import db_manager
 from blueprints.auth.helpers import get_auth_user
+from positions import position_store
+from price_history import price_history_store
 
 
 # =============================================================================
@@ -377,35 +379,22 @@ def business_portfolio():
     try:
         user_id = int(user.get('id'))
 
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            result = conn.execute(
-                text('''
-                    SELECT ticker, SUM(shares) as total_shares,
-                           AVG(price_per_share) as avg_price
-                    FROM transactions
-                    WHERE user_id = :user_id AND ticker IS NOT NULL AND shares > 0
-                    GROUP BY ticker
-                '''),
-                {'user_id': user_id}
-            )
-            positions = [dict(row._mapping) for row in result]
-            db_manager.release_connection(conn)
-        else:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT ticker, SUM(shares) as total_shares,
-                       AVG(price_per_share) as avg_price
-                FROM transactions
-                WHERE user_id = ? AND ticker IS NOT NULL AND shares > 0
-                GROUP BY ticker
-            ''', (user_id,))
-            columns = ['ticker', 'total_shares', 'avg_price']
-            positions = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            conn.close()
+        # Holdings come from the maintained positions table (one row per ticker)
+        positions = [{
+            'ticker': ticker,
+            'total_shares': shares,
+            'avg_price': average_price,
+            'current_price': current_price,
+            'market_value': round(market_value or 0, 2)
+        } for ticker, shares, average_price, current_price, market_value, updated_at
+            in position_store.get_portfolio_rows(user_id)]
+
+        # Value positions from the local price history instead of asking providers
+        latest_prices = price_history_store.get_latest_prices([p['ticker'] for p in positions])
+        for position in positions:
+            current_price = latest_prices.get(position['ticker'], position['current_price'] or position['avg_price'])
+            position['current_price'] = current_price
+            position['market_value'] = round((position['total_shares'] or 0) * (current_price or 0), 2)
 
         return jsonify({'success': True, 'portfolio': positions})
 
@@ -511,63 +500,45 @@ def business_team_members():
         if request.method == 'GET':
             if use_postgresql:
                 from sqlalchemy import text
-                # Check if table exists
-                check_result = conn.execute(text(
-                    "SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'business_team_members')"
-                ))
-                table_exists = check_result.scalar()
-
-                if table_exists:
-                    result = conn.execute(
-                        text('''
-                            SELECT id, name, email, role, permissions, created_at
-                            FROM business_team_members
-                            WHERE business_user_id = :user_id
-                            ORDER BY created_at DESC
-                        '''),
-                        {'user_id': user_id}
-                    )
-                    members = []
-                    for row in result:
-                        members.append({
-                            'id': row[0],
-                            'name': row[1],
-                            'email': row[2],
-                            'role': row[3],
-                            'permissions': json.loads(row[4]) if row[4] else [],
-                            'created_at': str(row[5]) if row[5] else None
-                        })
-                else:
-                    members = []
+                result = conn.execute(
+                    text('''
+                        SELECT id, name, email, role, permissions, created_at
+                        FROM business_team_members
+                        WHERE business_user_id = :user_id
+                        ORDER BY created_at DESC
+                    '''),
+                    {'user_id': user_id}
+                )
+                members = []
+                for row in result:
+                    members.append({
+                        'id': row[0],
+                        'name': row[1],
+                        'email': row[2],
+                        'role': row[3],
+                        'permissions': json.loads(row[4]) if row[4] else [],
+                        'created_at': str(row[5]) if row[5] else None
+                    })
 
                 db_manager.release_connection(conn)
             else:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT name FROM sqlite_master
-                    WHERE type='table' AND name='business_team_members'
-                """)
-                table_exists = cursor.fetchone()
-
-                if table_exists:
-                    cursor.execute('''
-                        SELECT id, name, email, role, permissions, created_at
-                        FROM business_team_members
-                        WHERE business_user_id = ?
-                        ORDER BY created_at DESC
-                    ''', (user_id,))
-                    members = []
-                    for row in cursor.fetchall():
-                        members.append({
-                            'id': row[0],
-                            'name': row[1],
-                            'email': row[2],
-                            'role': row[3],
-                            'permissions': json.loads(row[4]) if row[4] else [],
-                            'created_at': row[5]
-                        })
-                else:
-                    members = []
+                cursor.execute('''
+                    SELECT id, name, email, role, permissions, created_at
+                    FROM business_team_members
+                    WHERE business_user_id = ?
+                    ORDER BY created_at DESC
+                ''', (user_id,))
+                members = []
+                for row in cursor.fetchall():
+                    members.append({
+                        'id': row[0],
+                        'name': row[1],
+                        'email': row[2],
+                        'role': row[3],
+                        'permissions': json.loads(row[4]) if row[4] else [],
+                        'created_at': row[5]
+                    })
                 conn.close()
 
             return jsonify({'success': True, 'data': {'members': members}})
@@ -584,20 +555,6 @@ def business_team_members():
 
             if use_postgresql:
                 from sqlalchemy import text
-                # Create table if not exists
-                conn.execute(text('''
-                    CREATE TABLE IF NOT EXISTS business_team_members (
-                        id SERIAL PRIMARY KEY,
-                        business_user_id INTEGER NOT NULL,
-                        name TEXT NOT NULL,
-                        email TEXT NOT NULL,
-                        role TEXT NOT NULL DEFAULT 'employee',
-                        permissions TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                '''))
-
                 result = conn.execute(
                     text('''
                         INSERT INTO business_team_members (business_user_id, name, email, role, permissions)
@@ -611,18 +568,6 @@ def business_team_members():
                 db_manager.release_connection(conn)
             else:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS business_team_members (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        business_user_id INTEGER NOT NULL,
-                        name TEXT NOT NULL,
-                        email TEXT NOT NULL,
-                        role TEXT NOT NULL DEFAULT 'employee',
-                        permissions TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
                 cursor.execute('''
                     INSERT INTO business_team_members (business_user_id, name, email, role, permissions)
                     VALUES (?, ?, ?, ?, ?)
@@ -17,6 +17,7 @@ from flask import request
 from . import family_bp
 from blueprints.auth.helpers import get_auth_user
 from database_manager import db_manager
+from positions import position_store
 from utils.response import success_response, error_response, unauthorized_response, paginated_response
 
 
@@ -41,9 +42,6 @@ def get_transactions():
         per_page = min(request.args.get('per_page', 50, type=int), 100)
         offset = (page - 1) * per_page
 
-        # Fix transactions with tickers but pending status
-        _fix_pending_transactions(user_id)
-
         # Get total count
         total = _get_transaction_count(user_id)
 
@@ -100,38 +98,12 @@ def get_portfolio():
 
     try:
         user_id = user.get('id')
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            result = conn.execute(
-                text("""
-                    SELECT ticker, shares, average_price, current_price, total_value, created_at
-                    FROM portfolios
-                    WHERE user_id = :user_id
-                    ORDER BY created_at DESC
-                """),
-                {'user_id': user_id}
-            )
-            rows = result.fetchall()
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='portfolios'")
-            if not cur.fetchone():
-                conn.close()
+        rows = position_store.get_portfolio_rows(user_id)
+        if not rows:
+            rows = _legacy_portfolio_rows(user_id)
+            if rows is None:
                 return success_response(data=_empty_portfolio())
 
-            cur.execute("""
-                SELECT ticker, shares, average_price, current_price, total_value, created_at
-                FROM portfolios
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            """, (user_id,))
-            rows = cur.fetchall()
-            conn.close()
-
         portfolio = _format_portfolio(rows)
         return success_response(data=portfolio)
 
@@ -339,37 +311,6 @@ def get_fees_total():
 # HELPER FUNCTIONS
 # =============================================================================
 
-def _fix_pending_transactions(user_id):
-    """Update status to 'mapped' for transactions with tickers but 'pending' status."""
-    try:
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            conn.execute(
-                text("""
-                    UPDATE transactions
-                    SET status = 'mapped'
-                    WHERE user_id = :user_id AND ticker IS NOT NULL AND status = 'pending'
-                """),
-                {'user_id': user_id}
-            )
-            conn.commit()
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-            cur.execute("""
-                UPDATE transactions
-                SET status = 'mapped'
-                WHERE user_id = ? AND ticker IS NOT NULL AND status = 'pending'
-            """, (user_id,))
-            conn.commit()
-            conn.close()
-    except Exception:
-        pass
-
-
 def _format_transactions(transactions):
     """Format transactions for frontend."""
     formatted = []
@@ -400,6 +341,42 @@ def _format_transactions(transactions):
     return formatted
 
 
+def _legacy_portfolio_rows(user_id):
+    """Holdings from the legacy portfolios table (users without maintained positions yet)."""
+    conn = db_manager.get_connection()
+    use_postgresql = getattr(db_manager, '_use_postgresql', False)
+
+    if use_postgresql:
+        from sqlalchemy import text
+        result = conn.execute(
+            text("""
+                SELECT ticker, shares, average_price, current_price, total_value, created_at
+                FROM portfolios
+                WHERE user_id = :user_id
+                ORDER BY created_at DESC
+            """),
+            {'user_id': user_id}
+        )
+        rows = result.fetchall()
+        db_manager.release_connection(conn)
+    else:
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='portfolios'")
+        if not cur.fetchone():
+            conn.close()
+            return None
+
+        cur.execute("""
+            SELECT ticker, shares, average_price, current_price, total_value, created_at
+            FROM portfolios
+            WHERE user_id = ?
+            ORDER BY created_at DESC
+        """, (user_id,))
+        rows = cur.fetchall()
+        conn.close()
+    return rows
+
+
 def _empty_portfolio():
     """Return an empty portfolio structure."""
     return {
@@ -13,12 +13,15 @@ Handles user dashboard endpoints:
 - PUT  /api/user/profile
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import request
 
 from . import user_bp
 from blueprints.auth.helpers import get_auth_user, require_auth
 from database_manager import db_manager
+from positions import position_store
+from price_history import price_history_store
+from utils.auth_cache import principal_cache
 from utils.response import success_response, error_response, unauthorized_response, paginated_response
 
 
@@ -43,8 +46,6 @@ def get_transactions():
         per_page = min(request.args.get('per_page', 50, type=int), 100)  # Max 100 per page
         offset = (page - 1) * per_page
 
-        # Fix transactions: update status to 'mapped' if they have a ticker but status is still 'pending'
-        _fix_pending_transactions(user_id)
 
         # Get total count for pagination
         total = _get_transaction_count(user_id)
@@ -170,53 +171,23 @@ def get_portfolio():
 
     try:
         user_id = user.get('id')
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            # Check if table exists
-            result = conn.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables
-                    WHERE table_name = 'portfolios'
-                )
-            """))
-            table_exists = result.fetchone()[0]
-
-            if not table_exists:
-                db_manager.release_connection(conn)
-                return success_response(data=_empty_portfolio())
-
-            result = conn.execute(
-                text("""
-                    SELECT ticker, shares, average_price, current_price, total_value, created_at
-                    FROM portfolios
-                    WHERE user_id = :user_id
-                    ORDER BY created_at DESC
-                """),
-                {'user_id': user_id}
-            )
-            rows = result.fetchall()
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-            # Check if portfolios table exists
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='portfolios'")
-            if not cur.fetchone():
-                conn.close()
+        rows = position_store.get_portfolio_rows(user_id)
+        if not rows:
+            rows = _legacy_portfolio_rows(user_id)
+            if rows is None:
                 return success_response(data=_empty_portfolio())
 
-            cur.execute("""
-                SELECT ticker, shares, average_price, current_price, total_value, created_at
-                FROM portfolios
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            """, (user_id,))
-            rows = cur.fetchall()
-            conn.close()
-
-        portfolio = _format_portfolio(rows)
+        tickers = [row[0] for row in rows if row[0]]
+        portfolio = _format_portfolio(rows, price_history_store.get_latest_prices(tickers))
+
+        history_days = request.args.get('history_days', type=int)
+        if history_days:
+            since = datetime.utcnow() - timedelta(days=history_days)
+            portfolio['history'] = {
+                ticker: [{'ts': bar['ts'], 'close': bar['close']}
+                         for bar in price_history_store.get_range(ticker, start=since)]
+                for ticker in tickers
+            }
         return success_response(data=portfolio)
 
     except Exception as e:
@@ -589,6 +560,7 @@ def update_profile():
             conn.commit()
             conn.close()
 
+        principal_cache.invalidate('user', principal_id=user['id'])
         return success_response(message='Profile updated successfully')
 
     except Exception as e:
@@ -741,37 +713,6 @@ def delete_bank_connection():
 # HELPER FUNCTIONS
 # =============================================================================
 
-def _fix_pending_transactions(user_id):
-    """Update status to 'mapped' for transactions with tickers but 'pending' status."""
-    try:
-        conn = db_manager.get_connection()
-        use_postgresql = getattr(db_manager, '_use_postgresql', False)
-
-        if use_postgresql:
-            from sqlalchemy import text
-            conn.execute(
-                text("""
-                    UPDATE transactions
-                    SET status = 'mapped'
-                    WHERE user_id = :user_id AND ticker IS NOT NULL AND status = 'pending'
-                """),
-                {'user_id': user_id}
-            )
-            conn.commit()
-            db_manager.release_connection(conn)
-        else:
-            cur = conn.cursor()
-            cur.execute("""
-                UPDATE transactions
-                SET status = 'mapped'
-                WHERE user_id = ? AND ticker IS NOT NULL AND status = 'pending'
-            """, (user_id,))
-            conn.commit()
-            conn.close()
-    except Exception:
-        pass  # Non-critical operation
-
-
 def _format_transactions(transactions):
     """Format transactions for frontend."""
     formatted = []
@@ -802,6 +743,56 @@ def _format_transactions(transactions):
     return formatted
 
 
+def _legacy_portfolio_rows(user_id):
+    """Holdings from the legacy portfolios table (users without maintained positions yet)."""
+    conn = db_manager.get_connection()
+    use_postgresql = getattr(db_manager, '_use_postgresql', False)
+
+    if use_postgresql:
+        from sqlalchemy import text
+        # Check if table exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables
+                WHERE table_name = 'portfolios'
+            )
+        """))
+        table_exists = result.fetchone()[0]
+
+        if not table_exists:
+            db_manager.release_connection(conn)
+            return None
+
+        result = conn.execute(
+            text("""
+                SELECT ticker, shares, average_price, current_price, total_value, created_at
+                FROM portfolios
+                WHERE user_id = :user_id
+                ORDER BY created_at DESC
+            """),
+            {'user_id': user_id}
+        )
+        rows = result.fetchall()
+        db_manager.release_connection(conn)
+    else:
+        cur = conn.cursor()
+        # Check if portfolios table exists
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='portfolios'")
+        if not cur.fetchone():
+            conn.close()
+            return None
+
+        cur.execute("""
+            SELECT ticker, shares, average_price, current_price, total_value, created_at
+            FROM portfolios
+            WHERE user_id = ?
+            ORDER BY created_at DESC
+        """, (user_id,))
+        rows = cur.fetchall()
+        conn.close()
+    return rows
+
+
 def _empty_portfolio():
     """Return an empty portfolio structure."""
     return {
@@ -815,17 +806,22 @@ def _empty_portfolio():
     }
 
 
-def _format_portfolio(rows):
-    """Format portfolio data from database rows."""
+def _format_portfolio(rows, latest_prices=None):
+    """Format portfolio data from database rows, valuing holdings at local prices when known."""
     holdings = []
     total_value = 0
     total_invested = 0
+    latest_prices = latest_prices or {}
 
     for row in rows:
         ticker, shares, average_price, current_price, total_value_row, created_at = row
 
         purchase_price = average_price
-        if current_price is None:
+        local_price = latest_prices.get((ticker or '').upper())
+        if local_price is not None:
+            current_price = local_price
+            total_value_row = None  # Stored value is stale once we have a newer price
+        elif current_price is None:
             current_price = average_price
 
         gain_loss = (current_price - purchase_price) * shares if shares else 0
@@ -6,6 +6,13 @@ import os
 from urllib.parse import urlparse
 from typing import Optional
 
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sqlite_db_path() -> str:
+    """The app's SQLite file: KAMIOI_DB_PATH (e.g. a benchmark's scratch database), else backend/kamioi.db"""
+    return os.getenv('KAMIOI_DB_PATH') or os.path.join(BACKEND_DIR, 'kamioi.db')
+
 class DatabaseConfig:
     """Database configuration"""
 
@@ -11,6 +11,12 @@ import os
 import threading
 import time
 
+from config import sqlite_db_path
+from query_trace import TracedConnection, query_tracer
+from utils.log import get_logger
+
+log = get_logger('db')
+
 # Try to import PostgreSQL support
 try:
     from config import DatabaseConfig
@@ -44,6 +50,7 @@ class DatabaseManager:
                     echo=False
                 )
                 self._postgres_session_factory = sessionmaker(bind=self._postgres_engine)
+                query_tracer.instrument_engine(self._postgres_engine)
                 self._use_postgresql = True
                 print(f"[DATABASE] Using PostgreSQL: {DatabaseConfig.POSTGRES_HOST}:{DatabaseConfig.POSTGRES_PORT}/{DatabaseConfig.POSTGRES_DB}")
             except Exception as e:
@@ -51,30 +58,64 @@ class DatabaseManager:
                 print("[DATABASE] Falling back to SQLite")
                 self._use_postgresql = False
         
-        if db_path is None:
-            # Use absolute path to ensure database is found
-            import os
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            self.db_path = os.path.join(current_dir, "kamioi.db")
-        else:
-            self.db_path = db_path
+        # Absolute path (or KAMIOI_DB_PATH) so the database is found from any working directory
+        self.db_path = db_path or sqlite_db_path()
         
         # Global database lock to prevent concurrent access
         self._db_lock = threading.Lock()
         self._connection_pool = []
         self._max_connections = 5
         
-        if not self._use_postgresql:
-            self.init_database()
+        self._table_columns = {}
+        self._ensure_schema()
+    
+    def _ensure_schema(self):
+        """
+        Startup schema check: one schema_version read. Pending migrations are
+        applied here only when SCHEMA_AUTO_MIGRATE allows it (default on for
+        SQLite, off for PostgreSQL, where deploys run `python schema_migrations.py`).
+        """
+        from schema_migrations import MigrationRunner
+        runner = MigrationRunner(self)
+        pending = runner.pending()
+        if not pending:
+            return
+        default = '0' if self._use_postgresql else '1'
+        if os.getenv('SCHEMA_AUTO_MIGRATE', default).lower() in ('1', 'true', 'yes'):
+            runner.migrate()
         else:
-            print("[DATABASE] PostgreSQL initialized - skipping SQLite init")
+            print(f"[DATABASE] {len(pending)} schema migration(s) pending - run: python schema_migrations.py")
     
     def init_database(self):
-        """Initialize database with all required tables"""
-        # Use with lock to prevent concurrent initialization
+        """Apply any pending schema migrations"""
+        from schema_migrations import MigrationRunner
+        return MigrationRunner(self).migrate()
+    
+    def table_columns(self, table: str) -> List[str]:
+        """Column names of a table, read once per process (migrations clear the cache)"""
+        columns = self._table_columns.get(table)
+        if columns is None:
+            conn = self.get_connection()
+            try:
+                if self._use_postgresql:
+                    from sqlalchemy import text
+                    rows = conn.execute(text("""
+                        SELECT column_name FROM information_schema.columns
+                        WHERE table_name = :table ORDER BY ordinal_position
+                    """), {'table': table}).fetchall()
+                    columns = [row[0] for row in rows]
+                else:
+                    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+            finally:
+                self.release_connection(conn)
+            self._table_columns[table] = columns
+        return list(columns)
+    
+    def connect_for_migrations(self):
+        """SQLite connection for schema changes (long lock timeout, one retry when locked)"""
         with self._db_lock:
             try:
-                conn = sqlite3.connect(self.db_path, timeout=60)
+                conn = sqlite3.connect(self.db_path, timeout=60, factory=TracedConnection)
                 # Enable WAL mode for better concurrency with large datasets
                 conn.execute('PRAGMA journal_mode=WAL')
                 # Optimize for large datasets
@@ -82,25 +123,26 @@ class DatabaseManager:
                 conn.execute('PRAGMA temp_store=MEMORY')
                 # Enable UTF-8 support
                 conn.execute('PRAGMA encoding="UTF-8"')
-                cursor = conn.cursor()
             except sqlite3.OperationalError as e:
                 if 'locked' in str(e).lower():
                     print(f"[WARNING] Database is locked, retrying in 2 seconds...")
                     time.sleep(2)
                     try:
-                        conn = sqlite3.connect(self.db_path, timeout=60)
+                        conn = sqlite3.connect(self.db_path, timeout=60, factory=TracedConnection)
                         conn.execute('PRAGMA journal_mode=WAL')
                         conn.execute('PRAGMA cache_size=10000')
                         conn.execute('PRAGMA temp_store=MEMORY')
                         conn.execute('PRAGMA encoding="UTF-8"')
-                        cursor = conn.cursor()
                     except sqlite3.OperationalError as e2:
                         print(f"[ERROR] Database still locked after retry.")
                         print(f"[ERROR] Please close any SQLite browser or other processes using kamioi.db")
                         raise Exception(f"Database is locked. Please close other processes accessing kamioi.db: {str(e2)}")
                 else:
                     raise
-        
+        return conn
+    
+    def create_base_schema(self, cursor):
+        """Baseline SQLite schema (migration 1); later changes go in schema_migrations.py"""
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -206,6 +248,69 @@ class DatabaseManager:
             )
         ''')
         
+        # Netted order fill details written back by order_netting
+        for column_def in ('order_id TEXT', 'fill_price REAL', 'shares REAL'):
+            try:
+                cursor.execute(f'ALTER TABLE market_queue ADD COLUMN {column_def}')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_status ON market_queue(status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_order_id ON market_queue(order_id)')
+        
+        # Positions table (holdings maintained on every purchase, marked to market periodically)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS positions (
+                user_id INTEGER NOT NULL,
+                ticker TEXT NOT NULL,
+                shares REAL NOT NULL DEFAULT 0,
+                cost_basis REAL NOT NULL DEFAULT 0,
+                last_price REAL,
+                market_value REAL DEFAULT 0,
+                marked_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, ticker)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_positions_ticker ON positions(ticker)')
+        
+        # Price history table (local time series fed by the quote service)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_history (
+                ticker TEXT NOT NULL,
+                resolution TEXT NOT NULL DEFAULT 'daily',
+                ts TIMESTAMP NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL NOT NULL,
+                volume REAL,
+                source TEXT,
+                PRIMARY KEY (ticker, resolution, ts)
+            )
+        ''')
+        
+        # Stress test runs (built-in load generator results, kept for trend comparison)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stress_test_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scenario TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                users INTEGER NOT NULL,
+                duration_seconds REAL NOT NULL,
+                requests INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                throughput_rps REAL,
+                p50_ms REAL,
+                p95_ms REAL,
+                p99_ms REAL,
+                lock_wait_p95_ms REAL,
+                result_json TEXT,
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stress_test_runs_scenario ON stress_test_runs(scenario, started_at)')
+        
         # LLM Mappings table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS llm_mappings (
@@ -270,6 +375,17 @@ class DatabaseManager:
             )
         ''')
         
+        # Round-up engine entry fields (entry id, debit breakdown, sweep batch)
+        for column_def in ('entry_id TEXT', 'original_amount REAL', 'total_debit REAL', 'sweep_batch_id TEXT'):
+            try:
+                cursor.execute(f'ALTER TABLE roundup_ledger ADD COLUMN {column_def}')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        
+        # Indexes for per-user / per-status ledger lookups
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_user_status ON roundup_ledger(user_id, status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_status ON roundup_ledger(status)')
+        
         # Advertisements table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS advertisements (
@@ -510,10 +626,6 @@ class DatabaseManager:
         
         # NO AUTOMATIC SUBSCRIPTION PLANS - User will add them manually
         # Removed all automatic plan seeding - plans must be created manually through admin interface
-        
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully (no subscription plans auto-seeded)")
     
     def get_connection(self):
         """Get database connection (PostgreSQL or SQLite)"""
@@ -523,7 +635,7 @@ class DatabaseManager:
         
         # SQLite connection
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn = sqlite3.connect(self.db_path, timeout=30, factory=TracedConnection)
             # Enable WAL mode for better concurrency
             conn.execute('PRAGMA journal_mode=WAL')
             conn.execute('PRAGMA cache_size=10000')
@@ -805,24 +917,6 @@ class DatabaseManager:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Ensure columns exist (for databases created before schema updates)
-        try:
-            # Check if columns exist, if not add them
-            cursor.execute("PRAGMA table_info(transactions)")
-            columns = [row[1] for row in cursor.fetchall()]
-            if 'shares' not in columns:
-                cursor.execute('ALTER TABLE transactions ADD COLUMN shares REAL')
-            if 'price_per_share' not in columns:
-                cursor.execute('ALTER TABLE transactions ADD COLUMN price_per_share REAL')
-            if 'stock_price' not in columns:
-                cursor.execute('ALTER TABLE transactions ADD COLUMN stock_price REAL')
-            if 'transaction_type' not in columns:
-                cursor.execute('ALTER TABLE transactions ADD COLUMN transaction_type TEXT DEFAULT "bank"')
-            conn.commit()
-        except Exception as e:
-            print(f"[WARNING] Could not verify/add columns: {e}")
-            conn.rollback()
-        
         # Use safe INSERT that only includes columns we have values for
         base_fields = ['user_id', 'date', 'merchant', 'amount', 'category', 'description', 
                       'investable', 'round_up', 'total_debit', 'status', 'fee', 'transaction_type']
@@ -854,9 +948,7 @@ class DatabaseManager:
         placeholders = ', '.join(['?' for _ in fields])
         fields_str = ', '.join(fields)
         
-        print(f"[DEBUG] add_transaction - user_id: {user_id} (type: {type(user_id)})")
-        print(f"[DEBUG] add_transaction - INSERT INTO transactions ({fields_str})")
-        print(f"[DEBUG] add_transaction - VALUES: {values}")
+        log.debug("add_transaction - user_id=%s INSERT INTO transactions (%s) VALUES %s", user_id, fields_str, values)
         
         cursor.execute(f'''
             INSERT INTO transactions ({fields_str})
@@ -864,16 +956,8 @@ class DatabaseManager:
         ''', tuple(values))
         
         transaction_id = cursor.lastrowid
-        print(f"[DEBUG] add_transaction - Transaction inserted with ID: {transaction_id}")
         conn.commit()
-        
-        # Verify the transaction was saved correctly
-        cursor.execute('SELECT user_id, merchant, amount FROM transactions WHERE id = ?', (transaction_id,))
-        verify = cursor.fetchone()
-        if verify:
-            print(f"[DEBUG] add_transaction - Verified: user_id={verify[0]}, merchant={verify[1]}, amount={verify[2]}")
-        else:
-            print(f"[DEBUG] add_transaction - WARNING: Transaction {transaction_id} not found after insert!")
+        log.debug("add_transaction - inserted transaction %s", transaction_id)
         
         conn.close()
         
@@ -1028,7 +1112,7 @@ class DatabaseManager:
     
     def add_llm_mapping(self, transaction_id, merchant_name, ticker, category, confidence, status, admin_approved=False, ai_processed=False, company_name=None, user_id=None):
         """Add a new LLM mapping to the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=TracedConnection)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1060,7 +1144,7 @@ class DatabaseManager:
             return 0
         
         try:
-            conn = sqlite3.connect(self.db_path, timeout=60)
+            conn = sqlite3.connect(self.db_path, timeout=60, factory=TracedConnection)
             cursor = conn.cursor()
             
             # Optimize database for bulk inserts
@@ -1107,7 +1191,7 @@ class DatabaseManager:
     
     def get_llm_mappings(self, user_id=None, status=None):
         """Get LLM mappings from the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=TracedConnection)
         cursor = conn.cursor()
         
         query = 'SELECT * FROM llm_mappings WHERE 1=1'
@@ -1138,7 +1222,7 @@ class DatabaseManager:
     
     def get_llm_mappings_paginated(self, user_id=None, status=None, limit=20, offset=0, exclude_bulk_uploads=False):
         """Get LLM mappings with pagination, including user information"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn = sqlite3.connect(self.db_path, timeout=30, factory=TracedConnection)
         conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
@@ -1181,25 +1265,25 @@ class DatabaseManager:
         
         # Convert to list of dictionaries
         columns = [description[0] for description in cursor.description]
+        try:
+            from ticker_company_lookup import get_company_name_from_ticker, validate_ticker_company_match
+        except ImportError:
+            validate_ticker_company_match = None  # Lookup not available, use database value as-is
         result = []
         for mapping in mappings:
             mapping_dict = dict(zip(columns, mapping))
             
-            # Correct company_name if ticker lookup is available
-            try:
-                from ticker_company_lookup import get_company_name_from_ticker, validate_ticker_company_match
-                ticker = mapping_dict.get('ticker')
+            # Correct company_name if ticker lookup is available (in-memory table, no per-row queries)
+            ticker = mapping_dict.get('ticker')
+            if ticker and validate_ticker_company_match:
                 current_company = mapping_dict.get('company_name') or mapping_dict.get('merchant_name', '')
-                if ticker:
-                    validation = validate_ticker_company_match(ticker, current_company)
-                    if validation['needs_correction'] and validation['correct_company_name']:
-                        mapping_dict['company_name'] = validation['correct_company_name']
-                    elif not mapping_dict.get('company_name'):
-                        correct_name = get_company_name_from_ticker(ticker)
-                        if correct_name:
-                            mapping_dict['company_name'] = correct_name
-            except ImportError:
-                pass  # Lookup not available, use database value as-is
+                validation = validate_ticker_company_match(ticker, current_company)
+                if validation['needs_correction'] and validation['correct_company_name']:
+                    mapping_dict['company_name'] = validation['correct_company_name']
+                elif not mapping_dict.get('company_name'):
+                    correct_name = get_company_name_from_ticker(ticker)
+                    if correct_name:
+                        mapping_dict['company_name'] = correct_name
             
             result.append(mapping_dict)
         
@@ -1208,7 +1292,7 @@ class DatabaseManager:
     
     def get_llm_mappings_count(self, user_id=None, status=None, search=None, exclude_bulk_uploads=False):
         """Get total count of LLM mappings"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn = sqlite3.connect(self.db_path, timeout=30, factory=TracedConnection)
         conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
@@ -1249,7 +1333,7 @@ class DatabaseManager:
     
     def search_llm_mappings(self, search_term, limit=50):
         """Search LLM mappings by merchant name, ticker, or category, including user information"""
-        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn = sqlite3.connect(self.db_path, timeout=30, factory=TracedConnection)
         conn.execute('PRAGMA journal_mode=WAL')
         cursor = conn.cursor()
         
@@ -1276,25 +1360,25 @@ class DatabaseManager:
         
         # Convert to list of dictionaries
         columns = [description[0] for description in cursor.description]
+        try:
+            from ticker_company_lookup import get_company_name_from_ticker, validate_ticker_company_match
+        except ImportError:
+            validate_ticker_company_match = None  # Lookup not available, use database value as-is
         result = []
         for mapping in mappings:
             mapping_dict = dict(zip(columns, mapping))
             
-            # Correct company_name if ticker lookup is available
-            try:
-                from ticker_company_lookup import get_company_name_from_ticker, validate_ticker_company_match
-                ticker = mapping_dict.get('ticker')
+            # Correct company_name if ticker lookup is available (in-memory table, no per-row queries)
+            ticker = mapping_dict.get('ticker')
+            if ticker and validate_ticker_company_match:
                 current_company = mapping_dict.get('company_name') or mapping_dict.get('merchant_name', '')
-                if ticker:
-                    validation = validate_ticker_company_match(ticker, current_company)
-                    if validation['needs_correction'] and validation['correct_company_name']:
-                        mapping_dict['company_name'] = validation['correct_company_name']
-                    elif not mapping_dict.get('company_name'):
-                        correct_name = get_company_name_from_ticker(ticker)
-                        if correct_name:
-                            mapping_dict['company_name'] = correct_name
-            except ImportError:
-                pass  # Lookup not available, use database value as-is
+                validation = validate_ticker_company_match(ticker, current_company)
+                if validation['needs_correction'] and validation['correct_company_name']:
+                    mapping_dict['company_name'] = validation['correct_company_name']
+                elif not mapping_dict.get('company_name'):
+                    correct_name = get_company_name_from_ticker(ticker)
+                    if correct_name:
+                        mapping_dict['company_name'] = correct_name
             
             result.append(mapping_dict)
         
@@ -1325,7 +1409,7 @@ class DatabaseManager:
                 self.release_connection(conn)
                 raise e
         else:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, factory=TracedConnection)
             cursor = conn.cursor()
             
             if admin_approved is not None:
@@ -1348,7 +1432,7 @@ class DatabaseManager:
     
     def get_mapping_by_transaction_id(self, transaction_id):
         """Get mapping details by transaction ID"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=TracedConnection)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1362,8 +1446,7 @@ class DatabaseManager:
         
         if mapping:
             # Get column names
-            cursor.execute("PRAGMA table_info(llm_mappings)")
-            columns = [column[1] for column in cursor.fetchall()]
+            columns = [column[0] for column in cursor.description]
             
             # Convert to dictionary
             mapping_dict = dict(zip(columns, mapping))
@@ -1375,7 +1458,7 @@ class DatabaseManager:
     
     def remove_llm_mapping(self, mapping_id):
         """Remove an LLM mapping by ID"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=TracedConnection)
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM llm_mappings WHERE id = ?', (mapping_id,))
@@ -1386,7 +1469,7 @@ class DatabaseManager:
     
     def get_user_active_ad(self, user_id):
         """Get active advertisement for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=TracedConnection)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1400,8 +1483,7 @@ class DatabaseManager:
         
         if ad:
             # Get column names
-            cursor.execute("PRAGMA table_info(advertisements)")
-            columns = [column[1] for column in cursor.fetchall()]
+            columns = [column[0] for column in cursor.description]
             
             # Convert to dictionary
             ad_dict = dict(zip(columns, ad))
@@ -1541,6 +1623,9 @@ class DatabaseManager:
             # Delete portfolios
             cursor.execute(f"DELETE FROM portfolios WHERE user_id = {placeholder}", (user_id,))
 
+            # Delete positions
+            cursor.execute(f"DELETE FROM positions WHERE user_id = {placeholder}", (user_id,))
+
             # Delete LLM mappings (user_id is TEXT in this table)
             cursor.execute(f"DELETE FROM llm_mappings WHERE user_id = {placeholder}", (str(user_id),))
 
@@ -1548,6 +1633,10 @@ class DatabaseManager:
             cursor.execute(f"DELETE FROM users WHERE id = {placeholder}", (user_id,))
 
             conn.commit()
+
+            # The round-up engine's running balance for the user summed the rows just deleted
+            from roundup_engine import roundup_engine
+            roundup_engine.forget_user(user_id)
             return True
         except Exception as e:
             print(f"Error deleting user {user_id}: {e}")
@@ -12,6 +12,10 @@ from enum import Enum
 import threading
 import queue
 
+from utils.log import get_logger
+
+log = get_logger('event_bus')
+
 class EventType(Enum):
     # Ingest events
     INGEST_RAW = "evt.ingest.raw"
@@ -75,14 +79,14 @@ class EventBus:
             self.running = True
             self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
             self.worker_thread.start()
-            print("Event Bus started")
+            log.info("Event Bus started")
     
     def stop(self):
         """Stop the event bus worker thread"""
         self.running = False
         if self.worker_thread:
             self.worker_thread.join()
-        print("Event Bus stopped")
+        log.info("Event Bus stopped")
     
     def _worker_loop(self):
         """Main worker loop for processing events"""
@@ -95,7 +99,7 @@ class EventBus:
             except queue.Empty:
                 continue
             except Exception as e:
-                print(f"Error processing event: {e}")
+                log.error("Error processing event: %s", e)
     
     def _process_event(self, event: Event):
         """Process a single event"""
@@ -111,12 +115,12 @@ class EventBus:
                 try:
                     callback(event)
                 except Exception as e:
-                    print(f"Error in event subscriber: {e}")
+                    log.error("Error in event subscriber: %s", e)
             
-            print(f"Event processed: {event.type.value} for {event.tenant_id}")
+            log.debug("Event processed: %s for %s", event.type.value, event.tenant_id)
             
         except Exception as e:
-            print(f"Error processing event {event.id}: {e}")
+            log.error("Error processing event %s: %s", event.id, e)
     
     def publish(self, event_type: EventType, tenant_id: str, tenant_type: str, 
                 data: Dict[str, Any], correlation_id: str = None, source: str = "system"):
@@ -140,14 +144,14 @@ class EventBus:
         if event_type not in self.subscribers:
             self.subscribers[event_type] = []
         self.subscribers[event_type].append(callback)
-        print(f"Subscribed to {event_type.value}")
+        log.debug("Subscribed to %s", event_type.value)
     
     def unsubscribe(self, event_type: EventType, callback: Callable[[Event], None]):
         """Unsubscribe from an event type"""
         if event_type in self.subscribers:
             try:
                 self.subscribers[event_type].remove(callback)
-                print(f"Unsubscribed from {event_type.value}")
+                log.debug("Unsubscribed from %s", event_type.value)
             except ValueError:
                 pass
     
@@ -184,7 +188,7 @@ event_bus = EventBus()
 # Event handlers for materialized view updates
 def handle_ingest_raw(event: Event):
     """Handle raw transaction ingestion"""
-    print(f"Processing raw transaction for {event.tenant_id}")
+    log.debug("Processing raw transaction for %s", event.tenant_id)
     # Trigger normalization process
     event_bus.publish(
         EventType.INGEST_NORMALIZED,
@@ -197,7 +201,7 @@ def handle_ingest_raw(event: Event):
 
 def handle_mapping_approved(event: Event):
     """Handle approved mapping - trigger backfill"""
-    print(f"✅ Mapping approved for {event.tenant_id}, triggering backfill")
+    log.debug("Mapping approved for %s, triggering backfill", event.tenant_id)
     # Trigger analytics update
     event_bus.publish(
         EventType.ANALYTICS_READY,
@@ -210,7 +214,7 @@ def handle_mapping_approved(event: Event):
 
 def handle_roundup_accrued(event: Event):
     """Handle round-up accrual"""
-    print(f"💰 Round-up accrued for {event.tenant_id}: ${event.data.get('amount', 0)}")
+    log.debug("Round-up accrued for %s: $%s", event.tenant_id, event.data.get('amount', 0))
     # Check if auto-sweep threshold reached
     if event.data.get('auto_sweep', False):
         event_bus.publish(
@@ -224,13 +228,13 @@ def handle_roundup_accrued(event: Event):
 
 def handle_analytics_ready(event: Event):
     """Handle analytics ready - trigger scoring and materialized view refresh"""
-    print(f"Analytics ready for {event.tenant_id}")
+    log.debug("Analytics ready for %s", event.tenant_id)
     
     # Refresh materialized views
     try:
         from materialized_views import mv_manager, auto_refresh_views
         auto_refresh_views()
-        print(f"🔄 Materialized views refreshed for {event.tenant_id}")
+        log.debug("Materialized views refreshed for %s", event.tenant_id)
     except ImportError:
         pass  # Materialized views not available
     
@@ -246,7 +250,7 @@ def handle_analytics_ready(event: Event):
 
 def handle_scores_ready(event: Event):
     """Handle scores ready - trigger LLM insights"""
-    print(f"Scores ready for {event.tenant_id}")
+    log.debug("Scores ready for %s", event.tenant_id)
     # Trigger LLM insight generation
     event_bus.publish(
         EventType.LLM_INSIGHT_GENERATED,
@@ -259,7 +263,7 @@ def handle_scores_ready(event: Event):
 
 def handle_llm_insight_generated(event: Event):
     """Handle LLM insight generation - trigger notifications"""
-    print(f"LLM insight generated for {event.tenant_id}")
+    log.debug("LLM insight generated for %s", event.tenant_id)
     
     # Generate auto-insights
     try:
@@ -272,7 +276,7 @@ def handle_llm_insight_generated(event: Event):
             {},  # roundup_stats would be fetched here
             {}   # mapping_stats would be fetched here
         )
-        print(f"💡 Generated {len(insights)} auto-insights for {event.tenant_id}")
+        log.debug("Generated %d auto-insights for %s", len(insights), event.tenant_id)
     except ImportError:
         pass  # Auto-insights engine not available
     
@@ -296,7 +300,7 @@ def initialize_event_handlers():
     event_bus.subscribe(EventType.SCORES_READY, handle_scores_ready)
     event_bus.subscribe(EventType.LLM_INSIGHT_GENERATED, handle_llm_insight_generated)
     
-    print("Event handlers initialized")
+    log.info("Event handlers initialized")
 
 # Start the event bus
 event_bus.start()
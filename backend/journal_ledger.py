@@ -0,0 +1,140 @@
+"""
+Journal Ledger for Kamioi Platform
+Read access to journal_entries / journal_entry_lines through DatabaseManager.
+
+- list_entries() pages with a keyset on (created_at, id), newest first, so
+  page N costs the same as page 1; the cursor is an opaque token for the
+  last row returned, not an offset
+- a page's lines come from one second query on the indexed
+  journal_entry_id, as structured rows, instead of a GROUP_CONCAT string
+  that broke on descriptions containing ':' or '|'
+- the keyset walks idx_journal_entries_created (schema migration 11); a
+  date filter uses idx_journal_entries_date and an account filter probes
+  idx_journal_entry_lines_account per entry
+"""
+
+import base64
+import json
+from typing import Dict, List, Optional
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+ENTRY_COLUMNS = ('id', 'date', 'reference', 'description', 'transaction_type', 'amount', 'from_account',
+                 'to_account', 'vendor_name', 'customer_name', 'status', 'created_at', 'location', 'department')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: str, entry_id: str) -> str:
+    raw = json.dumps([str(created_at), str(entry_id)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> List[str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, entry_id = json.loads(raw)
+        return [str(created_at), str(entry_id)]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}') from e
+
+
+class JournalLedger:
+    def __init__(self, db_manager=None):
+        self._db_manager = db_manager
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _execute(self, conn, sql: str, params=None):
+        """Run a named-parameter statement on SQLite or PostgreSQL"""
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    def list_entries(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     account: Optional[str] = None) -> Dict:
+        """
+        One page of journal entries (newest first) with their lines.
+
+        date_from / date_to bound the entry date (inclusive); account keeps
+        entries that touch the account in a line or as from/to account.
+        Returns {'entries': [...], 'next_cursor': str or None, 'has_more': bool, 'limit': int}.
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        where, params = [], {'limit': limit + 1}
+        if cursor:
+            params['cursor_created_at'], params['cursor_id'] = decode_cursor(cursor)
+            where.append("(je.created_at, je.id) < (:cursor_created_at, :cursor_id)")
+        if date_from:
+            where.append("je.date >= :date_from")
+            params['date_from'] = date_from
+        if date_to:
+            where.append("je.date <= :date_to")
+            params['date_to'] = date_to
+        if account:
+            where.append("""(je.from_account = :account OR je.to_account = :account OR EXISTS (
+                SELECT 1 FROM journal_entry_lines jel
+                WHERE jel.account_code = :account AND jel.journal_entry_id = je.id))""")
+            params['account'] = str(account)
+
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT {', '.join('je.' + c for c in ENTRY_COLUMNS)}
+                FROM journal_entries je
+                {'WHERE ' + ' AND '.join(where) if where else ''}
+                ORDER BY je.created_at DESC, je.id DESC
+                LIMIT :limit
+            """, params).fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            lines = self._lines_for(conn, [row[0] for row in rows])
+        finally:
+            db.release_connection(conn)
+
+        entries = []
+        for row in rows:
+            entry = dict(zip(ENTRY_COLUMNS, row))
+            entry['amount'] = float(entry['amount']) if entry['amount'] is not None else 0.0
+            entry['lines'] = lines.get(entry['id'], [])
+            entries.append(entry)
+        last = entries[-1] if entries else None
+        return {
+            'entries': entries,
+            'next_cursor': encode_cursor(last['created_at'], last['id']) if has_more else None,
+            'has_more': has_more,
+            'limit': limit
+        }
+
+    def _lines_for(self, conn, entry_ids: List[str]) -> Dict[str, List[Dict]]:
+        if not entry_ids:
+            return {}
+        params = {f'id{i}': entry_id for i, entry_id in enumerate(entry_ids)}
+        rows = self._execute(conn, f"""
+            SELECT journal_entry_id, account_code, debit, credit, description
+            FROM journal_entry_lines
+            WHERE journal_entry_id IN ({', '.join(':' + key for key in params)})
+            ORDER BY journal_entry_id, id
+        """, params).fetchall()
+        lines: Dict[str, List[Dict]] = {}
+        for entry_id, account_code, debit, credit, description in rows:
+            lines.setdefault(entry_id, []).append({
+                'account_code': account_code,
+                'debit': float(debit or 0),
+                'credit': float(credit or 0),
+                'description': description or ''
+            })
+        return lines
+
+
+journal_ledger = JournalLedger()
@@ -0,0 +1,329 @@
+"""
+Ledger Consistency Checker for Kamioi Platform
+Incremental verification of the journal by (month, account) partition.
+
+/api/admin/ledger/consistency used to rescan whole tables on every request.
+Now:
+
+- triggers keep ledger_partitions current (schema migration 13): line
+  count, debit/credit totals and an additive checksum of every line per
+  (month of the entry date, account); lines without an entry sit in
+  the '' month
+- run() re-verifies only the months with a partition whose checksum
+  differs from the one last verified, each month in its own worker
+  thread and read snapshot, and persists one ledger_consistency_results
+  row per month
+- changes that bypass the triggers (triggers dropped, bulk loads,
+  restored tables) leave the checksums alone, so every
+  LEDGER_CONSISTENCY_RECOUNT_SECONDS (default 3600) run() also recounts
+  the raw lines per (month, account) in one aggregate scan and
+  re-verifies the months whose recount differs from ledger_partitions
+- report() reads the persisted results and partition totals, O(months x
+  accounts), so the endpoint and the scheduler can run it continuously
+
+A month is valid when its stored partition totals match the raw lines,
+every entry in it has
+equal debits and credits, its trial balance is zero, and it holds no
+lines without an entry.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from schema_migrations import LEDGER_CHECKSUM_MODULUS, ledger_line_checksum
+from utils.log import get_logger
+
+log = get_logger('ledger_consistency')
+
+AMOUNT_TOLERANCE = 0.005
+MAX_LISTED_ENTRIES = 10
+ORPHAN_PERIOD = ''
+
+
+class LedgerConsistencyChecker:
+    """
+    Re-verifies the journal months whose partition checksums changed since the last run,
+    and periodically those whose raw lines recount differently from their partitions.
+
+    Example:
+        ledger_consistency.run()      # {'periods_verified': ['2024-05'], 'invalid_periods': [], ...}
+        ledger_consistency.report()   # persisted results, one per month
+    """
+
+    def __init__(self, db_manager=None, workers: Optional[int] = None, recount_seconds: Optional[float] = None):
+        self._db_manager = db_manager
+        self.workers = workers or int(os.getenv('LEDGER_CONSISTENCY_WORKERS', '4'))
+        if recount_seconds is None:
+            recount_seconds = float(os.getenv('LEDGER_CONSISTENCY_RECOUNT_SECONDS', '3600'))
+        self.recount_seconds = recount_seconds
+        self._last_recount = None
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _use_postgresql(self) -> bool:
+        return getattr(self._get_db(), '_use_postgresql', False)
+
+    def _execute(self, conn, sql: str, params=None):
+        """Run a named-parameter statement on SQLite or PostgreSQL"""
+        if self._use_postgresql():
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    def run(self, recount: Optional[bool] = None) -> Dict:
+        """
+        Verify every month with a changed partition checksum and persist the results.
+        With recount (default: when recount_seconds have passed since the last one)
+        also verify the months whose raw lines no longer match their partitions.
+        """
+        periods = self.changed_periods()
+        if recount is None:
+            recount = self._last_recount is None or time.monotonic() - self._last_recount >= self.recount_seconds
+        if recount:
+            periods = sorted(set(periods) | set(self.drifted_periods()))
+            self._last_recount = time.monotonic()
+        if periods:
+            workers = max(1, min(self.workers, len(periods)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ledger-check') as executor:
+                results = list(executor.map(self.verify_period, periods))
+            self._persist(results)
+        else:
+            results = []
+        invalid = [r['period'] for r in results if r['status'] == 'invalid']
+        if invalid:
+            log.warning("Ledger consistency: %d of %d changed months invalid: %s", len(invalid), len(results), invalid)
+        return {'periods_verified': periods, 'invalid_periods': invalid}
+
+    def changed_periods(self) -> List[str]:
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, """
+                SELECT DISTINCT period FROM ledger_partitions
+                WHERE verified_checksum IS NULL OR verified_checksum != checksum
+                ORDER BY period
+            """).fetchall()
+        finally:
+            db.release_connection(conn)
+        return [row[0] for row in rows]
+
+    def drifted_periods(self) -> List[str]:
+        """Months whose raw lines recount differently from ledger_partitions, e.g. written with the triggers off"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            if self._use_postgresql():
+                self._execute(conn, "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            else:
+                conn.execute("BEGIN")
+            stored = {(row[0], row[1]): row[2:] for row in self._execute(conn, """
+                SELECT period, account_code, line_count, debit_total, credit_total, checksum
+                FROM ledger_partitions
+            """).fetchall()}
+            raw = {(row[0], row[1]): row[2:] for row in self._execute(conn, f"""
+                SELECT COALESCE(SUBSTR(je.date, 1, 7), ''), l.account_code, COUNT(*), SUM(COALESCE(l.debit, 0)),
+                       SUM(COALESCE(l.credit, 0)), SUM({ledger_line_checksum('l')}) % {LEDGER_CHECKSUM_MODULUS}
+                FROM journal_entry_lines l
+                LEFT JOIN journal_entries je ON je.id = l.journal_entry_id
+                GROUP BY COALESCE(SUBSTR(je.date, 1, 7), ''), l.account_code
+            """).fetchall()}
+        finally:
+            conn.rollback()
+            db.release_connection(conn)
+        drifted = sorted({key[0] for key in set(stored) | set(raw) if not _same_totals(stored.get(key), raw.get(key))})
+        if drifted:
+            log.warning("Ledger consistency: partition totals drifted from the journal lines in %s", drifted)
+        return drifted
+
+    def transaction_checks(self) -> Dict:
+        """Totals and sanity counts over the transactions table: one aggregate scan plus one grouped scan"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            totals = self._execute(conn, """
+                SELECT COUNT(*), COALESCE(SUM(CASE WHEN amount > 0 THEN amount END), 0),
+                       COALESCE(SUM(CASE WHEN amount < 0 THEN amount END), 0),
+                       COUNT(CASE WHEN amount < 0 THEN 1 END), COUNT(CASE WHEN date > :today THEN 1 END)
+                FROM transactions
+            """, {'today': date.today().isoformat()}).fetchone()
+            duplicates = self._execute(conn, """
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM transactions GROUP BY description, amount, date HAVING COUNT(*) > 1
+                ) duplicate_groups
+            """).fetchone()[0]
+        finally:
+            db.release_connection(conn)
+
+        total_transactions, total_income, total_expenses, negative, future = totals
+        issues = []
+        if negative:
+            issues.append(f"{negative} transactions with negative amounts")
+        if duplicates:
+            issues.append(f"{duplicates} potential duplicate transactions")
+        if future:
+            issues.append(f"{future} transactions with future dates")
+        return {
+            'total_transactions': int(total_transactions or 0),
+            'total_income': round(float(total_income or 0), 2),
+            'total_expenses': round(float(total_expenses or 0), 2),
+            'issues': issues
+        }
+
+    def verify_period(self, period: str) -> Dict:
+        """Check one month against its raw journal lines, from a single read snapshot"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            if self._use_postgresql():
+                self._execute(conn, "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            else:
+                conn.execute("BEGIN")
+            stored = {row[0]: row[1:] for row in self._execute(conn, """
+                SELECT account_code, line_count, debit_total, credit_total, checksum
+                FROM ledger_partitions WHERE period = :period
+            """, {'period': period}).fetchall()}
+            lines_where, params = self._period_filter(period)
+            raw = {row[0]: row[1:] for row in self._execute(conn, f"""
+                SELECT l.account_code, COUNT(*), SUM(COALESCE(l.debit, 0)), SUM(COALESCE(l.credit, 0)),
+                       SUM({ledger_line_checksum('l')}) % {LEDGER_CHECKSUM_MODULUS}
+                FROM journal_entry_lines l
+                LEFT JOIN journal_entries je ON je.id = l.journal_entry_id
+                WHERE {lines_where}
+                GROUP BY l.account_code
+            """, params).fetchall()}
+            unbalanced = [] if period == ORPHAN_PERIOD else [row[0] for row in self._execute(conn, f"""
+                SELECT je.id FROM journal_entries je
+                JOIN journal_entry_lines l ON l.journal_entry_id = je.id
+                WHERE {lines_where}
+                GROUP BY je.id
+                HAVING ABS(SUM(COALESCE(l.debit, 0)) - SUM(COALESCE(l.credit, 0))) > :tolerance
+                ORDER BY je.id
+            """, {**params, 'tolerance': AMOUNT_TOLERANCE}).fetchall()]
+        finally:
+            conn.rollback()
+            db.release_connection(conn)
+
+        issues = []
+        drifted = sorted(account for account in set(stored) | set(raw)
+                         if not _same_totals(stored.get(account), raw.get(account)))
+        if drifted:
+            issues.append({'check': 'partition_totals',
+                           'message': f"Stored totals differ from the journal lines for accounts {', '.join(drifted)}"})
+        line_count = sum(int(values[0]) for values in raw.values())
+        debit_total = round(sum(float(values[1] or 0) for values in raw.values()), 2)
+        credit_total = round(sum(float(values[2] or 0) for values in raw.values()), 2)
+        if unbalanced:
+            listed = ', '.join(unbalanced[:MAX_LISTED_ENTRIES]) + (' ...' if len(unbalanced) > MAX_LISTED_ENTRIES else '')
+            issues.append({'check': 'entry_balance',
+                           'message': f"{len(unbalanced)} entries with unequal debits and credits: {listed}"})
+        if abs(debit_total - credit_total) > AMOUNT_TOLERANCE:
+            issues.append({'check': 'trial_balance',
+                           'message': f"Debits {debit_total:.2f} and credits {credit_total:.2f} do not balance"})
+        if period == ORPHAN_PERIOD and line_count:
+            issues.append({'check': 'orphan_lines', 'message': f"{line_count} journal lines without a journal entry"})
+        return {
+            'period': period,
+            'status': 'invalid' if issues else 'valid',
+            'issues': issues,
+            'line_count': line_count,
+            'debit_total': debit_total,
+            'credit_total': credit_total,
+            # What was verified: later trigger updates leave the partition changed
+            'checksums': {account: int(values[3]) for account, values in stored.items()}
+        }
+
+    def report(self) -> Dict:
+        """Persisted results per month (newest first) with ledger-wide totals"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, """
+                SELECT period, status, issues, line_count, debit_total, credit_total, checked_at
+                FROM ledger_consistency_results
+                ORDER BY period DESC
+            """).fetchall()
+            totals = self._execute(conn, """
+                SELECT COALESCE(SUM(line_count), 0), COALESCE(SUM(debit_total), 0), COALESCE(SUM(credit_total), 0),
+                       COUNT(CASE WHEN verified_checksum IS NULL OR verified_checksum != checksum THEN 1 END)
+                FROM ledger_partitions
+            """).fetchone()
+        finally:
+            db.release_connection(conn)
+
+        periods = [{
+            'period': period,
+            'status': status,
+            'issues': json.loads(issues) if issues else [],
+            'line_count': int(line_count or 0),
+            'debit_total': float(debit_total or 0),
+            'credit_total': float(credit_total or 0),
+            'checked_at': str(checked_at) if checked_at else None
+        } for period, status, issues, line_count, debit_total, credit_total, checked_at in rows]
+        return {
+            'periods': periods,
+            'invalid_periods': [p['period'] for p in periods if p['status'] == 'invalid'],
+            'pending_partitions': int(totals[3] or 0),
+            'total_lines': int(totals[0] or 0),
+            'total_debits': round(float(totals[1] or 0), 2),
+            'total_credits': round(float(totals[2] or 0), 2),
+            'last_checked_at': max((p['checked_at'] for p in periods if p['checked_at']), default=None)
+        }
+
+    def _period_filter(self, period: str):
+        if period == ORPHAN_PERIOD:
+            return "je.id IS NULL", {}
+        try:
+            month = datetime.strptime(period, '%Y-%m')
+        except ValueError:
+            # Not a YYYY-MM date; match the partition key as the triggers computed it
+            return "SUBSTR(je.date, 1, 7) = :period", {'period': period}
+        next_period = f'{month.year + month.month // 12:04d}-{month.month % 12 + 1:02d}'
+        # 'YYYY-MM' <= 'YYYY-MM-DD' < next 'YYYY-MM': a range on idx_journal_entries_date
+        return "je.date >= :period AND je.date < :next_period", {'period': period, 'next_period': next_period}
+
+    def _persist(self, results: List[Dict]):
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            for result in results:
+                self._execute(conn, """
+                    INSERT INTO ledger_consistency_results
+                        (period, status, issues, line_count, debit_total, credit_total, checked_at)
+                    VALUES (:period, :status, :issues, :line_count, :debit_total, :credit_total, CURRENT_TIMESTAMP)
+                    ON CONFLICT (period) DO UPDATE SET
+                        status = excluded.status, issues = excluded.issues, line_count = excluded.line_count,
+                        debit_total = excluded.debit_total, credit_total = excluded.credit_total,
+                        checked_at = excluded.checked_at
+                """, {**{key: result[key] for key in ('period', 'status', 'line_count', 'debit_total', 'credit_total')},
+                      'issues': json.dumps(result['issues'])})
+                for account_code, checksum in result['checksums'].items():
+                    self._execute(conn, """
+                        UPDATE ledger_partitions SET verified_checksum = :checksum, verified_at = CURRENT_TIMESTAMP
+                        WHERE period = :period AND account_code = :account_code
+                    """, {'checksum': checksum, 'period': result['period'], 'account_code': account_code})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.release_connection(conn)
+
+
+def _same_totals(stored, raw) -> bool:
+    """Stored (count, debit, credit, checksum) against the recomputed ones; a missing side is all zero"""
+    stored = stored or (0, 0, 0, 0)
+    raw = raw or (0, 0, 0, 0)
+    return (int(stored[0]) == int(raw[0]) and int(stored[3]) == int(raw[3])
+            and abs(float(stored[1] or 0) - float(raw[1] or 0)) <= AMOUNT_TOLERANCE
+            and abs(float(stored[2] or 0) - float(raw[2] or 0)) <= AMOUNT_TOLERANCE)
+
+
+ledger_consistency = LedgerConsistencyChecker()
@@ -9,9 +9,11 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
 
+from config import sqlite_db_path
+
 class LLMAssetManager:
-    def __init__(self, db_path: str = 'kamioi.db'):
-        self.db_path = db_path
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or sqlite_db_path()
         
     def get_connection(self):
         """Get database connection"""
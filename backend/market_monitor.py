@@ -1,6 +1,7 @@
 """
 AI-Powered Market Condition Monitoring System
 Monitors market conditions, competitor pricing, and provides AI-driven recommendations
+(transaction trends and volatility come from the daily behaviour rollup, see behavior_rollup.py)
 """
 
 import sqlite3
@@ -10,11 +11,17 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import numpy as np
 
+from behavior_rollup import BehaviorRollup, behavior_volatility, growth_rate, pooled_volatility
+from config import sqlite_db_path
+
+TREND_WINDOW_DAYS = 30
+
 class MarketMonitor:
     """AI-powered market condition monitoring and analysis"""
     
-    def __init__(self, db_path: str = 'kamioi.db'):
-        self.db_path = db_path
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or sqlite_db_path()
+        self.rollup = BehaviorRollup(self.db_path)
         self.competitor_apis = {
             'competitor_a': 'https://api.competitor-a.com/pricing',
             'competitor_b': 'https://api.competitor-b.com/fees',
@@ -56,6 +63,10 @@ class MarketMonitor:
     
     def _gather_market_data(self) -> Dict:
         """Gather market data from various sources"""
+        # Roll up the transactions added since the last run; the trend and
+        # volatility figures below only read the rollup
+        self.rollup.refresh()
+        
         market_data = {
             'volatility': self._calculate_market_volatility(),
             'competitor_fees': self._fetch_competitor_pricing(),
@@ -67,40 +78,28 @@ class MarketMonitor:
         return market_data
     
     def _calculate_market_volatility(self) -> float:
-        """Calculate market volatility based on transaction patterns"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get transaction data for volatility calculation
-        cursor.execute("""
-            SELECT amount, fee, created_at
-            FROM transactions 
-            WHERE created_at >= date('now', '-30 days')
-            ORDER BY created_at
-        """)
-        
-        transactions = cursor.fetchall()
-        conn.close()
+        """Calculate market volatility from local price history, else from transaction patterns"""
+        try:
+            from price_history import price_history_store
+            price_volatility = price_history_store.get_volatility(price_history_store.get_tracked_tickers())
+        except Exception as e:
+            print(f"Price history volatility unavailable: {e}")
+            price_volatility = None
+        if price_volatility is not None:
+            return min(0.1, max(0.01, price_volatility))  # Clamp between 0.01 and 0.1
         
-        if len(transactions) < 10:
+        series = self.rollup.series(TREND_WINDOW_DAYS)
+        if series['transaction_count'].sum() < 10:
             return 0.025  # Default volatility
         
-        # Calculate fee volatility
-        fees = [t[1] for t in transactions if t[1]]
-        if len(fees) > 1:
-            fee_volatility = np.std(fees) / np.mean(fees) if np.mean(fees) > 0 else 0.025
-        else:
-            fee_volatility = 0.025
-        
-        # Calculate transaction amount volatility
-        amounts = [t[0] for t in transactions if t[0]]
-        if len(amounts) > 1:
-            amount_volatility = np.std(amounts) / np.mean(amounts) if np.mean(amounts) > 0 else 0.025
-        else:
-            amount_volatility = 0.025
+        # Fee and transaction amount volatility over every (non-zero) value in the window
+        fee_volatility = pooled_volatility(series['fee_nonzero_count'], series['fee_total'], series['fee_sq_total'])
+        amount_volatility = pooled_volatility(series['amount_nonzero_count'], series['amount_total'],
+                                              series['amount_sq_total'])
         
         # Combine volatilities
-        combined_volatility = (fee_volatility + amount_volatility) / 2
+        combined_volatility = ((fee_volatility if fee_volatility is not None else 0.025) +
+                               (amount_volatility if amount_volatility is not None else 0.025)) / 2
         
         return min(0.1, max(0.01, combined_volatility))  # Clamp between 0.01 and 0.1
     
@@ -140,83 +139,37 @@ class MarketMonitor:
     
     def _analyze_user_behavior_trends(self) -> Dict:
         """Analyze user behavior trends for market insights"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get user behavior trends
-        cursor.execute("""
-            SELECT 
-                DATE(created_at) as date,
-                COUNT(*) as transaction_count,
-                AVG(amount) as avg_amount,
-                AVG(fee) as avg_fee
-            FROM transactions 
-            WHERE created_at >= date('now', '-30 days')
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """)
-        
-        daily_trends = cursor.fetchall()
+        series = self.rollup.series(TREND_WINDOW_DAYS)
+        transaction_counts = series['transaction_count']
         
         # Calculate trends
-        if len(daily_trends) > 1:
-            transaction_counts = [t[1] for t in daily_trends]
-            avg_amounts = [t[2] for t in daily_trends if t[2]]
-            avg_fees = [t[3] for t in daily_trends if t[3]]
+        if len(transaction_counts) > 1:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                avg_amounts = series['amount_total'] / series['amount_count']
+                avg_fees = series['fee_total'] / series['fee_count']
+            # Days without a (non-zero) average drop out, as before
+            avg_amounts = avg_amounts[np.nan_to_num(avg_amounts) != 0]
+            avg_fees = avg_fees[np.nan_to_num(avg_fees) != 0]
             
             # Calculate growth rates
-            transaction_growth = self._calculate_growth_rate(transaction_counts)
-            amount_growth = self._calculate_growth_rate(avg_amounts) if avg_amounts else 0
-            fee_growth = self._calculate_growth_rate(avg_fees) if avg_fees else 0
+            transaction_growth = growth_rate(transaction_counts)
+            amount_growth = growth_rate(avg_amounts)
+            fee_growth = growth_rate(avg_fees)
         else:
             transaction_growth = 0
             amount_growth = 0
             fee_growth = 0
         
-        conn.close()
-        
         return {
             'transaction_growth_rate': transaction_growth,
             'amount_growth_rate': amount_growth,
             'fee_growth_rate': fee_growth,
             'trend_direction': 'up' if transaction_growth > 0 else 'down',
-            'volatility_score': self._calculate_behavior_volatility(daily_trends)
+            'volatility_score': behavior_volatility(transaction_counts),
+            'active_users': int(series['active_users'][-1]) if len(transaction_counts) else 0,
+            'roundup_volume': float(series['roundup_volume'].sum())
         }
     
-    def _calculate_growth_rate(self, values: List[float]) -> float:
-        """Calculate growth rate for a series of values"""
-        if len(values) < 2:
-            return 0.0
-        
-        first_half = values[:len(values)//2]
-        second_half = values[len(values)//2:]
-        
-        if not first_half or not second_half:
-            return 0.0
-        
-        first_avg = sum(first_half) / len(first_half)
-        second_avg = sum(second_half) / len(second_half)
-        
-        if first_avg == 0:
-            return 0.0
-        
-        return (second_avg - first_avg) / first_avg
-    
-    def _calculate_behavior_volatility(self, daily_trends: List) -> float:
-        """Calculate volatility in user behavior"""
-        if len(daily_trends) < 3:
-            return 0.5
-        
-        transaction_counts = [t[1] for t in daily_trends]
-        if len(transaction_counts) < 2:
-            return 0.5
-        
-        mean_count = sum(transaction_counts) / len(transaction_counts)
-        variance = sum((count - mean_count) ** 2 for count in transaction_counts) / len(transaction_counts)
-        volatility = (variance ** 0.5) / mean_count if mean_count > 0 else 0.5
-        
-        return min(1.0, max(0.0, volatility))
-    
     def _get_economic_indicators(self) -> Dict:
         """Get economic indicators (simulated for demo)"""
         # In a real implementation, this would fetch from economic data APIs
@@ -306,12 +306,71 @@ def create_postgres_schema():
                 status VARCHAR(50) DEFAULT 'queued',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 processed_at TIMESTAMP,
+                order_id VARCHAR(255),
+                fill_price REAL,
+                shares REAL,
                 FOREIGN KEY (transaction_id) REFERENCES transactions (id) ON DELETE CASCADE,
                 FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
             )
         ''')
         print("[OK] Created market_queue table")
         
+        # Positions table (holdings maintained on every purchase, marked to market periodically)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS positions (
+                user_id INTEGER NOT NULL,
+                ticker VARCHAR(10) NOT NULL,
+                shares REAL NOT NULL DEFAULT 0,
+                cost_basis REAL NOT NULL DEFAULT 0,
+                last_price REAL,
+                market_value REAL DEFAULT 0,
+                marked_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, ticker),
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        print("[OK] Created positions table")
+        
+        # Price history table (local time series fed by the quote service)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_history (
+                ticker VARCHAR(10) NOT NULL,
+                resolution VARCHAR(20) NOT NULL DEFAULT 'daily',
+                ts TIMESTAMP NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL NOT NULL,
+                volume REAL,
+                source VARCHAR(50),
+                PRIMARY KEY (ticker, resolution, ts)
+            )
+        ''')
+        print("[OK] Created price_history table")
+        
+        # Stress test runs (built-in load generator results, kept for trend comparison)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stress_test_runs (
+                id SERIAL PRIMARY KEY,
+                scenario VARCHAR(50) NOT NULL,
+                mode VARCHAR(20) NOT NULL,
+                users INTEGER NOT NULL,
+                duration_seconds REAL NOT NULL,
+                requests INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                throughput_rps REAL,
+                p50_ms REAL,
+                p95_ms REAL,
+                p99_ms REAL,
+                lock_wait_p95_ms REAL,
+                result_json TEXT,
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP
+            )
+        ''')
+        print("[OK] Created stress_test_runs table")
+        
         # LLM Mappings table (14M+ records - critical for performance)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS llm_mappings (
@@ -358,6 +417,10 @@ def create_postgres_schema():
                 status VARCHAR(50) DEFAULT 'pending',
                 swept_at TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                entry_id VARCHAR(255),
+                original_amount REAL,
+                total_debit REAL,
+                sweep_batch_id VARCHAR(255),
                 FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
                 FOREIGN KEY (transaction_id) REFERENCES transactions (id) ON DELETE CASCADE
             )
@@ -572,7 +635,18 @@ def create_postgres_schema():
             )
         ''')
         print("[OK] Created promo_code_usage table")
-        
+
+        # Schema version (this script is migration 1; later ones: python schema_migrations.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("INSERT INTO schema_version (version, name) VALUES (1, 'baseline') ON CONFLICT (version) DO NOTHING")
+        print("[OK] Created schema_version table")
+
         # Initialize default admin settings
         cursor.execute('''
             INSERT INTO admin_settings (setting_key, setting_value, setting_type, description)
@@ -655,11 +729,20 @@ def create_indexes(cursor, conn):
     # Market queue indexes
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_status ON market_queue(status)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_user_id ON market_queue(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_queue_order_id ON market_queue(order_id)')
     print("[OK] Created market_queue indexes")
     
+    # Positions indexes
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_positions_ticker ON positions(ticker)')
+    print("[OK] Created positions indexes")
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stress_test_runs_scenario ON stress_test_runs(scenario, started_at)')
+    print("[OK] Created stress_test_runs indexes")
+    
     # Round-up ledger indexes
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_user_id ON roundup_ledger(user_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_status ON roundup_ledger(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_roundup_ledger_user_status ON roundup_ledger(user_id, status)')
     print("[OK] Created roundup_ledger indexes")
     
     # User subscriptions indexes
@@ -0,0 +1,565 @@
+"""
+Order Netting Engine for Kamioi Platform
+Aggregates pending round-up buys by ticker, submits one broker order per ticker
+and allocates the fill back to users as fractional shares.
+
+Both the admin sweep (`/api/admin/roundup/sweep-all`) and after-hours mapping
+(`SmartLLMProcessor.queue_for_next_day`) feed the `market_queue` table; draining
+it here replaces one broker call per user per ticker with one call per ticker.
+
+A drain first claims its rows (status 'submitting' under a fresh batch id), so
+a concurrent drain cannot pick them up, and each netted order carries the
+client_order_id `kamioi-<batch>-<ticker>`. Claims older than
+ORDER_NETTING_CLAIM_TIMEOUT_SECONDS (a crash mid-submit) are retried under the
+same batch id, so the broker rejects a duplicate instead of buying twice and
+the existing order is looked up and recorded.
+
+Only what the broker reports as filled is booked. A market order is usually
+accepted before it fills: its rows wait in status 'ordered' and every drain
+first reconciles them against the broker. A final order books its
+filled_qty at filled_avg_price. The unfilled dollars of a partial fill go
+back to the queue as new rows, and an order that ended without a fill
+releases its rows.
+"""
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils.rate_limiter import TokenBucket
+
+# Broker order statuses after which filled_qty no longer changes
+FINAL_ORDER_STATUSES = ('filled', 'canceled', 'expired', 'rejected')
+
+
+class OrderNettingEngine:
+    def __init__(self, broker=None, db_manager=None, account_id: str = None,
+                 max_concurrency: int = None, orders_per_minute: int = None, position_store=None):
+        self._broker = broker
+        self._db_manager = db_manager
+        self._position_store = position_store
+        self.account_id = account_id or os.getenv('ALPACA_FIRM_ACCOUNT_ID')
+        self.max_concurrency = max_concurrency or int(os.getenv('ORDER_NETTING_CONCURRENCY', '4'))
+        # Alpaca allows 200 requests/minute per key; stay under it by default
+        self.rate_limiter = TokenBucket(
+            rate_per_minute=orders_per_minute or int(os.getenv('ORDER_NETTING_ORDERS_PER_MINUTE', '180')),
+            burst=self.max_concurrency
+        )
+        self.min_order_notional = 1.00  # Broker minimum for notional (fractional) orders
+        self.share_precision = 6
+        self.claim_timeout = timedelta(seconds=int(os.getenv('ORDER_NETTING_CLAIM_TIMEOUT_SECONDS', '900')))
+
+    # ------------------------------------------------------------------
+    # Dependencies
+    # ------------------------------------------------------------------
+
+    @property
+    def broker(self):
+        if self._broker is None:
+            from alpaca_service import AlpacaService
+            self._broker = AlpacaService()
+        return self._broker
+
+    @property
+    def position_store(self):
+        if self._position_store is None:
+            from positions import PositionStore
+            self._position_store = PositionStore(db_manager=self._get_db())
+        return self._position_store
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _execute(self, conn, sql: str, params: Dict = None):
+        """Run a named-parameter statement on either SQLite or PostgreSQL"""
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    @staticmethod
+    def _in_clause(prefix: str, values: List, params: Dict) -> str:
+        """Expand a list into named placeholders usable by sqlite3 and SQLAlchemy"""
+        names = []
+        for i, value in enumerate(values):
+            name = f"{prefix}{i}"
+            params[name] = value
+            names.append(f":{name}")
+        return ', '.join(names)
+
+    # ------------------------------------------------------------------
+    # Netting
+    # ------------------------------------------------------------------
+
+    def net_orders(self, orders: List[Dict]) -> Dict[str, Dict]:
+        """
+        Group buy requests by ticker.
+
+        Each order is a dict with 'ticker', 'amount', 'user_id' and optionally
+        'queue_id' / 'transaction_id'. Returns {ticker: {'total_amount', 'allocations'}}.
+        """
+        netted: Dict[str, Dict] = {}
+        for order in orders:
+            ticker = (order.get('ticker') or '').upper()
+            amount = float(order.get('amount') or 0)
+            if not ticker or amount <= 0:
+                continue
+            bucket = netted.setdefault(ticker, {'ticker': ticker, 'total_amount': 0.0, 'allocations': []})
+            bucket['total_amount'] += amount
+            bucket['allocations'].append(dict(order, ticker=ticker, amount=amount))
+
+        for bucket in netted.values():
+            bucket['total_amount'] = round(bucket['total_amount'], 2)
+        return netted
+
+    def allocate_fill(self, allocations: List[Dict], total_amount: float, filled_qty: float) -> List[Dict]:
+        """
+        Split a filled quantity across users pro rata to their dollar amounts.
+
+        Any rounding residual goes to the largest allocation so the per-user
+        shares always add up to exactly what the broker filled.
+        """
+        if not allocations or total_amount <= 0:
+            return []
+
+        shares_per_dollar = filled_qty / total_amount
+        result = []
+        for allocation in allocations:
+            shares = round(allocation['amount'] * shares_per_dollar, self.share_precision)
+            result.append(dict(allocation, shares=shares))
+
+        residual = round(filled_qty - sum(a['shares'] for a in result), self.share_precision)
+        if residual:
+            largest = max(result, key=lambda a: a['amount'])
+            largest['shares'] = round(largest['shares'] + residual, self.share_precision)
+        return result
+
+    def _find_order(self, client_order_id: str) -> Optional[Dict]:
+        """The broker's order for a client_order_id; None if it was never placed, raises if unknown"""
+        lookup = getattr(self.broker, 'get_order_by_client_order_id', None)
+        if lookup is None:
+            return None
+        return lookup(client_order_id, account_id=self.account_id)
+
+    def _submit_ticker(self, bucket: Dict) -> Dict:
+        """
+        Submit one aggregated order for a ticker and work out its fill.
+
+        'release' on a failed result means the order certainly was not placed
+        (or ended without a fill) and its rows can go back to the queue;
+        'pending' means the order is open at the broker; otherwise they stay claimed.
+        """
+        ticker = bucket['ticker']
+        total_amount = bucket['total_amount']
+        client_order_id = bucket.get('client_order_id')
+
+        if total_amount < self.min_order_notional:
+            return {'ticker': ticker, 'success': False, 'deferred': True, 'release': True,
+                    'allocations': bucket['allocations'],
+                    'reason': f'Below minimum order of ${self.min_order_notional:.2f}'}
+
+        self.rate_limiter.acquire()
+        try:
+            order = self.broker.buy_fractional_shares(
+                account_id=self.account_id,
+                symbol=ticker,
+                dollar_amount=total_amount,
+                client_order_id=client_order_id
+            )
+        except Exception as e:
+            return {'ticker': ticker, 'success': False, 'allocations': bucket['allocations'], 'reason': str(e)}
+
+        if not order and client_order_id:
+            # Rejected, or a retried batch whose order already exists (duplicate client_order_id)
+            try:
+                order = self._find_order(client_order_id)
+            except Exception as e:
+                return {'ticker': ticker, 'success': False, 'allocations': bucket['allocations'],
+                        'reason': f'Order status unknown: {e}'}
+
+        if not order:
+            return {'ticker': ticker, 'success': False, 'release': True, 'allocations': bucket['allocations'],
+                    'reason': 'Broker rejected order'}
+        return self._order_result(bucket, order)
+
+    def _order_result(self, bucket: Dict, order: Dict) -> Dict:
+        """
+        What to book for a placed order: its actual fill once the order is
+        final, nothing while it is still open at the broker.
+        """
+        ticker = bucket['ticker']
+        total_amount = bucket['total_amount']
+        status = (order.get('status') or '').lower()
+        filled_qty = float(order.get('filled_qty') or 0)
+        fill_price = float(order.get('filled_avg_price') or 0)
+        result = {'ticker': ticker, 'client_order_id': bucket.get('client_order_id'), 'order_id': order.get('id'),
+                  'order_status': status, 'allocations': bucket['allocations']}
+
+        if status not in FINAL_ORDER_STATUSES:
+            return dict(result, success=False, pending=True, reason=f"Order {status or 'accepted'}, not filled yet")
+        if filled_qty <= 0 or fill_price <= 0:
+            return dict(result, success=False, release=True, reason=f'Order {status} without a fill')
+
+        # Dollars actually bought; a partial fill leaves the rest to re-queue
+        filled_amount = min(total_amount, filled_qty * fill_price)
+        filled_fraction = 1.0 if total_amount - filled_amount < 0.01 else filled_amount / total_amount
+        return dict(
+            result,
+            success=True,
+            fill_price=fill_price,
+            filled_qty=round(filled_qty, self.share_precision),
+            total_amount=total_amount,
+            filled_fraction=filled_fraction,
+            allocations=self.allocate_fill(bucket['allocations'], total_amount, filled_qty)
+        )
+
+    def submit_netted(self, netted: Dict[str, Dict]) -> List[Dict]:
+        """Submit one order per ticker with bounded concurrency"""
+        if not netted:
+            return []
+        workers = max(1, min(self.max_concurrency, len(netted)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self._submit_ticker, netted.values()))
+
+    # ------------------------------------------------------------------
+    # market_queue integration
+    # ------------------------------------------------------------------
+
+    def enqueue(self, orders: List[Dict]) -> int:
+        """Insert buy requests into market_queue in a single transaction"""
+        rows = [o for o in orders if o.get('ticker') and float(o.get('amount') or 0) > 0]
+        if not rows:
+            return 0
+
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._insert_queued(conn, rows)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+        return len(rows)
+
+    def _insert_queued(self, conn, rows: List[Dict]):
+        sql = """
+            INSERT INTO market_queue (transaction_id, user_id, ticker, amount, status, created_at)
+            VALUES (:transaction_id, :user_id, :ticker, :amount, 'queued', :created_at)
+        """
+        now = datetime.now().isoformat()
+        params = [{
+            'transaction_id': o.get('transaction_id'),
+            'user_id': o.get('user_id'),
+            'ticker': o['ticker'].upper(),
+            'amount': float(o['amount']),
+            'created_at': now
+        } for o in rows]
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            conn.execute(text(sql), params)
+        else:
+            conn.executemany(sql, params)
+
+    def _claim_queued(self, limit: Optional[int]) -> List[Dict]:
+        """Move queued rows to 'submitting' under a new batch id and return them"""
+        batch_id = uuid.uuid4().hex[:16]
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            params = {'batch_id': batch_id, 'now': datetime.now().isoformat()}
+            limit_clause = ''
+            if limit:
+                limit_clause = 'LIMIT :limit'
+                params['limit'] = int(limit)
+            # SKIP LOCKED lets concurrent PostgreSQL drains claim disjoint rows;
+            # SQLite serializes the UPDATE, and the status re-check covers both
+            lock_clause = 'FOR UPDATE SKIP LOCKED' if getattr(db, '_use_postgresql', False) else ''
+            self._execute(conn, f"""
+                UPDATE market_queue
+                SET status = 'submitting', batch_id = :batch_id, claimed_at = :now
+                WHERE status = 'queued' AND id IN (
+                    SELECT id FROM market_queue
+                    WHERE status = 'queued'
+                    ORDER BY created_at, id
+                    {limit_clause}
+                    {lock_clause}
+                )
+            """, params)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+        return self._load_batch(batch_id)
+
+    def _claim_stale(self) -> List[Dict]:
+        """
+        Re-claim batches left 'submitting' past the claim timeout (a drain
+        that crashed mid-submit), keeping their batch ids and so their
+        client_order_ids.
+        """
+        cutoff = (datetime.now() - self.claim_timeout).isoformat()
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            batch_ids = [r[0] for r in self._execute(conn, """
+                SELECT DISTINCT batch_id FROM market_queue
+                WHERE status = 'submitting' AND claimed_at < :cutoff
+            """, {'cutoff': cutoff}).fetchall()]
+            claimed = []
+            for batch_id in batch_ids:
+                result = self._execute(conn, """
+                    UPDATE market_queue SET claimed_at = :now
+                    WHERE batch_id = :batch_id AND status = 'submitting' AND claimed_at < :cutoff
+                """, {'batch_id': batch_id, 'cutoff': cutoff, 'now': datetime.now().isoformat()})
+                if result.rowcount:  # another drain did not refresh it first
+                    claimed.append(batch_id)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+        return [row for batch_id in claimed for row in self._load_batch(batch_id)]
+
+    def _load_batch(self, batch_id: str) -> List[Dict]:
+        return self._load_rows("batch_id = :batch_id AND status = 'submitting'", {'batch_id': batch_id})
+
+    def _load_rows(self, where: str, params: Dict) -> List[Dict]:
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT id, transaction_id, user_id, ticker, amount, batch_id
+                FROM market_queue
+                WHERE {where}
+                ORDER BY created_at, id
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+        return [{'queue_id': r[0], 'transaction_id': r[1], 'user_id': r[2], 'ticker': r[3], 'amount': r[4],
+                 'batch_id': r[5]} for r in rows]
+
+    def reconcile_open_orders(self) -> List[Dict]:
+        """Look up every order left open at the broker ('ordered' rows) and work out its fill"""
+        results = []
+        for client_order_id, bucket in self.net_claimed(self._load_rows("status = 'ordered'", {})).items():
+            self.rate_limiter.acquire()
+            try:
+                order = self._find_order(client_order_id)
+            except Exception as e:
+                results.append({'ticker': bucket['ticker'], 'success': False, 'queue_status': 'ordered',
+                                'allocations': bucket['allocations'], 'reason': f'Order status unknown: {e}'})
+                continue
+            if not order:
+                results.append({'ticker': bucket['ticker'], 'success': False, 'queue_status': 'ordered',
+                                'allocations': bucket['allocations'], 'reason': 'Open order not found at the broker'})
+                continue
+            results.append(self._order_result(bucket, order))
+        return results
+
+    def _queue_ids(self, results: List[Dict]) -> List:
+        return [a['queue_id'] for r in results for a in r.get('allocations', []) if a.get('queue_id') is not None]
+
+    def _release(self, results: List[Dict]):
+        """Return the rows of orders that were certainly not placed, or ended unfilled, to the queue"""
+        queue_ids = self._queue_ids(results)
+        if not queue_ids:
+            return
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            params = {}
+            queue_in = self._in_clause('q', queue_ids, params)
+            self._execute(conn, f"""
+                UPDATE market_queue SET status = 'queued', batch_id = NULL, claimed_at = NULL, order_id = NULL
+                WHERE id IN ({queue_in}) AND status IN ('submitting', 'ordered')
+            """, params)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    def _mark_ordered(self, results: List[Dict]):
+        """Keep the rows of orders still open at the broker for the next reconciliation"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            for result in results:
+                params = {'order_id': result.get('order_id')}
+                queue_in = self._in_clause('q', self._queue_ids([result]), params)
+                if not queue_in:
+                    continue
+                self._execute(conn, f"""
+                    UPDATE market_queue SET status = 'ordered', order_id = :order_id
+                    WHERE id IN ({queue_in}) AND status IN ('submitting', 'ordered')
+                """, params)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    def _record_fills(self, fills: List[Dict]):
+        """Write fills back with one UPDATE per ticker on each table"""
+        now = datetime.now().isoformat()
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            for fill in fills:
+                allocations = [a for a in fill['allocations'] if a.get('queue_id') is not None]
+                if not allocations:
+                    continue
+                fraction = fill.get('filled_fraction', 1.0)
+                shares_per_dollar = fill['filled_qty'] / fill['total_amount']
+
+                params = {
+                    'order_id': fill['order_id'],
+                    'fill_price': fill['fill_price'],
+                    'shares_per_dollar': shares_per_dollar,
+                    'fraction': fraction,
+                    'processed_at': now
+                }
+                queue_in = self._in_clause('q', [a['queue_id'] for a in allocations], params)
+                # amount keeps the dollars this order bought; SET reads the old amount
+                updated = self._execute(conn, f"""
+                    UPDATE market_queue
+                    SET status = 'completed', processed_at = :processed_at, order_id = :order_id,
+                        fill_price = :fill_price, shares = amount * :shares_per_dollar, amount = amount * :fraction
+                    WHERE id IN ({queue_in}) AND status IN ('submitting', 'ordered')
+                """, params)
+                if not updated.rowcount:
+                    continue  # another drain already recorded this order
+
+                # Holdings move in the same transaction as the fill
+                self.position_store.apply_fills(conn, [{
+                    'user_id': a.get('user_id'),
+                    'ticker': fill['ticker'],
+                    'shares': a['shares'],
+                    'cost': round(a['amount'] * fraction, 2),
+                    'price': fill['fill_price']
+                } for a in allocations])
+
+                remainder = [dict(a, amount=round(a['amount'] * (1 - fraction), 2)) for a in allocations]
+                remainder = [a for a in remainder if a['amount'] > 0]
+                if remainder:
+                    self._insert_queued(conn, remainder)
+
+                tx_ids = [a['transaction_id'] for a in allocations if a.get('transaction_id')]
+                if not tx_ids:
+                    continue
+                params = {'ticker': fill['ticker'], 'fill_price': fill['fill_price']}
+                tx_in = self._in_clause('t', tx_ids, params)
+                # Completed once none of its dollars are still waiting to be bought
+                self._execute(conn, f"""
+                    UPDATE transactions
+                    SET ticker = :ticker, price_per_share = :fill_price, stock_price = :fill_price,
+                        shares = (SELECT SUM(mq.shares) FROM market_queue mq
+                                  WHERE mq.transaction_id = transactions.id AND mq.status = 'completed'),
+                        status = CASE WHEN EXISTS (
+                            SELECT 1 FROM market_queue mq
+                            WHERE mq.transaction_id = transactions.id AND mq.status IN ('queued', 'submitting', 'ordered')
+                        ) THEN status ELSE 'completed' END
+                    WHERE id IN ({tx_in})
+                """, params)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    def net_claimed(self, claimed: List[Dict]) -> Dict[str, Dict]:
+        """Net claimed rows per (batch, ticker), keyed by the order's client_order_id"""
+        batches: Dict[str, List[Dict]] = {}
+        for row in claimed:
+            batches.setdefault(row['batch_id'], []).append(row)
+        netted = {}
+        for batch_id, rows in batches.items():
+            for ticker, bucket in self.net_orders(rows).items():
+                bucket['client_order_id'] = f'kamioi-{batch_id}-{ticker}'
+                netted[bucket['client_order_id']] = bucket
+        return netted
+
+    def drain_market_queue(self, limit: int = None) -> Dict:
+        """Reconcile open orders, claim queued buys, net them by ticker, submit, and write fills back"""
+        reconciled = self.reconcile_open_orders()
+        queued = self._claim_stale() + self._claim_queued(limit)
+        if not queued and not reconciled:
+            return {'queued': 0, 'orders_submitted': 0, 'filled': 0, 'failed': []}
+
+        submitted = self.submit_netted(self.net_claimed(queued))
+        results = reconciled + submitted
+        fills = [r for r in results if r.get('success')]
+        if fills:
+            self._record_fills(fills)
+        pending = [r for r in results if r.get('pending')]
+        if pending:
+            self._mark_ordered(pending)
+        self._release([r for r in results if not r.get('success') and r.get('release')])
+
+        failed = [{'ticker': r['ticker'], 'reason': r.get('reason'),
+                   'status': 'queued' if r.get('release') else r.get('queue_status', 'submitting')}
+                  for r in results if not r.get('success') and not r.get('pending')]
+        if failed:
+            print(f"[ORDER NETTING] {len(failed)} ticker order(s) not filled: {failed}")
+
+        return {
+            'queued': len(queued),
+            'orders_submitted': len(submitted),
+            'filled': sum(len(r['allocations']) for r in fills),
+            'fills': [{k: r[k] for k in ('ticker', 'client_order_id', 'order_id', 'fill_price', 'filled_qty',
+                                         'total_amount')}
+                      for r in fills],
+            'open_orders': [{'ticker': r['ticker'], 'client_order_id': r['client_order_id'], 'order_id': r['order_id'],
+                             'order_status': r['order_status']} for r in pending],
+            'failed': failed
+        }
+
+    # ------------------------------------------------------------------
+    # Round-up sweeps
+    # ------------------------------------------------------------------
+
+    def _lookup_tickers(self, transaction_ids: List) -> Dict:
+        ids = [t for t in transaction_ids if t]
+        if not ids:
+            return {}
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            params = {}
+            id_in = self._in_clause('t', ids, params)
+            rows = self._execute(conn, f"""
+                SELECT id, ticker FROM transactions
+                WHERE id IN ({id_in}) AND ticker IS NOT NULL
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+        return {row[0]: row[1] for row in rows}
+
+    def sweep_roundups(self, roundup_engine, execute: bool = True) -> Dict:
+        """
+        Sweep every user's pending round-ups into market_queue and, if
+        `execute` is set, drain the queue as netted per-ticker orders.
+        Entries whose transaction has no ticker yet are swept without a buy.
+        """
+        sweep_results = []
+        swept_entries = []
+        for user_id in roundup_engine.get_users_with_pending():
+            entries = roundup_engine.get_pending_entries(user_id)
+            result = roundup_engine.manual_sweep(user_id)
+            sweep_results.append({'user_id': user_id, 'result': result})
+            if result.get('swept'):
+                swept_entries.extend(entries)
+
+        tickers = self._lookup_tickers([e['transaction_id'] for e in swept_entries])
+        orders = [{
+            'transaction_id': e['transaction_id'],
+            'user_id': e['user_id'],
+            'ticker': tickers.get(e['transaction_id']),
+            'amount': e['delta']
+        } for e in swept_entries if tickers.get(e['transaction_id'])]
+        queued = self.enqueue(orders)
+
+        return {
+            'sweeps': sweep_results,
+            'queued_orders': queued,
+            'execution': self.drain_market_queue() if execute else None
+        }
+
+
+# Global order netting engine instance
+order_netting_engine = OrderNettingEngine()
@@ -0,0 +1,273 @@
+"""
+Period Balances for Kamioi Platform
+Per-account month-end balance snapshots and open-period deltas from journal_entry_lines.
+
+Balance sheet, cash flow and financial analytics used to sum raw rows (and
+partly the transactions table) on every request. Here:
+
+- triggers keep account_period_deltas current (schema migration 15): one
+  row per (account, month of the entry date), adjusted in the same
+  transaction as every journal line insert, update or delete and every
+  entry date change; lines without an entry count nowhere
+- close_period() writes account_balance_snapshots for each month up to the
+  given one (opening, period debits/credits, closing per account), then
+  drops the deltas it folded in; deltas dated on or before an already
+  closed month (backdated entries) are folded into the next month closed
+- balances() is the last closing balance plus the open deltas, so a report
+  reads O(accounts) rows however many years of journal lines there are
+- rebuild() recomputes everything from the raw lines
+
+Amounts are kept debit-positive (debit - credit); balances() reports them
+in the account's normal-balance sign.
+"""
+
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from schema_migrations import period_delta_backfill
+from utils.log import get_logger
+
+log = get_logger('period_balances')
+
+# Account class by leading digit of the account code, used for accounts the
+# chart of accounts does not list (or when it is not there at all)
+ACCOUNT_CLASSES = {
+    '1': ('Asset', 'Debit'),
+    '2': ('Liability', 'Credit'),
+    '3': ('Equity', 'Credit'),
+    '4': ('Revenue', 'Credit'),
+    '5': ('COGS', 'Debit'),
+    '6': ('Expense', 'Debit'),
+    '7': ('Other Income/Expense', 'Credit'),
+}
+
+CASH_ACCOUNT_PREFIX = '101'  # 10100 Cash – Bank of America, 10150 Petty Cash
+
+# The previous month's closing balances plus every delta up to the month closed
+_CLOSE_PERIOD = """
+    INSERT INTO account_balance_snapshots
+        (period, account_code, opening_balance, period_debit, period_credit, closing_balance, closed_at)
+    SELECT :period, account_code, SUM(opening), SUM(debit), SUM(credit),
+           SUM(opening) + SUM(debit) - SUM(credit), CURRENT_TIMESTAMP
+    FROM (
+        SELECT account_code, closing_balance AS opening, 0 AS debit, 0 AS credit
+        FROM account_balance_snapshots WHERE period = :previous
+        UNION ALL
+        SELECT account_code, 0, debit_total, credit_total
+        FROM account_period_deltas WHERE period <= :period
+    ) movements
+    GROUP BY account_code
+"""
+
+
+class PeriodBalances:
+    """
+    Month-end account balance snapshots plus trigger-maintained open-period deltas.
+
+    Example:
+        period_balances.close_period('2024-05') # snapshot every unclosed month up to May 2024
+        period_balances.balances()              # [{'account_code': '10100', 'balance': ...}, ...]
+    """
+
+    def __init__(self, db_manager=None):
+        self._db_manager = db_manager
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _execute(self, conn, sql: str, params=None):
+        """Run a named-parameter statement on SQLite or PostgreSQL"""
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    def close_period(self, period: Optional[str] = None, today: Optional[date] = None) -> Dict:
+        """
+        Snapshot every unclosed month up to `period` ('YYYY-MM', default: the
+        month before today). Closing a month that is already closed is a no-op.
+        """
+        period = period or _previous_month(today or datetime.utcnow().date())
+        _parse_period(period)
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            last_closed = self._lock_state(conn)['last_closed_period']
+            if last_closed and period <= last_closed:
+                conn.commit()
+                return {'periods_closed': [], 'last_closed_period': last_closed}
+            closed = self._close_through(conn, period, last_closed)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.release_connection(conn)
+        log.info("Closed periods %s", closed)
+        return {'periods_closed': closed, 'last_closed_period': closed[-1] if closed else last_closed}
+
+    def rebuild(self) -> Dict:
+        """Recompute every snapshot and delta from the raw journal lines, up to the last closed month"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            last_closed = self._lock_state(conn)['last_closed_period']
+            for table in ('account_balance_snapshots', 'account_period_deltas'):
+                self._execute(conn, f"DELETE FROM {table}")
+            self._execute(conn, "UPDATE account_balance_state SET last_closed_period = NULL WHERE id = 1")
+            self._execute(conn, period_delta_backfill())
+            closed = self._close_through(conn, last_closed, None) if last_closed else []
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.release_connection(conn)
+        return {'periods_closed': closed, 'last_closed_period': last_closed}
+
+    def _close_through(self, conn, period: str, last_closed: Optional[str]) -> List[str]:
+        """Snapshot each month after `last_closed` up to `period` and fold in their deltas"""
+        if last_closed:
+            month = _next_month(last_closed)
+        else:
+            earliest = self._execute(conn, "SELECT MIN(period) FROM account_period_deltas").fetchone()[0]
+            month = min(earliest, period) if earliest else period
+        closed = []
+        while month <= period:
+            self._execute(conn, _CLOSE_PERIOD, {'period': month, 'previous': last_closed or ''})
+            self._execute(conn, "DELETE FROM account_period_deltas WHERE period <= :period", {'period': month})
+            closed.append(month)
+            last_closed, month = month, _next_month(month)
+        self._execute(conn, """
+            UPDATE account_balance_state SET last_closed_period = :period, updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+        """, {'period': last_closed})
+        return closed
+
+    def balances(self) -> List[Dict]:
+        """Every account's balance: the last closing balance plus the open deltas"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            last_closed = self._state(conn)['last_closed_period']
+            rows = self._execute(conn, """
+                SELECT account_code, SUM(opening), SUM(debit), SUM(credit)
+                FROM (
+                    SELECT account_code, closing_balance AS opening, 0 AS debit, 0 AS credit
+                    FROM account_balance_snapshots WHERE period = :period
+                    UNION ALL
+                    SELECT account_code, 0, debit_total, credit_total FROM account_period_deltas
+                ) movements
+                GROUP BY account_code
+                ORDER BY account_code
+            """, {'period': last_closed or ''}).fetchall()
+            accounts = self._accounts(conn)
+        finally:
+            db.release_connection(conn)
+
+        balances = []
+        for account_code, opening, debit, credit in rows:
+            opening, debit, credit = float(opening or 0), float(debit or 0), float(credit or 0)
+            info = accounts.get(account_code) or _account_class(account_code)
+            sign = -1 if info['normal_balance'] == 'Credit' else 1
+            balances.append({
+                'account_code': account_code,
+                'account_name': info.get('account_name') or account_code,
+                'account_type': info['account_type'],
+                'normal_balance': info['normal_balance'],
+                'opening_balance': round(sign * opening, 2),
+                'period_debit': round(debit, 2),
+                'period_credit': round(credit, 2),
+                'balance': round(sign * (opening + debit - credit), 2),
+                'as_of_period': last_closed
+            })
+        return balances
+
+    def movements(self, account_prefix: str, periods: int = 12) -> List[Dict]:
+        """Debits and credits per month for accounts starting with `account_prefix`, newest first"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            params = {'prefix': f'{account_prefix}%', 'periods': int(periods)}
+            rows = self._execute(conn, """
+                SELECT period, SUM(period_debit), SUM(period_credit)
+                FROM account_balance_snapshots
+                WHERE account_code LIKE :prefix
+                  AND period IN (SELECT DISTINCT period FROM account_balance_snapshots
+                                 ORDER BY period DESC LIMIT :periods)
+                GROUP BY period
+            """, params).fetchall()
+            rows += self._execute(conn, """
+                SELECT period, SUM(debit_total), SUM(credit_total)
+                FROM account_period_deltas
+                WHERE account_code LIKE :prefix
+                GROUP BY period
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+
+        # Backdated deltas share a closed month's label; report them with it
+        by_period: Dict[str, List[float]] = {}
+        for period, debit, credit in rows:
+            totals = by_period.setdefault(period, [0.0, 0.0])
+            totals[0] += float(debit or 0)
+            totals[1] += float(credit or 0)
+        return [{'period': period, 'debit': round(debit, 2), 'credit': round(credit, 2)}
+                for period, (debit, credit) in sorted(by_period.items(), reverse=True)[:int(periods)]]
+
+    def _lock_state(self, conn) -> Dict:
+        """
+        The state row, written first so closes and rebuilds run one at a time
+        (a write lock on SQLite, a row lock on PostgreSQL). On PostgreSQL the
+        deltas table is locked against journal writes too, so no trigger
+        update lands between a month's snapshot and the delete of its deltas.
+        """
+        self._execute(conn, """
+            INSERT INTO account_balance_state (id, last_line_id, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO NOTHING
+        """)
+        self._execute(conn, "UPDATE account_balance_state SET updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+        if getattr(self._get_db(), '_use_postgresql', False):
+            self._execute(conn, "LOCK TABLE account_period_deltas IN EXCLUSIVE MODE")
+        return self._state(conn)
+
+    def _state(self, conn) -> Dict:
+        row = self._execute(conn, "SELECT last_closed_period FROM account_balance_state WHERE id = 1").fetchone()
+        return {'last_closed_period': row[0] if row else None}
+
+    def _accounts(self, conn) -> Dict[str, Dict]:
+        """Names and types from chart_of_accounts, where the table exists"""
+        if not self._get_db().table_columns('chart_of_accounts'):
+            return {}
+        rows = self._execute(conn, """
+            SELECT account_number, account_name, account_type, normal_balance FROM chart_of_accounts
+        """).fetchall()
+        return {str(row[0]): {'account_name': row[1], 'account_type': row[2], 'normal_balance': row[3]}
+                for row in rows}
+
+
+def _account_class(account_code: str) -> Dict:
+    account_type, normal_balance = ACCOUNT_CLASSES.get(str(account_code)[:1], ('Other', 'Debit'))
+    return {'account_type': account_type, 'normal_balance': normal_balance}
+
+
+def _parse_period(period: str) -> date:
+    try:
+        return datetime.strptime(period, '%Y-%m').date()
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid period {period!r}, expected 'YYYY-MM'") from e
+
+
+def _next_month(period: str) -> str:
+    month = _parse_period(period)
+    return f'{month.year + month.month // 12:04d}-{month.month % 12 + 1:02d}'
+
+
+def _previous_month(today: date) -> str:
+    return f'{today.year - (today.month == 1):04d}-{(today.month - 2) % 12 + 1:02d}'
+
+
+period_balances = PeriodBalances()
@@ -0,0 +1,244 @@
+"""
+Position Store for Kamioi Platform
+Incrementally maintained holdings per user and ticker.
+
+- The positions table holds one row per (user_id, ticker) with shares and
+  cost basis, updated in the same database transaction that records a
+  purchase, so portfolio reads are O(holdings) instead of O(transactions)
+- A periodic mark-to-market pass prices every position from the local
+  price history store and stores market_value, so the platform-wide
+  portfolio value is a single SUM over positions
+- rebuild() recomputes positions from transactions (backfill / drift repair):
+    python positions.py --rebuild
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class PositionStore:
+    def __init__(self, db_manager=None, price_source=None):
+        self._db_manager = db_manager
+        self._price_source = price_source
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _get_price_source(self):
+        if self._price_source is None:
+            from price_history import price_history_store
+            self._price_source = price_history_store
+        return self._price_source
+
+    def _execute(self, conn, sql: str, params=None):
+        """Run a named-parameter statement (or executemany for a list) on SQLite or PostgreSQL"""
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        if isinstance(params, list):
+            return conn.executemany(sql, params)
+        return conn.execute(sql, params or {})
+
+    # ------------------------------------------------------------------
+    # Writes (called inside the caller's purchase transaction)
+    # ------------------------------------------------------------------
+
+    def apply_fills(self, conn, fills: List[Dict]):
+        """
+        Add purchased shares to positions without committing.
+
+        Each fill is a dict with 'user_id', 'ticker', 'shares', 'cost' and
+        optionally 'price'. The caller commits together with its own writes.
+        """
+        now = datetime.now().isoformat()
+        rows = []
+        for fill in fills:
+            ticker = (fill.get('ticker') or '').upper()
+            shares = float(fill.get('shares') or 0)
+            if not ticker or fill.get('user_id') is None or shares <= 0:
+                continue
+            cost = float(fill.get('cost') or 0)
+            price = fill.get('price') or (cost / shares)
+            rows.append({'user_id': int(fill['user_id']), 'ticker': ticker, 'shares': shares,
+                         'cost': cost, 'price': float(price), 'now': now})
+        if not rows:
+            return 0
+
+        self._execute(conn, """
+            INSERT INTO positions (user_id, ticker, shares, cost_basis, last_price, market_value, marked_at, updated_at)
+            VALUES (:user_id, :ticker, :shares, :cost, :price, :shares * :price, :now, :now)
+            ON CONFLICT (user_id, ticker) DO UPDATE SET
+                shares = positions.shares + excluded.shares,
+                cost_basis = positions.cost_basis + excluded.cost_basis,
+                last_price = excluded.last_price,
+                market_value = (positions.shares + excluded.shares) * excluded.last_price,
+                marked_at = excluded.marked_at,
+                updated_at = excluded.updated_at
+        """, rows)
+        return len(rows)
+
+    def apply_fill(self, conn, user_id: int, ticker: str, shares: float, cost: float, price: float = None):
+        return self.apply_fills(conn, [{'user_id': user_id, 'ticker': ticker, 'shares': shares,
+                                        'cost': cost, 'price': price}])
+
+    def reverse_fills(self, conn, where: str, params: Dict = None):
+        """
+        Take the purchases of the transactions matching `where` back out of
+        positions without committing. Call before deleting those transactions,
+        in the same database transaction.
+        """
+        rows = self._execute(conn, f"""
+            SELECT user_id, UPPER(ticker), SUM(shares), SUM(shares * COALESCE(price_per_share, stock_price, 0))
+            FROM transactions
+            WHERE ticker IS NOT NULL AND shares > 0 AND ({where})
+            GROUP BY user_id, UPPER(ticker)
+        """, params or {}).fetchall()
+        if not rows:
+            return 0
+
+        now = datetime.now().isoformat()
+        self._execute(conn, """
+            UPDATE positions
+            SET shares = shares - :shares,
+                cost_basis = cost_basis - :cost,
+                market_value = CASE WHEN shares > 0 THEN market_value * (shares - :shares) / shares ELSE 0 END,
+                updated_at = :now
+            WHERE user_id = :user_id AND ticker = :ticker
+        """, [{'user_id': user_id, 'ticker': ticker, 'shares': float(shares or 0), 'cost': float(cost or 0),
+               'now': now} for user_id, ticker, shares, cost in rows])
+        self._execute(conn, "DELETE FROM positions WHERE shares <= 0.000001")
+        return len(rows)
+
+    def rebuild(self, user_id: Optional[int] = None) -> int:
+        """Recompute positions from transactions, for all users or one"""
+        params = {'now': datetime.now().isoformat()}
+        user_filter = ''
+        if user_id is not None:
+            params['user_id'] = int(user_id)
+            user_filter = 'AND user_id = :user_id'
+
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, f"DELETE FROM positions WHERE 1 = 1 {user_filter}", params)
+            self._execute(conn, f"""
+                INSERT INTO positions (user_id, ticker, shares, cost_basis, last_price, market_value, marked_at, updated_at)
+                SELECT user_id, UPPER(ticker),
+                       SUM(shares),
+                       SUM(shares * COALESCE(price_per_share, stock_price, 0)),
+                       NULL,
+                       SUM(shares * COALESCE(stock_price, price_per_share, 0)),
+                       NULL,
+                       :now
+                FROM transactions
+                WHERE ticker IS NOT NULL AND shares > 0 {user_filter}
+                GROUP BY user_id, UPPER(ticker)
+            """, params)
+            count = self._execute(conn, f"SELECT COUNT(*) FROM positions WHERE 1 = 1 {user_filter}",
+                                  params).fetchone()[0]
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+        print(f"[POSITIONS] Rebuilt {count} positions from transactions")
+        return count
+
+    def ensure_backfilled(self) -> bool:
+        """Rebuild once if positions is empty but purchases exist (first run after upgrade)"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            has_positions = self._execute(conn, "SELECT 1 FROM positions LIMIT 1").fetchone()
+            has_purchases = has_positions or self._execute(
+                conn, "SELECT 1 FROM transactions WHERE ticker IS NOT NULL AND shares > 0 LIMIT 1").fetchone()
+        finally:
+            db.release_connection(conn)
+        if has_positions or not has_purchases:
+            return False
+        self.rebuild()
+        return True
+
+    def mark_to_market(self) -> Dict:
+        """Price every held ticker from local price history and refresh market values"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            tickers = [r[0] for r in self._execute(
+                conn, "SELECT DISTINCT ticker FROM positions WHERE shares > 0").fetchall()]
+            prices = self._get_price_source().get_latest_prices(tickers) if tickers else {}
+            now = datetime.now().isoformat()
+            rows = [{'ticker': ticker, 'price': float(price), 'now': now}
+                    for ticker, price in prices.items() if price]
+            if rows:
+                self._execute(conn, """
+                    UPDATE positions
+                    SET last_price = :price, market_value = shares * :price, marked_at = :now
+                    WHERE ticker = :ticker
+                """, rows)
+                conn.commit()
+        finally:
+            db.release_connection(conn)
+        return {'tickers': len(tickers), 'priced': len(rows)}
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get_portfolio_rows(self, user_id: int) -> List[tuple]:
+        """
+        Holdings for one user shaped like portfolios rows:
+        (ticker, shares, average_price, current_price, total_value, updated_at)
+        """
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, """
+                SELECT ticker, shares, cost_basis, last_price, market_value, updated_at
+                FROM positions
+                WHERE user_id = :user_id AND shares > 0
+                ORDER BY market_value DESC
+            """, {'user_id': int(user_id)}).fetchall()
+        finally:
+            db.release_connection(conn)
+        return [(ticker, shares, (cost_basis / shares) if shares else 0, last_price, market_value, updated_at)
+                for ticker, shares, cost_basis, last_price, market_value, updated_at in rows]
+
+    def get_total_value(self, exclude_user_ids: List[int] = None) -> float:
+        """Platform-wide portfolio value as one SUM over positions"""
+        params = {}
+        where = ''
+        if exclude_user_ids:
+            names = []
+            for i, user_id in enumerate(exclude_user_ids):
+                params[f'u{i}'] = int(user_id)
+                names.append(f':u{i}')
+            where = f"WHERE user_id NOT IN ({', '.join(names)})"
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            value = self._execute(conn, f"SELECT COALESCE(SUM(market_value), 0) FROM positions {where}",
+                                  params).fetchone()[0]
+        finally:
+            db.release_connection(conn)
+        return float(value or 0)
+
+
+# Global position store
+position_store = PositionStore()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Maintain the positions table')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute positions from transactions')
+    parser.add_argument('--user-id', type=int, help='Only rebuild this user')
+    parser.add_argument('--mark', action='store_true', help='Run a mark-to-market pass')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        position_store.rebuild(args.user_id)
+    if args.mark:
+        print(f"[POSITIONS] Mark-to-market: {position_store.mark_to_market()}")
@@ -0,0 +1,347 @@
+"""
+Price History Store for Kamioi Platform
+Local time series of daily/intraday prices per ticker, fed by the quote service.
+
+- Rows live in the price_history table keyed by (ticker, resolution, ts), so
+  range queries and "latest close" lookups are index seeks
+- Every quote the quote service fetches is folded into a daily bar and a
+  5-minute intraday bar (open/high/low/close), so portfolio valuations and
+  charts read locally instead of asking providers again
+- Closed daily bars for hot tickers are kept as NumPy arrays, memory-mapped
+  from PRICE_HISTORY_CACHE_DIR when it is set; today's live bar is kept in
+  memory and appended on read, so the cached arrays never need rewriting
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils.lazy_import import lazy_module
+
+try:
+    np = lazy_module('numpy')  # Loaded on the first cached-array read
+except ImportError:  # numpy is optional; the store falls back to plain lists
+    np = None
+
+
+DAILY = 'daily'
+INTRADAY = 'intraday'
+
+
+class PriceHistoryStore:
+    def __init__(self, db_manager=None, cache_dir: str = None, hot_tickers: int = 64,
+                 intraday_bucket_seconds: int = 300):
+        self._db_manager = db_manager
+        self.cache_dir = cache_dir
+        self.hot_tickers = hot_tickers
+        self.intraday_bucket_seconds = intraday_bucket_seconds
+        self._latest: Dict[str, tuple] = {}          # ticker -> (price, datetime)
+        self._live_bars: Dict[str, Dict] = {}        # ticker -> today's daily bar
+        self._hot: OrderedDict = OrderedDict()       # ticker -> (day built for, ts array, close array)
+        self._lock = threading.RLock()
+        if cache_dir and np is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Database helpers
+    # ------------------------------------------------------------------
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _use_postgresql(self) -> bool:
+        return getattr(self._get_db(), '_use_postgresql', False)
+
+    def _execute(self, conn, sql: str, params=None):
+        """Run a named-parameter statement (or executemany for a list) on SQLite or PostgreSQL"""
+        if self._use_postgresql():
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        if isinstance(params, list):
+            return conn.executemany(sql, params)
+        return conn.execute(sql, params or {})
+
+    @staticmethod
+    def _in_clause(prefix: str, values: List, params: Dict) -> str:
+        names = []
+        for i, value in enumerate(values):
+            name = f"{prefix}{i}"
+            params[name] = value
+            names.append(f":{name}")
+        return ', '.join(names)
+
+    @staticmethod
+    def _normalize(ticker: str) -> str:
+        return (ticker or '').strip().upper()
+
+    @staticmethod
+    def _format_ts(value: datetime) -> str:
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def _parse_ts(value) -> datetime:
+        if isinstance(value, datetime):
+            return value
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def _upsert_sql(self) -> str:
+        greatest, least = ('GREATEST', 'LEAST') if self._use_postgresql() else ('MAX', 'MIN')
+        return f"""
+            INSERT INTO price_history (ticker, resolution, ts, open, high, low, close, volume, source)
+            VALUES (:ticker, :resolution, :ts, :price, :price, :price, :price, :volume, :source)
+            ON CONFLICT (ticker, resolution, ts) DO UPDATE SET
+                high = {greatest}(price_history.high, excluded.high),
+                low = {least}(price_history.low, excluded.low),
+                close = excluded.close,
+                volume = COALESCE(excluded.volume, price_history.volume),
+                source = excluded.source
+        """
+
+    def _bucket(self, when: datetime) -> datetime:
+        seconds = int(when.timestamp()) // self.intraday_bucket_seconds * self.intraday_bucket_seconds
+        return datetime.fromtimestamp(seconds)
+
+    def record_quotes(self, quotes: Dict[str, Dict]):
+        """Fold fetched quotes into daily and intraday bars (quote service listener)"""
+        rows = []
+        with self._lock:
+            for ticker, quote in quotes.items():
+                if not quote or not quote.get('price'):
+                    continue
+                ticker = self._normalize(ticker)
+                price = float(quote['price'])
+                when = quote.get('timestamp')
+                when = when if isinstance(when, datetime) else datetime.utcnow()
+                day = datetime(when.year, when.month, when.day)
+                params = {'ticker': ticker, 'price': price, 'volume': quote.get('volume'),
+                          'source': quote.get('source')}
+                rows.append(dict(params, resolution=DAILY, ts=self._format_ts(day)))
+                rows.append(dict(params, resolution=INTRADAY, ts=self._format_ts(self._bucket(when))))
+
+                self._latest[ticker] = (price, when)
+                bar = self._live_bars.get(ticker)
+                if bar is None or bar['day'] != day:
+                    self._live_bars[ticker] = {'day': day, 'close': price}
+                else:
+                    bar['close'] = price
+        if not rows:
+            return
+
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, self._upsert_sql(), rows)
+            conn.commit()
+        except Exception as e:
+            print(f"[PRICE HISTORY] Failed to record {len(rows)} bars: {e}")
+        finally:
+            db.release_connection(conn)
+
+    def record_bars(self, ticker: str, bars: List[Dict], resolution: str = DAILY):
+        """Backfill historical bars (dicts with ts, open, high, low, close, volume)"""
+        ticker = self._normalize(ticker)
+        rows = [{
+            'ticker': ticker,
+            'resolution': resolution,
+            'ts': self._format_ts(self._parse_ts(bar['ts'])),
+            'open': bar.get('open', bar['close']),
+            'high': bar.get('high', bar['close']),
+            'low': bar.get('low', bar['close']),
+            'close': bar['close'],
+            'volume': bar.get('volume'),
+            'source': bar.get('source', 'backfill')
+        } for bar in bars]
+        if not rows:
+            return
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, """
+                INSERT INTO price_history (ticker, resolution, ts, open, high, low, close, volume, source)
+                VALUES (:ticker, :resolution, :ts, :open, :high, :low, :close, :volume, :source)
+                ON CONFLICT (ticker, resolution, ts) DO UPDATE SET
+                    open = excluded.open, high = excluded.high, low = excluded.low,
+                    close = excluded.close, volume = excluded.volume, source = excluded.source
+            """, rows)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+        with self._lock:
+            self._hot.pop(ticker, None)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get_range(self, ticker: str, start: datetime = None, end: datetime = None,
+                  resolution: str = DAILY, limit: int = None) -> List[Dict]:
+        """Bars for one ticker between start and end (inclusive), oldest first"""
+        params = {'ticker': self._normalize(ticker), 'resolution': resolution}
+        where = ['ticker = :ticker', 'resolution = :resolution']
+        if start is not None:
+            params['start'] = self._format_ts(start)
+            where.append('ts >= :start')
+        if end is not None:
+            params['end'] = self._format_ts(end)
+            where.append('ts <= :end')
+        limit_clause = ''
+        if limit:
+            params['limit'] = int(limit)
+            limit_clause = 'LIMIT :limit'
+
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT ts, open, high, low, close, volume FROM (
+                    SELECT ts, open, high, low, close, volume
+                    FROM price_history
+                    WHERE {' AND '.join(where)}
+                    ORDER BY ts DESC
+                    {limit_clause}
+                ) recent ORDER BY ts
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+        return [{
+            'ts': str(r[0])[:19],
+            'open': r[1],
+            'high': r[2],
+            'low': r[3],
+            'close': r[4],
+            'volume': r[5]
+        } for r in rows]
+
+    def get_latest_prices(self, tickers: List[str]) -> Dict[str, float]:
+        """Most recent local close per ticker; tickers with no history are omitted"""
+        prices, missing = {}, []
+        with self._lock:
+            for ticker in {self._normalize(t) for t in tickers if t}:
+                latest = self._latest.get(ticker)
+                if latest:
+                    prices[ticker] = latest[0]
+                else:
+                    missing.append(ticker)
+        if not missing:
+            return prices
+
+        params = {'resolution': DAILY}
+        ticker_in = self._in_clause('t', missing, params)
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT p.ticker, p.close, p.ts
+                FROM price_history p
+                WHERE p.resolution = :resolution AND p.ticker IN ({ticker_in})
+                  AND p.ts = (SELECT MAX(ts) FROM price_history
+                              WHERE ticker = p.ticker AND resolution = :resolution)
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+        with self._lock:
+            for ticker, close, ts in rows:
+                prices[ticker] = close
+                self._latest.setdefault(ticker, (close, self._parse_ts(ts)))
+        return prices
+
+    # ------------------------------------------------------------------
+    # Hot ticker cache
+    # ------------------------------------------------------------------
+
+    def _build_closed_series(self, ticker: str, today: datetime):
+        """Load closed daily bars (before today) into arrays, memory-mapped if configured"""
+        bars = self.get_range(ticker, end=today - timedelta(seconds=1))
+        ts = [self._parse_ts(b['ts']).timestamp() for b in bars]
+        closes = [b['close'] for b in bars]
+        if np is None:
+            return ts, closes
+        if self.cache_dir and bars:
+            # Write a fresh file and swap it in so existing mappings keep their old inode
+            path = os.path.join(self.cache_dir, f"{ticker}_{DAILY}.npy")
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            data = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64, shape=(2, len(bars)))
+            data[0, :] = ts
+            data[1, :] = closes
+            data.flush()
+            del data
+            os.replace(tmp_path, path)
+            data = np.load(path, mmap_mode='r')
+            return data[0], data[1]
+        return np.asarray(ts, dtype=np.float64), np.asarray(closes, dtype=np.float64)
+
+    def get_daily_closes(self, ticker: str, days: int = 30):
+        """Daily closes for the last `days` days including today's live bar (array or list)"""
+        ticker = self._normalize(ticker)
+        now = datetime.utcnow()
+        today = datetime(now.year, now.month, now.day)
+        with self._lock:
+            entry = self._hot.get(ticker)
+            if entry is not None and entry[0] == today:
+                self._hot.move_to_end(ticker)
+                ts, closes = entry[1], entry[2]
+            else:
+                ts, closes = self._build_closed_series(ticker, today)
+                self._hot[ticker] = (today, ts, closes)
+                while len(self._hot) > self.hot_tickers:
+                    self._hot.popitem(last=False)
+            live = self._live_bars.get(ticker)
+
+        cutoff = (today - timedelta(days=days)).timestamp()
+        if np is not None:
+            selected = closes[np.searchsorted(ts, cutoff):]
+            if live and live['day'] == today:
+                selected = np.append(selected, live['close'])
+            return selected
+        selected = [c for t, c in zip(ts, closes) if t >= cutoff]
+        if live and live['day'] == today:
+            selected.append(live['close'])
+        return selected
+
+    def get_volatility(self, tickers: List[str], days: int = 30, min_points: int = 5) -> Optional[float]:
+        """Average standard deviation of daily returns across tickers, or None without enough history"""
+        volatilities = []
+        for ticker in tickers:
+            closes = self.get_daily_closes(ticker, days)
+            if len(closes) < min_points:
+                continue
+            if np is not None:
+                returns = np.diff(closes) / closes[:-1]
+                volatilities.append(float(np.std(returns)))
+            else:
+                returns = [(b - a) / a for a, b in zip(closes, closes[1:]) if a]
+                mean = sum(returns) / len(returns)
+                volatilities.append((sum((r - mean) ** 2 for r in returns) / len(returns)) ** 0.5)
+        if not volatilities:
+            return None
+        return sum(volatilities) / len(volatilities)
+
+    def get_tracked_tickers(self, limit: int = 50) -> List[str]:
+        """Tickers with the most recent daily history"""
+        since = self._format_ts(datetime.utcnow() - timedelta(days=30))
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, """
+                SELECT ticker FROM price_history
+                WHERE resolution = :resolution AND ts >= :since
+                GROUP BY ticker
+                ORDER BY COUNT(*) DESC
+                LIMIT :limit
+            """, {'resolution': DAILY, 'since': since, 'limit': int(limit)}).fetchall()
+        finally:
+            db.release_connection(conn)
+        return [r[0] for r in rows]
+
+
+# Global price history store
+price_history_store = PriceHistoryStore(cache_dir=os.getenv('PRICE_HISTORY_CACHE_DIR'))
@@ -0,0 +1,356 @@
+"""
+Query Tracing for Kamioi Platform
+Per-request SQL counts, DB time, repeated-statement (N+1) detection and a
+slow-query log with query plans.
+
+- SQLite: DatabaseManager opens connections with `factory=TracedConnection`.
+  execute/executemany (on the connection or its cursors) are timed; the
+  connection's set_trace_callback catches statements issued outside those
+  wrappers (executescript, COMMIT)
+- PostgreSQL: before/after_cursor_execute events on the SQLAlchemy engine
+- Statements are fingerprinted (literals -> ?, whitespace collapsed) so the
+  same query with different ids groups together. A request that runs one
+  fingerprint QUERY_N_PLUS_ONE_THRESHOLD or more times is flagged as N+1
+- Statements slower than QUERY_SLOW_MS are logged with EXPLAIN QUERY PLAN
+  (SQLite) / EXPLAIN (PostgreSQL SELECTs) and kept in a ring buffer
+- Traces and the slow-query log only hold fingerprints: bound values and
+  inline literals (emails, tokens, amounts) never reach logs or /api/admin/perf
+- Flask: query_tracer.init_app(app) opens a trace per request and adds a
+  Server-Timing `db` entry to responses
+
+Set QUERY_TRACE=0 to disable.
+"""
+
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from utils.log import get_logger
+
+log = get_logger('query_trace')
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('kamioi_query_trace', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:[?]|:\w+|%\(\w+\)s)(?:\s*,\s*(?:[?]|:\w+|%\(\w+\)s))+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so executions differing only in literals group together"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class RequestTrace:
+    """Queries issued while handling one request"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements: Dict[str, List] = {}  # fingerprint -> [count, total_ms]
+        self.slowest: List = []  # [(ms, sql)], longest first, at most 5
+
+    def add(self, fp: str, sql: str, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        entry = self.statements.get(fp)
+        if entry is None:
+            self.statements[fp] = [1, ms]
+        else:
+            entry[0] += 1
+            entry[1] += ms
+        if len(self.slowest) < 5 or ms > self.slowest[-1][0]:
+            self.slowest.append((ms, sql))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[5:]
+
+    def repeated(self, threshold: int) -> List[Dict]:
+        return [{'fingerprint': fp, 'count': count, 'total_ms': round(total_ms, 2)}
+                for fp, (count, total_ms) in self.statements.items() if count >= threshold]
+
+    def summary(self) -> Dict:
+        return {'queries': self.count, 'db_ms': round(self.total_ms, 2),
+                'slowest': [{'ms': round(ms, 2), 'sql': sql[:500]} for ms, sql in self.slowest]}
+
+
+class QueryTracer:
+    """
+    Records every traced statement globally and into the active request trace.
+
+    Example:
+        with query_tracer.trace('nightly job') as trace:
+            run_job()
+        print(trace.summary())
+    """
+
+    def __init__(self, enabled: bool = True, slow_ms: float = 100.0, n_plus_one_threshold: int = 10,
+                 slow_log_size: int = 100, plan_cache_seconds: float = 600):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.plan_cache_seconds = plan_cache_seconds
+        self._lock = threading.Lock()
+        self._statements: Dict[str, List] = {}  # fingerprint -> [count, total_ms, max_ms]
+        self._routes: Dict[str, List] = {}  # route -> [requests, queries, db_ms, max_queries]
+        self._n_plus_one: Dict[tuple, Dict] = {}  # (route, fingerprint) -> detection
+        self._plans: Dict[str, tuple] = {}  # fingerprint -> (explained_at, plan)
+        self.slow_queries = deque(maxlen=slow_log_size)
+
+    # ------------------------------------------------------------------
+    # Trace scopes
+    # ------------------------------------------------------------------
+
+    def start(self, label: str = '') -> Optional[contextvars.Token]:
+        if not self.enabled:
+            return None
+        return _current_trace.set(RequestTrace(label))
+
+    def finish(self, token: Optional[contextvars.Token], route: str = None) -> Optional[RequestTrace]:
+        trace = _current_trace.get()
+        if token is not None:
+            _current_trace.reset(token)
+        if trace is None:
+            return None
+        route = route or trace.label
+        with self._lock:
+            stats = self._routes.setdefault(route, [0, 0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += trace.count
+            stats[2] += trace.total_ms
+            stats[3] = max(stats[3], trace.count)
+        for repeat in trace.repeated(self.n_plus_one_threshold):
+            self._flag_n_plus_one(route, repeat)
+        return trace
+
+    def trace(self, label: str):
+        tracer = self
+
+        class _Scope:
+            def __enter__(self):
+                self.token = tracer.start(label)
+                return _current_trace.get()
+
+            def __exit__(self, *exc):
+                tracer.finish(self.token)
+                return False
+
+        return _Scope()
+
+    def current(self) -> Optional[RequestTrace]:
+        return _current_trace.get()
+
+    def _flag_n_plus_one(self, route: str, repeat: Dict):
+        key = (route, repeat['fingerprint'])
+        with self._lock:
+            existing = self._n_plus_one.get(key)
+            if existing is not None:
+                existing['occurrences'] += 1
+                existing['max_count'] = max(existing['max_count'], repeat['count'])
+                existing['last_seen'] = datetime.now().isoformat()
+                return
+            self._n_plus_one[key] = {'route': route, 'fingerprint': repeat['fingerprint'],
+                                     'max_count': repeat['count'], 'occurrences': 1,
+                                     'last_seen': datetime.now().isoformat()}
+        log.warning("Possible N+1 in %s: %d executions of %s", route, repeat['count'], repeat['fingerprint'][:200])
+
+    # ------------------------------------------------------------------
+    # Recording (called by the SQLite wrappers and SQLAlchemy events)
+    # ------------------------------------------------------------------
+
+    def record(self, sql: str, seconds: float, explain=None):
+        """Account one statement; `explain` is a callable returning its plan when it's slow"""
+        ms = seconds * 1000.0
+        fp = fingerprint(sql)
+        with self._lock:
+            entry = self._statements.get(fp)
+            if entry is None:
+                self._statements[fp] = [1, ms, ms]
+            else:
+                entry[0] += 1
+                entry[1] += ms
+                entry[2] = max(entry[2], ms)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(fp, fp, ms)
+        if ms >= self.slow_ms:
+            self._log_slow(fp, ms, explain, trace)
+
+    def _log_slow(self, fp: str, ms: float, explain, trace: Optional[RequestTrace]):
+        plan = None
+        now = time.monotonic()
+        cached = self._plans.get(fp)
+        if cached is not None and now - cached[0] < self.plan_cache_seconds:
+            plan = cached[1]
+        elif explain is not None:
+            try:
+                plan = explain()
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+            self._plans[fp] = (now, plan)
+        self.slow_queries.append({'ms': round(ms, 2), 'sql': fp[:2000], 'fingerprint': fp, 'plan': plan,
+                                  'route': trace.label if trace else None, 'at': datetime.now().isoformat()})
+        log.warning("Slow query (%.1fms)%s: %s | plan: %s", ms,
+                    f" in {trace.label}" if trace else '', fp[:500], plan)
+
+    # ------------------------------------------------------------------
+    # Integrations
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """Open a trace per request and report it in a Server-Timing header"""
+        from flask import g, request
+
+        @app.before_request
+        def _start_query_trace():
+            g._query_trace_token = self.start(request.path)
+
+        @app.after_request
+        def _finish_query_trace(response):
+            token = g.pop('_query_trace_token', None)
+            route = request.url_rule.rule if request.url_rule is not None else request.path
+            trace = self.finish(token, route=f"{request.method} {route}")
+            if trace is not None:
+                response.headers.add('Server-Timing', f'db;dur={trace.total_ms:.1f};desc="{trace.count} queries"')
+            return response
+
+    def instrument_engine(self, engine):
+        """Time statements on a SQLAlchemy engine (PostgreSQL path)"""
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['_query_started'].pop()
+
+            def explain():
+                # SELECTs only: a failing EXPLAIN must not abort a write transaction
+                if executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    return None
+                explain_cursor = conn.connection.cursor()
+                try:
+                    explain_cursor.execute('EXPLAIN ' + statement, parameters)
+                    return '\n'.join(row[0] for row in explain_cursor.fetchall())
+                finally:
+                    explain_cursor.close()
+
+            self.record(statement, time.perf_counter() - started, explain=explain)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def snapshot(self, top: int = 20) -> Dict:
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            routes = sorted(self._routes.items(), key=lambda item: item[1][2], reverse=True)[:top]
+            n_plus_one = sorted(self._n_plus_one.values(), key=lambda d: d['max_count'], reverse=True)
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'top_statements': [{'fingerprint': fp, 'count': count, 'total_ms': round(total_ms, 2),
+                                'mean_ms': round(total_ms / count, 3), 'max_ms': round(max_ms, 2)}
+                               for fp, (count, total_ms, max_ms) in statements],
+            'routes': [{'route': route, 'requests': requests, 'avg_queries': round(queries / requests, 1),
+                        'max_queries': max_queries, 'avg_db_ms': round(db_ms / requests, 2)}
+                       for route, (requests, queries, db_ms, max_queries) in routes],
+            'n_plus_one': n_plus_one,
+            'slow_queries': list(self.slow_queries)[-top:]
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._routes.clear()
+            self._n_plus_one.clear()
+            self._plans.clear()
+            self.slow_queries.clear()
+
+
+# Global query tracer
+query_tracer = QueryTracer(
+    enabled=os.getenv('QUERY_TRACE', '1') != '0',
+    slow_ms=float(os.getenv('QUERY_SLOW_MS', '100')),
+    n_plus_one_threshold=int(os.getenv('QUERY_N_PLUS_ONE_THRESHOLD', '10'))
+)
+
+
+class TracedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return self.connection._traced(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.connection._traced(super().executemany, sql, seq_of_parameters, many=True)
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that reports statements to query_tracer.
+
+    Example:
+        conn = sqlite3.connect(path, factory=TracedConnection)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._in_call = False
+        if query_tracer.enabled:
+            self.set_trace_callback(self._on_trace)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        self.set_trace_callback(None)
+        super().close()
+
+    def _on_trace(self, statement: str):
+        if not self._in_call and not statement.startswith(('BEGIN', 'COMMIT', 'ROLLBACK')):
+            query_tracer.record(statement, 0.0)  # executescript etc.: counted, untimed
+
+    def _traced(self, call, sql, parameters, many: bool = False):
+        if not query_tracer.enabled or self._in_call:
+            return call(sql, parameters)
+        self._in_call = True
+        started = time.perf_counter()
+        try:
+            return call(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_call = False
+
+            def explain():
+                if many or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+                    return None
+                self._in_call = True  # Don't trace the EXPLAIN itself
+                try:
+                    rows = sqlite3.Cursor(self).execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+                finally:
+                    self._in_call = False
+                return '\n'.join(str(row[-1]) for row in rows)
+
+            query_tracer.record(sql, elapsed, explain=explain)
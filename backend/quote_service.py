@@ -0,0 +1,550 @@
+"""
+Quote Service for Kamioi Platform
+Single source of stock quotes for portfolio, dashboard and purchase paths.
+
+- One TTL cache shared by StockAPIManager and AlpacaService, with
+  stale-while-revalidate so callers never wait on a refresh they don't need
+- Concurrent requests for the same ticker coalesce into one in-flight fetch
+- fetch-many uses provider batch endpoints (Alpaca market data) where available
+- Each provider keeps a persistent requests.Session and its own rate limiter
+- Providers are hedged: if the preferred one hasn't answered by its recent
+  p95 latency, the next one is fired and the first good answer wins. A
+  circuit breaker per provider skips providers that are failing or slow.
+  A call refused by the provider's own rate limiter raises RateLimited and
+  is kept out of the breaker and latency history (it never hit the network)
+- Fresh quotes are handed to listeners (the local price history store)
+  on a background thread
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.latency_histogram import LatencyHistogram
+from utils.lazy_import import lazy_module
+from utils.rate_limiter import TokenBucket
+
+requests = lazy_module('requests')  # Loaded when the first provider session is built
+
+
+class RateLimited(Exception):
+    """The provider's local rate limiter refused the call; nothing was sent"""
+
+
+class QuoteProvider:
+    """Base class for a market data source"""
+
+    name = 'base'
+    supports_batch = False
+    calls_per_minute = 60
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.rate_limiter = TokenBucket(rate_per_minute=self.calls_per_minute,
+                                        burst=max(1, self.calls_per_minute // 12))
+        self.timeout = 10
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyHistogram()
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def hedge_delay(self, default: float, minimum: float) -> float:
+        """Seconds to wait on this provider before hedging: its recent p95"""
+        p95_ms = self.latency.recent_percentile(95, min_samples=10)
+        if p95_ms is None:
+            return default
+        return max(minimum, p95_ms / 1000.0)
+
+    def fetch(self, ticker: str) -> Optional[Dict]:
+        """Fetch a single quote; return None if unavailable"""
+        raise NotImplementedError
+
+    def fetch_many(self, tickers: List[str]) -> Dict[str, Dict]:
+        """Fetch several quotes; providers with a batch endpoint override this"""
+        results = {}
+        for ticker in tickers:
+            try:
+                quote = self.fetch(ticker)
+            except RateLimited:
+                if not results:
+                    raise
+                break  # Out of budget part way through: return what we have
+            if quote:
+                results[ticker] = quote
+        return results
+
+    def _get_json(self, url: str, params: Dict = None, headers: Dict = None) -> Optional[Dict]:
+        # Don't block a quote on a provider that's out of budget; the next one can answer
+        if not self.rate_limiter.try_acquire():
+            raise RateLimited(self.name)
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _quote(self, ticker: str, price: float, **fields) -> Dict:
+        quote = {
+            'ticker': ticker,
+            'price': float(price),
+            'change': 0.0,
+            'change_percent': 0.0,
+            'timestamp': datetime.utcnow(),
+            'source': self.name
+        }
+        quote.update(fields)
+        return quote
+
+
+class AlpacaDataProvider(QuoteProvider):
+    name = 'alpaca'
+    supports_batch = True
+    calls_per_minute = 200
+    base_url = 'https://data.alpaca.markets/v2/stocks'
+
+    def __init__(self, api_key: str = None, api_secret: str = None):
+        super().__init__()
+        self.timeout = 5
+        self.api_key = api_key or os.getenv('ALPACA_API_KEY')
+        self.api_secret = api_secret or os.getenv('ALPACA_API_SECRET')
+        self.session.headers.update({
+            'APCA-API-KEY-ID': self.api_key or '',
+            'APCA-API-SECRET-KEY': self.api_secret or ''
+        })
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key and self.api_secret)
+
+    def fetch(self, ticker: str) -> Optional[Dict]:
+        return self.fetch_many([ticker]).get(ticker)
+
+    def fetch_many(self, tickers: List[str]) -> Dict[str, Dict]:
+        results = {}
+        symbols = ','.join(tickers)
+
+        data = self._get_json(f'{self.base_url}/quotes/latest', params={'symbols': symbols})
+        for ticker, quote in ((data or {}).get('quotes') or {}).items():
+            price = quote.get('ap') or quote.get('bp')  # Ask price, bid when the ask is empty
+            if price:
+                results[ticker] = self._quote(ticker, price)
+
+        missing = [t for t in tickers if t not in results]
+        if missing:
+            try:
+                data = self._get_json(f'{self.base_url}/bars/latest', params={'symbols': ','.join(missing)})
+            except RateLimited:
+                if not results:
+                    raise
+                return results
+            for ticker, bar in ((data or {}).get('bars') or {}).items():
+                if bar.get('c'):
+                    results[ticker] = self._quote(
+                        ticker, bar['c'], open=float(bar.get('o', 0)), high=float(bar.get('h', 0)),
+                        low=float(bar.get('l', 0)), volume=int(bar.get('v', 0)))
+        return results
+
+
+class FinnhubProvider(QuoteProvider):
+    name = 'finnhub'
+    calls_per_minute = 60
+
+    def __init__(self, api_key: str = None):
+        super().__init__()
+        self.api_key = api_key or os.getenv('FINNHUB_API_KEY', 'demo')
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key and self.api_key != 'demo')
+
+    def fetch(self, ticker: str) -> Optional[Dict]:
+        data = self._get_json('https://finnhub.io/api/v1/quote', params={'symbol': ticker, 'token': self.api_key})
+        if data and data.get('c'):
+            return self._quote(
+                ticker, data['c'],
+                change=float(data.get('d') or 0),
+                change_percent=float(data.get('dp') or 0),
+                high=float(data.get('h', 0)),
+                low=float(data.get('l', 0)),
+                open=float(data.get('o', 0)),
+                previous_close=float(data.get('pc', 0)))
+        return None
+
+
+class AlphaVantageProvider(QuoteProvider):
+    name = 'alpha_vantage'
+    calls_per_minute = 5
+
+    def __init__(self, api_key: str = None):
+        super().__init__()
+        self.api_key = api_key or os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key and self.api_key != 'demo')
+
+    def fetch(self, ticker: str) -> Optional[Dict]:
+        data = self._get_json('https://www.alphavantage.co/query', params={
+            'function': 'GLOBAL_QUOTE',
+            'symbol': ticker,
+            'apikey': self.api_key
+        })
+        quote = (data or {}).get('Global Quote')
+        if quote and quote.get('05. price'):
+            return self._quote(
+                ticker, quote['05. price'],
+                change=float(quote.get('09. change', 0)),
+                change_percent=quote.get('10. change percent', '0%').replace('%', ''),
+                volume=int(quote.get('06. volume', 0)),
+                high=float(quote.get('03. high', 0)),
+                low=float(quote.get('04. low', 0)),
+                open=float(quote.get('02. open', 0)))
+        return None
+
+
+class PolygonProvider(QuoteProvider):
+    name = 'polygon'
+    calls_per_minute = 5
+
+    def __init__(self, api_key: str = None):
+        super().__init__()
+        self.api_key = api_key or os.getenv('POLYGON_API_KEY', 'demo')
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key and self.api_key != 'demo')
+
+    def fetch(self, ticker: str) -> Optional[Dict]:
+        data = self._get_json(f'https://api.polygon.io/v2/aggs/ticker/{ticker}/prev',
+                              params={'adjusted': 'true', 'apikey': self.api_key})
+        results = (data or {}).get('results') or []
+        if results:
+            result = results[0]
+            close = float(result.get('c', 0))
+            open_price = float(result.get('o', 0))
+            return self._quote(
+                ticker, close,
+                change=close - open_price,
+                change_percent=((close - open_price) / open_price * 100) if open_price else 0.0,
+                volume=int(result.get('v', 0)),
+                high=float(result.get('h', 0)),
+                low=float(result.get('l', 0)),
+                open=open_price)
+        return None
+
+
+class YahooProvider(QuoteProvider):
+    name = 'yahoo'
+    calls_per_minute = 120
+
+    def __init__(self):
+        super().__init__()
+        self.timeout = 5
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+
+    def fetch(self, ticker: str) -> Optional[Dict]:
+        data = self._get_json(f'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}',
+                              params={'interval': '1d', 'range': '1d'})
+        result = ((data or {}).get('chart') or {}).get('result') or []
+        if result:
+            price = result[0].get('meta', {}).get('regularMarketPrice')
+            if price:
+                return self._quote(ticker, price)
+        return None
+
+
+class QuoteService:
+    def __init__(self, providers: List[QuoteProvider] = None, ttl: float = 60,
+                 stale_ttl: float = 600, fallback: Callable[[str], Optional[Dict]] = None,
+                 max_wait: float = 3.0, default_hedge_delay: float = 0.5, min_hedge_delay: float = 0.05):
+        self.providers = providers if providers is not None else default_providers()
+        self.ttl = ttl                # Seconds a quote is served without refreshing
+        self.stale_ttl = stale_ttl    # Seconds a quote may be served while a refresh runs
+        self.fallback = fallback
+        self.max_wait = max_wait      # Upper bound on time spent waiting for providers
+        self.default_hedge_delay = default_hedge_delay  # Hedge delay until a provider has latency history
+        self.min_hedge_delay = min_hedge_delay
+        self._provider_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='quote-provider')
+        self._cache: Dict[str, tuple] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='quote-refresh')
+        self._listeners: List[Callable[[Dict[str, Dict]], None]] = []
+        self._notifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quote-listeners')
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'provider_calls': 0, 'hedged': 0,
+                      'rate_limited': 0}
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _normalize(ticker: str) -> str:
+        return (ticker or '').strip().upper()
+
+    def _cached(self, ticker: str):
+        """Return (quote, age_seconds) or (None, None)"""
+        entry = self._cache.get(ticker)
+        if entry is None:
+            return None, None
+        quote, fetched_at = entry
+        return quote, time.monotonic() - fetched_at
+
+    def _store(self, ticker: str, quote: Dict):
+        self._cache[ticker] = (quote, time.monotonic())
+
+    def add_listener(self, callback: Callable[[Dict[str, Dict]], None]):
+        """Register a callback receiving every batch of freshly fetched quotes (off the request path)"""
+        self._listeners.append(callback)
+
+    def _notify(self, quotes: Dict[str, Dict]):
+        for callback in self._listeners:
+            try:
+                callback(quotes)
+            except Exception as e:
+                print(f"[QUOTES] Listener error: {e}")
+
+    def invalidate(self, ticker: str = None):
+        with self._lock:
+            if ticker is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self._normalize(ticker), None)
+
+    # ------------------------------------------------------------------
+    # Fetching
+    # ------------------------------------------------------------------
+
+    def _call_provider(self, provider: QuoteProvider, tickers: List[str]) -> Dict[str, Dict]:
+        """Call one provider, feeding its latency histogram and circuit breaker"""
+        started = time.monotonic()
+        success = True
+        try:
+            if len(tickers) == 1:
+                quote = provider.fetch(tickers[0])
+                return {tickers[0]: quote} if quote else {}
+            return provider.fetch_many(tickers)
+        except RateLimited:
+            # Not an outcome of the provider: no latency sample, no breaker verdict
+            self.stats['rate_limited'] += 1
+            provider.breaker.release()
+            success = None
+            return {}
+        except Exception as e:
+            success = False
+            print(f"[QUOTES] {provider.name} error for {','.join(tickers)}: {e}")
+            return {}
+        finally:
+            if success is not None:
+                elapsed = time.monotonic() - started
+                provider.latency.record(elapsed)
+                provider.breaker.record(success, elapsed)
+
+    def _hedged_round(self, tickers: List[str], candidates: List[QuoteProvider], deadline: float):
+        """
+        Race providers for `tickers`: start the first, and each time the latest
+        one outlives its hedge delay (or fails) start the next. Returns the first
+        non-empty answer and the providers that were never started.
+        """
+        queue = list(candidates)
+        pending: Dict[Future, QuoteProvider] = {}
+
+        def launch():
+            while queue:
+                provider = queue.pop(0)
+                if provider.breaker.allow_request():
+                    self.stats['provider_calls'] += 1
+                    pending[self._provider_pool.submit(self._call_provider, provider, tickers)] = provider
+                    return provider
+            return None
+
+        latest = launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = remaining
+            if queue and latest is not None:
+                timeout = min(remaining, latest.hedge_delay(self.default_hedge_delay, self.min_hedge_delay))
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedge = launch()
+                if hedge is not None:
+                    self.stats['hedged'] += 1
+                    latest = hedge
+                continue
+            for future in done:
+                pending.pop(future)
+                fetched = future.result()
+                if fetched:
+                    return fetched, queue
+            # Everything that finished came back empty; move on immediately
+            nxt = launch()
+            if nxt is not None:
+                latest = nxt
+        return {}, queue
+
+    def _fetch_from_providers(self, tickers: List[str]) -> Dict[str, Dict]:
+        """Hedge across providers until every ticker has a quote or max_wait passes"""
+        results: Dict[str, Dict] = {}
+        remaining = list(tickers)
+        candidates = [p for p in self.providers if p.enabled]
+        deadline = time.monotonic() + self.max_wait
+        while remaining and candidates and time.monotonic() < deadline:
+            fetched, candidates = self._hedged_round(remaining, candidates, deadline)
+            if not fetched:
+                break
+            results.update(fetched)
+            remaining = [t for t in remaining if t not in results]
+        return results
+
+    def _run_fetch(self, tickers: List[str], futures: Dict[str, Future]):
+        """Fetch tickers this thread owns and resolve their in-flight futures"""
+        try:
+            fetched = self._fetch_from_providers(tickers)
+        except Exception as e:
+            fetched = {}
+            print(f"[QUOTES] Fetch failed for {','.join(tickers)}: {e}")
+        with self._lock:
+            for ticker in tickers:
+                quote = fetched.get(ticker)
+                if quote:
+                    self._store(ticker, quote)
+                self._inflight.pop(ticker, None)
+        for ticker in tickers:
+            futures[ticker].set_result(fetched.get(ticker))
+        if fetched and self._listeners:
+            self._notifier.submit(self._notify, fetched)
+
+    def _claim(self, tickers: List[str]):
+        """Split tickers into ones we must fetch and futures someone else is already fetching"""
+        owned, owned_futures, waiting = [], {}, {}
+        with self._lock:
+            for ticker in tickers:
+                future = self._inflight.get(ticker)
+                if future is not None:
+                    waiting[ticker] = future
+                    self.stats['coalesced'] += 1
+                else:
+                    future = Future()
+                    self._inflight[ticker] = future
+                    owned.append(ticker)
+                    owned_futures[ticker] = future
+        return owned, owned_futures, waiting
+
+    def _refresh_in_background(self, tickers: List[str]):
+        owned, owned_futures, _ = self._claim(tickers)
+        if owned:
+            self._refresher.submit(self._run_fetch, owned, owned_futures)
+
+    def _with_flags(self, quote: Dict, cached: bool, stale: bool = False) -> Dict:
+        result = dict(quote)
+        result['cached'] = cached
+        if stale:
+            result['stale'] = True
+        return result
+
+    def get_quotes(self, tickers: List[str]) -> Dict[str, Dict]:
+        """Get quotes for many tickers using cache, coalescing and batch fetches"""
+        normalized = []
+        for ticker in tickers:
+            ticker = self._normalize(ticker)
+            if ticker and ticker not in normalized:
+                normalized.append(ticker)
+
+        results: Dict[str, Dict] = {}
+        to_refresh, to_fetch = [], []
+        with self._lock:
+            for ticker in normalized:
+                quote, age = self._cached(ticker)
+                if quote is not None and age < self.ttl:
+                    self.stats['hits'] += 1
+                    results[ticker] = self._with_flags(quote, cached=True)
+                elif quote is not None and age < self.stale_ttl:
+                    self.stats['stale_hits'] += 1
+                    results[ticker] = self._with_flags(quote, cached=True, stale=True)
+                    to_refresh.append(ticker)
+                else:
+                    self.stats['misses'] += 1
+                    to_fetch.append(ticker)
+
+        if to_refresh:
+            self._refresh_in_background(to_refresh)
+
+        if to_fetch:
+            owned, owned_futures, waiting = self._claim(to_fetch)
+            if owned:
+                self._run_fetch(owned, owned_futures)
+            for ticker, future in list(owned_futures.items()) + list(waiting.items()):
+                try:
+                    quote = future.result(timeout=30)
+                except Exception:
+                    quote = None
+                if quote:
+                    results[ticker] = self._with_flags(quote, cached=False)
+                elif self.fallback:
+                    fallback_quote = self.fallback(ticker)
+                    if fallback_quote:
+                        results[ticker] = fallback_quote
+
+        return results
+
+    def get_quote(self, ticker: str) -> Optional[Dict]:
+        """Get a single quote (see get_quotes)"""
+        return self.get_quotes([ticker]).get(self._normalize(ticker))
+
+    def get_price(self, ticker: str) -> Optional[float]:
+        quote = self.get_quote(ticker)
+        return quote['price'] if quote else None
+
+    def get_prices(self, tickers: List[str]) -> Dict[str, float]:
+        return {ticker: quote['price'] for ticker, quote in self.get_quotes(tickers).items()}
+
+    def get_status(self) -> Dict:
+        return {
+            'providers': [{
+                'name': p.name,
+                'enabled': p.enabled,
+                'batch': p.supports_batch,
+                'circuit': p.breaker.snapshot(),
+                'latency': p.latency.snapshot()
+            } for p in self.providers],
+            'cache': {'entries': len(self._cache), 'ttl_seconds': self.ttl, 'stale_ttl_seconds': self.stale_ttl},
+            'stats': dict(self.stats)
+        }
+
+
+def default_providers() -> List[QuoteProvider]:
+    """Providers in order of preference: batch-capable and low-latency first"""
+    return [
+        AlpacaDataProvider(),
+        FinnhubProvider(),
+        AlphaVantageProvider(),
+        PolygonProvider(),
+        YahooProvider()
+    ]
+
+
+# Global quote service - created on first use so importing this module is cheap
+_quote_service = None
+_quote_service_lock = threading.Lock()
+
+
+def get_quote_service() -> QuoteService:
+    """Get or create the shared quote service"""
+    global _quote_service
+    if _quote_service is None:
+        with _quote_service_lock:
+            if _quote_service is None:
+                _quote_service = QuoteService(
+                    ttl=float(os.getenv('QUOTE_CACHE_TTL', '60')),
+                    stale_ttl=float(os.getenv('QUOTE_STALE_TTL', '600')),
+                    max_wait=float(os.getenv('QUOTE_MAX_WAIT', '3.0'))
+                )
+                from price_history import price_history_store
+                _quote_service.add_listener(price_history_store.record_quotes)
+    return _quote_service
@@ -4,7 +4,6 @@ Real RAG System for Kamioi Platform
 Implements vector embeddings, semantic search, and knowledge base retrieval
 """
 
-import numpy as np
 import sqlite3
 import json
 import re
@@ -12,6 +11,10 @@ from datetime import datetime
 from typing import List, Dict, Tuple
 import hashlib
 
+from utils.lazy_import import lazy_module
+
+np = lazy_module('numpy')  # Only similarity scoring needs it
+
 class KamioiRAGSystem:
     def __init__(self, db_path: str):
         self.db_path = db_path
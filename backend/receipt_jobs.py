@@ -0,0 +1,379 @@
+"""
+Receipt Job Queue for Kamioi Platform
+Runs receipt OCR, parsing, mapping and allocation off the request threads.
+
+- POST /api/receipts/<id>/process enqueues a job and returns 202 with its id;
+  GET /api/receipts/jobs/<job_id> polls it
+- A job moves queued -> ocr -> parsed -> mapped [-> allocated] and ends in
+  'failed' on error. Status, result and per-stage timings live in the
+  receipt_jobs table, so a poll can be answered by any worker
+- OCR, the CPU-heavy stage, runs in a pool of RECEIPT_OCR_WORKERS processes
+  (0 = in the dispatcher thread); RECEIPT_JOB_THREADS dispatcher threads drive
+  the cheaper stages. Request threads only insert a row and return, so a
+  burst of uploads waits here instead of starving dashboard traffic
+- At most RECEIPT_QUEUE_MAX jobs wait at once; enqueue raises QueueFull
+  beyond that (the endpoint answers 503)
+- recover_stranded() runs at startup: jobs a restart left queued or
+  mid-pipeline are run again from the start, or failed if their receipt
+  file is gone, so a client polling them always sees them finish
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from utils.latency_histogram import LatencyHistogram
+from utils.log import get_logger
+
+log = get_logger('receipt_jobs')
+
+STAGES = ('queued', 'ocr', 'parsed', 'mapped', 'allocated')
+FAILED = 'failed'
+DEFAULT_ROUND_UP = 1.00
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+def _ocr_in_worker(image_path: str) -> str:
+    """Runs in an OCR worker process"""
+    from services.receipt_processing_service import ocr_image
+    return ocr_image(image_path)
+
+
+def resolve_round_up_amount(conn, user_id, existing_round_up=None, use_postgresql: bool = False) -> float:
+    """The receipt's own round-up if one was set, otherwise the user's configured amount ($1.00 default)"""
+    if existing_round_up is not None and float(existing_round_up) > 0:
+        return float(existing_round_up)
+    try:
+        if use_postgresql:
+            from sqlalchemy import text
+            row = conn.execute(text("SELECT round_up_amount FROM users WHERE id = :user_id"),
+                               {'user_id': user_id}).fetchone()
+        else:
+            row = conn.execute("SELECT round_up_amount FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row and row[0] is not None:
+            return float(row[0])
+    except Exception as e:
+        log.warning("Could not read round_up_amount for user %s: %s", user_id, e)
+    return DEFAULT_ROUND_UP
+
+
+class ReceiptJobQueue:
+    """
+    Background pipeline for receipt processing.
+
+    Example:
+        job = receipt_jobs.enqueue(receipt_id, user_id, file_path, allocate=True)
+        receipt_jobs.get(job['jobId'])   # {'status': 'ocr', 'timings': {...}, ...}
+    """
+
+    def __init__(self, db_manager=None, ocr_workers: int = None, threads: int = None, max_queued: int = None,
+                 receipt_service=None, allocation_service=None):
+        self._db_manager = db_manager
+        self.ocr_workers = int(os.getenv('RECEIPT_OCR_WORKERS', str(max(1, (os.cpu_count() or 2) // 2)))
+                               if ocr_workers is None else ocr_workers)
+        self.threads = int(os.getenv('RECEIPT_JOB_THREADS', '4') if threads is None else threads)
+        self.max_queued = int(os.getenv('RECEIPT_QUEUE_MAX', '200') if max_queued is None else max_queued)
+        self._receipt_service = receipt_service
+        self._allocation_service = allocation_service
+        self._lock = threading.Lock()
+        self._dispatcher: Optional[ThreadPoolExecutor] = None
+        self._ocr_pool: Optional[ProcessPoolExecutor] = None
+        self._waiting = 0
+        self._running = 0
+        self.stage_latency: Dict[str, LatencyHistogram] = {}
+        self.counts = {'enqueued': 0, 'finished': 0, 'failed': 0, 'rejected': 0}
+        self.started_at = datetime.now().isoformat()
+
+    # -- wiring --------------------------------------------------------
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _services(self):
+        if self._receipt_service is None:
+            from api.receipt_endpoints import allocation_service, receipt_service
+            self._receipt_service, self._allocation_service = receipt_service, allocation_service
+        return self._receipt_service, self._allocation_service
+
+    def _execute(self, conn, sql: str, params=None):
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    def _write(self, sql: str, params: Dict):
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, sql, params)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    def _get_dispatcher(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = ThreadPoolExecutor(max_workers=max(1, self.threads),
+                                                      thread_name_prefix='receipt-job')
+            return self._dispatcher
+
+    def _get_ocr_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.ocr_workers <= 0:
+            return None
+        with self._lock:
+            if self._ocr_pool is None:
+                # spawn: forking a threaded server process can copy held locks into the child
+                context = multiprocessing.get_context(os.getenv('RECEIPT_OCR_START_METHOD', 'spawn'))
+                self._ocr_pool = ProcessPoolExecutor(max_workers=self.ocr_workers, mp_context=context)
+            return self._ocr_pool
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            dispatcher, pool = self._dispatcher, self._ocr_pool
+            self._dispatcher = self._ocr_pool = None
+        if dispatcher is not None:
+            dispatcher.shutdown(wait=wait)
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    # -- public API ----------------------------------------------------
+
+    def enqueue(self, receipt_id: str, user_id, file_path: str = None, raw_text: str = '',
+                allocate: bool = False) -> Dict:
+        with self._lock:
+            if self._waiting >= self.max_queued:
+                self.counts['rejected'] += 1
+                raise QueueFull(f'Receipt queue is full ({self.max_queued} jobs waiting)')
+            self._waiting += 1
+            self.counts['enqueued'] += 1
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        try:
+            self._write("""
+                INSERT INTO receipt_jobs (id, receipt_id, user_id, status, allocate, created_at, updated_at)
+                VALUES (:id, :receipt_id, :user_id, 'queued', :allocate, :now, :now)
+            """, {'id': job_id, 'receipt_id': receipt_id, 'user_id': user_id, 'allocate': 1 if allocate else 0,
+                  'now': now})
+            self._get_dispatcher().submit(self._run, job_id, receipt_id, user_id, file_path, raw_text or '',
+                                          allocate, time.perf_counter())
+        except Exception:
+            with self._lock:
+                self._waiting -= 1
+            raise
+        return {'jobId': job_id, 'receiptId': receipt_id, 'status': 'queued', 'done': False}
+
+    def recover_stranded(self) -> Dict:
+        """
+        Re-run the unfinished jobs of a previous process, or fail them when
+        the receipt file is gone. Only jobs untouched since this queue was
+        created count as stranded (a peer worker's running jobs move on), and
+        each is claimed on the status and updated_at read here, so processes
+        starting together recover it once. Call at startup.
+        """
+        db = self._get_db()
+        conn = db.get_connection()
+        requeued, failed = [], []
+        try:
+            rows = self._execute(conn, """
+                SELECT j.id, j.receipt_id, j.user_id, j.allocate, j.status, j.updated_at, r.file_path
+                FROM receipt_jobs j
+                LEFT JOIN receipts r ON r.id = j.receipt_id
+                WHERE j.finished_at IS NULL AND j.updated_at < :started_at
+                ORDER BY j.created_at
+            """, {'started_at': self.started_at}).fetchall()
+            now = datetime.now().isoformat()
+            for job_id, receipt_id, user_id, allocate, status, updated_at, file_path in rows:
+                runnable = bool(file_path) and os.path.exists(file_path)
+                claimed = self._execute(conn, """
+                    UPDATE receipt_jobs
+                    SET status = :new_status, error = :error, updated_at = :now, finished_at = :finished_at
+                    WHERE id = :id AND finished_at IS NULL AND status = :status AND updated_at = :updated_at
+                """, {'new_status': 'queued' if runnable else FAILED,
+                      'error': None if runnable else 'Interrupted by a server restart; the receipt file is gone',
+                      'now': now, 'finished_at': None if runnable else now, 'id': job_id, 'status': status,
+                      'updated_at': updated_at}).rowcount
+                if not claimed:
+                    continue
+                if runnable:
+                    requeued.append((job_id, receipt_id, user_id, file_path, bool(allocate)))
+                else:
+                    failed.append(job_id)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+        for job_id, receipt_id, user_id, file_path, allocate in requeued:
+            with self._lock:
+                self._waiting += 1
+                self.counts['enqueued'] += 1
+            self._get_dispatcher().submit(self._run, job_id, receipt_id, user_id, file_path, '', allocate,
+                                          time.perf_counter())
+        if requeued or failed:
+            log.warning("Recovered stranded receipt jobs: %d requeued, %d failed", len(requeued), len(failed))
+        return {'requeued': len(requeued), 'failed': len(failed)}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        rows = self._select("WHERE id = :value", job_id)
+        return rows[0] if rows else None
+
+    def latest_for_receipt(self, receipt_id: str) -> Optional[Dict]:
+        rows = self._select("WHERE receipt_id = :value ORDER BY created_at DESC LIMIT 1", receipt_id)
+        return rows[0] if rows else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            state = dict(self.counts, waiting=self._waiting, running=self._running,
+                         ocr_workers=self.ocr_workers, threads=self.threads, max_queued=self.max_queued)
+            histograms = dict(self.stage_latency)
+        state['stages'] = {stage: {k: v for k, v in h.snapshot().items() if k != 'buckets'}
+                           for stage, h in histograms.items()}
+        return state
+
+    # -- pipeline ------------------------------------------------------
+
+    def _select(self, where: str, value) -> List[Dict]:
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT id, receipt_id, user_id, status, allocate, timings, result, error,
+                       created_at, updated_at, finished_at
+                FROM receipt_jobs {where}
+            """, {'value': value}).fetchall()
+        finally:
+            db.release_connection(conn)
+        jobs = []
+        for row in rows:
+            allocate = bool(row[4])
+            jobs.append({
+                'jobId': row[0], 'receiptId': row[1], 'userId': row[2], 'status': row[3], 'allocate': allocate,
+                'timings': json.loads(row[5]) if row[5] else {},
+                'result': json.loads(row[6]) if row[6] else None,
+                'error': row[7], 'createdAt': str(row[8]) if row[8] else None,
+                'updatedAt': str(row[9]) if row[9] else None,
+                'finishedAt': str(row[10]) if row[10] else None,
+                'done': row[10] is not None
+            })
+        return jobs
+
+    def _record(self, stage: str, seconds: float, timings: Dict):
+        timings[f'{stage}_ms'] = round(seconds * 1000, 1)
+        with self._lock:
+            histogram = self.stage_latency.get(stage)
+            if histogram is None:
+                histogram = self.stage_latency[stage] = LatencyHistogram(recent_window=0)
+        histogram.record(seconds)
+
+    def _set_status(self, job_id: str, status: str, timings: Dict, result: Dict = None, error: str = None,
+                    finished: bool = False):
+        now = datetime.now().isoformat()
+        self._write("""
+            UPDATE receipt_jobs
+            SET status = :status, timings = :timings, result = COALESCE(:result, result),
+                error = :error, updated_at = :now, finished_at = :finished_at
+            WHERE id = :id
+        """, {'status': status, 'timings': json.dumps(timings),
+              'result': json.dumps(result) if result is not None else None, 'error': error, 'now': now,
+              'finished_at': now if finished else None, 'id': job_id})
+
+    def _ocr(self, file_path: str) -> str:
+        pool = self._get_ocr_pool()
+        if pool is None:
+            return _ocr_in_worker(file_path)
+        return pool.submit(_ocr_in_worker, file_path).result()
+
+    def _run(self, job_id: str, receipt_id: str, user_id, file_path: str, raw_text: str, allocate: bool,
+             enqueued_at: float):
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+        timings: Dict[str, float] = {}
+        self._record('queue_wait', started - enqueued_at, timings)
+        try:
+            receipt_service, allocation_service = self._services()
+            if not raw_text and file_path:
+                self._set_status(job_id, 'ocr', timings)
+                stage = time.perf_counter()
+                raw_text = self._ocr(file_path)
+                self._record('ocr', time.perf_counter() - stage, timings)
+
+            stage = time.perf_counter()
+            parsed_data = receipt_service.parse_receipt_text(raw_text) if raw_text else None
+            self._record('parse', time.perf_counter() - stage, timings)
+            self._set_status(job_id, 'parsed', timings)
+
+            stage = time.perf_counter()
+            if parsed_data is None:
+                parsed_data = receipt_service.manual_entry_data()
+            else:
+                # LLM enhancement stays on-demand (when the user edits); the keyword cache is enough here
+                parsed_data = receipt_service.map_receipt(parsed_data, raw_text, skip_llm_enhancement=True)
+            self._store_receipt("SET status = 'processed', parsed_data = :parsed_data",
+                                {'parsed_data': json.dumps(parsed_data)}, receipt_id)
+            self._record('map', time.perf_counter() - stage, timings)
+            result = {'success': True, 'data': parsed_data}
+
+            if not allocate or parsed_data.get('needs_manual_entry'):
+                # Nothing to allocate until the user fills in the manual-entry form
+                self._finish(job_id, 'mapped', timings, result, started)
+                return
+            self._set_status(job_id, 'mapped', timings, result)
+
+            stage = time.perf_counter()
+            round_up_amount = self._round_up_for(receipt_id, user_id)
+            allocation = allocation_service.allocate_receipt(parsed_data, round_up_amount)
+            if not allocation.get('success'):
+                raise RuntimeError(allocation.get('error') or 'Allocation failed')
+            self._store_receipt("SET status = 'allocated', round_up_amount = :round_up, allocation_data = :allocation",
+                                {'round_up': round_up_amount, 'allocation': json.dumps(allocation)}, receipt_id)
+            self._record('allocate', time.perf_counter() - stage, timings)
+            result['allocation'] = allocation
+            self._finish(job_id, 'allocated', timings, result, started)
+        except Exception as e:
+            log.exception("Receipt job %s (receipt %s) failed", job_id, receipt_id)
+            with self._lock:
+                self.counts['failed'] += 1
+            try:
+                self._record('total', time.perf_counter() - started, timings)
+                self._set_status(job_id, FAILED, timings, error=str(e), finished=True)
+            except Exception:
+                log.exception("Could not mark receipt job %s failed", job_id)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _finish(self, job_id: str, status: str, timings: Dict, result: Dict, started: float):
+        self._record('total', time.perf_counter() - started, timings)
+        self._set_status(job_id, status, timings, result, finished=True)
+        with self._lock:
+            self.counts['finished'] += 1
+
+    def _store_receipt(self, set_clause: str, params: Dict, receipt_id: str):
+        self._write(f"UPDATE receipts {set_clause} WHERE id = :receipt_id", dict(params, receipt_id=receipt_id))
+
+    def _round_up_for(self, receipt_id: str, user_id) -> float:
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            row = self._execute(conn, "SELECT round_up_amount FROM receipts WHERE id = :id",
+                                {'id': receipt_id}).fetchone()
+            return resolve_round_up_amount(conn, user_id, row[0] if row else None,
+                                           getattr(db, '_use_postgresql', False))
+        finally:
+            db.release_connection(conn)
+
+
+receipt_jobs = ReceiptJobQueue()
@@ -0,0 +1,347 @@
+"""
+Request Metrics for Kamioi Platform
+Per-route latency histograms, byte counts and error rates for every request.
+
+- A before/after_request pair times each request and records it against the
+  matched URL rule (e.g. /api/user/portfolio/<int:user_id>), so label
+  cardinality stays bounded by the number of routes
+- Latencies go into fixed-bucket LatencyHistograms; memory is constant per
+  route no matter how much traffic is served
+- With REQUEST_METRICS_DB set, each worker periodically writes its cumulative
+  counters to a shared SQLite file and reads merge every worker's rows, so
+  /api/admin/perf and /metrics report the whole deployment, not one process
+- /metrics renders the Prometheus text format behind `Authorization: Bearer
+  <METRICS_TOKEN>`; without METRICS_TOKEN set it is disabled
+"""
+
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.latency_histogram import BUCKET_BOUNDS_MS, LatencyHistogram
+from utils.log import get_logger
+
+log = get_logger('request_metrics')
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class RouteStats:
+    """Counters for one (method, route)"""
+
+    __slots__ = ('latency', 'requests', 'errors_4xx', 'errors_5xx', 'bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.latency = LatencyHistogram(recent_window=0)
+        self.requests = 0
+        self.errors_4xx = 0
+        self.errors_5xx = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def as_row(self) -> Dict:
+        counts, count, total_ms, max_ms = self.latency.state()
+        return {'counts': counts, 'count': count, 'total_ms': total_ms, 'max_ms': max_ms,
+                'requests': self.requests, 'errors_4xx': self.errors_4xx, 'errors_5xx': self.errors_5xx,
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+class SQLiteMetricsSink:
+    """
+    Shared store of per-worker cumulative counters.
+
+    Every worker upserts its own rows (keyed by worker id), so flushing is
+    idempotent and a crashed worker's last flush still counts. Rows not
+    updated within `retention_seconds` are pruned.
+    """
+
+    def __init__(self, path: str, retention_seconds: float = 86400):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS request_metrics (
+                    worker TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    route TEXT NOT NULL,
+                    counts TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total_ms REAL NOT NULL,
+                    max_ms REAL NOT NULL,
+                    requests INTEGER NOT NULL,
+                    errors_4xx INTEGER NOT NULL,
+                    errors_5xx INTEGER NOT NULL,
+                    bytes_in INTEGER NOT NULL,
+                    bytes_out INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (worker, method, route)
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def write(self, worker: str, rows: Dict[Tuple[str, str], Dict]):
+        now = time.time()
+        params = [{'worker': worker, 'method': method, 'route': route, 'now': now,
+                   **row, 'counts': json.dumps(row['counts'])}
+                  for (method, route), row in rows.items()]
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT INTO request_metrics (worker, method, route, counts, count, total_ms, max_ms, requests,
+                                             errors_4xx, errors_5xx, bytes_in, bytes_out, updated_at)
+                VALUES (:worker, :method, :route, :counts, :count, :total_ms, :max_ms, :requests,
+                        :errors_4xx, :errors_5xx, :bytes_in, :bytes_out, :now)
+                ON CONFLICT (worker, method, route) DO UPDATE SET
+                    counts = excluded.counts, count = excluded.count, total_ms = excluded.total_ms,
+                    max_ms = excluded.max_ms, requests = excluded.requests, errors_4xx = excluded.errors_4xx,
+                    errors_5xx = excluded.errors_5xx, bytes_in = excluded.bytes_in,
+                    bytes_out = excluded.bytes_out, updated_at = excluded.updated_at
+            """, params)
+            conn.execute("DELETE FROM request_metrics WHERE updated_at < ?", (now - self.retention_seconds,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def read(self) -> List[Tuple]:
+        conn = self._connect()
+        try:
+            return conn.execute("""
+                SELECT worker, method, route, counts, count, total_ms, max_ms, requests,
+                       errors_4xx, errors_5xx, bytes_in, bytes_out
+                FROM request_metrics
+            """).fetchall()
+        finally:
+            conn.close()
+
+
+class RequestMetrics:
+    """
+    In-process request recorder with an optional cross-worker sink.
+
+    Example:
+        request_metrics.init_app(app)
+        request_metrics.snapshot()         # {'routes': [...], 'workers_merged': ...}
+        request_metrics.render_prometheus()
+    """
+
+    def __init__(self, sink: Optional[SQLiteMetricsSink] = None, flush_interval: float = 10.0):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{int(time.time())}"
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """Register the timing hooks on a Flask app"""
+        from flask import g, request
+
+        @app.before_request
+        def _start_request_timer():
+            g._request_started = time.perf_counter()
+
+        @app.after_request
+        def _record_request_metrics(response):
+            started = g.pop('_request_started', None)
+            if started is not None:
+                route = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+                self.record(request.method, route, response.status_code, time.perf_counter() - started,
+                            bytes_in=request.content_length or 0,
+                            bytes_out=response.content_length or 0)
+            return response
+
+        if self.sink is not None:
+            self._start_flusher()
+            atexit.register(self.flush)
+
+    def record(self, method: str, route: str, status: int, seconds: float, bytes_in: int = 0, bytes_out: int = 0):
+        key = (method, route)
+        stats = self._routes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._routes.setdefault(key, RouteStats())
+        stats.latency.record(seconds)
+        with self._lock:
+            stats.requests += 1
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            if status >= 500:
+                stats.errors_5xx += 1
+            elif status >= 400:
+                stats.errors_4xx += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    # ------------------------------------------------------------------
+    # Cross-worker sink
+    # ------------------------------------------------------------------
+
+    def _local_rows(self) -> Dict[Tuple[str, str], Dict]:
+        with self._lock:
+            routes = list(self._routes.items())
+        return {key: stats.as_row() for key, stats in routes}
+
+    def flush(self):
+        if self.sink is None:
+            return
+        rows = self._local_rows()
+        if not rows:
+            return
+        try:
+            self.sink.write(self.worker_id, rows)
+        except sqlite3.Error as e:
+            log.warning("Could not flush request metrics to %s: %s", self.sink.path, e)
+
+    def _start_flusher(self):
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=run, name='request-metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _merged_rows(self) -> Tuple[Dict[Tuple[str, str], Dict], int]:
+        """Counters for every worker: from the sink when configured, else this process"""
+        if self.sink is None:
+            return self._local_rows(), 1
+        self.flush()
+        merged: Dict[Tuple[str, str], Dict] = {}
+        try:
+            rows = self.sink.read()
+        except sqlite3.Error as e:
+            log.warning("Could not read request metrics from %s: %s", self.sink.path, e)
+            return self._local_rows(), 1
+        workers = set()
+        for worker, method, route, counts, count, total_ms, max_ms, requests, e4, e5, b_in, b_out in rows:
+            workers.add(worker)
+            target = merged.setdefault((method, route), {
+                'counts': [0] * (len(BUCKET_BOUNDS_MS) + 1), 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'requests': 0, 'errors_4xx': 0, 'errors_5xx': 0, 'bytes_in': 0, 'bytes_out': 0})
+            for i, value in enumerate(json.loads(counts)):
+                target['counts'][i] += value
+            target['count'] += count
+            target['total_ms'] += total_ms
+            target['max_ms'] = max(target['max_ms'], max_ms)
+            target['requests'] += requests
+            target['errors_4xx'] += e4
+            target['errors_5xx'] += e5
+            target['bytes_in'] += b_in
+            target['bytes_out'] += b_out
+        return merged, max(1, len(workers))
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def snapshot(self, sort: str = 'p95', limit: Optional[int] = None) -> Dict:
+        """Per-route p50/p95/p99, error rates and bytes, merged across workers"""
+        rows, workers = self._merged_rows()
+        routes = []
+        for (method, route), row in rows.items():
+            histogram = LatencyHistogram(recent_window=0)
+            histogram.merge_counts(row['counts'], row['count'], row['total_ms'], row['max_ms'])
+            requests = row['requests'] or 1
+            routes.append({
+                'method': method,
+                'route': route,
+                'requests': row['requests'],
+                'p50_ms': histogram.percentile(50),
+                'p95_ms': histogram.percentile(95),
+                'p99_ms': histogram.percentile(99),
+                'mean_ms': round(row['total_ms'] / row['count'], 2) if row['count'] else None,
+                'max_ms': round(row['max_ms'], 2),
+                'total_ms': round(row['total_ms'], 2),
+                'error_rate_4xx': round(row['errors_4xx'] / requests, 4),
+                'error_rate_5xx': round(row['errors_5xx'] / requests, 4),
+                'bytes_in': row['bytes_in'],
+                'bytes_out': row['bytes_out']
+            })
+        sort_keys = {
+            'p95': lambda r: r['p95_ms'] or 0,
+            'p99': lambda r: r['p99_ms'] or 0,
+            'count': lambda r: r['requests'],
+            'total': lambda r: r['total_ms'],
+            'errors': lambda r: r['error_rate_5xx']
+        }
+        routes.sort(key=sort_keys.get(sort, sort_keys['p95']), reverse=True)
+        if limit:
+            routes = routes[:limit]
+        return {'routes': routes, 'workers_merged': workers, 'worker_id': self.worker_id,
+                'bucket_bounds_ms': list(BUCKET_BOUNDS_MS)}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition (histogram + quantile gauges + counters)"""
+        rows, _ = self._merged_rows()
+        lines = [
+            '# HELP kamioi_http_request_duration_seconds Request latency by route',
+            '# TYPE kamioi_http_request_duration_seconds histogram'
+        ]
+        quantiles, counters = [], []
+        for (method, route), row in sorted(rows.items(), key=lambda item: (item[0][1], item[0][0])):
+            labels = f'method="{method}",route="{_escape_label(route)}"'
+            running = 0
+            for i, bound in enumerate(BUCKET_BOUNDS_MS):
+                running += row['counts'][i]
+                lines.append(f'kamioi_http_request_duration_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {running}')
+            lines.append(f'kamioi_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {row["count"]}')
+            lines.append(f'kamioi_http_request_duration_seconds_sum{{{labels}}} {row["total_ms"] / 1000:.6f}')
+            lines.append(f'kamioi_http_request_duration_seconds_count{{{labels}}} {row["count"]}')
+
+            histogram = LatencyHistogram(recent_window=0)
+            histogram.merge_counts(row['counts'], row['count'], row['total_ms'], row['max_ms'])
+            for q in (50, 95, 99):
+                value = histogram.percentile(q)
+                if value is not None:
+                    quantiles.append(f'kamioi_http_request_duration_quantile_seconds{{{labels},quantile="{q / 100:g}"}} '
+                                     f'{value / 1000:g}')
+            counters.append((labels, row))
+
+        lines.append('# HELP kamioi_http_request_duration_quantile_seconds Bucket-estimated latency quantiles')
+        lines.append('# TYPE kamioi_http_request_duration_quantile_seconds gauge')
+        lines.extend(quantiles)
+        for name, field, help_text in (
+                ('kamioi_http_requests_total', 'requests', 'Requests served'),
+                ('kamioi_http_client_errors_total', 'errors_4xx', 'Responses with a 4xx status'),
+                ('kamioi_http_server_errors_total', 'errors_5xx', 'Responses with a 5xx status'),
+                ('kamioi_http_request_bytes_total', 'bytes_in', 'Request body bytes received'),
+                ('kamioi_http_response_bytes_total', 'bytes_out', 'Response body bytes sent')):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{{{labels}}} {row[field]}' for labels, row in counters)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _build_request_metrics() -> RequestMetrics:
+    path = os.getenv('REQUEST_METRICS_DB')
+    sink = SQLiteMetricsSink(path) if path else None
+    return RequestMetrics(sink=sink, flush_interval=float(os.getenv('REQUEST_METRICS_FLUSH_SECONDS', '10')))
+
+
+# Global request metrics (shared sink when REQUEST_METRICS_DB is set)
+request_metrics = _build_request_metrics()
@@ -4,13 +4,24 @@ Handles automatic round-up calculations, fee application, and portfolio sweeps
 """
 
 import math
+import threading
+from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import json
 
 class RoundUpEngine:
-    def __init__(self):
-        self.roundup_ledger = []
+    def __init__(self, db_manager=None):
+        # Ledger rows live in the roundup_ledger table. In memory we only keep
+        # what the hot paths need: each user's pending entries and running
+        # balances, both maintained on append/sweep so no call scans the ledger.
+        self._db_manager = db_manager
+        self._ledger_lock = threading.RLock()
+        self._ledger_loaded = False
+        self._persistent = True
+        self._pending_by_user: Dict[str, List[Dict]] = defaultdict(list)
+        self._balances: Dict[str, Dict] = {}
+        self._memory_entries: Dict[str, List[Dict]] = defaultdict(list)  # Only used when the DB is unavailable
         self.user_preferences = {}
         self.kamioi_fee = 0  # No fee - subscription pays for service
         self.sweep_threshold = 10.00  # Auto-sweep when $10+ accumulated
@@ -70,6 +81,180 @@ class RoundUpEngine:
             'rule_used': rule
         }
     
+    # ------------------------------------------------------------------
+    # Ledger storage
+    # ------------------------------------------------------------------
+
+    _ENTRY_COLUMNS = ('id, entry_id, user_id, transaction_id, original_amount, '
+                      'round_up_amount, fee_amount, total_debit, status, '
+                      'created_at, swept_at, sweep_batch_id')
+
+    @staticmethod
+    def _user_key(user_id) -> str:
+        """Normalize user ids so '5' from a query string and 5 from the DB match"""
+        return str(user_id)
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _execute(self, conn, sql: str, params: Dict = None):
+        """Run a named-parameter statement on either SQLite or PostgreSQL"""
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    def _empty_balance(self) -> Dict:
+        return {
+            'total_roundups': 0.0,
+            'total_fees': 0.0,
+            'pending_roundups': 0.0,
+            'swept_roundups': 0.0,
+            'pending_count': 0,
+            'swept_count': 0,
+            'transaction_count': 0
+        }
+
+    def _balance_for(self, key: str) -> Dict:
+        balance = self._balances.get(key)
+        if balance is None:
+            balance = self._balances[key] = self._empty_balance()
+        return balance
+
+    @staticmethod
+    def _row_to_entry(row) -> Dict:
+        (row_id, entry_id, user_id, transaction_id, original_amount, delta, fee,
+         total_debit, status, created_at, swept_at, sweep_batch_id) = row
+        return {
+            'id': entry_id or f"roundup_{row_id}",
+            'user_id': user_id,
+            'transaction_id': transaction_id,
+            'original_amount': original_amount,
+            'delta': delta or 0.0,
+            'fee': fee or 0.0,
+            'total_debit': total_debit,
+            'status': status,
+            'created_at': str(created_at) if created_at is not None else None,
+            'swept_at': str(swept_at) if swept_at is not None else None,
+            'sweep_batch_id': sweep_batch_id
+        }
+
+    def _ensure_loaded(self):
+        """Load running balances and open pending entries once per process"""
+        if self._ledger_loaded:
+            return
+        with self._ledger_lock:
+            if self._ledger_loaded:
+                return
+            try:
+                db = self._get_db()
+                conn = db.get_connection()
+                try:
+                    balance_rows = self._execute(conn, """
+                        SELECT user_id, status, COUNT(*), COALESCE(SUM(round_up_amount), 0),
+                               COALESCE(SUM(fee_amount), 0)
+                        FROM roundup_ledger
+                        GROUP BY user_id, status
+                    """).fetchall()
+                    pending_rows = self._execute(conn, f"""
+                        SELECT {self._ENTRY_COLUMNS}
+                        FROM roundup_ledger
+                        WHERE status = 'pending'
+                        ORDER BY created_at, id
+                    """).fetchall()
+                finally:
+                    db.release_connection(conn)
+
+                for user_id, status, count, roundups, fees in balance_rows:
+                    balance = self._balance_for(self._user_key(user_id))
+                    balance['total_roundups'] += roundups
+                    balance['total_fees'] += fees
+                    balance['transaction_count'] += count
+                    if status == 'pending':
+                        balance['pending_roundups'] += roundups
+                        balance['pending_count'] += count
+                    elif status == 'swept':
+                        balance['swept_roundups'] += roundups
+                        balance['swept_count'] += count
+
+                for row in pending_rows:
+                    entry = self._row_to_entry(row)
+                    self._pending_by_user[self._user_key(entry['user_id'])].append(entry)
+            except Exception as e:
+                print(f"[ROUNDUP] Ledger persistence unavailable, using in-memory ledger: {e}")
+                self._persistent = False
+            self._ledger_loaded = True
+
+    def _persist_entry(self, entry: Dict):
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, """
+                INSERT INTO roundup_ledger
+                (entry_id, user_id, transaction_id, original_amount, round_up_amount,
+                 fee_amount, total_debit, status, created_at)
+                VALUES (:entry_id, :user_id, :transaction_id, :original_amount, :delta,
+                        :fee, :total_debit, :status, :created_at)
+            """, {
+                'entry_id': entry['id'],
+                'user_id': entry['user_id'],
+                'transaction_id': entry['transaction_id'],
+                'original_amount': entry['original_amount'],
+                'delta': entry['delta'],
+                'fee': entry['fee'],
+                'total_debit': entry['total_debit'],
+                'status': entry['status'],
+                'created_at': entry['created_at']
+            })
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    def _persist_sweep(self, user_id, sweep_batch_id: str, swept_at: str):
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, """
+                UPDATE roundup_ledger
+                SET status = 'swept', swept_at = :swept_at, sweep_batch_id = :batch_id
+                WHERE user_id = :user_id AND status = 'pending'
+            """, {'swept_at': swept_at, 'batch_id': sweep_batch_id, 'user_id': user_id})
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    def _append_entry(self, entry: Dict):
+        """Record a ledger entry and update the user's running balances"""
+        self._ensure_loaded()
+        key = self._user_key(entry['user_id'])
+        with self._ledger_lock:
+            if self._persistent:
+                self._persist_entry(entry)
+            else:
+                self._memory_entries[key].append(entry)
+            self._pending_by_user[key].append(entry)
+            balance = self._balance_for(key)
+            balance['total_roundups'] += entry['delta']
+            balance['total_fees'] += entry['fee']
+            balance['pending_roundups'] += entry['delta']
+            balance['pending_count'] += 1
+            balance['transaction_count'] += 1
+
+    def forget_user(self, user_id):
+        """Drop a deleted user's cached pending entries and running balances (their rows are gone)"""
+        key = self._user_key(user_id)
+        with self._ledger_lock:
+            self._pending_by_user.pop(key, None)
+            self._balances.pop(key, None)
+            self._memory_entries.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Round-up processing
+    # ------------------------------------------------------------------
+
     def process_transaction(self, transaction: Dict) -> Dict:
         """Process a transaction and apply round-up"""
         user_id = transaction.get('user_id', 'default')
@@ -94,7 +279,7 @@ class RoundUpEngine:
         }
         
         # Add to ledger
-        self.roundup_ledger.append(ledger_entry)
+        self._append_entry(ledger_entry)
         
         # Publish round-up accrued event
         try:
@@ -133,34 +318,52 @@ class RoundUpEngine:
     
     def get_pending_total(self, user_id: str) -> float:
         """Get total pending round-ups for a user"""
-        total = 0.0
-        for entry in self.roundup_ledger:
-            if (entry['user_id'] == user_id and 
-                entry['status'] == 'pending'):
-                total += entry['delta']
-        return round(total, 2)
+        self._ensure_loaded()
+        balance = self._balances.get(self._user_key(user_id))
+        return round(balance['pending_roundups'], 2) if balance else 0.0
     
     def get_pending_entries(self, user_id: str) -> List[Dict]:
         """Get all pending round-up entries for a user"""
-        return [
-            entry for entry in self.roundup_ledger
-            if entry['user_id'] == user_id and entry['status'] == 'pending'
-        ]
+        self._ensure_loaded()
+        return list(self._pending_by_user.get(self._user_key(user_id), []))
+    
+    def get_users_with_pending(self) -> List:
+        """Get the ids of users that currently have pending round-ups"""
+        self._ensure_loaded()
+        with self._ledger_lock:
+            return [entries[0]['user_id'] for entries in self._pending_by_user.values() if entries]
     
     def auto_sweep(self, user_id: str) -> Dict:
         """Automatically sweep round-ups to portfolio"""
-        pending_entries = self.get_pending_entries(user_id)
-        if not pending_entries:
-            return {'swept': False, 'reason': 'No pending round-ups'}
-        
-        sweep_batch_id = f"sweep_{user_id}_{int(datetime.utcnow().timestamp())}"
-        total_swept = 0.0
-        
-        for entry in pending_entries:
-            entry['status'] = 'swept'
-            entry['swept_at'] = datetime.utcnow().isoformat()
-            entry['sweep_batch_id'] = sweep_batch_id
-            total_swept += entry['delta']
+        self._ensure_loaded()
+        key = self._user_key(user_id)
+        with self._ledger_lock:
+            pending_entries = self._pending_by_user.pop(key, [])
+            if not pending_entries:
+                return {'swept': False, 'reason': 'No pending round-ups'}
+            
+            sweep_batch_id = f"sweep_{user_id}_{int(datetime.utcnow().timestamp())}"
+            swept_at = datetime.utcnow().isoformat()
+            total_swept = sum(entry['delta'] for entry in pending_entries)
+            
+            if self._persistent:
+                try:
+                    self._persist_sweep(pending_entries[0]['user_id'], sweep_batch_id, swept_at)
+                except Exception:
+                    # Leave the entries pending so the next sweep retries them
+                    self._pending_by_user[key] = pending_entries
+                    raise
+            
+            for entry in pending_entries:
+                entry['status'] = 'swept'
+                entry['swept_at'] = swept_at
+                entry['sweep_batch_id'] = sweep_batch_id
+            
+            balance = self._balance_for(key)
+            balance['pending_roundups'] -= total_swept
+            balance['swept_roundups'] += total_swept
+            balance['pending_count'] -= len(pending_entries)
+            balance['swept_count'] += len(pending_entries)
         
         # Publish round-up swept event
         try:
@@ -185,7 +388,7 @@ class RoundUpEngine:
             'sweep_batch_id': sweep_batch_id,
             'entries_swept': len(pending_entries),
             'total_swept': round(total_swept, 2),
-            'swept_at': datetime.utcnow().isoformat()
+            'swept_at': swept_at
         }
     
     def manual_sweep(self, user_id: str) -> Dict:
@@ -194,73 +397,85 @@ class RoundUpEngine:
     
     def get_user_stats(self, user_id: str) -> Dict:
         """Get round-up statistics for a user"""
-        user_entries = [entry for entry in self.roundup_ledger if entry['user_id'] == user_id]
-        
-        total_roundups = sum(entry['delta'] for entry in user_entries)
-        total_fees = sum(entry['fee'] for entry in user_entries)
-        pending_roundups = sum(entry['delta'] for entry in user_entries if entry['status'] == 'pending')
-        swept_roundups = sum(entry['delta'] for entry in user_entries if entry['status'] == 'swept')
+        self._ensure_loaded()
+        balance = self._balances.get(self._user_key(user_id)) or self._empty_balance()
         
         return {
-            'total_roundups': round(total_roundups, 2),
-            'total_fees': round(total_fees, 2),
-            'pending_roundups': round(pending_roundups, 2),
-            'swept_roundups': round(swept_roundups, 2),
-            'total_transactions': len(user_entries),
-            'pending_count': len([e for e in user_entries if e['status'] == 'pending']),
-            'swept_count': len([e for e in user_entries if e['status'] == 'swept'])
+            'total_roundups': round(balance['total_roundups'], 2),
+            'total_fees': round(balance['total_fees'], 2),
+            'pending_roundups': round(balance['pending_roundups'], 2),
+            'swept_roundups': round(balance['swept_roundups'], 2),
+            'total_transactions': balance['transaction_count'],
+            'pending_count': balance['pending_count'],
+            'swept_count': balance['swept_count']
         }
     
     def get_admin_stats(self) -> Dict:
-        """Get admin-level round-up statistics"""
-        total_roundups = sum(entry['delta'] for entry in self.roundup_ledger)
-        total_fees = sum(entry['fee'] for entry in self.roundup_ledger)
-        total_pending = sum(entry['delta'] for entry in self.roundup_ledger if entry['status'] == 'pending')
-        total_swept = sum(entry['delta'] for entry in self.roundup_ledger if entry['status'] == 'swept')
+        """Get admin-level round-up statistics from the per-user running balances"""
+        self._ensure_loaded()
+        with self._ledger_lock:
+            balances = {key: dict(balance) for key, balance in self._balances.items()}
         
         # User breakdown
         user_stats = {}
-        for entry in self.roundup_ledger:
-            user_id = entry['user_id']
-            if user_id not in user_stats:
-                user_stats[user_id] = {
-                    'total_roundups': 0,
-                    'total_fees': 0,
-                    'pending_roundups': 0,
-                    'swept_roundups': 0,
-                    'transaction_count': 0
-                }
-            
-            user_stats[user_id]['total_roundups'] += entry['delta']
-            user_stats[user_id]['total_fees'] += entry['fee']
-            user_stats[user_id]['transaction_count'] += 1
-            
-            if entry['status'] == 'pending':
-                user_stats[user_id]['pending_roundups'] += entry['delta']
-            elif entry['status'] == 'swept':
-                user_stats[user_id]['swept_roundups'] += entry['delta']
+        for key, balance in balances.items():
+            user_stats[key] = {
+                'total_roundups': round(balance['total_roundups'], 2),
+                'total_fees': round(balance['total_fees'], 2),
+                'pending_roundups': round(balance['pending_roundups'], 2),
+                'swept_roundups': round(balance['swept_roundups'], 2),
+                'transaction_count': balance['transaction_count']
+            }
         
         return {
-            'total_roundups': round(total_roundups, 2),
-            'total_fees': round(total_fees, 2),
-            'total_pending': round(total_pending, 2),
-            'total_swept': round(total_swept, 2),
-            'total_transactions': len(self.roundup_ledger),
+            'total_roundups': round(sum(b['total_roundups'] for b in balances.values()), 2),
+            'total_fees': round(sum(b['total_fees'] for b in balances.values()), 2),
+            'total_pending': round(sum(b['pending_roundups'] for b in balances.values()), 2),
+            'total_swept': round(sum(b['swept_roundups'] for b in balances.values()), 2),
+            'total_transactions': sum(b['transaction_count'] for b in balances.values()),
             'active_users': len(user_stats),
             'user_breakdown': user_stats
         }
     
-    def get_ledger_entries(self, user_id: str = None, status: str = None) -> List[Dict]:
-        """Get ledger entries with optional filtering"""
-        entries = self.roundup_ledger
+    def get_ledger_entries(self, user_id: str = None, status: str = None,
+                           limit: int = 100, offset: int = 0) -> List[Dict]:
+        """Get ledger entries with optional filtering, newest first"""
+        self._ensure_loaded()
         
-        if user_id:
-            entries = [e for e in entries if e['user_id'] == user_id]
+        if not self._persistent:
+            if user_id:
+                entries = list(self._memory_entries.get(self._user_key(user_id), []))
+            else:
+                entries = [e for user_entries in self._memory_entries.values() for e in user_entries]
+            if status:
+                entries = [e for e in entries if e['status'] == status]
+            entries.sort(key=lambda x: x['created_at'], reverse=True)
+            return entries[offset:offset + limit]
         
+        # Served by idx_roundup_ledger_user_status / idx_roundup_ledger_status
+        conditions = []
+        params = {'limit': int(limit), 'offset': int(offset)}
+        if user_id:
+            conditions.append('user_id = :user_id')
+            params['user_id'] = user_id
         if status:
-            entries = [e for e in entries if e['status'] == status]
+            conditions.append('status = :status')
+            params['status'] = status
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
         
-        return sorted(entries, key=lambda x: x['created_at'], reverse=True)
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT {self._ENTRY_COLUMNS}
+                FROM roundup_ledger
+                {where_clause}
+                ORDER BY created_at DESC, id DESC
+                LIMIT :limit OFFSET :offset
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+        return [self._row_to_entry(row) for row in rows]
 
 # Global round-up engine instance
 roundup_engine = RoundUpEngine()
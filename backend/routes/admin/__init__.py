@@ -182,70 +182,24 @@ def get_admin_analytics_settings():
         }
     })
 
-# Business Stress Test endpoints
+# Business Stress Test endpoints (engine in stress_test.py; runs are started from app.py)
 @admin_bp.route('/business-stress-test/status', methods=['GET'])
 def get_business_stress_test_status():
     """Get business stress test status"""
+    from stress_test import stress_test_runner
     return jsonify({
         'success': True,
-        'data': {
-            'status': 'completed',
-            'last_run': '2025-10-08T20:00:00Z',
-            'total_tests': 15,
-            'passed_tests': 14,
-            'failed_tests': 1,
-            'success_rate': 93.3,
-            'average_response_time': '245ms',
-            'peak_load': '1000 requests/min',
-            'recommendations': [
-                'Database connection pool needs optimization',
-                'Consider implementing caching for frequently accessed data'
-            ]
-        }
+        'data': stress_test_runner.status()
     })
 
 @admin_bp.route('/business-stress-test/categories', methods=['GET'])
 def get_business_stress_test_categories():
     """Get business stress test categories"""
+    from stress_test import stress_test_runner
     return jsonify({
         'success': True,
         'data': {
-            'categories': [
-                {
-                    'id': 1,
-                    'name': 'API Endpoints',
-                    'tests': 8,
-                    'passed': 8,
-                    'failed': 0,
-                    'status': 'passed'
-                },
-                {
-                    'id': 2,
-                    'name': 'Database Performance',
-                    'tests': 4,
-                    'passed': 3,
-                    'failed': 1,
-                    'status': 'warning'
-                },
-                {
-                    'id': 3,
-                    'name': 'Authentication',
-                    'tests': 2,
-                    'passed': 2,
-                    'failed': 0,
-                    'status': 'passed'
-                },
-                {
-                    'id': 4,
-                    'name': 'File Upload',
-                    'tests': 1,
-                    'passed': 1,
-                    'failed': 0,
-                    'status': 'passed'
-                }
-            ],
-            'overall_status': 'warning',
-            'last_updated': '2025-10-08T20:00:00Z'
+            'categories': stress_test_runner.category_summary()
         }
     })
 
@@ -771,8 +725,10 @@ def get_roundup_ledger():
         
         user_id = request.args.get('user_id')
         status = request.args.get('status')
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        offset = request.args.get('offset', 0, type=int)
         
-        entries = roundup_engine.get_ledger_entries(user_id, status)
+        entries = roundup_engine.get_ledger_entries(user_id, status, limit=limit, offset=offset)
         
         return jsonify({
             'success': True,
@@ -786,41 +742,6 @@ def get_roundup_ledger():
             'error': str(e)
         }), 500
 
-@admin_bp.route('/roundup/sweep-all', methods=['POST'])
-def sweep_all_roundups():
-    """Admin trigger to sweep all pending round-ups"""
-    try:
-        from roundup_engine import roundup_engine
-        
-        data = request.get_json()
-        admin_id = data.get('admin_id', 'admin')
-        
-        # Get all users with pending round-ups
-        admin_stats = roundup_engine.get_admin_stats()
-        user_breakdown = admin_stats.get('user_breakdown', {})
-        
-        sweep_results = []
-        for user_id, user_stats in user_breakdown.items():
-            if user_stats['pending_roundups'] > 0:
-                result = roundup_engine.manual_sweep(user_id)
-                sweep_results.append({
-                    'user_id': user_id,
-                    'result': result
-                })
-        
-        return jsonify({
-            'success': True,
-            'message': f'Swept round-ups for {len(sweep_results)} users',
-            'data': sweep_results
-        })
-        
-    except Exception as e:
-        print(f"Error sweeping all round-ups: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
-
 # Event Bus Management endpoints for admin
 @admin_bp.route('/events/stats', methods=['GET'])
 def get_event_bus_stats():
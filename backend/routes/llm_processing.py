@@ -54,48 +54,6 @@ def process_mapping(mapping_id):
             print(f"✅ AI processing complete. Result: {ai_result}")
             
             # Update mapping in database with AI results (using same connection)
-            # Add AI columns if they don't exist
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_attempted INTEGER DEFAULT 0")
-                conn.commit()
-            except:
-                pass  # Column already exists
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_status TEXT")
-                conn.commit()
-            except:
-                pass
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_confidence REAL")
-                conn.commit()
-            except:
-                pass
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_reasoning TEXT")
-                conn.commit()
-            except:
-                pass
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_model_version TEXT")
-                conn.commit()
-            except:
-                pass
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_processing_duration INTEGER")
-                conn.commit()
-            except:
-                pass
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN ai_processing_time TEXT")
-                conn.commit()
-            except:
-                pass
-            try:
-                cursor.execute("ALTER TABLE llm_mappings ADD COLUMN suggested_ticker TEXT")
-                conn.commit()
-            except:
-                pass
-            
             # Prepare update values
             ai_status = ai_result.get('ai_status', 'uncertain')
             ai_confidence = float(ai_result.get('ai_confidence', 0.0))
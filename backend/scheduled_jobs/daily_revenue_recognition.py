@@ -13,34 +13,23 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def run_daily_revenue_recognition():
+def run_daily_revenue_recognition(start_date=None, end_date=None):
     """
     Main function to run daily revenue recognition
     This should be called by a scheduler (cron, APScheduler, etc.)
+    
+    Without dates it recognizes every day since the last run up to today,
+    so missed runs are caught up in the same pass
     """
     try:
         logger.info("Starting daily revenue recognition process...")
         
-        # Initialize service (with actual DB connection)
-        # accounting_service = SubscriptionAccountingService(db_connection)
-        
-        # Fetch all active subscriptions from database
-        # subscriptions = db.get_active_subscriptions()
-        
-        # Process recognition for today
-        # entries = accounting_service.process_daily_revenue_recognition(
-        #     subscriptions=subscriptions,
-        #     recognition_date=datetime.now().date()
-        # )
+        accounting_service = SubscriptionAccountingService()
+        result = accounting_service.recognize_revenue(start_date=start_date, end_date=end_date)
         
-        # Log results
-        logger.info(f"Daily recognition complete: {0} entries created")  # len(entries)
+        logger.info(f"Daily recognition complete: {result['entries_created']} entries created")
         
-        return {
-            'success': True,
-            'entries_created': 0,  # len(entries),
-            'date': datetime.now().date().isoformat()
-        }
+        return dict(result, success=True, date=result['end_date'])
         
     except Exception as e:
         logger.error(f"Error in daily revenue recognition: {e}")
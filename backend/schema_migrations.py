@@ -0,0 +1,1512 @@
+"""
+Schema Migrations for Kamioi Platform
+Ordered, versioned schema changes for SQLite and PostgreSQL.
+
+- schema_version records every applied migration; startup only reads
+  MAX(version) from it, so no request or service call probes or alters
+  the schema any more
+- Each migration runs in its own transaction under a write lock (BEGIN
+  IMMEDIATE on SQLite, an advisory lock on PostgreSQL) and re-checks the
+  version first, so several workers starting together apply it once
+- Migration 1 is the baseline: DatabaseManager.create_base_schema on SQLite,
+  migrations/create_postgres_schema.py on PostgreSQL. Every later change is
+  appended to MIGRATIONS with the next version number; never edit or
+  reorder an applied one
+
+Run once per deploy, before the new code serves traffic (the Procfile release
+phase does this; PostgreSQL does not auto-migrate at startup):
+
+    python schema_migrations.py            # apply pending migrations
+    python schema_migrations.py --status   # show applied/pending
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence, Tuple, Union
+
+from utils.log import get_logger
+
+log = get_logger('schema')
+
+ADVISORY_LOCK_ID = 7_270_039
+
+Step = Union[str, Callable]
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    sqlite: Sequence[Step] = field(default_factory=list)
+    postgres: Sequence[Step] = field(default_factory=list)
+
+
+def add_columns(table: str, columns: List[Tuple[str, str, str]]) -> Callable:
+    """
+    Step adding (name, sqlite_type, postgres_type) columns that are missing.
+
+    Databases created before a column reached the baseline lack it, newer
+    ones already have it; a missing SQLite table is skipped (nothing to alter).
+    """
+    def step(runner, conn):
+        if runner.use_postgresql:
+            for name, _, pg_type in columns:
+                runner.execute(conn, f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {pg_type}")
+            return
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+        if not existing:
+            return
+        for name, sqlite_type, _ in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sqlite_type}")
+    step.__name__ = f'add_columns_{table}'
+    return step
+
+
+def _baseline_sqlite(runner, conn):
+    runner.db.create_base_schema(conn.cursor())
+
+
+def _roundup_ledger_nullable_transaction_sqlite(runner, conn):
+    """SQLite cannot drop NOT NULL in place: rebuild roundup_ledger from its own definition without it"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'roundup_ledger'").fetchone()
+    if not row or 'transaction_id INTEGER NOT NULL' not in row[0]:
+        return
+    indexes = [r[0] for r in conn.execute("""
+        SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'roundup_ledger' AND sql IS NOT NULL
+    """).fetchall()]
+    columns = ', '.join(r[1] for r in conn.execute("PRAGMA table_info(roundup_ledger)").fetchall())
+    conn.execute("ALTER TABLE roundup_ledger RENAME TO roundup_ledger_old")
+    conn.execute(row[0].replace('transaction_id INTEGER NOT NULL', 'transaction_id INTEGER'))
+    conn.execute(f"INSERT INTO roundup_ledger ({columns}) SELECT {columns} FROM roundup_ledger_old")
+    conn.execute("DROP TABLE roundup_ledger_old")
+    for index in indexes:
+        conn.execute(index)
+
+
+LEDGER_CHECKSUM_MODULUS = 2147483647
+
+
+def ledger_line_checksum(row: str) -> str:
+    """SQL fingerprint of one journal line (id and amounts) in [0, LEDGER_CHECKSUM_MODULUS)"""
+    return (f"(((CAST({row}.id AS BIGINT) * 1000003"
+            f" + CAST(ROUND(COALESCE({row}.debit, 0) * 100) AS BIGINT) * 7919"
+            f" + CAST(ROUND(COALESCE({row}.credit, 0) * 100) AS BIGINT) * 104729)"
+            f" % {LEDGER_CHECKSUM_MODULUS}) + {LEDGER_CHECKSUM_MODULUS}) % {LEDGER_CHECKSUM_MODULUS}")
+
+
+def _ledger_partition_upsert(select: str) -> str:
+    """Add the (period, account_code, count, debit, credit, checksum) rows of `select` to ledger_partitions"""
+    return f"""
+            INSERT INTO ledger_partitions
+                (period, account_code, line_count, debit_total, credit_total, checksum, updated_at)
+            {select}
+            ON CONFLICT (period, account_code) DO UPDATE SET
+                line_count = ledger_partitions.line_count + excluded.line_count,
+                debit_total = ledger_partitions.debit_total + excluded.debit_total,
+                credit_total = ledger_partitions.credit_total + excluded.credit_total,
+                checksum = (ledger_partitions.checksum + excluded.checksum) % {LEDGER_CHECKSUM_MODULUS},
+                updated_at = excluded.updated_at"""
+
+
+def _ledger_line_delta(row: str, period: str, sign: int) -> str:
+    """One line added to (sign 1) or taken out of (sign -1) its partition"""
+    checksum = ledger_line_checksum(row)
+    if sign < 0:
+        checksum = f"({LEDGER_CHECKSUM_MODULUS} - {checksum}) % {LEDGER_CHECKSUM_MODULUS}"
+    sign_prefix = '-' if sign < 0 else ''
+    return _ledger_partition_upsert(
+        f"SELECT {period}, {row}.account_code, {sign}, {sign_prefix}COALESCE({row}.debit, 0), "
+        f"{sign_prefix}COALESCE({row}.credit, 0), {checksum}, CURRENT_TIMESTAMP WHERE 1 = 1")
+
+
+def _ledger_entry_move(entry_id: str, from_period: str, to_period: str) -> List[str]:
+    """Move every line of an entry from one period partition to another"""
+    line_sums = (f"account_code, COUNT(*), SUM(COALESCE(debit, 0)), SUM(COALESCE(credit, 0)), "
+                 f"SUM({ledger_line_checksum('l')}) % {LEDGER_CHECKSUM_MODULUS}")
+    lines = f"FROM journal_entry_lines l WHERE l.journal_entry_id = {entry_id} GROUP BY account_code"
+    return [
+        _ledger_partition_upsert(
+            f"SELECT {from_period}, account_code, -COUNT(*), -SUM(COALESCE(debit, 0)), -SUM(COALESCE(credit, 0)), "
+            f"({LEDGER_CHECKSUM_MODULUS} - SUM({ledger_line_checksum('l')}) % {LEDGER_CHECKSUM_MODULUS}) "
+            f"% {LEDGER_CHECKSUM_MODULUS}, CURRENT_TIMESTAMP {lines}"),
+        _ledger_partition_upsert(f"SELECT {to_period}, {line_sums}, CURRENT_TIMESTAMP {lines}"),
+    ]
+
+
+def _line_period(row: str) -> str:
+    """A line's partition: the month of its entry date, '' for a line without an entry"""
+    return f"COALESCE((SELECT SUBSTR(date, 1, 7) FROM journal_entries WHERE id = {row}.journal_entry_id), '')"
+
+
+def _ledger_backfill() -> str:
+    return f"""
+        INSERT INTO ledger_partitions (period, account_code, line_count, debit_total, credit_total, checksum, updated_at)
+        SELECT COALESCE(SUBSTR(je.date, 1, 7), ''), l.account_code, COUNT(*), SUM(COALESCE(l.debit, 0)),
+               SUM(COALESCE(l.credit, 0)), SUM({ledger_line_checksum('l')}) % {LEDGER_CHECKSUM_MODULUS},
+               CURRENT_TIMESTAMP
+        FROM journal_entry_lines l
+        LEFT JOIN journal_entries je ON je.id = l.journal_entry_id
+        GROUP BY COALESCE(SUBSTR(je.date, 1, 7), ''), l.account_code
+    """
+
+
+def _period_delta_upsert(select: str) -> str:
+    """Add the (account_code, period, debit, credit) rows of `select` to account_period_deltas"""
+    return f"""
+            INSERT INTO account_period_deltas (account_code, period, debit_total, credit_total, updated_at)
+            {select}
+            ON CONFLICT (account_code, period) DO UPDATE SET
+                debit_total = account_period_deltas.debit_total + excluded.debit_total,
+                credit_total = account_period_deltas.credit_total + excluded.credit_total,
+                updated_at = excluded.updated_at"""
+
+
+def _period_line_delta(row: str, sign: int) -> str:
+    """One line added to (sign 1) or taken out of (sign -1) its entry's month; a line without an entry counts nowhere"""
+    sign_prefix = '-' if sign < 0 else ''
+    return _period_delta_upsert(
+        f"SELECT {row}.account_code, SUBSTR(je.date, 1, 7), {sign_prefix}COALESCE({row}.debit, 0), "
+        f"{sign_prefix}COALESCE({row}.credit, 0), CURRENT_TIMESTAMP "
+        f"FROM journal_entries je WHERE je.id = {row}.journal_entry_id")
+
+
+def _period_entry_delta(entry_id: str, period: str, sign: int) -> str:
+    """Every line of an entry added to or taken out of `period`"""
+    sign_prefix = '-' if sign < 0 else ''
+    return _period_delta_upsert(
+        f"SELECT account_code, {period}, {sign_prefix}SUM(COALESCE(debit, 0)), "
+        f"{sign_prefix}SUM(COALESCE(credit, 0)), CURRENT_TIMESTAMP "
+        f"FROM journal_entry_lines WHERE journal_entry_id = {entry_id} GROUP BY account_code")
+
+
+def period_delta_backfill() -> str:
+    """
+    Recompute account_period_deltas from the journal lines: every line of an
+    open month, plus whatever the closed months' snapshots have not folded in
+    (backdated lines), labelled with the last closed month so the next close
+    picks it up. Run on an empty account_period_deltas.
+    """
+    last_closed = "(SELECT last_closed_period FROM account_balance_state WHERE id = 1)"
+    return f"""
+        INSERT INTO account_period_deltas (account_code, period, debit_total, credit_total, updated_at)
+        SELECT account_code, period, SUM(debit), SUM(credit), CURRENT_TIMESTAMP
+        FROM (
+            SELECT l.account_code,
+                   CASE WHEN SUBSTR(je.date, 1, 7) <= {last_closed} THEN {last_closed}
+                        ELSE SUBSTR(je.date, 1, 7) END AS period,
+                   COALESCE(l.debit, 0) AS debit, COALESCE(l.credit, 0) AS credit
+            FROM journal_entry_lines l
+            JOIN journal_entries je ON je.id = l.journal_entry_id
+            UNION ALL
+            SELECT account_code, {last_closed}, -period_debit, -period_credit
+            FROM account_balance_snapshots
+        ) movements
+        GROUP BY account_code, period
+        HAVING ABS(SUM(debit)) > 0.000001 OR ABS(SUM(credit)) > 0.000001
+    """
+
+
+def _ledger_consistency_tables(real: str, bigint: str) -> List[str]:
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS ledger_partitions (
+            period TEXT NOT NULL,
+            account_code TEXT NOT NULL,
+            line_count {bigint} NOT NULL DEFAULT 0,
+            debit_total {real} NOT NULL DEFAULT 0,
+            credit_total {real} NOT NULL DEFAULT 0,
+            checksum {bigint} NOT NULL DEFAULT 0,
+            verified_checksum {bigint},
+            verified_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (period, account_code)
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS ledger_consistency_results (
+            period TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            issues TEXT,
+            line_count {bigint} NOT NULL DEFAULT 0,
+            debit_total {real} NOT NULL DEFAULT 0,
+            credit_total {real} NOT NULL DEFAULT 0,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]
+
+
+def _holdings_and_load_test_tables(id_column: str) -> List[str]:
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS positions (
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            shares REAL NOT NULL DEFAULT 0,
+            cost_basis REAL NOT NULL DEFAULT 0,
+            last_price REAL,
+            market_value REAL DEFAULT 0,
+            marked_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, ticker)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_positions_ticker ON positions(ticker)",
+        f"""
+        CREATE TABLE IF NOT EXISTS price_history (
+            ticker TEXT NOT NULL,
+            resolution TEXT NOT NULL DEFAULT 'daily',
+            ts TIMESTAMP NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL NOT NULL,
+            volume REAL,
+            source TEXT,
+            PRIMARY KEY (ticker, resolution, ts)
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS stress_test_runs (
+            id {id_column},
+            scenario TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            users INTEGER NOT NULL,
+            duration_seconds REAL NOT NULL,
+            requests INTEGER NOT NULL,
+            errors INTEGER NOT NULL,
+            throughput_rps REAL,
+            p50_ms REAL,
+            p95_ms REAL,
+            p99_ms REAL,
+            lock_wait_p95_ms REAL,
+            result_json TEXT,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stress_test_runs_scenario ON stress_test_runs(scenario, started_at)",
+    ]
+
+
+def _roundup_and_netting_columns() -> List[Step]:
+    return [
+        add_columns('roundup_ledger', [('entry_id', 'TEXT', 'VARCHAR(255)'), ('original_amount', 'REAL', 'REAL'),
+                                       ('total_debit', 'REAL', 'REAL'), ('sweep_batch_id', 'TEXT', 'VARCHAR(255)')]),
+        "CREATE INDEX IF NOT EXISTS idx_roundup_ledger_user_status ON roundup_ledger(user_id, status)",
+        add_columns('market_queue', [('order_id', 'TEXT', 'VARCHAR(255)'), ('fill_price', 'REAL', 'REAL'),
+                                     ('shares', 'REAL', 'REAL')]),
+        "CREATE INDEX IF NOT EXISTS idx_market_queue_order_id ON market_queue(order_id)",
+    ]
+
+
+# ----------------------------------------------------------------------
+# Migrations (append only)
+# ----------------------------------------------------------------------
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'baseline', sqlite=[_baseline_sqlite], postgres=[
+        # Created by migrations/create_postgres_schema.py
+    ]),
+
+    # Columns add_transaction / migrate_user_address_fields used to add on the fly
+    Migration(2, 'legacy_transaction_and_address_columns', sqlite=[
+        add_columns('transactions', [
+            ('shares', 'REAL', 'REAL'),
+            ('price_per_share', 'REAL', 'REAL'),
+            ('stock_price', 'REAL', 'REAL'),
+            ("transaction_type", "TEXT DEFAULT 'bank'", "TEXT DEFAULT 'bank'"),
+        ]),
+        add_columns('users', [(c, 'TEXT', 'TEXT') for c in ('city', 'state', 'zip_code', 'phone')]),
+    ], postgres=[
+        add_columns('transactions', [
+            ('shares', 'REAL', 'REAL'),
+            ('price_per_share', 'REAL', 'REAL'),
+            ('stock_price', 'REAL', 'REAL'),
+            ("transaction_type", "TEXT DEFAULT 'bank'", "TEXT DEFAULT 'bank'"),
+        ]),
+        add_columns('users', [(c, 'TEXT', 'TEXT') for c in ('city', 'state', 'zip_code', 'phone')]),
+    ]),
+
+    # Profile/registration columns and admin flags previously added by request handlers
+    Migration(3, 'user_profile_and_admin_columns', sqlite=[
+        add_columns('users', [(c, t, t) for c, t in (
+            ('first_name', 'TEXT'), ('last_name', 'TEXT'), ('address', 'TEXT'), ('annual_income', 'TEXT'),
+            ('employment_status', 'TEXT'), ('employer', 'TEXT'), ('occupation', 'TEXT'), ('round_up_amount', 'REAL'),
+            ('risk_tolerance', 'TEXT'), ('date_of_birth', 'TEXT'), ('ssn_last4', 'TEXT'), ('country', 'TEXT'),
+            ('timezone', 'TEXT'), ('subscription_plan_id', 'INTEGER'), ('billing_cycle', 'TEXT'),
+            ('promo_code', 'TEXT'), ('mx_data', 'TEXT'), ('registration_completed', 'TEXT'),
+            ('company_name', 'TEXT'), ('invite_code', 'TEXT'))]),
+        add_columns('admins', [
+            ('is_active', 'INTEGER DEFAULT 1', 'BOOLEAN DEFAULT TRUE'),
+            ('totp_secret', 'TEXT', 'VARCHAR(64)'),
+            ('totp_enabled', 'INTEGER DEFAULT 0', 'BOOLEAN DEFAULT FALSE'),
+        ]),
+    ], postgres=[
+        add_columns('users', [(c, t, t) for c, t in (
+            ('first_name', 'TEXT'), ('last_name', 'TEXT'), ('address', 'TEXT'), ('annual_income', 'TEXT'),
+            ('employment_status', 'TEXT'), ('employer', 'TEXT'), ('occupation', 'TEXT'), ('round_up_amount', 'REAL'),
+            ('risk_tolerance', 'TEXT'), ('date_of_birth', 'TEXT'), ('ssn_last4', 'TEXT'), ('country', 'TEXT'),
+            ('timezone', 'TEXT'), ('subscription_plan_id', 'INTEGER'), ('billing_cycle', 'TEXT'),
+            ('promo_code', 'TEXT'), ('mx_data', 'TEXT'), ('registration_completed', 'TEXT'),
+            ('company_name', 'TEXT'), ('invite_code', 'TEXT'))]),
+        add_columns('admins', [
+            ('is_active', 'INTEGER DEFAULT 1', 'BOOLEAN DEFAULT TRUE'),
+            ('totp_secret', 'TEXT', 'VARCHAR(64)'),
+            ('totp_enabled', 'INTEGER DEFAULT 0', 'BOOLEAN DEFAULT FALSE'),
+        ]),
+    ]),
+
+    # APIUsageTracker / LearningService / AIProcessor tables
+    Migration(4, 'ai_usage_tables', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS api_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            endpoint TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            processing_time_ms INTEGER NOT NULL,
+            cost REAL NOT NULL DEFAULT 0.0000,
+            success INTEGER DEFAULT 1,
+            error_message TEXT,
+            request_data TEXT,
+            response_data TEXT,
+            user_id INTEGER,
+            page_tab TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+        add_columns('api_usage', [('user_id', 'INTEGER', 'INTEGER'), ('page_tab', 'TEXT', 'TEXT')]),
+        "CREATE INDEX IF NOT EXISTS idx_api_usage_created_at ON api_usage(created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS api_balance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            balance REAL NOT NULL DEFAULT 20.00,
+            updated_at TEXT NOT NULL
+        )
+        """,
+        "INSERT INTO api_balance (balance, updated_at) SELECT 20.00, datetime('now') "
+        "WHERE NOT EXISTS (SELECT 1 FROM api_balance)",
+        """
+        CREATE TABLE IF NOT EXISTS ai_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mapping_id INTEGER,
+            merchant_name TEXT NOT NULL,
+            category TEXT,
+            prompt TEXT NOT NULL,
+            raw_response TEXT NOT NULL,
+            parsed_response TEXT NOT NULL,
+            processing_time_ms INTEGER NOT NULL,
+            model_version TEXT NOT NULL,
+            is_error INTEGER DEFAULT 0,
+            admin_feedback TEXT,
+            admin_correct_ticker TEXT,
+            was_ai_correct INTEGER,
+            feedback_notes TEXT,
+            feedback_date TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS api_usage (
+            id SERIAL PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            processing_time_ms INTEGER NOT NULL,
+            cost REAL NOT NULL DEFAULT 0.0000,
+            success INTEGER DEFAULT 1,
+            error_message TEXT,
+            request_data TEXT,
+            response_data TEXT,
+            user_id INTEGER,
+            page_tab TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+        add_columns('api_usage', [('user_id', 'INTEGER', 'INTEGER'), ('page_tab', 'TEXT', 'TEXT')]),
+        "CREATE INDEX IF NOT EXISTS idx_api_usage_created_at ON api_usage(created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS api_balance (
+            id SERIAL PRIMARY KEY,
+            balance REAL NOT NULL DEFAULT 20.00,
+            updated_at TEXT NOT NULL
+        )
+        """,
+        "INSERT INTO api_balance (balance, updated_at) SELECT 20.00, NOW()::text "
+        "WHERE NOT EXISTS (SELECT 1 FROM api_balance)",
+        """
+        CREATE TABLE IF NOT EXISTS ai_responses (
+            id SERIAL PRIMARY KEY,
+            mapping_id INTEGER,
+            merchant_name TEXT NOT NULL,
+            category TEXT,
+            prompt TEXT NOT NULL,
+            raw_response TEXT NOT NULL,
+            parsed_response TEXT NOT NULL,
+            processing_time_ms INTEGER NOT NULL,
+            model_version TEXT NOT NULL,
+            is_error INTEGER DEFAULT 0,
+            admin_feedback TEXT,
+            admin_correct_ticker TEXT,
+            was_ai_correct INTEGER,
+            feedback_notes TEXT,
+            feedback_date TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+    ]),
+
+    # AI processing results and receipt pipeline columns/tables
+    Migration(5, 'ai_mapping_and_receipt_schema', sqlite=[
+        add_columns('llm_mappings', [
+            ('ai_attempted', 'INTEGER DEFAULT 0', 'INTEGER DEFAULT 0'),
+            ('ai_status', 'TEXT', 'TEXT'),
+            ('ai_confidence', 'REAL', 'REAL'),
+            ('ai_reasoning', 'TEXT', 'TEXT'),
+            ('ai_model_version', 'TEXT', 'TEXT'),
+            ('ai_processing_duration', 'INTEGER', 'INTEGER'),
+            ('ai_processing_time', 'TEXT', 'TEXT'),
+            ('suggested_ticker', 'TEXT', 'TEXT'),
+            ("source_type", "TEXT DEFAULT 'receipt_processing'", "TEXT DEFAULT 'receipt_processing'"),
+            ('receipt_id', 'TEXT', 'TEXT'),
+            ('mapping_data', 'TEXT', 'TEXT'),
+        ]),
+        add_columns('transactions', [('round_up_amount', 'REAL DEFAULT 0', 'REAL DEFAULT 0'),
+                                     ('receipt_id', 'TEXT', 'TEXT')]),
+        "CREATE INDEX IF NOT EXISTS idx_llm_mappings_source_receipt ON llm_mappings(source_type, receipt_id)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_mappings_user_id ON llm_mappings(user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            filename TEXT,
+            file_path TEXT,
+            status TEXT DEFAULT 'uploaded',
+            parsed_data TEXT,
+            round_up_amount DECIMAL(10,2),
+            allocation_data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS round_up_allocations (
+            id TEXT PRIMARY KEY,
+            transaction_id TEXT,
+            stock_symbol VARCHAR(10),
+            allocation_amount DECIMAL(10,2),
+            allocation_percentage DECIMAL(5,2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (transaction_id) REFERENCES transactions(id)
+        )
+        """,
+    ], postgres=[
+        add_columns('llm_mappings', [
+            ('ai_attempted', 'INTEGER DEFAULT 0', 'INTEGER DEFAULT 0'),
+            ('ai_status', 'TEXT', 'TEXT'),
+            ('ai_confidence', 'REAL', 'REAL'),
+            ('ai_reasoning', 'TEXT', 'TEXT'),
+            ('ai_model_version', 'TEXT', 'TEXT'),
+            ('ai_processing_duration', 'INTEGER', 'INTEGER'),
+            ('ai_processing_time', 'TEXT', 'TEXT'),
+            ('suggested_ticker', 'TEXT', 'TEXT'),
+            ("source_type", "TEXT DEFAULT 'receipt_processing'", "TEXT DEFAULT 'receipt_processing'"),
+            ('receipt_id', 'TEXT', 'TEXT'),
+            ('mapping_data', 'TEXT', 'TEXT'),
+        ]),
+        add_columns('transactions', [('round_up_amount', 'REAL DEFAULT 0', 'REAL DEFAULT 0'),
+                                     ('receipt_id', 'TEXT', 'TEXT')]),
+        "CREATE INDEX IF NOT EXISTS idx_llm_mappings_source_receipt ON llm_mappings(source_type, receipt_id)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_mappings_user_id ON llm_mappings(user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            filename TEXT,
+            file_path TEXT,
+            status TEXT DEFAULT 'uploaded',
+            parsed_data TEXT,
+            round_up_amount DECIMAL(10,2),
+            allocation_data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS round_up_allocations (
+            id TEXT PRIMARY KEY,
+            transaction_id TEXT,
+            stock_symbol VARCHAR(10),
+            allocation_amount DECIMAL(10,2),
+            allocation_percentage DECIMAL(5,2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+
+    # Tables request handlers used to create on first use
+    Migration(6, 'business_and_content_tables', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS business_team_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            business_user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'employee',
+            permissions TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (business_user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS business_goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            business_user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            target_value REAL,
+            current_value REAL DEFAULT 0,
+            department TEXT,
+            deadline TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (business_user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS business_reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            business_user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            format TEXT DEFAULT 'PDF',
+            period TEXT,
+            period_type TEXT,
+            status TEXT DEFAULT 'pending',
+            file_path TEXT,
+            download_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (business_user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS business_bank_connections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            institution_name TEXT NOT NULL,
+            bank_name TEXT,
+            account_name TEXT,
+            account_type TEXT,
+            account_id TEXT,
+            member_guid TEXT,
+            user_guid TEXT,
+            status TEXT DEFAULT 'connected',
+            connected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            setting_key TEXT NOT NULL,
+            setting_value TEXT,
+            updated_at TIMESTAMP,
+            UNIQUE(user_id, setting_key)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS seo_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setting_key TEXT UNIQUE NOT NULL,
+            setting_value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS demo_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT,
+            address TEXT,
+            interest_type TEXT,
+            heard_from TEXT,
+            experience_level TEXT,
+            memo TEXT,
+            status TEXT DEFAULT 'pending',
+            demo_code TEXT,
+            admin_notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS contact_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT DEFAULT 'unread',
+            admin_notes TEXT,
+            admin_reply TEXT,
+            replied_at TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS frontend_content (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            section_key TEXT UNIQUE NOT NULL,
+            section_name TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            content_data TEXT NOT NULL,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS business_team_members (
+            id SERIAL PRIMARY KEY,
+            business_user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'employee',
+            permissions TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS business_goals (
+            id SERIAL PRIMARY KEY,
+            business_user_id INTEGER NOT NULL REFERENCES users(id),
+            name TEXT NOT NULL,
+            description TEXT,
+            target_value REAL,
+            current_value REAL DEFAULT 0,
+            department TEXT,
+            deadline TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS business_reports (
+            id SERIAL PRIMARY KEY,
+            business_user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            format TEXT DEFAULT 'PDF',
+            period TEXT,
+            period_type TEXT,
+            status TEXT DEFAULT 'pending',
+            file_path TEXT,
+            download_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (business_user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS business_bank_connections (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            institution_name TEXT NOT NULL,
+            bank_name TEXT,
+            account_name TEXT,
+            account_type TEXT,
+            account_id TEXT,
+            member_guid TEXT,
+            user_guid TEXT,
+            status TEXT DEFAULT 'connected',
+            connected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_settings (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            setting_key TEXT NOT NULL,
+            setting_value TEXT,
+            updated_at TIMESTAMP,
+            UNIQUE(user_id, setting_key)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS seo_settings (
+            id SERIAL PRIMARY KEY,
+            setting_key VARCHAR(255) UNIQUE NOT NULL,
+            setting_value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS demo_requests (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            phone VARCHAR(50),
+            address TEXT,
+            interest_type VARCHAR(100),
+            heard_from VARCHAR(100),
+            experience_level VARCHAR(100),
+            memo TEXT,
+            status VARCHAR(50) DEFAULT 'pending',
+            demo_code VARCHAR(100),
+            admin_notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS contact_messages (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            subject VARCHAR(500) NOT NULL,
+            message TEXT NOT NULL,
+            status VARCHAR(50) DEFAULT 'unread',
+            admin_notes TEXT,
+            admin_reply TEXT,
+            replied_at TIMESTAMP,
+            ip_address VARCHAR(50),
+            user_agent TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS frontend_content (
+            id SERIAL PRIMARY KEY,
+            section_key VARCHAR(255) UNIQUE NOT NULL,
+            section_name VARCHAR(255) NOT NULL,
+            content_type VARCHAR(50) NOT NULL,
+            content_data TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+
+    # A transaction with a ticker is 'mapped': enforced on write instead of
+    # rewriting statuses from GET /transactions; the UPDATE backfills old rows
+    Migration(7, 'transactions_mapped_status_trigger', sqlite=[
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_mapped_insert
+        AFTER INSERT ON transactions
+        WHEN NEW.ticker IS NOT NULL AND NEW.status = 'pending'
+        BEGIN
+            UPDATE transactions SET status = 'mapped' WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_mapped_update
+        AFTER UPDATE OF ticker, status ON transactions
+        WHEN NEW.ticker IS NOT NULL AND NEW.status = 'pending'
+        BEGIN
+            UPDATE transactions SET status = 'mapped' WHERE id = NEW.id;
+        END
+        """,
+        "UPDATE transactions SET status = 'mapped' WHERE ticker IS NOT NULL AND status = 'pending'",
+    ], postgres=[
+        """
+        CREATE OR REPLACE FUNCTION transactions_mark_mapped() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.ticker IS NOT NULL AND NEW.status = 'pending' THEN
+                NEW.status := 'mapped';
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_transactions_mapped ON transactions",
+        """
+        CREATE TRIGGER trg_transactions_mapped
+        BEFORE INSERT OR UPDATE OF ticker, status ON transactions
+        FOR EACH ROW EXECUTE FUNCTION transactions_mark_mapped()
+        """,
+        "UPDATE transactions SET status = 'mapped' WHERE ticker IS NOT NULL AND status = 'pending'",
+    ]),
+
+    # Background receipt pipeline (receipt_jobs.py): one row per queued job
+    Migration(8, 'receipt_jobs', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS receipt_jobs (
+            id TEXT PRIMARY KEY,
+            receipt_id TEXT NOT NULL,
+            user_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            allocate INTEGER DEFAULT 0,
+            timings TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            FOREIGN KEY (receipt_id) REFERENCES receipts(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_receipt_jobs_receipt ON receipt_jobs(receipt_id, created_at)",
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS receipt_jobs (
+            id TEXT PRIMARY KEY,
+            receipt_id TEXT NOT NULL REFERENCES receipts(id),
+            user_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            allocate INTEGER DEFAULT 0,
+            timings TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_receipt_jobs_receipt ON receipt_jobs(receipt_id, created_at)",
+    ]),
+
+    # Daily transaction rollup read by MarketMonitor (behavior_rollup.py);
+    # behavior_rollup_state holds its single watermark row
+    Migration(9, 'daily_behavior_rollup', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS daily_behavior_rollup (
+            day TEXT PRIMARY KEY,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            roundup_volume REAL NOT NULL DEFAULT 0,
+            amount_total REAL NOT NULL DEFAULT 0,
+            amount_count INTEGER NOT NULL DEFAULT 0,
+            amount_nonzero_count INTEGER NOT NULL DEFAULT 0,
+            amount_sq_total REAL NOT NULL DEFAULT 0,
+            fee_total REAL NOT NULL DEFAULT 0,
+            fee_count INTEGER NOT NULL DEFAULT 0,
+            fee_nonzero_count INTEGER NOT NULL DEFAULT 0,
+            fee_sq_total REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS behavior_rollup_state (
+            id INTEGER PRIMARY KEY,
+            last_transaction_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at)",
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS daily_behavior_rollup (
+            day TEXT PRIMARY KEY,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            roundup_volume DOUBLE PRECISION NOT NULL DEFAULT 0,
+            amount_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            amount_count INTEGER NOT NULL DEFAULT 0,
+            amount_nonzero_count INTEGER NOT NULL DEFAULT 0,
+            amount_sq_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            fee_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            fee_count INTEGER NOT NULL DEFAULT 0,
+            fee_nonzero_count INTEGER NOT NULL DEFAULT 0,
+            fee_sq_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS behavior_rollup_state (
+            id INTEGER PRIMARY KEY,
+            last_transaction_id BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at)",
+    ]),
+
+    # Journal tables (previously only made by create_journal_tables.py) and
+    # the (subscription_id, recognition_date) ledger that keeps daily revenue
+    # recognition idempotent (SubscriptionAccountingService.recognize_revenue)
+    Migration(10, 'journal_tables_and_revenue_recognition', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS journal_entries (
+            id TEXT PRIMARY KEY,
+            date TEXT NOT NULL,
+            reference TEXT,
+            description TEXT,
+            location TEXT,
+            department TEXT,
+            transaction_type TEXT NOT NULL,
+            vendor_name TEXT,
+            customer_name TEXT,
+            amount REAL NOT NULL,
+            from_account TEXT NOT NULL,
+            to_account TEXT NOT NULL,
+            status TEXT DEFAULT 'draft',
+            created_at TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            updated_at TEXT,
+            updated_by TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS journal_entry_lines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            journal_entry_id TEXT NOT NULL,
+            account_code TEXT NOT NULL,
+            debit REAL DEFAULT 0,
+            credit REAL DEFAULT 0,
+            description TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (journal_entry_id) REFERENCES journal_entries (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_journal_entries_date ON journal_entries(date)",
+        "CREATE INDEX IF NOT EXISTS idx_journal_entry_lines_journal_id ON journal_entry_lines(journal_entry_id)",
+        """
+        CREATE TABLE IF NOT EXISTS subscription_revenue_recognitions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscription_id INTEGER NOT NULL,
+            recognition_date DATE NOT NULL,
+            journal_entry_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_revenue_recognition_subscription_date
+        ON subscription_revenue_recognitions(subscription_id, recognition_date)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_revenue_recognition_date ON subscription_revenue_recognitions(recognition_date)",
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS journal_entries (
+            id TEXT PRIMARY KEY,
+            date TEXT NOT NULL,
+            reference TEXT,
+            description TEXT,
+            location TEXT,
+            department TEXT,
+            transaction_type TEXT NOT NULL,
+            vendor_name TEXT,
+            customer_name TEXT,
+            amount DOUBLE PRECISION NOT NULL,
+            from_account TEXT NOT NULL,
+            to_account TEXT NOT NULL,
+            status TEXT DEFAULT 'draft',
+            created_at TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            updated_at TEXT,
+            updated_by TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS journal_entry_lines (
+            id SERIAL PRIMARY KEY,
+            journal_entry_id TEXT NOT NULL,
+            account_code TEXT NOT NULL,
+            debit DOUBLE PRECISION DEFAULT 0,
+            credit DOUBLE PRECISION DEFAULT 0,
+            description TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (journal_entry_id) REFERENCES journal_entries (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_journal_entries_date ON journal_entries(date)",
+        "CREATE INDEX IF NOT EXISTS idx_journal_entry_lines_journal_id ON journal_entry_lines(journal_entry_id)",
+        """
+        CREATE TABLE IF NOT EXISTS subscription_revenue_recognitions (
+            id SERIAL PRIMARY KEY,
+            subscription_id INTEGER NOT NULL,
+            recognition_date DATE NOT NULL,
+            journal_entry_id TEXT NOT NULL,
+            amount DOUBLE PRECISION NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_revenue_recognition_subscription_date
+        ON subscription_revenue_recognitions(subscription_id, recognition_date)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_revenue_recognition_date ON subscription_revenue_recognitions(recognition_date)",
+    ]),
+
+    # Keyset pagination of journal entries on (created_at, id), optionally
+    # filtered by date or by account (journal_ledger.py)
+    Migration(11, 'journal_entry_listing_indexes', sqlite=[
+        "CREATE INDEX IF NOT EXISTS idx_journal_entries_created ON journal_entries(created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_journal_entry_lines_account ON journal_entry_lines(account_code, journal_entry_id)",
+    ], postgres=[
+        "CREATE INDEX IF NOT EXISTS idx_journal_entries_created ON journal_entries(created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_journal_entry_lines_account ON journal_entry_lines(account_code, journal_entry_id)",
+    ]),
+
+    # Month-end account balance snapshots and open-period deltas read by the
+    # financial reports (period_balances.py); account_balance_state holds the
+    # journal line watermark and the last closed month
+    Migration(12, 'account_period_balances', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS account_balance_snapshots (
+            period TEXT NOT NULL,
+            account_code TEXT NOT NULL,
+            opening_balance REAL NOT NULL DEFAULT 0,
+            period_debit REAL NOT NULL DEFAULT 0,
+            period_credit REAL NOT NULL DEFAULT 0,
+            closing_balance REAL NOT NULL DEFAULT 0,
+            closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (period, account_code)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS account_period_deltas (
+            account_code TEXT NOT NULL,
+            period TEXT NOT NULL,
+            debit_total REAL NOT NULL DEFAULT 0,
+            credit_total REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (account_code, period)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS account_balance_state (
+            id INTEGER PRIMARY KEY,
+            last_line_id INTEGER NOT NULL DEFAULT 0,
+            last_closed_period TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS account_balance_snapshots (
+            period TEXT NOT NULL,
+            account_code TEXT NOT NULL,
+            opening_balance DOUBLE PRECISION NOT NULL DEFAULT 0,
+            period_debit DOUBLE PRECISION NOT NULL DEFAULT 0,
+            period_credit DOUBLE PRECISION NOT NULL DEFAULT 0,
+            closing_balance DOUBLE PRECISION NOT NULL DEFAULT 0,
+            closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (period, account_code)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS account_period_deltas (
+            account_code TEXT NOT NULL,
+            period TEXT NOT NULL,
+            debit_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            credit_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (account_code, period)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS account_balance_state (
+            id INTEGER PRIMARY KEY,
+            last_line_id BIGINT NOT NULL DEFAULT 0,
+            last_closed_period TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+
+    # Line count, debit/credit totals and an additive checksum per (month,
+    # account) of the journal, kept current by triggers, so the ledger
+    # consistency job re-verifies only the months that changed
+    # (ledger_consistency.py); the backfill leaves every partition unverified
+    Migration(13, 'ledger_consistency_partitions', sqlite=[
+        *_ledger_consistency_tables('REAL', 'INTEGER'),
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_partition_line_insert
+        AFTER INSERT ON journal_entry_lines
+        BEGIN
+            {_ledger_line_delta('NEW', _line_period('NEW'), 1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_partition_line_delete
+        AFTER DELETE ON journal_entry_lines
+        BEGIN
+            {_ledger_line_delta('OLD', _line_period('OLD'), -1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_partition_line_update
+        AFTER UPDATE OF id, journal_entry_id, account_code, debit, credit ON journal_entry_lines
+        BEGIN
+            {_ledger_line_delta('OLD', _line_period('OLD'), -1)};
+            {_ledger_line_delta('NEW', _line_period('NEW'), 1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_partition_entry_insert
+        AFTER INSERT ON journal_entries
+        BEGIN
+            {';'.join(_ledger_entry_move('NEW.id', "''", 'SUBSTR(NEW.date, 1, 7)'))};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_partition_entry_delete
+        AFTER DELETE ON journal_entries
+        BEGIN
+            {';'.join(_ledger_entry_move('OLD.id', 'SUBSTR(OLD.date, 1, 7)', "''"))};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_partition_entry_date
+        AFTER UPDATE OF date ON journal_entries
+        WHEN SUBSTR(OLD.date, 1, 7) != SUBSTR(NEW.date, 1, 7)
+        BEGIN
+            {';'.join(_ledger_entry_move('NEW.id', 'SUBSTR(OLD.date, 1, 7)', 'SUBSTR(NEW.date, 1, 7)'))};
+        END
+        """,
+        _ledger_backfill(),
+    ], postgres=[
+        *_ledger_consistency_tables('DOUBLE PRECISION', 'BIGINT'),
+        f"""
+        CREATE OR REPLACE FUNCTION ledger_partition_line() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                {_ledger_line_delta('OLD', _line_period('OLD'), -1)};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                {_ledger_line_delta('NEW', _line_period('NEW'), 1)};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION ledger_partition_entry() RETURNS trigger AS $$
+        DECLARE
+            from_period TEXT DEFAULT '';
+            to_period TEXT DEFAULT '';
+            moved_entry_id TEXT;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                from_period := SUBSTR(OLD.date, 1, 7);
+                moved_entry_id := OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                to_period := SUBSTR(NEW.date, 1, 7);
+                moved_entry_id := NEW.id;
+            END IF;
+            IF from_period = to_period THEN
+                RETURN NULL;
+            END IF;
+            {';'.join(_ledger_entry_move('moved_entry_id', 'from_period', 'to_period'))};
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_ledger_partition_line ON journal_entry_lines",
+        """
+        CREATE TRIGGER trg_ledger_partition_line
+        AFTER INSERT OR DELETE OR UPDATE OF id, journal_entry_id, account_code, debit, credit ON journal_entry_lines
+        FOR EACH ROW EXECUTE FUNCTION ledger_partition_line()
+        """,
+        "DROP TRIGGER IF EXISTS trg_ledger_partition_entry ON journal_entries",
+        """
+        CREATE TRIGGER trg_ledger_partition_entry
+        AFTER INSERT OR DELETE OR UPDATE OF date ON journal_entries
+        FOR EACH ROW EXECUTE FUNCTION ledger_partition_entry()
+        """,
+        _ledger_backfill(),
+    ]),
+
+    # market_queue rows are claimed (status 'submitting') under a batch id
+    # before their netted order goes to the broker; the batch id and ticker
+    # make the order's client_order_id (order_netting.py)
+    Migration(14, 'market_queue_claims', sqlite=[
+        add_columns('market_queue', [('batch_id', 'TEXT', 'TEXT'), ('claimed_at', 'TIMESTAMP', 'TIMESTAMP')]),
+        "CREATE INDEX IF NOT EXISTS idx_market_queue_batch ON market_queue(batch_id)",
+    ], postgres=[
+        add_columns('market_queue', [('batch_id', 'TEXT', 'TEXT'), ('claimed_at', 'TIMESTAMP', 'TIMESTAMP')]),
+        "CREATE INDEX IF NOT EXISTS idx_market_queue_batch ON market_queue(batch_id)",
+    ]),
+
+    # account_period_deltas kept current by triggers instead of being posted
+    # past a journal line id watermark, which skipped lines whose (lower) ids
+    # committed late on PostgreSQL and needed every delete or date change to
+    # unpost/repost by hand; account_balance_state.last_line_id is unused from here
+    Migration(15, 'account_period_delta_triggers', sqlite=[
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_period_delta_line_insert
+        AFTER INSERT ON journal_entry_lines
+        BEGIN
+            {_period_line_delta('NEW', 1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_period_delta_line_delete
+        AFTER DELETE ON journal_entry_lines
+        BEGIN
+            {_period_line_delta('OLD', -1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_period_delta_line_update
+        AFTER UPDATE OF journal_entry_id, account_code, debit, credit ON journal_entry_lines
+        BEGIN
+            {_period_line_delta('OLD', -1)};
+            {_period_line_delta('NEW', 1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_period_delta_entry_insert
+        AFTER INSERT ON journal_entries
+        BEGIN
+            {_period_entry_delta('NEW.id', 'SUBSTR(NEW.date, 1, 7)', 1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_period_delta_entry_delete
+        AFTER DELETE ON journal_entries
+        BEGIN
+            {_period_entry_delta('OLD.id', 'SUBSTR(OLD.date, 1, 7)', -1)};
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_period_delta_entry_date
+        AFTER UPDATE OF date ON journal_entries
+        WHEN SUBSTR(OLD.date, 1, 7) != SUBSTR(NEW.date, 1, 7)
+        BEGIN
+            {_period_entry_delta('NEW.id', 'SUBSTR(OLD.date, 1, 7)', -1)};
+            {_period_entry_delta('NEW.id', 'SUBSTR(NEW.date, 1, 7)', 1)};
+        END
+        """,
+        "DELETE FROM account_period_deltas",
+        period_delta_backfill(),
+    ], postgres=[
+        f"""
+        CREATE OR REPLACE FUNCTION period_delta_line() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                {_period_line_delta('OLD', -1)};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                {_period_line_delta('NEW', 1)};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION period_delta_entry() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND SUBSTR(OLD.date, 1, 7) = SUBSTR(NEW.date, 1, 7) THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                {_period_entry_delta('OLD.id', 'SUBSTR(OLD.date, 1, 7)', -1)};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                {_period_entry_delta('NEW.id', 'SUBSTR(NEW.date, 1, 7)', 1)};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_period_delta_line ON journal_entry_lines",
+        """
+        CREATE TRIGGER trg_period_delta_line
+        AFTER INSERT OR DELETE OR UPDATE OF journal_entry_id, account_code, debit, credit ON journal_entry_lines
+        FOR EACH ROW EXECUTE FUNCTION period_delta_line()
+        """,
+        "DROP TRIGGER IF EXISTS trg_period_delta_entry ON journal_entries",
+        """
+        CREATE TRIGGER trg_period_delta_entry
+        AFTER INSERT OR DELETE OR UPDATE OF date ON journal_entries
+        FOR EACH ROW EXECUTE FUNCTION period_delta_entry()
+        """,
+        # Journal writes wait on the table lock, so none lands between the delete and the backfill
+        "LOCK TABLE account_period_deltas IN EXCLUSIVE MODE",
+        "DELETE FROM account_period_deltas",
+        period_delta_backfill(),
+    ]),
+
+    # Round-up entries without a transaction store NULL, not 0, which is no
+    # transactions row and breaks the foreign key on PostgreSQL
+    Migration(16, 'roundup_ledger_nullable_transaction', sqlite=[
+        _roundup_ledger_nullable_transaction_sqlite,
+        "UPDATE roundup_ledger SET transaction_id = NULL WHERE transaction_id = 0",
+    ], postgres=[
+        "ALTER TABLE roundup_ledger ALTER COLUMN transaction_id DROP NOT NULL",
+        "UPDATE roundup_ledger SET transaction_id = NULL WHERE transaction_id = 0",
+    ]),
+
+    # Tables and columns that first shipped only in the baseline scripts, so
+    # databases created before them never got them: positions, price_history,
+    # stress_test_runs, the round-up engine's ledger columns and the netted
+    # order fill columns on market_queue
+    Migration(17, 'positions_price_history_and_netting_columns', sqlite=[
+        *_holdings_and_load_test_tables('INTEGER PRIMARY KEY AUTOINCREMENT'),
+        *_roundup_and_netting_columns(),
+    ], postgres=[
+        *_holdings_and_load_test_tables('SERIAL PRIMARY KEY'),
+        *_roundup_and_netting_columns(),
+    ]),
+]
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+class MigrationRunner:
+    """
+    Applies MIGRATIONS in order against a DatabaseManager.
+
+    Example:
+        runner = MigrationRunner(db_manager)
+        runner.pending()     # [Migration, ...] not yet applied
+        runner.migrate()     # apply them, returns the versions applied
+    """
+
+    def __init__(self, db, migrations: List[Migration] = None):
+        self.db = db
+        self.migrations = sorted(migrations if migrations is not None else MIGRATIONS, key=lambda m: m.version)
+        self.use_postgresql = getattr(db, '_use_postgresql', False)
+
+    def execute(self, conn, sql: str, params=None):
+        if self.use_postgresql:
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    def _connect(self):
+        return self.db.get_connection() if self.use_postgresql else self.db.connect_for_migrations()
+
+    def _close(self, conn):
+        if self.use_postgresql:
+            self.db.release_connection(conn)
+        else:
+            conn.close()
+
+    def _ensure_version_table(self, conn):
+        if self.use_postgresql:
+            self.execute(conn, """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        else:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        conn.commit()
+
+    def _current_version(self, conn) -> int:
+        row = self.execute(conn, "SELECT MAX(version) FROM schema_version").fetchone()
+        return int(row[0]) if row and row[0] is not None else 0
+
+    def current_version(self) -> int:
+        """Highest applied version (0 for a database that predates schema_version)"""
+        conn = self.db.get_connection()
+        try:
+            return self._current_version(conn)
+        except Exception:
+            if self.use_postgresql:
+                conn.rollback()
+            return 0
+        finally:
+            self.db.release_connection(conn)
+
+    def pending(self) -> List[Migration]:
+        current = self.current_version()
+        return [m for m in self.migrations if m.version > current]
+
+    def applied(self) -> List[Tuple]:
+        conn = self.db.get_connection()
+        try:
+            return [tuple(row) for row in self.execute(
+                conn, "SELECT version, name, applied_at FROM schema_version ORDER BY version").fetchall()]
+        except Exception:
+            return []
+        finally:
+            self.db.release_connection(conn)
+
+    def migrate(self, target: int = None) -> List[int]:
+        """Apply pending migrations up to `target` (default: latest); returns applied versions"""
+        applied = []
+        conn = self._connect()
+        try:
+            self._ensure_version_table(conn)
+            for migration in self.migrations:
+                if target is not None and migration.version > target:
+                    break
+                if self._apply(conn, migration):
+                    applied.append(migration.version)
+        finally:
+            self._close(conn)
+        if applied:
+            self.db._table_columns = {}
+            log.info("Applied schema migrations %s", applied)
+        return applied
+
+    def _apply(self, conn, migration: Migration) -> bool:
+        try:
+            if self.use_postgresql:
+                self.execute(conn, "SELECT pg_advisory_xact_lock(:lock_id)", {'lock_id': ADVISORY_LOCK_ID})
+            else:
+                conn.execute('BEGIN IMMEDIATE')
+            if self._current_version(conn) >= migration.version:
+                conn.rollback()  # Another worker got here first
+                return False
+            steps = migration.postgres if self.use_postgresql else migration.sqlite
+            for step in steps:
+                if callable(step):
+                    step(self, conn)
+                else:
+                    self.execute(conn, step)
+            self.execute(conn, "INSERT INTO schema_version (version, name) VALUES (:version, :name)",
+                         {'version': migration.version, 'name': migration.name})
+            conn.commit()
+            print(f"[SCHEMA] Applied migration {migration.version}: {migration.name}")
+            return True
+        except Exception:
+            conn.rollback()
+            log.exception("Schema migration %s (%s) failed", migration.version, migration.name)
+            raise
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Apply Kamioi schema migrations')
+    parser.add_argument('--status', action='store_true', help='Show applied and pending migrations')
+    parser.add_argument('--target', type=int, help='Migrate up to this version')
+    args = parser.parse_args()
+
+    import os
+    os.environ['SCHEMA_AUTO_MIGRATE'] = '0'  # Apply below, explicitly
+    from database_manager import _ensure_db_manager
+
+    runner = MigrationRunner(_ensure_db_manager())
+    if args.status:
+        for version, name, applied_at in runner.applied():
+            print(f"  [applied] {version:>4}  {name}  ({applied_at})")
+        for migration in runner.pending():
+            print(f"  [pending] {migration.version:>4}  {migration.name}")
+    else:
+        versions = runner.migrate(args.target)
+        print(f"[SCHEMA] {'Applied ' + ', '.join(map(str, versions)) if versions else 'Already up to date'} "
+              f"(version {runner.current_version()})")
@@ -395,28 +395,6 @@ RESPOND IN JSON FORMAT ONLY:
             try:
                 cursor = conn.cursor()
                 
-                # Ensure ai_responses table exists
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ai_responses (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        mapping_id INTEGER,
-                        merchant_name TEXT NOT NULL,
-                        category TEXT,
-                        prompt TEXT NOT NULL,
-                        raw_response TEXT NOT NULL,
-                        parsed_response TEXT NOT NULL,
-                        processing_time_ms INTEGER NOT NULL,
-                        model_version TEXT NOT NULL,
-                        is_error INTEGER DEFAULT 0,
-                        admin_feedback TEXT,
-                        admin_correct_ticker TEXT,
-                        was_ai_correct INTEGER,
-                        feedback_notes TEXT,
-                        feedback_date TEXT,
-                        created_at TEXT NOT NULL
-                    )
-                """)
-                
                 # Insert AI response
                 cursor.execute("""
                     INSERT INTO ai_responses 
@@ -20,64 +20,6 @@ class APIUsageTracker:
     # Default: assume cache miss for input (more conservative cost estimate)
     DEFAULT_INPUT_COST = INPUT_COST_CACHE_MISS
     
-    def _ensure_tables(self):
-        """Ensure API usage and balance tables exist"""
-        conn = db_manager.get_connection()
-        try:
-            cursor = conn.cursor()
-            
-            # Create api_usage table (SQLite syntax)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS api_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    endpoint TEXT NOT NULL,
-                    model TEXT NOT NULL,
-                    prompt_tokens INTEGER DEFAULT 0,
-                    completion_tokens INTEGER DEFAULT 0,
-                    total_tokens INTEGER DEFAULT 0,
-                    processing_time_ms INTEGER NOT NULL,
-                    cost REAL NOT NULL DEFAULT 0.0000,
-                    success INTEGER DEFAULT 1,
-                    error_message TEXT,
-                    request_data TEXT,
-                    response_data TEXT,
-                    user_id INTEGER,
-                    page_tab TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            
-            # Add new columns if they don't exist (for existing databases)
-            try:
-                cursor.execute("ALTER TABLE api_usage ADD COLUMN user_id INTEGER")
-            except:
-                pass  # Column already exists
-            try:
-                cursor.execute("ALTER TABLE api_usage ADD COLUMN page_tab TEXT")
-            except:
-                pass  # Column already exists
-            
-            # Create api_balance table (SQLite syntax)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS api_balance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    balance REAL NOT NULL DEFAULT 20.00,
-                    updated_at TEXT NOT NULL
-                )
-            """)
-            
-            # Initialize balance if not exists
-            cursor.execute("SELECT COUNT(*) FROM api_balance")
-            if cursor.fetchone()[0] == 0:
-                cursor.execute("INSERT INTO api_balance (balance, updated_at) VALUES (?, ?)", (20.00, datetime.now().isoformat()))
-            
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            print(f"Error ensuring tables: {e}")
-        finally:
-            db_manager.release_connection(conn)
-    
     def record_api_call(self, endpoint: str, model: str, 
                        prompt_tokens: int = 0, completion_tokens: int = 0,
                        total_tokens: int = 0, processing_time_ms: int = 0, 
@@ -91,7 +33,6 @@ class APIUsageTracker:
         Returns:
             ID of the created record
         """
-        self._ensure_tables()
         
         if not success:
             cost = 0.0  # No charge for failed calls
@@ -157,7 +98,6 @@ class APIUsageTracker:
         """
         Get usage statistics for the specified period
         """
-        self._ensure_tables()
         cutoff_date = datetime.now() - timedelta(days=days)
         
         conn = db_manager.get_connection()
@@ -244,7 +184,6 @@ class APIUsageTracker:
     
     def get_current_month_cost(self) -> float:
         """Get total cost for current month"""
-        self._ensure_tables()
         now = datetime.now()
         start_of_month = datetime(now.year, now.month, 1)
         
@@ -265,7 +204,6 @@ class APIUsageTracker:
         """
         Get balance information from database
         """
-        self._ensure_tables()
         
         conn = db_manager.get_connection()
         try:
@@ -325,7 +263,6 @@ class APIUsageTracker:
                 'total_pages': int
             }
         """
-        self._ensure_tables()
         cutoff_date = datetime.now() - timedelta(days=days)
         
         conn = db_manager.get_connection()
@@ -539,7 +476,6 @@ class APIUsageTracker:
         """
         Update the API balance
         """
-        self._ensure_tables()
         
         conn = db_manager.get_connection()
         try:
@@ -572,7 +508,6 @@ class APIUsageTracker:
     
     def get_daily_cost_limit_status(self, daily_limit: float = 10.0) -> Dict:
         """Check if daily cost limit is approaching"""
-        self._ensure_tables()
         today = datetime.now().date()
         today_start = datetime.combine(today, datetime.min.time())
         
@@ -622,7 +557,6 @@ class APIUsageTracker:
         """
         Update the daily cost limit setting
         """
-        self._ensure_tables()
 
         conn = db_manager.get_connection()
         try:
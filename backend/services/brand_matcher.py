@@ -0,0 +1,230 @@
+"""
+Brand Matcher - one compiled dictionary automaton for receipt text
+
+Receipt parsing used to test every item name against every retailer, brand
+alias, keyword and regex in turn, and ran a LIKE query per item for the
+rest. Here all of those phrases are compiled into a single Aho-Corasick
+automaton, so a whole receipt (its text, or all item names joined) is
+resolved in one linear pass, however many phrases there are.
+
+- each phrase belongs to a group ('retailer', 'brand', 'keyword', ...) and
+  has a priority; per text and group the lowest priority hit wins, which
+  reproduces the old first-match-in-dict-order behaviour
+- `whole_word` phrases only match on word boundaries (the old `\\b...\\b`
+  regexes); the rest match anywhere, like the old `in` checks
+- the compiled automaton is saved as JSON under data/cache (never under
+  the user-writable uploads/, and never pickled) so workers and restarts
+  load it instead of rebuilding; the file is keyed by a fingerprint of the
+  phrase list and rebuilt when the phrases change or don't match it
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from utils.log import get_logger
+
+log = get_logger('brand_matcher')
+
+MATCHER_VERSION = 1
+_WHITESPACE = re.compile(r'\s+')
+
+
+class Phrase(NamedTuple):
+    text: str
+    group: str
+    priority: int
+    whole_word: bool
+    payload: Dict
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace runs, so 'HP   Envy' matches 'hp envy'"""
+    return _WHITESPACE.sub(' ', (text or '').lower()).strip()
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _boundary(text: str, i: int) -> bool:
+    """Same rule as the regex \\b: a word character on exactly one side of position i"""
+    before = i > 0 and _is_word(text[i - 1])
+    after = i < len(text) and _is_word(text[i])
+    return before != after
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring automaton.
+
+    Example:
+        automaton = AhoCorasick(['nike', 'nike store'])
+        automaton.find('nike store #12')   # [(0, 4, 0), (0, 10, 1)]
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._lengths = [len(p) for p in patterns]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(index)
+
+        # Breadth-first failure links; outputs are merged along them so a
+        # match never needs to walk the failure chain at search time
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def to_dict(self) -> Dict:
+        return {'goto': self._goto, 'fail': self._fail, 'out': self._out, 'lengths': self._lengths}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AhoCorasick':
+        automaton = cls.__new__(cls)
+        automaton._goto = [dict(node) for node in data['goto']]
+        automaton._fail = [int(f) for f in data['fail']]
+        automaton._out = [[int(i) for i in out] for out in data['out']]
+        automaton._lengths = [int(n) for n in data['lengths']]
+        if not len(automaton._goto) == len(automaton._fail) == len(automaton._out):
+            raise ValueError('automaton tables differ in length')
+        return automaton
+
+    def find(self, text: str) -> List[tuple]:
+        """All (start, end, pattern_index) occurrences in text, overlapping ones included"""
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        hits = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in out[node]:
+                hits.append((i + 1 - lengths[index], i + 1, index))
+        return hits
+
+
+class BrandMatcher:
+    """
+    Compiled phrase dictionary answering "which phrase of each group does
+    this text contain".
+
+    Example:
+        matcher = BrandMatcher([Phrase('nike', 'brand', 0, False, {'symbol': 'NKE'})])
+        matcher.scan(['Nike Air Max', 'Milk'])   # [{'brand': Phrase(...)}, {}]
+    """
+
+    def __init__(self, phrases: Sequence[Phrase]):
+        self.phrases = [p._replace(text=normalize(p.text)) for p in phrases if normalize(p.text)]
+        self.fingerprint = fingerprint(self.phrases)
+        self._automaton = AhoCorasick([p.text for p in self.phrases])
+
+    def scan_text(self, text: str) -> Dict[str, Phrase]:
+        return self.scan([text])[0]
+
+    def scan(self, texts: Sequence[str]) -> List[Dict[str, Phrase]]:
+        """Best phrase per group for each text, found in a single pass over all of them"""
+        normalized = [normalize(t) for t in texts]
+        joined = '\n'.join(normalized)
+        # Offsets where each text starts, to attribute hits back to it
+        starts, offset = [], 0
+        for text in normalized:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        results: List[Dict[str, Phrase]] = [{} for _ in texts]
+        owner = 0
+        for start, end, index in sorted(self._automaton.find(joined)):
+            phrase = self.phrases[index]
+            if phrase.whole_word and not (_boundary(joined, start) and _boundary(joined, end)):
+                continue
+            while owner + 1 < len(starts) and starts[owner + 1] <= start:
+                owner += 1
+            best = results[owner].get(phrase.group)
+            if best is None or phrase.priority < best.priority:
+                results[owner][phrase.group] = phrase
+        return results
+
+    def save(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': MATCHER_VERSION, 'fingerprint': self.fingerprint,
+                           'phrases': [list(p) for p in self.phrases],
+                           'automaton': self._automaton.to_dict()}, f, separators=(',', ':'))
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            log.warning("Could not persist brand matcher: %s", e)
+
+    @staticmethod
+    def load(path: str) -> Optional['BrandMatcher']:
+        """Read a saved matcher; None if it is missing, malformed or its phrases don't match its fingerprint"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MATCHER_VERSION:
+                return None
+            matcher = BrandMatcher.__new__(BrandMatcher)
+            matcher.phrases = [Phrase(str(text), str(group), int(priority), bool(whole_word), dict(payload))
+                               for text, group, priority, whole_word, payload in data['phrases']]
+            matcher.fingerprint = fingerprint(matcher.phrases)
+            if matcher.fingerprint != data.get('fingerprint'):
+                raise ValueError('fingerprint does not match the stored phrases')
+            matcher._automaton = AhoCorasick.from_dict(data['automaton'])
+            if len(matcher._automaton) != len(matcher.phrases):
+                raise ValueError('automaton does not match the stored phrases')
+            return matcher
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                log.warning("Ignoring unreadable brand matcher artifact %s: %s", path, e)
+            return None
+
+
+def fingerprint(phrases: Sequence[Phrase]) -> str:
+    digest = hashlib.sha256(repr((MATCHER_VERSION, [tuple(p[:4]) + (sorted(p.payload.items()),)
+                                                    for p in phrases])).encode())
+    return digest.hexdigest()
+
+
+def compile_matcher(phrases: Sequence[Phrase], path: Optional[str] = None) -> BrandMatcher:
+    """Load the saved matcher at `path` if it was built from the same phrases, otherwise build and save it"""
+    wanted = fingerprint([p._replace(text=normalize(p.text)) for p in phrases if normalize(p.text)])
+    if path:
+        cached = BrandMatcher.load(path)
+        if cached is not None and cached.fingerprint == wanted:
+            return cached
+    matcher = BrandMatcher(phrases)
+    if path:
+        matcher.save(path)
+    log.info("Compiled brand matcher: %d phrases", len(matcher.phrases))
+    return matcher
+
+
+def default_artifact_path() -> str:
+    return os.getenv('BRAND_MATCHER_PATH') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'brand_matcher.json')
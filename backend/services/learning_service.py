@@ -21,38 +21,6 @@ class LearningService:
     5. Tracks model performance over time
     """
     
-    def _ensure_tables(self):
-        """Ensure ai_responses table exists"""
-        conn = db_manager.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS ai_responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    mapping_id INTEGER,
-                    merchant_name TEXT NOT NULL,
-                    category TEXT,
-                    prompt TEXT NOT NULL,
-                    raw_response TEXT NOT NULL,
-                    parsed_response TEXT NOT NULL,
-                    processing_time_ms INTEGER NOT NULL,
-                    model_version TEXT NOT NULL,
-                    is_error INTEGER DEFAULT 0,
-                    admin_feedback TEXT,
-                    admin_correct_ticker TEXT,
-                    was_ai_correct INTEGER,
-                    feedback_notes TEXT,
-                    feedback_date TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            print(f"Error ensuring ai_responses table: {e}")
-        finally:
-            db_manager.release_connection(conn)
-    
     def calculate_accuracy(self, days: int = 30) -> Dict:
         """
         Calculate AI accuracy from stored responses with feedback
@@ -69,7 +37,6 @@ class LearningService:
                 'category_accuracy': Dict     # Accuracy by category
             }
         """
-        self._ensure_tables()
         cutoff_date = datetime.now() - timedelta(days=days)
         
         conn = db_manager.get_connection()
@@ -210,7 +177,6 @@ class LearningService:
         
         Returns most common merchant -> ticker mappings with confidence
         """
-        self._ensure_tables()
         
         conn = db_manager.get_connection()
         try:
@@ -286,7 +252,6 @@ class LearningService:
         
         This is CRITICAL - every admin action teaches the system
         """
-        self._ensure_tables()
         
         conn = db_manager.get_connection()
         try:
@@ -348,7 +313,6 @@ class LearningService:
         
         Returns patterns and recommendations
         """
-        self._ensure_tables()
         
         conn = db_manager.get_connection()
         try:
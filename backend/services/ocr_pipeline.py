@@ -0,0 +1,352 @@
+"""
+OCR Pipeline - preprocessing, concurrent Tesseract passes and a result cache
+
+Receipt OCR used to run Tesseract four times in a row (PSM 6, 11, 12, 7) on
+the full-resolution photo and keep the longest output. Here:
+
+- the photo is normalised once: grayscale, rescaled to ~300 DPI, deskewed
+  and adaptively thresholded (Tesseract's accuracy peaks around 300 DPI
+  and it copes poorly with skew and uneven lighting)
+- the PSM variants run concurrently, most promising first, and the run
+  stops as soon as one reaches the confidence threshold
+- results are cached by a SHA-256 of the image bytes, so re-uploads of the
+  same receipt skip OCR entirely; the cache files live under data/cache/ocr
+  (gitignored) and are pruned to OCR_CACHE_ENTRIES, least recently used first
+
+Each pass already runs in its own `tesseract` process (pytesseract shells
+out), so a thread pool gives real multi-core parallelism without pickling
+images into a process pool; OMP_THREAD_LIMIT=1 keeps the passes from
+oversubscribing the cores with Tesseract's own OpenMP threads.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.log import get_logger
+
+log = get_logger('ocr')
+
+PREPROCESS_VERSION = 1          # Bump when preprocessing changes so cached results are recomputed
+TARGET_DPI = 300
+ASSUMED_DPI = 72                # Phone photos rarely carry a DPI; treat them as screen resolution
+MAX_SIDE_PX = 3500              # Never upscale a receipt beyond this
+MIN_SIDE_PX = 1000              # Small crops are upscaled until text is legible to Tesseract
+PSM_MODES = (6, 4, 11, 12)      # 6=uniform block, 4=columns, 11=sparse text, 12=sparse + OSD
+CONFIDENCE_THRESHOLD = float(os.getenv('OCR_CONFIDENCE_THRESHOLD', '80'))
+MIN_TEXT_CHARS = 10
+
+OCRResult = Tuple[str, float]   # (text, mean word confidence 0-100)
+
+
+# ----------------------------------------------------------------------
+# Preprocessing (numpy core, PIL for I/O and geometry)
+# ----------------------------------------------------------------------
+
+def target_scale(size: Tuple[int, int], dpi: Optional[float] = None) -> float:
+    """Scale factor bringing an image of `size` (w, h) at `dpi` to TARGET_DPI within the pixel bounds"""
+    scale = TARGET_DPI / float(dpi or ASSUMED_DPI)
+    longest = max(size)
+    shortest = min(size)
+    if longest * scale > MAX_SIDE_PX:
+        scale = MAX_SIDE_PX / float(longest)
+    if shortest * scale < MIN_SIDE_PX:
+        scale = min(MIN_SIDE_PX / float(shortest), MAX_SIDE_PX / float(longest))
+    return scale
+
+
+def estimate_skew(pixels, max_angle: float = 5.0, step: float = 0.25) -> float:
+    """
+    Text skew in degrees (positive = counter-clockwise), by projection profile.
+
+    Shearing the ink mask row-wise approximates a small rotation; the angle
+    whose horizontal projection is most peaked lines text rows up with the
+    pixel rows. Works on a downsampled mask, so it costs a few milliseconds.
+    """
+    import numpy as np
+
+    pixels = np.asarray(pixels, dtype=np.float32)
+    stride = max(1, int(max(pixels.shape) // 800))
+    ink = pixels[::stride, ::stride] < (pixels.mean() - pixels.std() * 0.5)
+    rows, cols = np.nonzero(ink)
+    if rows.size < 50:
+        return 0.0
+    height = ink.shape[0]
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        shifted = np.round(rows + cols * np.tan(np.radians(angle))).astype(np.int64)
+        shifted -= shifted.min()
+        profile = np.bincount(shifted, minlength=height)
+        score = float(np.sum(profile.astype(np.float64) ** 2))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return round(best_angle, 2)
+
+
+def adaptive_threshold(pixels, block: int = 31, offset: float = 10.0):
+    """Binarise against the local mean (integral image), which survives shadows and uneven light"""
+    import numpy as np
+
+    pixels = np.asarray(pixels, dtype=np.float64)
+    half = block // 2
+    padded = np.pad(pixels, half + 1, mode='edge')
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    h, w = pixels.shape
+    top, left = np.arange(h), np.arange(w)
+    bottom, right = top + block, left + block
+    total = (integral[np.ix_(bottom, right)] - integral[np.ix_(top, right)]
+             - integral[np.ix_(bottom, left)] + integral[np.ix_(top, left)])
+    local_mean = total / float(block * block)
+    return np.where(pixels > local_mean - offset, 255, 0).astype(np.uint8)
+
+
+def preprocess(image):
+    """PIL image -> binarised, deskewed, ~300 DPI grayscale PIL image"""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    gray = ImageOps.grayscale(image)
+    dpi = (image.info.get('dpi') or (None,))[0]
+    scale = target_scale(gray.size, dpi)
+    if abs(scale - 1.0) > 0.05:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                           Image.LANCZOS)
+    angle = estimate_skew(np.asarray(gray))
+    if abs(angle) >= 0.25:
+        gray = gray.rotate(-angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return Image.fromarray(adaptive_threshold(np.asarray(gray)))
+
+
+# ----------------------------------------------------------------------
+# Concurrent PSM passes
+# ----------------------------------------------------------------------
+
+def tesseract_ocr(image, psm: int) -> OCRResult:
+    """One Tesseract pass: text rebuilt from image_to_data plus its mean word confidence"""
+    import pytesseract
+
+    data = pytesseract.image_to_data(image, config=f'--oem 3 --psm {psm}',
+                                     output_type=pytesseract.Output.DICT)
+    lines: "OrderedDict[tuple, List[str]]" = OrderedDict()
+    confidences = []
+    for i, word in enumerate(data.get('text', [])):
+        conf = float(data['conf'][i])
+        if conf < 0 or not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(conf)
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
+def choose_best(results: Dict[int, OCRResult]) -> Tuple[Optional[int], OCRResult]:
+    """
+    Highest-confidence pass among those with at least half the longest text
+    (a sparse mode can score high on a handful of words).
+    """
+    usable = {psm: r for psm, r in results.items() if len(r[0].strip()) >= MIN_TEXT_CHARS}
+    if not usable:
+        return None, ('', 0.0)
+    longest = max(len(r[0].strip()) for r in usable.values())
+    candidates = {psm: r for psm, r in usable.items() if len(r[0].strip()) * 2 >= longest}
+    psm = max(candidates, key=lambda p: (candidates[p][1], len(candidates[p][0])))
+    return psm, candidates[psm]
+
+
+def run_passes(image, ocr: Callable = tesseract_ocr, psm_modes: Sequence[int] = PSM_MODES,
+               threshold: float = CONFIDENCE_THRESHOLD, executor: ThreadPoolExecutor = None) -> Dict:
+    """
+    Run `ocr(image, psm)` for each mode concurrently; return early once a pass
+    reaches `threshold` confidence. Passes still queued are cancelled.
+    """
+    started = time.perf_counter()
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=min(len(psm_modes), os.cpu_count() or 1))
+    futures = {executor.submit(ocr, image, psm): psm for psm in psm_modes}
+    results: Dict[int, OCRResult] = {}
+    early_exit = None
+    try:
+        pending = set(futures)
+        while pending and early_exit is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                psm = futures[future]
+                try:
+                    results[psm] = future.result()
+                except Exception as e:
+                    log.warning("PSM %s failed: %s", psm, e)
+                    continue
+                text, conf = results[psm]
+                if conf >= threshold and len(text.strip()) >= MIN_TEXT_CHARS:
+                    early_exit = psm
+        for future in pending:
+            future.cancel()
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+    psm, (text, conf) = (early_exit, results[early_exit]) if early_exit is not None else choose_best(results)
+    return {'text': text, 'confidence': round(conf, 1), 'psm': psm, 'passes': len(results),
+            'early_exit': early_exit is not None, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+# ----------------------------------------------------------------------
+# Result cache
+# ----------------------------------------------------------------------
+
+class OCRCache:
+    """
+    LRU of OCR results keyed by image content hash, optionally persisted as
+    JSON files under `directory` so every worker (and restarts) share it.
+    Each write prunes the directory to the `max_entries` most recently used files.
+
+    Example:
+        key = ocr_cache.key_for(image_bytes)
+        result = ocr_cache.get(key) or ocr_cache.put(key, run_ocr())
+    """
+
+    def __init__(self, max_entries: int = 512, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key_for(image_bytes: bytes) -> str:
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}-p{PREPROCESS_VERSION}-{'.'.join(map(str, PSM_MODES))}"
+
+    def _path(self, key: str) -> Optional[str]:
+        return os.path.join(self.directory, f"{key}.json") if self.directory else None
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return dict(self._entries[key])
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    result = json.load(f)
+                self._remember(key, result)
+                os.utime(path)  # recently used: pruned last
+                with self._lock:
+                    self.stats['hits'] += 1
+                return dict(result)
+            except (OSError, ValueError):
+                pass
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key: str, result: Dict) -> Dict:
+        self._remember(key, result)
+        path = self._path(key)
+        if path:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, 'w') as f:
+                    json.dump(result, f)
+                os.replace(tmp, path)
+                self._prune()
+            except OSError as e:
+                log.warning("Could not persist OCR cache entry: %s", e)
+        return result
+
+    def _prune(self):
+        """Delete the least recently used cache files beyond max_entries"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass  # removed by another worker meanwhile
+        for _, path in sorted(files)[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remember(self, key: str, result: Dict):
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# ----------------------------------------------------------------------
+# Entry point
+# ----------------------------------------------------------------------
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+            workers = int(os.getenv('OCR_WORKERS', str(min(len(PSM_MODES), os.cpu_count() or 1))))
+            _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ocr')
+        return _executor
+
+
+def extract_text(image_path: str, ocr: Callable = tesseract_ocr, cache: OCRCache = None) -> Dict:
+    """
+    OCR a receipt image: cache lookup, preprocessing, concurrent passes.
+
+    Falls back to the unprocessed image when thresholding left nothing
+    legible (very faint thermal prints). Only results with text are cached,
+    so a run where every pass failed is retried on the next call.
+    """
+    cache = ocr_cache if cache is None else cache
+    with open(image_path, 'rb') as f:
+        key = cache.key_for(f.read())
+    cached = cache.get(key)
+    if cached is not None:
+        cached['cached'] = True
+        return cached
+
+    from PIL import Image
+
+    with Image.open(image_path) as original:
+        original.load()
+    started = time.perf_counter()
+    try:
+        prepared = preprocess(original)
+    except ImportError:
+        prepared = original  # numpy not installed: OCR the photo as-is
+    preprocess_ms = round((time.perf_counter() - started) * 1000, 1)
+    result = run_passes(prepared, ocr=ocr, executor=_shared_executor())
+    if len(result['text'].strip()) < MIN_TEXT_CHARS:
+        fallback = run_passes(original, ocr=ocr, executor=_shared_executor())
+        if len(fallback['text'].strip()) > len(result['text'].strip()):
+            result = dict(fallback, preprocessed=False)
+    result.setdefault('preprocessed', True)
+    result['preprocess_ms'] = preprocess_ms
+    if result['passes'] and result['text'].strip():
+        cache.put(key, result)
+    result['cached'] = False
+    return result
+
+
+ocr_cache = OCRCache(max_entries=int(os.getenv('OCR_CACHE_ENTRIES', '512')),
+                     directory=os.getenv('OCR_CACHE_DIR') or os.path.join(
+                         os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'ocr'))
@@ -3,57 +3,187 @@ Receipt Processing Service
 Handles OCR, text extraction, and intelligent parsing of receipts/invoices
 """
 
+import importlib.util
 import os
 import re
 import logging
+import threading
+import time
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import json
 
+from services import ocr_pipeline
+from services.brand_matcher import Phrase, compile_matcher, default_artifact_path
+
 # Initialize logger first
 logger = logging.getLogger(__name__)
 
-# Try to import OCR libraries
-try:
-    import pytesseract
-    from PIL import Image
-    PYTESSERACT_AVAILABLE = True
-    
-    # Try to find Tesseract executable automatically
-    # Always check and set the path to ensure it's found
-    username = os.getenv('USERNAME', '')
-    tesseract_paths = [
-        r'C:\Program Files\Tesseract-OCR\tesseract.exe',  # Standard location - check first
-        r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
-        r'C:\Users\beltr\Kamioi\5.5.1 source code\tesseract.exe',  # User's custom location
-    ]
-    # Check subdirectories in user's custom location
-    custom_path = r'C:\Users\beltr\Kamioi\5.5.1 source code'
-    if os.path.exists(custom_path):
-        # Search for tesseract.exe in subdirectories
-        for root, dirs, files in os.walk(custom_path):
-            if 'tesseract.exe' in files:
-                tesseract_paths.insert(0, os.path.join(root, 'tesseract.exe'))
-                break
-    
-    if username:
-        tesseract_paths.append(r'C:\Users\{}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'.format(username))
-    
-    tesseract_found = False
-    for path in tesseract_paths:
-        if os.path.exists(path):
-            pytesseract.pytesseract.tesseract_cmd = path
-            logger.info(f"Auto-detected Tesseract at: {path}")
-            tesseract_found = True
-            break
-    
-    if not tesseract_found:
-        logger.warning("Tesseract OCR not found. OCR will use manual entry fallback.")
-        logger.warning("Install Tesseract from: https://github.com/UB-Mannheim/tesseract/wiki")
-except ImportError:
-    PYTESSERACT_AVAILABLE = False
+# OCR libraries are optional and slow to import: only check they are installed
+# here, and import them (and locate Tesseract) on the first extraction
+PYTESSERACT_AVAILABLE = (importlib.util.find_spec('pytesseract') is not None
+                         and importlib.util.find_spec('PIL') is not None)
+if not PYTESSERACT_AVAILABLE:
     logger.warning("pytesseract or PIL not available - OCR will use manual entry fallback")
 
+_ocr_modules = None
+_ocr_lock = threading.Lock()
+
+
+def _load_ocr():
+    """Import pytesseract and PIL.Image and point pytesseract at a Tesseract binary"""
+    global _ocr_modules
+    with _ocr_lock:
+        if _ocr_modules is not None:
+            return _ocr_modules
+        import pytesseract
+        from PIL import Image
+
+        # Try to find Tesseract executable automatically
+        # Always check and set the path to ensure it's found
+        username = os.getenv('USERNAME', '')
+        tesseract_paths = [
+            r'C:\Program Files\Tesseract-OCR\tesseract.exe',  # Standard location - check first
+            r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+            r'C:\Users\beltr\Kamioi\5.5.1 source code\tesseract.exe',  # User's custom location
+        ]
+        # Check subdirectories in user's custom location
+        custom_path = r'C:\Users\beltr\Kamioi\5.5.1 source code'
+        if os.path.exists(custom_path):
+            # Search for tesseract.exe in subdirectories
+            for root, dirs, files in os.walk(custom_path):
+                if 'tesseract.exe' in files:
+                    tesseract_paths.insert(0, os.path.join(root, 'tesseract.exe'))
+                    break
+
+        if username:
+            tesseract_paths.append(r'C:\Users\{}\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'.format(username))
+
+        tesseract_found = False
+        for path in tesseract_paths:
+            if os.path.exists(path):
+                pytesseract.pytesseract.tesseract_cmd = path
+                logger.info(f"Auto-detected Tesseract at: {path}")
+                tesseract_found = True
+                break
+
+        if not tesseract_found:
+            logger.warning("Tesseract OCR not found. OCR will use manual entry fallback.")
+            logger.warning("Install Tesseract from: https://github.com/UB-Mannheim/tesseract/wiki")
+
+        _ocr_modules = (pytesseract, Image)
+        return _ocr_modules
+
+
+def ocr_image(image_path: str) -> str:
+    """
+    Extract text from a receipt image using OCR (module-level so receipt job
+    worker processes can run it without building the service).
+    Returns an empty string for manual entry when pytesseract is unavailable
+    """
+    try:
+        if not os.path.exists(image_path):
+            logger.error(f"Image file not found: {image_path}")
+            return ""
+        
+        if PYTESSERACT_AVAILABLE:
+            pytesseract, _ = _load_ocr()
+            # Ensure Tesseract path is set (set by _load_ocr, but double-check)
+            if not hasattr(pytesseract.pytesseract, 'tesseract_cmd') or not pytesseract.pytesseract.tesseract_cmd:
+                # Fallback: try to find it again
+                standard_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+                if os.path.exists(standard_path):
+                    pytesseract.pytesseract.tesseract_cmd = standard_path
+                    logger.info(f"Set Tesseract path at runtime: {standard_path}")
+                else:
+                    logger.error("Tesseract path not set and standard location not found!")
+                    return ""
+            
+            try:
+                # Preprocess once, run the PSM variants concurrently, reuse cached results
+                result = ocr_pipeline.extract_text(image_path)
+                if result['text']:
+                    logger.info(f"OCR extracted {len(result['text'])} characters from {image_path} "
+                                f"(psm={result['psm']}, confidence={result['confidence']}, "
+                                f"passes={result['passes']}, cached={result['cached']}, "
+                                f"{result['elapsed_ms']} ms)")
+                    return result['text']
+                else:
+                    logger.warning(f"No text extracted from {image_path} with any PSM mode")
+                    return ""
+                    
+            except pytesseract.TesseractNotFoundError:
+                logger.error("Tesseract OCR not found. Please install from: https://github.com/UB-Mannheim/tesseract/wiki")
+                logger.error("Or set pytesseract.pytesseract.tesseract_cmd to the tesseract.exe path")
+                return ""
+            except Exception as e:
+                logger.error(f"Tesseract OCR error: {str(e)}")
+                return ""
+        else:
+            logger.warning("pytesseract not available - OCR extraction skipped")
+            return ""
+    except Exception as e:
+        logger.error(f"Error extracting text from image: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return ""
+
+
+# Keyword -> ticker shortcuts for common brands (substring matches, first listed wins)
+KEYWORD_TICKERS = {
+    'hp': 'HPQ', 'hewlett': 'HPQ', 'hewlett-packard': 'HPQ', 'envy': 'HPQ',
+    'nike': 'NKE', 'adidas': 'ADDYY', 'apple': 'AAPL', 'iphone': 'AAPL', 'ipad': 'AAPL',
+    'microsoft': 'MSFT', 'google': 'GOOGL', 'amazon': 'AMZN',
+    'samsung': 'SSNLF', 'tesla': 'TSLA', 'target': 'TGT',
+    'walmart': 'WMT', 'costco': 'COST', 'starbucks': 'SBUX', 'sbr': 'SBUX',
+    'pillsbury': 'PSY'
+}
+
+COMPANY_NAMES = {
+    'HPQ': 'Hewlett-Packard', 'NKE': 'Nike', 'ADDYY': 'Adidas',
+    'AAPL': 'Apple', 'MSFT': 'Microsoft', 'GOOGL': 'Alphabet',
+    'AMZN': 'Amazon', 'SSNLF': 'Samsung', 'TSLA': 'Tesla',
+    'TGT': 'Target', 'WMT': 'Walmart', 'COST': 'Costco', 'SBUX': 'Starbucks',
+    'TJX': 'TJX Companies', 'PYPL': 'PayPal', 'V': 'Visa', 'MA': 'Mastercard',
+    'PSY': 'Pillsbury'
+}
+
+# Whole-word brand phrases, highest priority first: (spellings, ticker, company, confidence)
+KEYWORD_PATTERNS = [
+    # HP patterns (highest priority)
+    (('hp envy',), 'HPQ', 'Hewlett-Packard', 0.98),
+    (('hewlett-packard', 'hewlett packard', 'hewlettpackard'), 'HPQ', 'Hewlett-Packard', 0.97),
+    (('envy',), 'HPQ', 'Hewlett-Packard', 0.85),  # Lower confidence for just "envy"
+    (('hp',), 'HPQ', 'Hewlett-Packard', 0.90),
+    # Nike patterns
+    (('nike',), 'NKE', 'Nike', 0.95),
+    (('jordan',), 'NKE', 'Nike (Jordan)', 0.90),
+    # Apple patterns
+    (('apple',), 'AAPL', 'Apple', 0.95),
+    (('iphone',), 'AAPL', 'Apple', 0.90),
+    (('ipad',), 'AAPL', 'Apple', 0.90),
+    # Payment processors
+    (('paypal',), 'PYPL', 'PayPal', 0.95),
+    (('pay from primary',), 'PYPL', 'PayPal', 0.85),
+    # Retailers
+    (('walmart',), 'WMT', 'Walmart', 0.95),
+    (('tj maxx', 'tjmaxx'), 'TJX', 'TJX Companies', 0.95),
+    (('tjx',), 'TJX', 'TJX Companies', 0.90),
+    # Coffee/Starbucks patterns
+    (('starbucks',), 'SBUX', 'Starbucks', 0.95),
+    (('sbr',), 'SBUX', 'Starbucks', 0.90),  # SBR abbreviation
+    (('284050833',), 'SBUX', 'Starbucks', 0.85),  # Starbucks product code
+    # Food brands - Pillsbury
+    (('pillsbury',), 'PSY', 'Pillsbury', 0.95),
+    (('284000087',), 'PSY', 'Pillsbury', 0.90),  # Pillsbury product code
+]
+
+# Payment-method lines are not products and never get a brand
+PAYMENT_WORDS = ('debit tend', 'pay from', 'payment', 'tend', 'card')
+
+# How often (seconds) to check llm_mappings for newly approved receipt mappings
+LEARNED_MAPPINGS_REFRESH_SECONDS = float(os.getenv('LEARNED_MAPPINGS_REFRESH_SECONDS', '60'))
+
 
 class ReceiptProcessingService:
     """Service for processing receipts and invoices with OCR and AI parsing"""
@@ -66,6 +196,10 @@ class ReceiptProcessingService:
         self.brands_db = self._load_brands_database()
         # Retailers database (uses learned_mappings)
         self.retailers_db = self._load_retailers_database()
+        # Every retailer/brand/keyword phrase compiled into one automaton
+        self.matcher = compile_matcher(self._matcher_phrases(), default_artifact_path())
+        self._learned_signature = self._learned_mappings_signature()
+        self._learned_checked_at = time.monotonic()
     
     def _load_brands_database(self) -> Dict:
         """Load brand database with stock symbols"""
@@ -122,116 +256,40 @@ class ReceiptProcessingService:
             
             if db_manager._use_postgresql:
                 from sqlalchemy import text
-                # PostgreSQL: Check if mapping_data column exists
-                try:
-                    result = conn.execute(text("""
-                        SELECT column_name 
-                        FROM information_schema.columns 
-                        WHERE table_name = 'llm_mappings' AND column_name = 'mapping_data'
-                    """))
-                    has_mapping_data = result.fetchone() is not None
-                except:
-                    has_mapping_data = False
-                
-                if has_mapping_data:
-                    result = conn.execute(text("""
-                        SELECT merchant_name, ticker, company_name, category, mapping_data
-                        FROM llm_mappings
-                        WHERE source_type = 'receipt_processing'
-                        AND status = 'approved'
-                        AND admin_approved = 1
-                        ORDER BY created_at DESC
-                        LIMIT 100
-                    """))
-                else:
-                    # Fallback: use available columns
-                    result = conn.execute(text("""
-                        SELECT merchant_name, ticker, company_name, category
-                        FROM llm_mappings
-                        WHERE source_type = 'receipt_processing'
-                        AND status = 'approved'
-                        AND admin_approved = 1
-                        ORDER BY created_at DESC
-                        LIMIT 100
-                    """))
-                
+                result = conn.execute(text("""
+                    SELECT merchant_name, ticker, company_name, category, mapping_data
+                    FROM llm_mappings
+                    WHERE source_type = 'receipt_processing'
+                    AND status = 'approved'
+                    AND admin_approved = 1
+                    ORDER BY created_at DESC
+                    LIMIT 100
+                """))
                 rows = result.fetchall()
                 db_manager.release_connection(conn)
             else:
-                # SQLite path
                 cursor = conn.cursor()
-                
-                # Get approved receipt processing mappings
-                # Check if mapping_data column exists
-                cursor.execute("PRAGMA table_info(llm_mappings)")
-                columns = [col[1] for col in cursor.fetchall()]
-                has_mapping_data = 'mapping_data' in columns
-                
-                if has_mapping_data:
-                    cursor.execute("""
-                        SELECT merchant_name, ticker, company_name, category, mapping_data
-                        FROM llm_mappings
-                        WHERE source_type = 'receipt_processing'
-                        AND status = 'approved'
-                        AND admin_approved = 1
-                        ORDER BY updated_at DESC
-                        LIMIT 100
-                    """)
-                else:
-                    # Fallback: use available columns
-                    cursor.execute("""
-                        SELECT merchant_name, ticker, company_name, category
-                        FROM llm_mappings
-                        WHERE source_type = 'receipt_processing'
-                        AND status = 'approved'
-                        AND admin_approved = 1
-                        ORDER BY updated_at DESC
-                        LIMIT 100
-                    """)
-                
+                cursor.execute("""
+                    SELECT merchant_name, ticker, company_name, category, mapping_data
+                    FROM llm_mappings
+                    WHERE source_type = 'receipt_processing'
+                    AND status = 'approved'
+                    AND admin_approved = 1
+                    ORDER BY updated_at DESC
+                    LIMIT 100
+                """)
                 rows = cursor.fetchall()
                 conn.close()
             
             mappings = []
             for row in rows:
-                if has_mapping_data:
-                    # Handle both tuple and Row objects
-                    if hasattr(row, '_mapping'):
-                        row_dict = dict(row._mapping)
-                        mappings.append({
-                            'merchant_name': row_dict.get('merchant_name'),
-                            'ticker': row_dict.get('ticker'),
-                            'company_name': row_dict.get('company_name'),
-                            'category': row_dict.get('category'),
-                            'mapping_data': json.loads(row_dict.get('mapping_data')) if row_dict.get('mapping_data') else {}
-                        })
-                    else:
-                        mappings.append({
-                            'merchant_name': row[0],
-                            'ticker': row[1],
-                            'company_name': row[2],
-                            'category': row[3],
-                            'mapping_data': json.loads(row[4]) if row[4] else {}
-                        })
-                else:
-                    # Handle both tuple and Row objects
-                    if hasattr(row, '_mapping'):
-                        row_dict = dict(row._mapping)
-                        mappings.append({
-                            'merchant_name': row_dict.get('merchant_name'),
-                            'ticker': row_dict.get('ticker'),
-                            'company_name': row_dict.get('company_name'),
-                            'category': row_dict.get('category'),
-                            'mapping_data': {}
-                        })
-                    else:
-                        mappings.append({
-                            'merchant_name': row[0],
-                            'ticker': row[1],
-                            'company_name': row[2],
-                            'category': row[3],
-                            'mapping_data': {}
-                        })
+                mappings.append({
+                    'merchant_name': row[0],
+                    'ticker': row[1],
+                    'company_name': row[2],
+                    'category': row[3],
+                    'mapping_data': json.loads(row[4]) if row[4] else {}
+                })
             
             logger.info(f"Loaded {len(mappings)} learned mappings from LLM Center")
             return mappings
@@ -239,70 +297,100 @@ class ReceiptProcessingService:
             logger.warning(f"Could not load learned mappings: {e}")
             return []
     
+    def _learned_mappings_signature(self) -> Optional[Tuple]:
+        """(count, max id) of approved receipt mappings: changes whenever one is approved or withdrawn"""
+        try:
+            from database_manager import db_manager
+            conn = db_manager.get_connection()
+            query = """
+                SELECT COUNT(*), MAX(id) FROM llm_mappings
+                WHERE source_type = 'receipt_processing' AND status = 'approved' AND admin_approved = 1
+            """
+            try:
+                if db_manager._use_postgresql:
+                    from sqlalchemy import text
+                    row = conn.execute(text(query)).fetchone()
+                else:
+                    row = conn.execute(query).fetchone()
+            finally:
+                db_manager.release_connection(conn)
+            return tuple(row) if row else None
+        except Exception as e:
+            logger.warning(f"Could not check learned mappings: {e}")
+            return None
+    
+    def refresh_learned_mappings(self, force: bool = False) -> bool:
+        """
+        Reload learned mappings and recompile the matcher if approvals changed.
+        Checks at most every LEARNED_MAPPINGS_REFRESH_SECONDS unless forced
+        """
+        now = time.monotonic()
+        if not force and now - self._learned_checked_at < LEARNED_MAPPINGS_REFRESH_SECONDS:
+            return False
+        self._learned_checked_at = now
+        signature = self._learned_mappings_signature()
+        if not force and (signature is None or signature == self._learned_signature):
+            return False
+        self._learned_signature = signature
+        self.learned_mappings = self._load_learned_mappings()
+        self.retailers_db = self._load_retailers_database()
+        self.matcher = compile_matcher(self._matcher_phrases(), default_artifact_path())
+        return True
+    
+    def _matcher_phrases(self) -> List[Phrase]:
+        """Every phrase the receipt parser looks for, grouped by the lookup that uses it"""
+        phrases = []
+        for priority, (retailer_key, retailer_data) in enumerate(self.retailers_db.items()):
+            retailer = {'name': retailer_data['name'], 'stockSymbol': retailer_data['symbol']}
+            phrases.append(Phrase(retailer_key, 'retailer', priority, False, retailer))
+            phrases.append(Phrase(retailer_data['name'], 'retailer', priority, False, retailer))
+        
+        # Learned brands take precedence over the built-in brand database
+        learned_brands = {}
+        for mapping in self.learned_mappings:
+            if mapping.get('category') == 'Brand' and mapping.get('merchant_name'):
+                learned_brands[mapping['merchant_name'].lower()] = {
+                    'name': mapping['merchant_name'], 'stockSymbol': mapping.get('ticker')
+                }
+        for priority, (brand_key, brand) in enumerate(learned_brands.items()):
+            phrases.append(Phrase(brand_key, 'brand', priority, False, brand))
+        for priority, (brand_key, brand_data) in enumerate(self.brands_db.items(), start=len(learned_brands)):
+            brand = {'name': brand_data['name'], 'stockSymbol': brand_data['symbol']}
+            for alias in [brand_key] + brand_data['aliases']:
+                phrases.append(Phrase(alias, 'brand', priority, False, brand))
+        
+        for priority, (spellings, ticker, company_name, confidence) in enumerate(KEYWORD_PATTERNS):
+            for spelling in spellings:
+                phrases.append(Phrase(spelling, 'pattern', priority, True,
+                                      {'ticker': ticker, 'company_name': company_name, 'confidence': confidence}))
+        for priority, (keyword, ticker) in enumerate(KEYWORD_TICKERS.items()):
+            phrases.append(Phrase(keyword, 'keyword', priority, False,
+                                  {'ticker': ticker, 'company_name': COMPANY_NAMES.get(ticker, ticker),
+                                   'keyword': keyword}))
+        for word in PAYMENT_WORDS:
+            phrases.append(Phrase(word, 'payment', 0, False, {}))
+        
+        # Approved receipt mappings, most recent first
+        for priority, mapping in enumerate(self.learned_mappings):
+            if not mapping.get('ticker'):
+                continue
+            company_name = mapping.get('company_name') or mapping.get('merchant_name')
+            for name in (mapping.get('merchant_name'), mapping.get('company_name')):
+                if name and len(name.strip()) >= 3:
+                    phrases.append(Phrase(name, 'mapping', priority, False,
+                                          {'ticker': mapping['ticker'], 'company_name': company_name}))
+        return phrases
+    
+    def _scan_items(self, items: List[Dict]) -> List[Dict]:
+        """Matcher hits for every item name, in one pass"""
+        return self.matcher.scan([item.get('name') or '' for item in items])
+    
     def extract_text_from_image(self, image_path: str) -> str:
         """
         Extract text from receipt image using OCR
         Uses pytesseract if available, otherwise returns empty string for manual entry
         """
-        try:
-            if not os.path.exists(image_path):
-                logger.error(f"Image file not found: {image_path}")
-                return ""
-            
-            if PYTESSERACT_AVAILABLE:
-                # Open image with PIL
-                image = Image.open(image_path)
-                
-                # Ensure Tesseract path is set (should already be set at module load, but double-check)
-                if not hasattr(pytesseract.pytesseract, 'tesseract_cmd') or not pytesseract.pytesseract.tesseract_cmd:
-                    # Fallback: try to find it again
-                    standard_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-                    if os.path.exists(standard_path):
-                        pytesseract.pytesseract.tesseract_cmd = standard_path
-                        logger.info(f"Set Tesseract path at runtime: {standard_path}")
-                    else:
-                        logger.error("Tesseract path not set and standard location not found!")
-                        return ""
-                
-                try:
-                    # Try to extract text using Tesseract OCR
-                    # Try multiple PSM modes to get best results
-                    best_text = ""
-                    psm_modes = [6, 11, 12, 7]  # 6=block, 11=sparse, 12=line, 7=line
-                    
-                    for psm in psm_modes:
-                        try:
-                            custom_config = f'--oem 3 --psm {psm}'
-                            text = pytesseract.image_to_string(image, config=custom_config)
-                            if len(text.strip()) > len(best_text.strip()):
-                                best_text = text
-                                logger.debug(f"PSM {psm} extracted {len(text)} characters")
-                        except Exception as e:
-                            logger.debug(f"PSM {psm} failed: {str(e)}")
-                            continue
-                    
-                    if best_text:
-                        logger.info(f"OCR extracted {len(best_text)} characters from {image_path}")
-                        return best_text
-                    else:
-                        logger.warning(f"No text extracted from {image_path} with any PSM mode")
-                        return ""
-                        
-                except pytesseract.TesseractNotFoundError:
-                    logger.error("Tesseract OCR not found. Please install from: https://github.com/UB-Mannheim/tesseract/wiki")
-                    logger.error("Or set pytesseract.pytesseract.tesseract_cmd to the tesseract.exe path")
-                    return ""
-                except Exception as e:
-                    logger.error(f"Tesseract OCR error: {str(e)}")
-                    return ""
-            else:
-                logger.warning("pytesseract not available - OCR extraction skipped")
-                return ""
-        except Exception as e:
-            logger.error(f"Error extracting text from image: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return ""
+        return ocr_image(image_path)
     
     def parse_receipt_text(self, raw_text: str) -> Dict:
         """
@@ -319,6 +407,8 @@ class ReceiptProcessingService:
                 'raw_text': raw_text
             }
         
+        self.refresh_learned_mappings()
+        
         # Extract retailer
         retailer = self._identify_retailer(raw_text)
         
@@ -360,26 +450,12 @@ class ReceiptProcessingService:
     
     def _identify_retailer(self, text: str) -> Optional[Dict]:
         """Identify retailer from receipt text with improved matching"""
-        text_lower = text.lower()
-        
-        # Try to find retailer at the top of the receipt (first few lines)
-        lines = text.split('\n')[:10]  # Check first 10 lines
-        top_text = ' '.join(lines).lower()
+        lines = text.split('\n')
         
-        # Check against retailer database
-        for retailer_key, retailer_data in self.retailers_db.items():
-            # Check if retailer name appears in text
-            if retailer_key in text_lower or retailer_key in top_text:
-                return {
-                    'name': retailer_data['name'],
-                    'stockSymbol': retailer_data['symbol']
-                }
-            # Also check if retailer name (capitalized) appears
-            if retailer_data['name'].lower() in text_lower:
-                return {
-                    'name': retailer_data['name'],
-                    'stockSymbol': retailer_data['symbol']
-                }
+        # Check against retailer database (one pass over the whole text)
+        match = self.matcher.scan_text(text).get('retailer')
+        if match:
+            return dict(match.payload)
         
         # If no match, try to extract first line as potential retailer
         # (often the store name appears first)
@@ -626,261 +702,86 @@ class ReceiptProcessingService:
         
         return items
     
-    def _identify_brands_from_items(self, items: List[Dict]) -> List[Dict]:
+    def _identify_brands_from_items(self, items: List[Dict], hits: Optional[List[Dict]] = None) -> List[Dict]:
         """Identify brands from item names and add brand info to items"""
         brands = []
         brand_names_seen = set()
+        hits = self._scan_items(items) if hits is None else hits
         
-        # Build learned brands map from approved mappings
-        learned_brands = {}
-        if self.learned_mappings:
-            for mapping in self.learned_mappings:
-                if mapping.get('category') == 'Brand':
-                    brand_name = mapping.get('merchant_name', '').lower()
-                    if brand_name:
-                        learned_brands[brand_name] = {
-                            'name': mapping.get('merchant_name'),
-                            'symbol': mapping.get('ticker')
-                        }
-        
-        for item in items:
-            item_name_lower = item['name'].lower()
-            brand_found = None
+        for item, item_hits in zip(items, hits):
+            # Learned mappings rank ahead of the brand database in the 'brand' group
+            match = item_hits.get('brand')
+            if not match:
+                continue
+            brand_found = dict(match.payload)
             
-            # Check learned mappings first
-            for brand_key, brand_data in learned_brands.items():
-                if brand_key in item_name_lower:
-                    brand_found = {
-                        'name': brand_data['name'],
-                        'stockSymbol': brand_data['symbol']
-                    }
-                    break
+            # Add brand info to the item
+            item['brand'] = brand_found
+            item['brandSymbol'] = brand_found['stockSymbol']
             
-            # Check against brand database if not found in learned mappings
-            if not brand_found:
-                for brand_key, brand_data in self.brands_db.items():
-                    if brand_key in item_name_lower or any(alias in item_name_lower for alias in brand_data['aliases']):
-                        brand_found = {
-                            'name': brand_data['name'],
-                            'stockSymbol': brand_data['symbol']
-                        }
-                        break
-            
-            # Add brand info to the item if found
-            if brand_found:
-                item['brand'] = brand_found
-                item['brandSymbol'] = brand_found['stockSymbol']
-                
-                # Add to brands list if not already there
-                if brand_found['name'] not in brand_names_seen:
-                    brands.append(brand_found)
-                    brand_names_seen.add(brand_found['name'])
+            # Add to brands list if not already there
+            if brand_found['name'] not in brand_names_seen:
+                brands.append(brand_found)
+                brand_names_seen.add(brand_found['name'])
         
         return brands
     
-    def _enhance_items_with_llm_mappings(self, items: List[Dict], raw_text: str) -> List[Dict]:
+    def _enhance_items_with_llm_mappings(self, items: List[Dict], raw_text: str,
+                                         hits: Optional[List[Dict]] = None) -> List[Dict]:
         """
         Enhance items with stock ticker mappings from LLM Center
-        Uses the 14m+ mappings to identify stock tickers for product names
-        OPTIMIZED: Uses fast keyword matching and caching for speed
+        Keyword shortcuts first, then approved receipt mappings; both are
+        phrases of the compiled matcher, so there are no per-item queries
         """
         if not items:
             return items
+        hits = self._scan_items(items) if hits is None else hits
         
-        try:
-            from database_manager import db_manager
-            
-            # Quick keyword-to-ticker mapping cache (fast lookup)
-            # This avoids database queries for common brands
-            keyword_cache = {
-                'hp': 'HPQ', 'hewlett': 'HPQ', 'hewlett-packard': 'HPQ', 'envy': 'HPQ',
-                'nike': 'NKE', 'adidas': 'ADDYY', 'apple': 'AAPL', 'iphone': 'AAPL', 'ipad': 'AAPL',
-                'microsoft': 'MSFT', 'google': 'GOOGL', 'amazon': 'AMZN',
-                'samsung': 'SSNLF', 'tesla': 'TSLA', 'target': 'TGT',
-                'walmart': 'WMT', 'costco': 'COST', 'starbucks': 'SBUX', 'sbr': 'SBUX',
-                'pillsbury': 'PSY'
-            }
-            
-            # Check if llm_mappings table exists (fast check)
-            conn = db_manager.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='llm_mappings'
-            """)
-            has_llm_table = cursor.fetchone() is not None
-            
-            # Only proceed with DB queries if table exists and we have items to enhance
-            if not has_llm_table:
-                conn.close()
-                # Still try keyword cache for common brands
-                return self._enhance_with_keyword_cache(items, keyword_cache)
-            
-            enhanced_items = []
-            # Fast keyword cache lookup first (no DB queries)
-            for item in items:
-                item_name = item.get('name', '').lower()
-                if not item_name or len(item_name) < 3:
-                    enhanced_items.append(item)
-                    continue
-                
-                # Try keyword cache first (instant, no DB query)
-                best_match = None
-                for keyword, ticker in keyword_cache.items():
-                    if keyword in item_name:
-                        # Get company name from ticker
-                        company_names = {
-                            'HPQ': 'Hewlett-Packard', 'NKE': 'Nike', 'ADDYY': 'Adidas',
-                            'AAPL': 'Apple', 'MSFT': 'Microsoft', 'GOOGL': 'Alphabet',
-                            'AMZN': 'Amazon', 'SSNLF': 'Samsung', 'TSLA': 'Tesla',
-                            'TGT': 'Target', 'WMT': 'Walmart', 'COST': 'Costco', 'SBUX': 'Starbucks',
-                            'TJX': 'TJX Companies', 'PYPL': 'PayPal', 'V': 'Visa', 'MA': 'Mastercard',
-                            'PSY': 'Pillsbury'
-                        }
-                        best_match = {
-                            'ticker': ticker,
-                            'company_name': company_names.get(ticker, ticker),
-                            'confidence': 0.95  # High confidence for keyword matches
-                        }
-                        break
-                
-                # Only query DB if keyword cache didn't find a match
-                if not best_match:
-                    # Use a single optimized query with better indexing hints
-                    # Extract first meaningful word (skip numbers, single chars)
-                    words = [w for w in item_name.split() if len(w) >= 3][:1]  # Only check first meaningful word
-                    if words:
-                        search_term = f'%{words[0]}%'
-                        # Optimized query: use index on status/admin_approved/ticker, limit to 1 result
-                        cursor.execute("""
-                            SELECT merchant_name, ticker, company_name, category, confidence
-                            FROM llm_mappings
-                            WHERE (
-                                LOWER(merchant_name) LIKE ? OR
-                                LOWER(company_name) LIKE ?
-                            )
-                            AND status = 'approved'
-                            AND admin_approved = 1
-                            AND ticker IS NOT NULL
-                            AND ticker != ''
-                            ORDER BY confidence DESC
-                            LIMIT 1
-                        """, (search_term, search_term))
-                        
-                        match = cursor.fetchone()
-                        if match:
-                            best_match = {
-                                'ticker': match[1],
-                                'company_name': match[2] or match[0],
-                                'confidence': match[4] or 0.8
-                            }
-                
-                # Apply enhancement if found
-                if best_match and best_match['confidence'] > 0.5:
-                    item['brand'] = {
-                        'name': best_match['company_name'],
-                        'stockSymbol': best_match['ticker']
-                    }
-                    item['brandSymbol'] = best_match['ticker']
-                    item['brand_confidence'] = best_match['confidence']
-                    item['brand_source'] = 'keyword_cache' if best_match['confidence'] >= 0.95 else 'llm_center'
-                
-                enhanced_items.append(item)
+        for item, item_hits in zip(items, hits):
+            if len((item.get('name') or '').strip()) < 3:
+                continue
             
-            conn.close()
-            return enhanced_items
+            best_match = None
+            keyword = item_hits.get('keyword')
+            mapping = item_hits.get('mapping')
+            if keyword:
+                best_match = dict(keyword.payload, confidence=0.95)  # High confidence for keyword matches
+            elif mapping:
+                best_match = dict(mapping.payload, confidence=0.8)
             
-        except Exception as e:
-            logger.warning(f"Could not enhance items with LLM mappings: {e}")
-            # Fallback to keyword cache
-            return self._enhance_with_keyword_cache(items, keyword_cache)
+            # Apply enhancement if found
+            if best_match:
+                item['brand'] = {
+                    'name': best_match['company_name'],
+                    'stockSymbol': best_match['ticker']
+                }
+                item['brandSymbol'] = best_match['ticker']
+                item['brand_confidence'] = best_match['confidence']
+                item['brand_source'] = 'keyword_cache' if best_match['confidence'] >= 0.95 else 'llm_center'
+        
+        return items
     
-    def _enhance_with_keyword_cache(self, items: List[Dict], keyword_cache: Dict) -> List[Dict]:
+    def _enhance_with_keyword_cache(self, items: List[Dict], hits: Optional[List[Dict]] = None) -> List[Dict]:
         """Fast keyword-based enhancement without DB queries - IMPROVED with better matching"""
-        enhanced_items = []
-        company_names = {
-            'HPQ': 'Hewlett-Packard', 'NKE': 'Nike', 'ADDYY': 'Adidas',
-            'AAPL': 'Apple', 'MSFT': 'Microsoft', 'GOOGL': 'Alphabet',
-            'AMZN': 'Amazon', 'SSNLF': 'Samsung', 'TSLA': 'Tesla',
-            'TGT': 'Target', 'WMT': 'Walmart', 'COST': 'Costco', 'SBUX': 'Starbucks',
-            'TJX': 'TJX Companies', 'PYPL': 'PayPal', 'V': 'Visa', 'MA': 'Mastercard',
-            'PSY': 'Pillsbury'
-        }
-        
-        # Enhanced keyword patterns for better matching
-        # Priority order: specific patterns first, then general keywords
-        keyword_patterns = [
-            # HP patterns (highest priority)
-            (r'\bhp\s+envy\b', 'HPQ', 'Hewlett-Packard', 0.98),
-            (r'\bhewlett[-\s]?packard\b', 'HPQ', 'Hewlett-Packard', 0.97),
-            (r'\benvy\b', 'HPQ', 'Hewlett-Packard', 0.85),  # Lower confidence for just "envy"
-            (r'\bhp\b', 'HPQ', 'Hewlett-Packard', 0.90),
-            # Nike patterns
-            (r'\bnike\b', 'NKE', 'Nike', 0.95),
-            (r'\bjordan\b', 'NKE', 'Nike (Jordan)', 0.90),
-            # Apple patterns
-            (r'\bapple\b', 'AAPL', 'Apple', 0.95),
-            (r'\biphone\b', 'AAPL', 'Apple', 0.90),
-            (r'\bipad\b', 'AAPL', 'Apple', 0.90),
-            # Payment processors
-            (r'\bpaypal\b', 'PYPL', 'PayPal', 0.95),
-            (r'\bpay\s+from\s+primary\b', 'PYPL', 'PayPal', 0.85),
-            (r'\bdebit\s+tend\b', None, None, 0.0),  # Skip - payment method, not brand
-            # Retailers
-            (r'\bwalmart\b', 'WMT', 'Walmart', 0.95),
-            (r'\btj\s*maxx\b', 'TJX', 'TJX Companies', 0.95),
-            (r'\btjx\b', 'TJX', 'TJX Companies', 0.90),
-            # Coffee/Starbucks patterns
-            (r'\bstarbucks\b', 'SBUX', 'Starbucks', 0.95),
-            (r'\bsbr\b', 'SBUX', 'Starbucks', 0.90),  # SBR abbreviation
-            (r'\b284050833\b', 'SBUX', 'Starbucks', 0.85),  # Starbucks product code
-            # Food brands - Pillsbury
-            (r'\bpillsbury\b', 'PSY', 'Pillsbury', 0.95),
-            (r'\b284000087\b', 'PSY', 'Pillsbury', 0.90),  # Pillsbury product code
-        ]
+        hits = self._scan_items(items) if hits is None else hits
         
-        for item in items:
-            item_name = item.get('name', '').lower()
-            if not item_name:
-                enhanced_items.append(item)
+        for item, item_hits in zip(items, hits):
+            if not item.get('name'):
                 continue
             
             # Skip payment method lines (they're not products)
-            if any(skip in item_name for skip in ['debit tend', 'pay from', 'payment', 'tend', 'card']):
-                # These are payment methods, not products - don't assign brands
-                enhanced_items.append(item)
+            if 'payment' in item_hits:
                 continue
             
             best_match = None
-            best_confidence = 0.0
-            
             # Try pattern matching first (more accurate)
-            for pattern, ticker, company_name, confidence in keyword_patterns:
-                if ticker and re.search(pattern, item_name, re.IGNORECASE):
-                    if confidence > best_confidence:
-                        best_match = {
-                            'ticker': ticker,
-                            'company_name': company_name,
-                            'confidence': confidence
-                        }
-                        best_confidence = confidence
-                        break  # Found a match, use it
-            
-            # Fallback to simple keyword cache if no pattern match
-            if not best_match:
-                for keyword, ticker in keyword_cache.items():
-                    if keyword in item_name:
-                        company_name = company_names.get(ticker, ticker)
-                        # Lower confidence for simple keyword matches
-                        confidence = 0.75 if len(keyword) < 3 else 0.85
-                        if confidence > best_confidence:
-                            best_match = {
-                                'ticker': ticker,
-                                'company_name': company_name,
-                                'confidence': confidence
-                            }
-                            best_confidence = confidence
-                            break
+            pattern = item_hits.get('pattern')
+            keyword = item_hits.get('keyword')
+            if pattern:
+                best_match = dict(pattern.payload)
+            elif keyword:
+                # Fallback to simple keyword cache, lower confidence for simple keyword matches
+                best_match = dict(keyword.payload, confidence=0.75 if len(keyword.payload['keyword']) < 3 else 0.85)
             
             # Apply enhancement if we found a good match
             if best_match and best_match['confidence'] > 0.7:
@@ -897,12 +798,32 @@ class ReceiptProcessingService:
                 # No confident match found - mark for manual review
                 item['brand_confidence'] = 0.0
                 item['brand_source'] = 'none'
-                if item.get('name'):
-                    logger.debug(f"⚠️ No brand match found for item '{item.get('name')}' (best confidence: {best_confidence:.2f})")
-            
-            enhanced_items.append(item)
+                logger.debug(f"⚠️ No brand match found for item '{item.get('name')}'")
         
-        return enhanced_items
+        return items
+    
+    @staticmethod
+    def manual_entry_data() -> Dict:
+        """Parsed-receipt shape returned when OCR produced no text"""
+        return {
+            'retailer': None, 'items': [], 'brands': [], 'totalAmount': 0.0,
+            'timestamp': datetime.now().isoformat(), 'raw_text': '', 'needs_manual_entry': True
+        }
+    
+    def map_receipt(self, parsed_data: Dict, raw_text: str, skip_llm_enhancement: bool = False) -> Dict:
+        """Map parsed items to brands/tickers (LLM Center mappings, or the fast keyword cache)"""
+        self.refresh_learned_mappings()
+        items = parsed_data.get('items', [])
+        hits = self._scan_items(items)  # One pass over all item names serves every lookup below
+        if not skip_llm_enhancement:
+            parsed_data['items'] = self._enhance_items_with_llm_mappings(items, raw_text, hits)
+        else:
+            # Still use fast keyword cache for common brands
+            parsed_data['items'] = self._enhance_with_keyword_cache(items, hits)
+        
+        # Identify brands from items (this updates the brands list)
+        parsed_data['brands'] = self._identify_brands_from_items(parsed_data['items'], hits)
+        return parsed_data
     
     def process_receipt(self, receipt_data: Dict) -> Dict:
         """
@@ -918,31 +839,13 @@ class ReceiptProcessingService:
 
             if not raw_text:
                 logger.warning("No raw text available for parsing.")
-                return {
-                    'success': True,
-                    'data': {
-                        'retailer': None, 'items': [], 'brands': [], 'totalAmount': 0.0,
-                        'timestamp': datetime.now().isoformat(), 'raw_text': '', 'needs_manual_entry': True
-                    }
-                }
+                return {'success': True, 'data': self.manual_entry_data()}
 
             # Parse receipt text (this creates the basic structure)
             parsed_data = self.parse_receipt_text(raw_text)
             
             # Enhance items with LLM Center mappings (only if not skipped for speed)
-            skip_llm = receipt_data.get('skip_llm_enhancement', False)
-            if not skip_llm:
-                parsed_data['items'] = self._enhance_items_with_llm_mappings(parsed_data.get('items', []), raw_text)
-            else:
-                # Still use fast keyword cache for common brands
-                keyword_cache = {
-                    'hp': 'HPQ', 'hewlett': 'HPQ', 'nike': 'NKE', 'adidas': 'ADDYY',
-                    'apple': 'AAPL', 'microsoft': 'MSFT', 'google': 'GOOGL', 'amazon': 'AMZN'
-                }
-                parsed_data['items'] = self._enhance_with_keyword_cache(parsed_data.get('items', []), keyword_cache)
-            
-            # Identify brands from items (this updates the brands list)
-            parsed_data['brands'] = self._identify_brands_from_items(parsed_data.get('items', []))
+            parsed_data = self.map_receipt(parsed_data, raw_text, receipt_data.get('skip_llm_enhancement', False))
             
             return {'success': True, 'data': parsed_data}
         except Exception as e:
@@ -950,4 +853,3 @@ class ReceiptProcessingService:
             import traceback
             logger.error(traceback.format_exc())
             return {'success': False, 'error': str(e)}
-
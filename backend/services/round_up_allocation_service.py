@@ -86,6 +86,27 @@ class RoundUpAllocationService:
                 'error': str(e)
             }
     
+    def allocate_receipt(self, parsed_data: Dict, round_up_amount: float) -> Dict:
+        """Calculate the allocation for a parsed receipt (items, retailer, totalAmount)"""
+        items_for_allocation = []
+        for item in parsed_data.get('items', []):
+            # Make sure brand_confidence is set if brand exists
+            if item.get('brand') and not item.get('brand_confidence'):
+                # If brand exists but no confidence, set default high confidence
+                item['brand_confidence'] = 0.95
+                logger.info(f"Item '{item.get('name')}' has brand but no confidence - setting to 0.95")
+            items_for_allocation.append(item)
+        
+        transaction = {
+            'items': items_for_allocation,
+            'retailer': parsed_data.get('retailer'),
+            'totalAmount': parsed_data.get('totalAmount', 0.0),
+            'roundUpAmount': round_up_amount
+        }
+        logger.info(f"Transaction data for allocation: items={len(items_for_allocation)}, "
+                    f"retailer={transaction['retailer']}, roundUpAmount=${round_up_amount}")
+        return self.calculate_allocation(transaction)
+    
     def _calculate_round_up(self, amount: float) -> float:
         """Calculate round-up amount (round up to nearest dollar)"""
         return round(amount) - amount if amount % 1 != 0 else 1.0
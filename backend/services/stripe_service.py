@@ -4,11 +4,13 @@ Handles Stripe subscription management, payment processing, and webhook events
 """
 
 import os
-import stripe
 from datetime import datetime
 from typing import Dict, Optional, List
 import logging
 
+from utils.lazy_import import lazy_module
+
+stripe = lazy_module('stripe')  # The SDK is large; load it when a payment path first needs it
 logger = logging.getLogger(__name__)
 
 
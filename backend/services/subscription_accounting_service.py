@@ -1,14 +1,82 @@
 """
 Subscription Accounting Service
 Automatically creates journal entries for subscription payments and revenue recognition
+
+Daily revenue recognition (recognize_revenue) is set based:
+- one query expands every active subscription over the requested date
+  range and computes each day's amount, skipping days already recognized
+- all journal entries, their lines and the recognition ledger rows are
+  written with executemany in a single transaction
+- subscription_revenue_recognitions has a unique (subscription_id,
+  recognition_date) index, so re-runs and overlapping catch-up ranges
+  never recognize a day twice
 """
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Dict, Optional, List
 import logging
 
 logger = logging.getLogger(__name__)
 
+RECOGNITION_CREATED_BY = '1'  # System user, as for the LLM amortization entries
+
+# Every active subscription's unrecognized days in [:start, :end], with the
+# day's share of the period amount; one row per (subscription, day)
+_RECOGNITION_CANDIDATES_SQLITE = """
+    WITH RECURSIVE days(day) AS (
+        SELECT date(:start)
+        UNION ALL
+        SELECT date(day, '+1 day') FROM days WHERE day < date(:end)
+    ),
+    periods AS (
+        SELECT s.id, s.amount, s.plan_id,
+               date(s.current_period_start) AS period_start,
+               date(s.current_period_end) AS period_end,
+               CAST(julianday(date(s.current_period_end)) - julianday(date(s.current_period_start)) AS INTEGER) + 1
+                   AS total_days
+        FROM user_subscriptions s
+        WHERE s.status = 'active' AND s.amount > 0
+          AND date(s.current_period_start) <= date(:end) AND date(s.current_period_end) >= date(:start)
+    )
+    SELECT p.id, days.day, ROUND(p.amount / p.total_days, 4),
+           CAST(julianday(days.day) - julianday(p.period_start) AS INTEGER) + 1, p.total_days,
+           LOWER(COALESCE(sp.account_type, '')), COALESCE(sp.name, 'Unknown Plan')
+    FROM periods p
+    JOIN days ON days.day BETWEEN p.period_start AND p.period_end
+    LEFT JOIN subscription_plans sp ON sp.id = p.plan_id
+    LEFT JOIN subscription_revenue_recognitions r
+           ON r.subscription_id = p.id AND r.recognition_date = days.day
+    WHERE r.subscription_id IS NULL AND p.total_days > 0
+    ORDER BY days.day, p.id
+"""
+
+_RECOGNITION_CANDIDATES_POSTGRES = """
+    WITH days AS (
+        SELECT CAST(d AS DATE) AS day
+        FROM generate_series(CAST(:start AS DATE), CAST(:end AS DATE), INTERVAL '1 day') AS d
+    ),
+    periods AS (
+        SELECT s.id, s.amount, s.plan_id,
+               CAST(s.current_period_start AS DATE) AS period_start,
+               CAST(s.current_period_end AS DATE) AS period_end,
+               CAST(s.current_period_end AS DATE) - CAST(s.current_period_start AS DATE) + 1 AS total_days
+        FROM user_subscriptions s
+        WHERE s.status = 'active' AND s.amount > 0
+          AND CAST(s.current_period_start AS DATE) <= CAST(:end AS DATE)
+          AND CAST(s.current_period_end AS DATE) >= CAST(:start AS DATE)
+    )
+    SELECT p.id, CAST(days.day AS TEXT), ROUND(CAST(p.amount AS NUMERIC) / p.total_days, 4),
+           days.day - p.period_start + 1, p.total_days,
+           LOWER(COALESCE(sp.account_type, '')), COALESCE(sp.name, 'Unknown Plan')
+    FROM periods p
+    JOIN days ON days.day BETWEEN p.period_start AND p.period_end
+    LEFT JOIN subscription_plans sp ON sp.id = p.plan_id
+    LEFT JOIN subscription_revenue_recognitions r
+           ON r.subscription_id = p.id AND r.recognition_date = days.day
+    WHERE r.subscription_id IS NULL AND p.total_days > 0
+    ORDER BY days.day, p.id
+"""
+
 
 class SubscriptionAccountingService:
     """Service for handling subscription-related accounting entries"""
@@ -29,9 +97,15 @@ class SubscriptionAccountingService:
     FAILED_PAYMENT_ACCOUNT = '23040'  # Deferred Revenue – Failed Payments
     CASH_ACCOUNT = '10100'  # Cash – Bank of America (adjust if different)
     
-    def __init__(self, db_connection):
-        """Initialize service with database connection"""
-        self.db = db_connection
+    def __init__(self, db_manager=None):
+        """Initialize service with a DatabaseManager (defaults to the global one)"""
+        self.db = db_manager
+    
+    def _get_db(self):
+        if self.db is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self.db = db_manager or _ensure_db_manager()
+        return self.db
     
     def create_deferred_revenue_accounts(self) -> bool:
         """
@@ -308,9 +382,10 @@ class SubscriptionAccountingService:
         recognition_date: Optional[datetime] = None
     ) -> List[Dict]:
         """
-        Process daily revenue recognition for all active subscriptions
+        Build daily revenue recognition entries for the given subscriptions
         
-        Returns list of created journal entries
+        Returns list of journal entry dicts; nothing is persisted (use
+        recognize_revenue to post entries for every active subscription)
         """
         recognition_date = recognition_date or datetime.now().date()
         created_entries = []
@@ -369,6 +444,141 @@ class SubscriptionAccountingService:
             logger.error(f"Error processing daily revenue recognition: {e}")
             return []
     
+    def recognize_revenue(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> Dict:
+        """
+        Post daily revenue recognition for every active subscription and
+        every day in [start_date, end_date] not recognized yet
+        
+        end_date defaults to today; start_date to the day after the last
+        recognized day (or end_date when nothing was recognized yet), so a
+        scheduler that missed days catches up in one pass.
+        
+        Entry per subscription and day: DR Deferred Revenue / CR Revenue
+        """
+        db = self._get_db()
+        use_postgresql = getattr(db, '_use_postgresql', False)
+        end_date = end_date or datetime.now().date()
+        conn = db.get_connection()
+        try:
+            if start_date is None:
+                start_date = self._next_unrecognized_day(conn, use_postgresql) or end_date
+            if start_date > end_date:
+                return self._recognition_summary(start_date, end_date, [], 0)
+            
+            try:
+                rows, skipped = self._post_recognitions(conn, use_postgresql, start_date, end_date)
+            except Exception as e:
+                if not _is_unique_violation(e):
+                    raise
+                # A concurrent run recognized some of the same days first;
+                # its rows are committed now, so the retry skips them
+                conn.rollback()
+                logger.warning(f"Revenue recognition raced another run, retrying: {e}")
+                rows, skipped = self._post_recognitions(conn, use_postgresql, start_date, end_date)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.release_connection(conn)
+        
+        summary = self._recognition_summary(start_date, end_date, rows, skipped)
+        logger.info(f"Recognized revenue {start_date}..{end_date}: {summary['entries_created']} entries, "
+                    f"${summary['total_amount']:.2f}")
+        return summary
+    
+    def _post_recognitions(self, conn, use_postgresql: bool, start_date: date, end_date: date):
+        """Select and insert every pending recognition in one transaction; returns (rows, skipped)"""
+        params = {'start': start_date.isoformat(), 'end': end_date.isoformat()}
+        if use_postgresql:
+            from sqlalchemy import text
+            candidates = conn.execute(text(_RECOGNITION_CANDIDATES_POSTGRES), params).fetchall()
+        else:
+            candidates = conn.execute(_RECOGNITION_CANDIDATES_SQLITE, params).fetchall()
+        
+        now = datetime.now().isoformat()
+        entries, lines, ledger, rows = [], [], [], []
+        skipped = 0
+        for subscription_id, day, daily_amount, day_number, total_days, account_type, plan_name in candidates:
+            deferred_account = self.DEFERRED_REVENUE_ACCOUNTS.get(account_type)
+            revenue_account = self.REVENUE_ACCOUNTS.get(account_type)
+            daily_amount = float(daily_amount)
+            if not deferred_account or not revenue_account or daily_amount <= 0:
+                skipped += 1
+                continue
+            stamp = day.replace('-', '')
+            entry_id = f"JE-SUBREV-{subscription_id}-{stamp}"
+            entries.append({
+                'id': entry_id, 'date': day, 'reference': f"SUB-REV-{subscription_id}-{stamp}",
+                'description': f"Daily revenue recognition - {plan_name} - Day {day_number} of {total_days}",
+                'amount': daily_amount, 'from_account': deferred_account, 'to_account': revenue_account,
+                'created_at': now, 'created_by': RECOGNITION_CREATED_BY
+            })
+            lines.append({'entry_id': entry_id, 'account': deferred_account, 'debit': daily_amount, 'credit': 0,
+                          'description': f"Deferred revenue recognized - {account_type}", 'created_at': now})
+            lines.append({'entry_id': entry_id, 'account': revenue_account, 'debit': 0, 'credit': daily_amount,
+                          'description': f"Subscription revenue - {account_type}", 'created_at': now})
+            ledger.append({'subscription_id': subscription_id, 'day': day, 'entry_id': entry_id,
+                           'amount': daily_amount})
+            rows.append(ledger[-1])
+        
+        if ledger:
+            # The ledger goes first: its unique index rejects a day another run already took
+            self._executemany(conn, use_postgresql, """
+                INSERT INTO subscription_revenue_recognitions (subscription_id, recognition_date, journal_entry_id, amount)
+                VALUES (:subscription_id, :day, :entry_id, :amount)
+            """, ledger)
+            self._executemany(conn, use_postgresql, """
+                INSERT INTO journal_entries (
+                    id, date, reference, description, location, department,
+                    transaction_type, vendor_name, customer_name, amount,
+                    from_account, to_account, status, created_at, created_by
+                ) VALUES (:id, :date, :reference, :description, '', '', 'daily_recognition', '', '', :amount,
+                          :from_account, :to_account, 'posted', :created_at, :created_by)
+            """, entries)
+            self._executemany(conn, use_postgresql, """
+                INSERT INTO journal_entry_lines (journal_entry_id, account_code, debit, credit, description, created_at)
+                VALUES (:entry_id, :account, :debit, :credit, :description, :created_at)
+            """, lines)
+        conn.commit()
+        return rows, skipped
+    
+    @staticmethod
+    def _executemany(conn, use_postgresql: bool, sql: str, rows: List[Dict]):
+        if use_postgresql:
+            from sqlalchemy import text
+            conn.execute(text(sql), rows)
+        else:
+            conn.executemany(sql, rows)
+    
+    @staticmethod
+    def _next_unrecognized_day(conn, use_postgresql: bool) -> Optional[date]:
+        sql = "SELECT MAX(recognition_date) FROM subscription_revenue_recognitions"
+        if use_postgresql:
+            from sqlalchemy import text
+            last = conn.execute(text(sql)).scalar()
+        else:
+            last = conn.execute(sql).fetchone()[0]
+        if not last:
+            return None
+        if isinstance(last, str):
+            last = date.fromisoformat(last[:10])
+        return last + timedelta(days=1)
+    
+    @staticmethod
+    def _recognition_summary(start_date: date, end_date: date, rows: List[Dict], skipped: int) -> Dict:
+        return {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'entries_created': len(rows),
+            'subscriptions': len({r['subscription_id'] for r in rows}),
+            'total_amount': round(sum(r['amount'] for r in rows), 4),
+            'skipped': skipped
+        }
+    
     def handle_failed_payment(
         self,
         subscription_id: int,
@@ -512,3 +722,13 @@ class SubscriptionAccountingService:
             return None
 
 
+def _is_unique_violation(error: Exception) -> bool:
+    """True for a unique-index conflict from either sqlite3 or SQLAlchemy/psycopg2"""
+    import sqlite3
+    if isinstance(error, sqlite3.IntegrityError):
+        return True
+    try:
+        from sqlalchemy.exc import IntegrityError
+    except ImportError:
+        return False
+    return isinstance(error, IntegrityError)
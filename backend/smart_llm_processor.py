@@ -11,6 +11,10 @@ import json
 import requests
 from alpaca_service import AlpacaService
 from database_manager import db_manager
+from positions import position_store
+from utils.log import get_logger
+
+log = get_logger('llm_processor')
 
 class SmartLLMProcessor:
     def __init__(self):
@@ -29,6 +33,10 @@ class SmartLLMProcessor:
         # Kamioi funding account
         self.kamioi_account_id = "kamioi_funding_account"
         
+        # Netted execution of queued after-hours buys
+        from order_netting import OrderNettingEngine
+        self.order_netting = OrderNettingEngine(broker=self.alpaca)
+        
     def is_market_open(self) -> bool:
         """Check if stock market is currently open"""
         now = datetime.now()
@@ -48,7 +56,7 @@ class SmartLLMProcessor:
             cur = conn.cursor()
             
             cur.execute("""
-                SELECT id, user_id, merchant, amount, category, created_at
+                SELECT id, user_id, merchant, amount, category, created_at, round_up
                 FROM transactions 
                 WHERE status = 'pending' AND ticker IS NULL
                 ORDER BY created_at ASC
@@ -63,14 +71,15 @@ class SmartLLMProcessor:
                     'merchant': row[2],
                     'amount': row[3],
                     'category': row[4],
-                    'created_at': row[5]
+                    'created_at': row[5],
+                    'round_up': row[6]
                 })
             
             conn.close()
             return transactions
             
         except Exception as e:
-            print(f"Error getting pending transactions: {e}")
+            log.error(f"Error getting pending transactions: {e}")
             return []
     
     def llm_map_transaction(self, merchant: str, category: str = None) -> Dict:
@@ -98,7 +107,7 @@ class SmartLLMProcessor:
         try:
             # For now, we'll simulate the purchase
             # In production, you'd use the actual Alpaca API
-            print(f"Executing stock purchase: {ticker} for ${amount}")
+            log.debug("Executing stock purchase: %s for $%s", ticker, amount)
             
             # Simulate successful purchase
             purchase_result = {
@@ -114,7 +123,7 @@ class SmartLLMProcessor:
             return purchase_result
             
         except Exception as e:
-            print(f"Error executing stock purchase: {e}")
+            log.error(f"Error executing stock purchase: {e}")
             return {'success': False, 'error': str(e)}
     
     def process_transaction(self, transaction: Dict) -> Dict:
@@ -137,7 +146,7 @@ class SmartLLMProcessor:
                     
                     if purchase_result['success']:
                         # Update transaction status
-                        self.update_transaction_status(tx_id, 'mapped', ticker, purchase_result)
+                        self.update_transaction_status(tx_id, 'mapped', ticker, purchase_result, user_id=user_id)
                         
                         # Create mapping record
                         self.create_mapping_record(user_id, merchant, ticker, mapping_result)
@@ -153,7 +162,7 @@ class SmartLLMProcessor:
                         return {'status': 'pending', 'reason': 'Purchase failed'}
                 else:
                     # Market closed - queue for next day
-                    self.queue_for_next_day(tx_id, ticker, user_id)
+                    self.queue_for_next_day(tx_id, ticker, user_id, transaction.get('round_up'))
                     return {'status': 'queued', 'ticker': ticker, 'reason': 'Market closed'}
                     
             elif mapping_result['confidence'] >= self.learning_threshold:
@@ -165,11 +174,12 @@ class SmartLLMProcessor:
                 return {'status': 'pending', 'reason': 'Low confidence mapping'}
                 
         except Exception as e:
-            print(f"Error processing transaction {transaction['id']}: {e}")
+            log.error(f"Error processing transaction {transaction['id']}: {e}")
             return {'status': 'error', 'error': str(e)}
     
-    def update_transaction_status(self, tx_id: int, status: str, ticker: str = None, purchase_data: Dict = None):
-        """Update transaction status in database"""
+    def update_transaction_status(self, tx_id: int, status: str, ticker: str = None, purchase_data: Dict = None,
+                                  user_id: int = None):
+        """Update transaction status in database (and the user's position for purchases)"""
         try:
             conn = db_manager.get_connection()
             cur = conn.cursor()
@@ -185,6 +195,9 @@ class SmartLLMProcessor:
                     purchase_data['price_per_share'], purchase_data['order_id'], 
                     datetime.now().isoformat(), tx_id
                 ))
+                if user_id is not None:
+                    position_store.apply_fill(conn, user_id, ticker, purchase_data['shares'],
+                                              purchase_data.get('total_cost', 0), purchase_data['price_per_share'])
             else:
                 cur.execute("""
                     UPDATE transactions 
@@ -196,7 +209,7 @@ class SmartLLMProcessor:
             conn.close()
             
         except Exception as e:
-            print(f"Error updating transaction status: {e}")
+            log.error(f"Error updating transaction status: {e}")
     
     def create_mapping_record(self, user_id: int, merchant: str, ticker: str, mapping_result: Dict, status: str = 'approved'):
         """Create mapping record in database"""
@@ -218,30 +231,32 @@ class SmartLLMProcessor:
             conn.close()
             
         except Exception as e:
-            print(f"Error creating mapping record: {e}")
+            log.error(f"Error creating mapping record: {e}")
     
-    def queue_for_next_day(self, tx_id: int, ticker: str, user_id: int):
-        """Queue transaction for next day when market opens"""
+    def queue_for_next_day(self, tx_id: int, ticker: str, user_id: int, amount: float):
+        """Queue the transaction's round-up for the netted order when the market opens"""
         try:
-            conn = db_manager.get_connection()
-            cur = conn.cursor()
-            
-            # Create a queue record
-            cur.execute("""
-                INSERT INTO market_queue 
-                (transaction_id, user_id, ticker, amount, status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (tx_id, user_id, ticker, 1.0, 'queued', datetime.now().isoformat()))
-            
-            conn.commit()
-            conn.close()
-            
+            if not self.order_netting.enqueue([{'transaction_id': tx_id, 'user_id': user_id, 'ticker': ticker,
+                                                'amount': float(amount or 0)}]):
+                log.warning(f"Transaction {tx_id} has no round-up to queue")
         except Exception as e:
-            print(f"Error queuing transaction: {e}")
+            log.error(f"Error queuing transaction: {e}")
+    
+    def drain_market_queue(self) -> Dict:
+        """Submit everything queued while the market was closed as one order per ticker"""
+        if not self.is_market_open():
+            return {'drained': False, 'reason': 'Market closed'}
+        result = self.order_netting.drain_market_queue()
+        result['drained'] = True
+        return result
     
     def process_batch(self) -> Dict:
         """Process a batch of pending transactions"""
         try:
+            # Flush after-hours buys first so the queue drains at market open
+            if self.is_market_open():
+                self.drain_market_queue()
+            
             transactions = self.get_pending_transactions(self.batch_size)
             
             if not transactions:
@@ -268,11 +283,11 @@ class SmartLLMProcessor:
                 elif result['status'] == 'error':
                     results['errors'] += 1
             
-            print(f"Batch processing complete: {results}")
+            log.info("Batch processing complete: %s", results)
             return results
             
         except Exception as e:
-            print(f"Error processing batch: {e}")
+            log.error(f"Error processing batch: {e}")
             return {'error': str(e)}
     
     def start_processing(self):
@@ -283,14 +298,14 @@ class SmartLLMProcessor:
         self.is_running = True
         self.processing_thread = threading.Thread(target=self._processing_loop, daemon=True)
         self.processing_thread.start()
-        print("Smart LLM Processor started")
+        log.info("Smart LLM Processor started")
     
     def stop_processing(self):
         """Stop the background processing thread"""
         self.is_running = False
         if self.processing_thread:
             self.processing_thread.join()
-        print("Smart LLM Processor stopped")
+        log.info("Smart LLM Processor stopped")
     
     def _processing_loop(self):
         """Main processing loop"""
@@ -303,7 +318,7 @@ class SmartLLMProcessor:
                 time.sleep(self.processing_interval)
                 
             except Exception as e:
-                print(f"Error in processing loop: {e}")
+                log.error(f"Error in processing loop: {e}")
                 time.sleep(60)  # Wait a minute before retrying
     
     def get_processing_stats(self) -> Dict:
@@ -337,7 +352,7 @@ class SmartLLMProcessor:
             }
             
         except Exception as e:
-            print(f"Error getting stats: {e}")
+            log.error(f"Error getting stats: {e}")
             return {'error': str(e)}
 
 # Global processor instance
@@ -0,0 +1,623 @@
+"""
+Stress Test Engine for Kamioi Platform
+Built-in load generator behind /api/admin/business-stress-test/*.
+
+- N virtual users, each on its own thread, replay a weighted mix of
+  operations (dashboard reads, transaction inserts, bank-file uploads,
+  mapping submissions) for a fixed duration
+- Requests go through the Flask test client in-process, or over HTTP to a
+  running server (e.g. a local waitress started with start_local_server)
+- Reports throughput, per-operation latency percentiles, error rates and
+  SQLite write-lock waits (a probe measures how long BEGIN IMMEDIATE takes
+  to get the lock while the load runs)
+- Writes use two dedicated stress accounts whose rows are deleted after the
+  run; results are stored in stress_test_runs for trend comparison
+- HTTP mode sends real admin and user tokens, so base_url must point at
+  localhost or a host listed in STRESS_TEST_ALLOWED_HOSTS
+
+    python stress_test.py --scenario mixed --users 8 --duration 30
+    python stress_test.py --scenario dashboard_reads --http http://127.0.0.1:5111
+"""
+
+import io
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from utils.latency_histogram import LatencyHistogram
+from utils.log import get_logger
+
+log = get_logger('stress_test')
+
+STRESS_INDIVIDUAL_EMAIL = 'stress-individual@kamioi.local'
+STRESS_BUSINESS_EMAIL = 'stress-business@kamioi.local'
+MAX_USERS = 64
+MAX_DURATION_SECONDS = 600
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def allowed_hosts() -> List[str]:
+    """Hosts http mode may target: localhost plus STRESS_TEST_ALLOWED_HOSTS (comma separated)"""
+    extra = [h.strip().lower() for h in os.getenv('STRESS_TEST_ALLOWED_HOSTS', '').split(',') if h.strip()]
+    return list(LOCAL_HOSTS) + extra
+
+
+# ----------------------------------------------------------------------
+# Operations and scenarios
+# ----------------------------------------------------------------------
+
+@dataclass
+class Operation:
+    name: str
+    category: str
+    method: str
+    path: str
+    token: str  # 'admin', 'individual' or 'business'
+    writes: bool = False
+    build: Optional[Callable] = None  # (rng, ctx) -> request kwargs (json=... / data=...)
+
+
+def _transaction_body(rng, ctx):
+    from benchmarks.synthetic import merchant_sample
+    merchant, _, category, _ = merchant_sample(rng)
+    return {'json': {'merchant': merchant, 'amount': round(rng.uniform(2, 200), 2), 'category': category,
+                     'description': 'stress test'}}
+
+
+def _upload_body(rng, ctx):
+    from benchmarks.synthetic import bank_statement_csv
+    return {'files': {'file': ('stress.csv', bank_statement_csv(20, seed=rng.randrange(1 << 30)))}}
+
+
+def _mapping_body(rng, ctx):
+    from benchmarks.synthetic import BRANDS, noisy_merchant
+    name, ticker, category, company = rng.choice(BRANDS)
+    return {'json': {'merchant_name': noisy_merchant(rng, name), 'ticker': ticker, 'category': category,
+                     'company_name': company, 'confidence': 0.9, 'user_id': ctx['individual_id']}}
+
+
+OPERATIONS = {op.name: op for op in [
+    Operation('admin_dashboard', 'Dashboard Reads', 'GET', '/api/admin/dashboard/overview', 'admin'),
+    Operation('user_transactions', 'Dashboard Reads', 'GET', '/api/user/transactions', 'individual'),
+    Operation('user_portfolio', 'Dashboard Reads', 'GET', '/api/user/portfolio', 'individual'),
+    Operation('business_dashboard', 'Dashboard Reads', 'GET', '/api/business/dashboard/overview', 'business'),
+    Operation('insert_transaction', 'Transaction Inserts', 'POST', '/api/user/transactions', 'individual',
+              writes=True, build=_transaction_body),
+    Operation('upload_bank_file', 'File Upload', 'POST', '/api/business/upload-bank-file', 'business',
+              writes=True, build=_upload_body),
+    Operation('submit_mapping', 'Mapping Submissions', 'POST', '/api/mappings/submit', 'individual',
+              writes=True, build=_mapping_body),
+]}
+
+SCENARIOS = {
+    'dashboard_reads': {'name': 'Dashboard Reads', 'mix': {
+        'admin_dashboard': 1, 'user_transactions': 3, 'user_portfolio': 3, 'business_dashboard': 2}},
+    'transaction_inserts': {'name': 'Transaction Inserts', 'mix': {'insert_transaction': 4, 'user_transactions': 1}},
+    'uploads': {'name': 'File Upload', 'mix': {'upload_bank_file': 1}},
+    'mapping_submissions': {'name': 'Mapping Submissions', 'mix': {'submit_mapping': 1}},
+    'mixed': {'name': 'Mixed Production Traffic', 'mix': {
+        'admin_dashboard': 1, 'user_transactions': 6, 'user_portfolio': 5, 'business_dashboard': 3,
+        'insert_transaction': 3, 'submit_mapping': 1, 'upload_bank_file': 1}},
+}
+
+
+def list_scenarios() -> List[Dict]:
+    return [{'id': key, 'name': spec['name'], 'operations': spec['mix'],
+             'writes': any(OPERATIONS[name].writes for name in spec['mix'])}
+            for key, spec in SCENARIOS.items()]
+
+
+@dataclass
+class StressTestConfig:
+    scenario: str = 'dashboard_reads'
+    users: int = 4
+    duration_seconds: float = 10.0
+    mode: str = 'inprocess'  # or 'http'
+    base_url: Optional[str] = None
+    think_time_ms: float = 0.0
+    seed: int = 1
+    admin_id: Optional[int] = None
+    cleanup: bool = True
+
+    def validate(self):
+        if self.scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{self.scenario}'")
+        if not 1 <= int(self.users) <= MAX_USERS:
+            raise ValueError(f"users must be between 1 and {MAX_USERS}")
+        if not 0 < float(self.duration_seconds) <= MAX_DURATION_SECONDS:
+            raise ValueError(f"duration_seconds must be between 0 and {MAX_DURATION_SECONDS}")
+        if self.mode not in ('inprocess', 'http'):
+            raise ValueError("mode must be 'inprocess' or 'http'")
+        if self.mode == 'http' and not self.base_url:
+            raise ValueError("base_url is required for http mode")
+        if self.mode == 'http':
+            url = urlsplit(self.base_url)
+            if url.scheme not in ('http', 'https') or (url.hostname or '').lower() not in allowed_hosts():
+                raise ValueError("base_url must be an http(s) URL on localhost or a host in STRESS_TEST_ALLOWED_HOSTS")
+
+
+# ----------------------------------------------------------------------
+# Transports
+# ----------------------------------------------------------------------
+
+class InProcessClient:
+    """Flask test client; one per virtual user"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, headers: Dict, json=None, files=None) -> Tuple[int, int, str]:
+        data = None
+        if files:
+            data = {key: (io.BytesIO(payload), filename) for key, (filename, payload) in files.items()}
+        response = self.client.open(path, method=method, headers=headers, json=json, data=data,
+                                    content_type='multipart/form-data' if files else None)
+        body = response.get_data()
+        return response.status_code, len(body), body[:300].decode('utf-8', 'replace')
+
+
+class HttpClient:
+    """Keep-alive HTTP session against a running server"""
+
+    def __init__(self, base_url: str, timeout: float = 60):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, headers: Dict, json=None, files=None) -> Tuple[int, int, str]:
+        response = self.session.request(method, self.base_url + path, headers=headers, json=json,
+                                        files=files, timeout=self.timeout)
+        return response.status_code, len(response.content), response.text[:300]
+
+
+def start_local_server(app, host: str = '127.0.0.1', port: int = 5111, threads: int = 16) -> str:
+    """Serve the app with waitress on a daemon thread; returns its base URL"""
+    from waitress import serve
+
+    thread = threading.Thread(target=serve, args=(app,), kwargs={'host': host, 'port': port, 'threads': threads},
+                              name='stress-test-waitress', daemon=True)
+    thread.start()
+    time.sleep(0.5)
+    return f"http://{host}:{port}"
+
+
+# ----------------------------------------------------------------------
+# Lock wait probe
+# ----------------------------------------------------------------------
+
+class LockWaitProbe:
+    """Samples how long it takes to acquire SQLite's write lock under load"""
+
+    def __init__(self, db_path: str, interval: float = 0.25):
+        self.db_path = db_path
+        self.interval = interval
+        self.waits = LatencyHistogram(recent_window=5000)
+        self.timeouts = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stress-lock-probe', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            while not self._stop.wait(self.interval):
+                started = time.perf_counter()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    self.waits.record(time.perf_counter() - started)
+                    conn.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    self.timeouts += 1
+        finally:
+            conn.close()
+
+    def summary(self) -> Dict:
+        snapshot = self.waits.snapshot()
+        return {'samples': snapshot['count'], 'p50_ms': self.waits.recent_percentile(50),
+                'p95_ms': self.waits.recent_percentile(95), 'max_ms': snapshot['max_ms'],
+                'probe_timeouts': self.timeouts}
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+@dataclass
+class _OpStats:
+    latency: LatencyHistogram = field(default_factory=lambda: LatencyHistogram(recent_window=20000))
+    requests: int = 0
+    errors: int = 0
+    lock_errors: int = 0
+    bytes_out: int = 0
+    last_error: Optional[str] = None
+
+
+class StressTestRunner:
+    """
+    Runs one stress test at a time on a background thread.
+
+    Example:
+        stress_test_runner.start(StressTestConfig(scenario='mixed', users=8, duration_seconds=30))
+        stress_test_runner.status()       # progress while running, results when done
+        stress_test_runner.history('mixed')
+    """
+
+    def __init__(self, app=None, db_manager=None):
+        self._app = app
+        self._db_manager = db_manager
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._state: Dict = {'status': 'idle'}
+        self._ops: Dict[str, _OpStats] = {}
+
+    def _get_db(self):
+        if self._db_manager is None:
+            from database_manager import db_manager, _ensure_db_manager
+            self._db_manager = db_manager or _ensure_db_manager()
+        return self._db_manager
+
+    def _get_app(self):
+        if self._app is None:
+            from flask import current_app
+            self._app = current_app._get_current_object()
+        return self._app
+
+    def _execute(self, conn, sql: str, params=None):
+        if getattr(self._get_db(), '_use_postgresql', False):
+            from sqlalchemy import text
+            return conn.execute(text(sql), params or {})
+        return conn.execute(sql, params or {})
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self, config: StressTestConfig) -> Dict:
+        config.validate()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise RuntimeError('A stress test is already running')
+            if config.mode == 'inprocess':
+                self._get_app()  # Resolve current_app while still inside the request
+            self._stop.clear()
+            self._ops = {}
+            self._state = {'status': 'running', 'config': asdict(config), 'started_at': datetime.now().isoformat()}
+            self._thread = threading.Thread(target=self._run_safely, args=(config,), name='stress-test', daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self, config: StressTestConfig) -> Dict:
+        """Synchronous run (CLI)"""
+        self.start(config)
+        self.wait()
+        return self.status()
+
+    def status(self) -> Dict:
+        with self._lock:
+            state = dict(self._state)
+        if state.get('status') == 'running':
+            state['progress'] = self._summarize(time.monotonic() - state.get('_started_monotonic', time.monotonic()))
+        state.pop('_started_monotonic', None)
+        return state
+
+    # -- execution -----------------------------------------------------
+
+    def _run_safely(self, config: StressTestConfig):
+        try:
+            result = self._run(config)
+            with self._lock:
+                self._state = {'status': 'completed', 'result': result}
+        except Exception as e:
+            log.exception("Stress test failed")
+            with self._lock:
+                self._state = {'status': 'failed', 'error': str(e), 'config': asdict(config)}
+
+    def _run(self, config: StressTestConfig) -> Dict:
+        spec = SCENARIOS[config.scenario]
+        writes = any(OPERATIONS[name].writes for name in spec['mix'])
+        ctx = self._prepare_accounts(config)
+
+        db = self._get_db()
+        probe = None
+        if not getattr(db, '_use_postgresql', False):
+            probe = LockWaitProbe(db.db_path)
+            probe.start()
+
+        started_at = datetime.now()
+        ctx['started_at'] = started_at.isoformat()
+        started = time.monotonic()
+        with self._lock:
+            self._state['_started_monotonic'] = started
+        deadline = started + float(config.duration_seconds)
+        workers = [threading.Thread(target=self._virtual_user, args=(config, spec['mix'], ctx, i, deadline),
+                                    name=f'stress-vu-{i}', daemon=True) for i in range(int(config.users))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        if probe is not None:
+            probe.stop()
+        if writes and config.cleanup:
+            self._cleanup(ctx)
+
+        result = self._summarize(elapsed)
+        result.update({
+            'scenario': config.scenario,
+            'scenario_name': spec['name'],
+            'mode': config.mode,
+            'users': int(config.users),
+            'duration_seconds': round(elapsed, 2),
+            'lock_waits': probe.summary() if probe else None,
+            'started_at': started_at.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+        })
+        result['id'] = self._store(result)
+        log.info("Stress test %s: %d requests, %.1f req/s, p95 %sms, %d errors", config.scenario,
+                 result['requests'], result['throughput_rps'], result['latency']['p95_ms'], result['errors'])
+        return result
+
+    def _virtual_user(self, config: StressTestConfig, mix: Dict[str, int], ctx: Dict, index: int, deadline: float):
+        rng = random.Random(config.seed * 1000 + index)
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        client = HttpClient(config.base_url) if config.mode == 'http' else InProcessClient(self._get_app())
+        think = config.think_time_ms / 1000.0
+
+        while time.monotonic() < deadline and not self._stop.is_set():
+            op = OPERATIONS[rng.choices(names, weights)[0]]
+            kwargs = op.build(rng, ctx) if op.build else {}
+            headers = {'Authorization': f"Bearer {ctx['tokens'][op.token]}"}
+            started = time.perf_counter()
+            try:
+                status, size, snippet = client.request(op.method, op.path, headers, **kwargs)
+                error = None if status < 400 else f"HTTP {status}: {snippet}"
+            except Exception as e:
+                status, size, error = 0, 0, f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+
+            stats = self._ops.get(op.name)
+            if stats is None:
+                with self._lock:
+                    stats = self._ops.setdefault(op.name, _OpStats())
+            stats.latency.record(elapsed)
+            with self._lock:
+                stats.requests += 1
+                stats.bytes_out += size
+                if error:
+                    stats.errors += 1
+                    stats.last_error = error[:300]
+                    if 'locked' in error.lower():
+                        stats.lock_errors += 1
+            if think:
+                time.sleep(think)
+
+    def _summarize(self, elapsed: float) -> Dict:
+        with self._lock:
+            ops = dict(self._ops)
+        overall = LatencyHistogram(recent_window=0)
+        operations = {}
+        requests = errors = lock_errors = 0
+        for name, stats in ops.items():
+            counts, count, total_ms, max_ms = stats.latency.state()
+            overall.merge_counts(counts, count, total_ms, max_ms)
+            requests += stats.requests
+            errors += stats.errors
+            lock_errors += stats.lock_errors
+            operations[name] = {
+                'category': OPERATIONS[name].category,
+                'requests': stats.requests,
+                'errors': stats.errors,
+                'error_rate': round(stats.errors / stats.requests, 4) if stats.requests else 0.0,
+                'throughput_rps': round(stats.requests / elapsed, 2) if elapsed > 0 else 0.0,
+                'p50_ms': _round(stats.latency.recent_percentile(50)),
+                'p95_ms': _round(stats.latency.recent_percentile(95)),
+                'p99_ms': _round(stats.latency.recent_percentile(99)),
+                'mean_ms': round(total_ms / count, 2) if count else None,
+                'max_ms': round(max_ms, 2),
+                'bytes_out': stats.bytes_out,
+                'last_error': stats.last_error
+            }
+        snapshot = overall.snapshot()
+        return {
+            'requests': requests,
+            'errors': errors,
+            'lock_errors': lock_errors,
+            'error_rate': round(errors / requests, 4) if requests else 0.0,
+            'throughput_rps': round(requests / elapsed, 2) if elapsed > 0 else 0.0,
+            'latency': {key: snapshot[key] for key in ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'max_ms')},
+            'operations': operations
+        }
+
+    # -- accounts, cleanup and storage ---------------------------------
+
+    def _prepare_accounts(self, config: StressTestConfig) -> Dict:
+        """Find or create the dedicated stress accounts and build tokens"""
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            ids = {}
+            for kind, email in (('individual', STRESS_INDIVIDUAL_EMAIL), ('business', STRESS_BUSINESS_EMAIL)):
+                row = self._execute(conn, "SELECT id FROM users WHERE email = :email", {'email': email}).fetchone()
+                if row is None:
+                    self._execute(conn, """
+                        INSERT INTO users (email, name, account_type, account_number, password)
+                        VALUES (:email, :name, :kind, :account_number, '!')
+                    """, {'email': email, 'name': f'Stress Test {kind.title()}', 'kind': kind,
+                          'account_number': f'STRESS-{kind.upper()}'})
+                    row = self._execute(conn, "SELECT id FROM users WHERE email = :email",
+                                        {'email': email}).fetchone()
+                ids[kind] = int(row[0])
+            conn.commit()
+            admin_id = config.admin_id
+            if admin_id is None:
+                admin_id = 1
+                try:
+                    row = self._execute(conn, "SELECT id FROM admins ORDER BY id LIMIT 1").fetchone()
+                    admin_id = int(row[0]) if row else 1
+                except Exception:
+                    conn.rollback()  # No admins table on a bare schema; admin reads will just 401
+        finally:
+            db.release_connection(conn)
+        return {
+            'individual_id': ids['individual'],
+            'business_id': ids['business'],
+            'tokens': {'admin': f'admin_token_{admin_id}', 'individual': f"user_token_{ids['individual']}",
+                       'business': f"business_token_{ids['business']}"}
+        }
+
+    def _cleanup(self, ctx: Dict):
+        """Delete everything the stress accounts wrote"""
+        user_ids = [ctx['individual_id'], ctx['business_id']]
+        params = {'u0': user_ids[0], 'u1': user_ids[1], 's0': str(user_ids[0]), 's1': str(user_ids[1]),
+                  'started_at': ctx['started_at']}
+        # Journal entries carry the acting user id in created_by; only this run's are the stress accounts'
+        stress_entries = "SELECT id FROM journal_entries WHERE created_by IN (:s0, :s1) AND created_at >= :started_at"
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            self._execute(conn, f"DELETE FROM journal_entry_lines WHERE journal_entry_id IN ({stress_entries})", params)
+            self._execute(conn, f"DELETE FROM journal_entries WHERE id IN ({stress_entries})", params)
+            self._execute(conn, "DELETE FROM roundup_ledger WHERE user_id IN (:u0, :u1)", params)
+            self._execute(conn, "DELETE FROM market_queue WHERE user_id IN (:u0, :u1)", params)
+            self._execute(conn, "DELETE FROM llm_mappings WHERE user_id IN (:s0, :s1)", params)
+            self._execute(conn, "DELETE FROM positions WHERE user_id IN (:u0, :u1)", params)
+            self._execute(conn, "DELETE FROM transactions WHERE user_id IN (:u0, :u1)", params)
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+        # The round-up engine's cached running balances summed the deleted ledger rows
+        from roundup_engine import roundup_engine
+        for user_id in user_ids:
+            roundup_engine.forget_user(user_id)
+
+    def _store(self, result: Dict) -> Optional[int]:
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            params = {
+                'scenario': result['scenario'], 'mode': result['mode'], 'users': result['users'],
+                'duration': result['duration_seconds'], 'requests': result['requests'], 'errors': result['errors'],
+                'rps': result['throughput_rps'], 'p50': result['latency']['p50_ms'],
+                'p95': result['latency']['p95_ms'], 'p99': result['latency']['p99_ms'],
+                'lock_p95': (result['lock_waits'] or {}).get('p95_ms'),
+                'result_json': json.dumps(result, default=str),
+                'started_at': result['started_at'], 'finished_at': result['finished_at']
+            }
+            self._execute(conn, """
+                INSERT INTO stress_test_runs (scenario, mode, users, duration_seconds, requests, errors,
+                                              throughput_rps, p50_ms, p95_ms, p99_ms, lock_wait_p95_ms,
+                                              result_json, started_at, finished_at)
+                VALUES (:scenario, :mode, :users, :duration, :requests, :errors, :rps, :p50, :p95, :p99,
+                        :lock_p95, :result_json, :started_at, :finished_at)
+            """, params)
+            row = self._execute(conn, "SELECT MAX(id) FROM stress_test_runs").fetchone()
+            conn.commit()
+            return int(row[0]) if row and row[0] is not None else None
+        except Exception as e:
+            log.warning("Could not store stress test result: %s", e)
+            return None
+        finally:
+            db.release_connection(conn)
+
+    def history(self, scenario: str = None, limit: int = 20) -> List[Dict]:
+        """Recent runs (newest first) for trend comparison"""
+        params = {'limit': int(limit)}
+        where = ''
+        if scenario:
+            where = 'WHERE scenario = :scenario'
+            params['scenario'] = scenario
+        db = self._get_db()
+        conn = db.get_connection()
+        try:
+            rows = self._execute(conn, f"""
+                SELECT id, scenario, mode, users, duration_seconds, requests, errors, throughput_rps,
+                       p50_ms, p95_ms, p99_ms, lock_wait_p95_ms, started_at
+                FROM stress_test_runs {where}
+                ORDER BY started_at DESC, id DESC
+                LIMIT :limit
+            """, params).fetchall()
+        finally:
+            db.release_connection(conn)
+        keys = ('id', 'scenario', 'mode', 'users', 'duration_seconds', 'requests', 'errors', 'throughput_rps',
+                'p50_ms', 'p95_ms', 'p99_ms', 'lock_wait_p95_ms', 'started_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def category_summary(self) -> List[Dict]:
+        """Latest run per scenario, shaped for the stress-test dashboard cards"""
+        latest = {}
+        for run in self.history(limit=200):
+            latest.setdefault(run['scenario'], run)
+        categories = []
+        for index, scenario in enumerate(list_scenarios(), start=1):
+            run = latest.get(scenario['id'])
+            if run is None:
+                status = 'not_run'
+            elif run['requests'] and run['errors'] / run['requests'] > 0.05:
+                status = 'failed'
+            elif run['requests'] and run['errors']:
+                status = 'warning'
+            else:
+                status = 'passed'
+            categories.append({'id': index, 'key': scenario['id'], 'name': scenario['name'],
+                               'operations': scenario['operations'], 'writes': scenario['writes'],
+                               'status': status, 'last_run': run})
+        return categories
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+# Global runner (the app is resolved from the request that starts a run)
+stress_test_runner = StressTestRunner()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a stress test against the Kamioi app')
+    parser.add_argument('--scenario', default='dashboard_reads', choices=sorted(SCENARIOS))
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--think-time-ms', type=float, default=0)
+    parser.add_argument('--http', metavar='BASE_URL', help='Target a running server instead of in-process')
+    parser.add_argument('--waitress-port', type=int, help='Start a local waitress server on this port and target it')
+    parser.add_argument('--keep-data', action='store_true', help="Don't delete rows written by the stress accounts")
+    args = parser.parse_args()
+
+    from app import app as flask_app
+
+    base_url = args.http
+    if args.waitress_port:
+        base_url = start_local_server(flask_app, port=args.waitress_port)
+    runner = StressTestRunner(app=flask_app)
+    outcome = runner.run(StressTestConfig(
+        scenario=args.scenario, users=args.users, duration_seconds=args.duration,
+        mode='http' if base_url else 'inprocess', base_url=base_url,
+        think_time_ms=args.think_time_ms, cleanup=not args.keep_data))
+    print(json.dumps(outcome, indent=2, default=str))
@@ -0,0 +1,115 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import ai_fee_engine
+from ai_fee_engine import AIFeeEngine
+
+
+def _build(path, users=40, seed=11):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, account_type TEXT, current_tier INTEGER,
+                            monthly_transaction_count INTEGER, loyalty_score REAL, risk_profile TEXT,
+                            ai_fee_multiplier REAL, total_lifetime_transactions INTEGER,
+                            avg_monthly_transactions REAL, created_at TEXT);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER, amount REAL, fee REAL,
+                                   created_at TEXT, status TEXT);
+        CREATE TABLE fee_tiers (id INTEGER PRIMARY KEY, account_type TEXT, tier_level INTEGER,
+                                min_transactions INTEGER, max_transactions INTEGER, base_fee REAL,
+                                is_active BOOLEAN DEFAULT 1);
+        CREATE TABLE market_conditions (id INTEGER PRIMARY KEY, date TEXT, volatility REAL, competitor_fees TEXT,
+                                        market_sentiment TEXT, ai_recommendations TEXT);
+        CREATE TABLE ai_fee_history (id INTEGER PRIMARY KEY, user_id INTEGER, transaction_id INTEGER, base_fee REAL,
+                                     ai_adjustments TEXT, final_fee REAL, ai_factors TEXT, tier_at_time INTEGER,
+                                     loyalty_score_at_time REAL);
+    """)
+    tiers = [('individual', 1, 0, 10, 0.25), ('individual', 2, 11, 25, 0.20), ('individual', 3, 26, None, 0.15),
+             ('business', 1, 0, 20, 0.10), ('business', 2, 21, None, 0.08)]
+    conn.executemany("INSERT INTO fee_tiers (account_type, tier_level, min_transactions, max_transactions, base_fee) "
+                     "VALUES (?, ?, ?, ?, ?)", tiers)
+    conn.execute("INSERT INTO market_conditions (date, volatility, competitor_fees, market_sentiment) "
+                 "VALUES ('2024-06-01', 0.03, '{\"a\": 0.25, \"b\": 0.3}', 'positive')")
+    now = datetime.now()
+    for user_id in range(1, users + 1):
+        conn.execute("INSERT INTO users VALUES (?, ?, ?, 1, ?, 0.5, 'medium', 1.0, ?, ?, ?)", (
+            user_id, f'u{user_id}@example.com', rng.choice(['individual', 'family', 'business']),
+            rng.randint(0, 70), rng.randint(0, 300), rng.choice([0, 4.0, 20.0, 60.0]),
+            (now - timedelta(days=rng.randint(0, 800))).isoformat()))
+        for n in range(rng.choice([0, 1, 5, 60])):
+            conn.execute("INSERT INTO transactions (user_id, amount, fee, created_at, status) VALUES (?, ?, 0.25, ?, 'mapped')",
+                         (user_id, rng.choice([0, rng.uniform(1, 120)]), (now - timedelta(hours=n)).isoformat()))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'fees.db')
+    _build(path)
+    return path
+
+
+def _history_count(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM ai_fee_history").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_batch_matches_single_calculations(db_path):
+    rng = random.Random(3)
+    user_ids = [rng.randint(1, 42) for _ in range(120)]  # 41 and 42 do not exist
+    amounts = [rng.uniform(1, 200) for _ in user_ids]
+    roundups = [rng.choice([0.25, 0.5, 1.0]) for _ in user_ids]
+
+    batch = AIFeeEngine(db_path).calculate_fees_batch(user_ids, amounts, roundups, store_history=False)
+    engine = AIFeeEngine(db_path, history_flush_size=10 ** 6)
+    single = [engine.calculate_optimal_fee(u, a, r) for u, a, r in zip(user_ids, amounts, roundups)]
+
+    assert len(batch) == len(single)
+    for got, want in zip(batch, single):
+        assert got['final_fee'] == want['final_fee']
+        assert got['base_fee'] == want['base_fee']
+        assert got['tier_level'] == want['tier_level']
+        assert got['recommendation'] == want['recommendation']
+        assert got['ai_adjustments'] == pytest.approx(want['ai_adjustments'])
+        if want['ai_factors']:  # Empty for the fallback
+            got_behavior, want_behavior = got['ai_factors']['behavior_analysis'], want['ai_factors']['behavior_analysis']
+            assert got_behavior['consistency_score'] == pytest.approx(want_behavior['consistency_score'])
+            assert got_behavior['activity_level'] == want_behavior['activity_level']
+            assert got_behavior['risk_level'] == want_behavior['risk_level']
+            assert got['ai_factors']['loyalty_score'] == pytest.approx(want['ai_factors']['loyalty_score'])
+            assert got['ai_factors']['retention_risk'] == pytest.approx(want['ai_factors']['retention_risk'])
+
+
+def test_batch_buffers_history_into_one_write(db_path, monkeypatch):
+    engine = AIFeeEngine(db_path)
+    engine.calculate_fees_batch([1, 2, 3], [10, 20, 30], [1, 1, 1], store_history=False)  # warm the caches
+
+    connects = []
+    real_connect = sqlite3.connect
+    monkeypatch.setattr(ai_fee_engine.sqlite3, 'connect', lambda *a, **k: connects.append(a) or real_connect(*a, **k))
+    results = engine.calculate_fees_batch([1, 2, 3] * 100, [10.0] * 300, [1.0] * 300)
+
+    assert len(results) == 300
+    assert len(connects) == 1  # just the history flush
+    conn = real_connect(db_path)
+    with_transactions = conn.execute("SELECT COUNT(DISTINCT user_id) FROM transactions WHERE user_id IN (1, 2, 3)").fetchone()[0]
+    conn.close()
+    assert _history_count(db_path) == with_transactions * 100
+
+
+def test_feature_cache_expires(db_path):
+    engine = AIFeeEngine(db_path, feature_ttl=60)
+    first = engine._get_user_profile(5)
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE users SET monthly_transaction_count = 999 WHERE id = 5")
+    conn.commit()
+    conn.close()
+    assert engine._get_user_profile(5)['monthly_transaction_count'] == first['monthly_transaction_count']
+    engine.invalidate(5)
+    assert engine._get_user_profile(5)['monthly_transaction_count'] == 999
@@ -55,3 +55,79 @@ def test_admin_with_token(client):
     assert resp.status_code == 200
     data = resp.get_json()
     assert data['success'] is True
+
+
+def test_revenue_recognition_requires_admin_and_bounds_the_range(client, monkeypatch):
+    url = '/api/admin/subscriptions/process-daily-recognition'
+    resp = client.post(url, json={})
+    assert resp.status_code in (401, 403)
+
+    monkeypatch.setattr(app_module, 'require_role', lambda role: (True, None))
+    resp = client.post(url, json={'start_date': '2020-01-01', 'end_date': '2024-12-31'})
+    assert resp.status_code == 400
+    assert 'limited' in resp.get_json()['error']
+    resp = client.post(url, json={'start_date': 'yesterday'})
+    assert resp.status_code == 400
+
+
+def test_metrics_is_denied_without_a_configured_token(client, monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+
+def test_llm_approval_without_a_price_stays_pending_and_is_queued(client, monkeypatch, tmp_path):
+    import sqlite3
+
+    from database_manager import DatabaseManager
+    from order_netting import order_netting_engine
+    from price_history import price_history_store
+
+    db = DatabaseManager(str(tmp_path / 'approve.db'))
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("INSERT INTO users (id, name, email, account_type) VALUES (7, 'Ada', 'ada@example.com', 'individual')")
+    conn.execute("INSERT INTO transactions (id, user_id, date, merchant, amount, total_debit, status) "
+                 "VALUES (70, 7, '2024-05-01', 'Nike', 12.5, 12.5, 'pending')")
+    conn.execute("INSERT INTO llm_mappings (id, transaction_id, merchant_name, ticker) VALUES (700, 70, 'Nike', 'NKE')")
+    conn.commit()
+    conn.close()
+    queued = []
+    monkeypatch.setattr(app_module, 'db_manager', db)
+    monkeypatch.setattr(app_module, 'require_role', lambda role: (True, None))
+    monkeypatch.setattr(price_history_store, 'get_latest_prices', lambda tickers: {})
+    monkeypatch.setattr(order_netting_engine, 'enqueue', lambda orders: queued.extend(orders) or len(orders))
+
+    resp = client.post('/api/admin/llm-center/approve', json={'mapping_id': 700})
+    assert resp.status_code == 200
+    details = resp.get_json()['investment_details']
+    assert details['status'] == 'pending' and details['order_id'] is None
+    assert queued == [{'transaction_id': 70, 'user_id': 7, 'ticker': 'NKE', 'amount': 1.0}]
+    conn = sqlite3.connect(db.db_path)
+    assert conn.execute("SELECT status, shares FROM transactions WHERE id = 70").fetchone() == ('mapped', None)
+    assert conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0] == 0
+    conn.close()
+
+
+def test_profile_update_drops_the_cached_principal(monkeypatch, tmp_path):
+    import sqlite3
+
+    from database_manager import DatabaseManager
+    from utils.auth_cache import principal_cache
+
+    db = DatabaseManager(str(tmp_path / 'profile.db'))
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("INSERT INTO users (id, name, email, account_type) VALUES (7, 'Ada', 'ada@example.com', 'individual')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(app_module, 'db_manager', db)
+    monkeypatch.setattr(app_module, 'get_auth_user', lambda: {'id': 7, 'email': 'ada@example.com'})
+    principal_cache.put('profile-token', {'id': 7, 'email': 'ada@example.com', 'name': 'Ada'}, kind='user')
+
+    # The user blueprint's PUT /api/user/profile is registered first; call app.py's handler itself
+    with app.test_request_context('/api/user/profile', method='PUT', json={'name': 'Ada Lovelace'}):
+        resp = app_module.user_profile()
+    assert resp.get_json()['success'] is True
+    assert principal_cache.get('profile-token') is None
@@ -0,0 +1,53 @@
+import time
+
+import jwt
+import pytest
+
+from utils.auth_cache import JWTDecodeCache, PrincipalCache
+
+
+def test_principal_cache_ttl_and_lru():
+    cache = PrincipalCache(ttl=0.05, max_entries=2)
+    cache.put('token_1', {'id': 1})
+    cache.put('token_2', {'id': 2})
+    assert cache.get('token_1') == {'id': 1}
+    cache.put('token_3', {'id': 3})  # Evicts token_2, the least recently used
+    assert cache.get('token_2') is None
+    assert cache.get('token_3') == {'id': 3}
+    time.sleep(0.06)
+    assert cache.get('token_1') is None
+
+
+def test_principal_cache_invalidation():
+    cache = PrincipalCache(ttl=60)
+    cache.put('token_5', {'id': 5, 'email': 'a@b.com'}, kind='user')
+    cache.put('user_token_5', {'id': 5, 'email': 'a@b.com'}, kind='user')
+    cache.put('admin_token_5', {'id': 5, 'email': 'admin@b.com'}, kind='admin')
+
+    cache.invalidate('user', principal_id=5)
+    assert cache.get('token_5') is None and cache.get('user_token_5') is None
+    assert cache.get('admin_token_5') is not None
+
+    cache.invalidate('admin', email='ADMIN@b.com')
+    assert cache.get('admin_token_5') is None
+
+    cache.put('token_6', {'id': 6})
+    cache.invalidate_token('token_6')
+    assert cache.get('token_6') is None
+
+
+def test_jwt_decode_memoized_until_expiry(monkeypatch):
+    cache = JWTDecodeCache()
+    token = jwt.encode({'user_id': 7, 'exp': int(time.time()) + 60}, 'secret', algorithm='HS256')
+    assert cache.decode(token, 'secret')['user_id'] == 7
+
+    calls = []
+    monkeypatch.setattr(jwt, 'decode', lambda *a, **k: calls.append(a))
+    assert cache.decode(token, 'secret')['user_id'] == 7
+    assert calls == []
+
+
+def test_jwt_decode_rejects_bad_signature():
+    token = jwt.encode({'user_id': 7}, 'secret', algorithm='HS256')
+    with pytest.raises(jwt.InvalidTokenError):
+        JWTDecodeCache().decode(token, 'other-secret')
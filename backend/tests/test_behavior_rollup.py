@@ -0,0 +1,98 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from behavior_rollup import BehaviorRollup
+from market_monitor import MarketMonitor
+from schema_migrations import MIGRATIONS
+
+
+def _insert(conn, rng, count, days_back=45):
+    now = datetime.utcnow()
+    conn.executemany("INSERT INTO transactions (user_id, amount, round_up, fee, created_at) VALUES (?, ?, ?, ?, ?)", [
+        (rng.randint(1, 25), rng.choice([0, round(rng.uniform(1, 150), 2)]), rng.choice([0, 0.5, 1.0]),
+         rng.choice([None, 0, 0.25, 0.3, 0.1]),
+         (now - timedelta(days=rng.randint(0, days_back), minutes=rng.randint(0, 1400))).strftime('%Y-%m-%d %H:%M:%S'))
+        for _ in range(count)])
+    conn.commit()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'rollup.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, amount REAL, "
+                 "round_up REAL, fee REAL, created_at TIMESTAMP)")
+    for step in next(m for m in MIGRATIONS if m.name == 'daily_behavior_rollup').sqlite:
+        conn.execute(step)
+    _insert(conn, random.Random(4), 600)
+    conn.close()
+    return path
+
+
+def _raw_trends(path):
+    """The figures MarketMonitor used to compute by rescanning the raw transactions"""
+    conn = sqlite3.connect(path)
+    daily = conn.execute("""
+        SELECT DATE(created_at), COUNT(*), AVG(amount), AVG(fee) FROM transactions
+        WHERE created_at >= date('now', '-30 days') GROUP BY DATE(created_at) ORDER BY 1
+    """).fetchall()
+    rows = conn.execute("SELECT amount, fee FROM transactions WHERE created_at >= date('now', '-30 days')").fetchall()
+    conn.close()
+
+    def growth(values):
+        half = len(values) // 2
+        first, second = sum(values[:half]) / half, sum(values[half:]) / (len(values) - half)
+        return (second - first) / first if first else 0.0
+
+    def cv(values):
+        return np.std(values) / np.mean(values)
+
+    counts = [d[1] for d in daily]
+    return {
+        'transaction_growth_rate': growth(counts),
+        'amount_growth_rate': growth([d[2] for d in daily if d[2]]),
+        'fee_growth_rate': growth([d[3] for d in daily if d[3]]),
+        'volatility_score': min(1.0, np.std(counts) / np.mean(counts)),
+        'volatility': min(0.1, max(0.01, (cv([r[1] for r in rows if r[1]]) + cv([r[0] for r in rows if r[0]])) / 2)),
+    }
+
+
+def _monitor(path, monkeypatch):
+    monkeypatch.setattr('price_history.price_history_store.get_volatility', lambda tickers: None, raising=False)
+    return MarketMonitor(path)
+
+
+def test_rollup_figures_match_a_raw_rescan(db_path, monkeypatch):
+    monitor = _monitor(db_path, monkeypatch)
+    monitor.rollup.refresh()
+    trends = monitor._analyze_user_behavior_trends()
+    expected = _raw_trends(db_path)
+
+    for key in ('transaction_growth_rate', 'amount_growth_rate', 'fee_growth_rate', 'volatility_score'):
+        assert trends[key] == pytest.approx(expected[key])
+    assert monitor._calculate_market_volatility() == pytest.approx(expected['volatility'])
+
+
+def test_refresh_only_recomputes_touched_days_and_matches_rebuild(db_path):
+    rollup = BehaviorRollup(db_path)
+    assert rollup.refresh()['days_recomputed'] > 30
+    assert rollup.refresh()['days_recomputed'] == 1  # nothing new: just today
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO transactions (user_id, amount, round_up, fee, created_at) VALUES (3, 12.5, 1.0, 0.25, ?)",
+                 ((datetime.utcnow() - timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S'),))
+    conn.commit()
+    conn.close()
+    assert rollup.refresh()['days_recomputed'] == 2
+
+    incremental = rollup.series(60)
+    rollup.rebuild()
+    rebuilt = rollup.series(60)
+    assert incremental['day'] == rebuilt['day']
+    for key, values in rebuilt.items():
+        if key != 'day':
+            np.testing.assert_allclose(incremental[key], values)
@@ -0,0 +1,50 @@
+import sqlite3
+
+from benchmarks import harness, synthetic
+
+
+def _digest(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [conn.execute(f"SELECT COUNT(*), TOTAL(LENGTH({column})) FROM {table}").fetchone()
+                for table, column in (('users', 'email'), ('transactions', 'merchant || amount'),
+                                      ('llm_mappings', 'merchant_name || ticker'))]
+    finally:
+        conn.close()
+
+
+def test_synthetic_data_is_deterministic(tmp_path):
+    first = synthetic.generate(str(tmp_path / 'a.db'), scale='10k', seed=3)
+    synthetic.generate(str(tmp_path / 'b.db'), scale='10k', seed=3)
+
+    assert first['transactions'] == 10_000
+    assert _digest(str(tmp_path / 'a.db')) == _digest(str(tmp_path / 'b.db'))
+    assert synthetic.bank_statement_csv(5, seed=1) == synthetic.bank_statement_csv(5, seed=1)
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {'meta': {'scale': '10k'}, 'results': {
+        'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}, 'c': {'median_ms': 0.01}}}
+    current = {'meta': {'scale': '10k'}, 'results': {
+        'a': {'median_ms': 13.0}, 'b': {'median_ms': 7.0}, 'c': {'median_ms': 0.02}, 'd': {'median_ms': 1.0}}}
+
+    comparison = harness.compare(current, baseline, tolerance=0.2)
+    assert [r['name'] for r in comparison['regressions']] == ['a']
+    assert [r['name'] for r in comparison['improvements']] == ['b']
+    assert [r['name'] for r in comparison['unchanged']] == ['c']  # Below min_delta_ms
+    assert comparison['missing'] == ['d']
+
+
+def test_run_benchmark_reports_statistics():
+    result = harness.run_benchmark(harness.Benchmark('noop', lambda: None, repeat=3, number=10))
+    assert result['repeat'] == 3 and result['median_ms'] >= 0
+
+
+def test_default_database_paths_follow_kamioi_db_path(tmp_path, monkeypatch):
+    from ai_fee_engine import AIFeeEngine
+    from behavior_rollup import BehaviorRollup
+    from llm_assets_manager import LLMAssetManager
+
+    scratch = str(tmp_path / 'bench.db')
+    monkeypatch.setenv('KAMIOI_DB_PATH', scratch)
+    assert AIFeeEngine().db_path == BehaviorRollup().db_path == LLMAssetManager().db_path == scratch
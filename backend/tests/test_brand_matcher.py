@@ -0,0 +1,94 @@
+import random
+import re
+
+import pytest
+
+from services.brand_matcher import AhoCorasick, BrandMatcher, Phrase, compile_matcher
+from services.receipt_processing_service import ReceiptProcessingService
+
+
+def test_automaton_finds_every_overlapping_occurrence():
+    patterns = ['ab', 'abc', 'bca', 'c', 'aa', 'cab']
+    automaton = AhoCorasick(patterns)
+    rng = random.Random(7)
+    for _ in range(500):
+        text = ''.join(rng.choice('abc') for _ in range(24))
+        expected = sorted((m.start(), m.start() + len(p), i)
+                          for i, p in enumerate(patterns) for m in re.finditer(f'(?={p})', text))
+        assert sorted(automaton.find(text)) == expected
+
+
+def test_scan_picks_best_priority_per_text_and_respects_word_boundaries():
+    matcher = BrandMatcher([
+        Phrase('nike', 'brand', 1, False, {'symbol': 'NKE'}),
+        Phrase('nike store', 'brand', 0, False, {'symbol': 'NKE-STORE'}),
+        Phrase('hp', 'pattern', 0, True, {'symbol': 'HPQ'}),
+    ])
+    hits = matcher.scan(['NIKE   Store #12', 'Nike socks', 'HP Envy 13', 'Shampoo'])
+    assert hits[0]['brand'].payload['symbol'] == 'NKE-STORE'
+    assert hits[1]['brand'].payload['symbol'] == 'NKE'
+    assert hits[2]['pattern'].payload['symbol'] == 'HPQ'
+    assert hits[3] == {}
+
+
+def test_compiled_matcher_is_reused_until_phrases_change(tmp_path, monkeypatch):
+    path = str(tmp_path / 'matcher.json')
+    phrases = [Phrase('target', 'retailer', 0, False, {'symbol': 'TGT'})]
+    first = compile_matcher(phrases, path)
+
+    saved = []
+    monkeypatch.setattr(BrandMatcher, 'save', lambda self, p: saved.append(p))
+    assert compile_matcher(phrases, path).fingerprint == first.fingerprint
+    assert saved == []  # loaded from the artifact, not rebuilt
+    monkeypatch.undo()
+
+    changed = compile_matcher(phrases + [Phrase('costco', 'retailer', 1, False, {'symbol': 'COST'})], path)
+    assert changed.fingerprint != first.fingerprint
+    loaded = BrandMatcher.load(path)
+    assert loaded.fingerprint == changed.fingerprint
+    assert loaded.scan_text('COSTCO #4')['retailer'].payload == {'symbol': 'COST'}
+
+
+def test_tampered_artifact_is_ignored(tmp_path):
+    path = tmp_path / 'matcher.json'
+    compile_matcher([Phrase('target', 'retailer', 0, False, {'symbol': 'TGT'})], str(path))
+    path.write_text(path.read_text().replace('TGT', 'EVIL'))
+    assert BrandMatcher.load(str(path)) is None
+    path.write_bytes(b'\x80\x04not json')
+    assert BrandMatcher.load(str(path)) is None
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv('BRAND_MATCHER_PATH', str(tmp_path / 'matcher.json'))
+    learned = [{'merchant_name': 'Blue Bottle', 'ticker': 'NSRGY', 'company_name': 'Nestle',
+                'category': 'Brand', 'mapping_data': {}}]
+    monkeypatch.setattr(ReceiptProcessingService, '_load_learned_mappings', lambda self: list(learned))
+    monkeypatch.setattr(ReceiptProcessingService, '_learned_mappings_signature', lambda self: (len(learned),))
+    svc = ReceiptProcessingService()
+    svc.learned = learned
+    return svc
+
+
+def test_receipt_items_resolve_from_one_scan(service):
+    parsed = service.parse_receipt_text("COSTCO WHOLESALE\nNIKE AIR MAX 89.99\nBLUE BOTTLE BEANS 14.99\nTOTAL 104.98")
+    assert parsed['retailer'] == {'name': 'Costco', 'stockSymbol': 'COST'}
+
+    items = [{'name': 'HP ENVY LAPTOP'}, {'name': 'Blue Bottle Beans'}, {'name': 'DEBIT TEND'}, {'name': 'Milk'}]
+    service.map_receipt({'items': items}, '', skip_llm_enhancement=True)
+    assert items[0]['brandSymbol'] == 'HPQ' and items[0]['brand_confidence'] == 0.98
+    assert items[1]['brandSymbol'] == 'NSRGY'  # learned brand
+    assert 'brand' not in items[2]
+    assert items[3]['brand_source'] == 'none'
+
+
+def test_new_approvals_recompile_the_matcher(service, monkeypatch):
+    items = [{'name': 'Oatly Barista'}]
+    assert not service._identify_brands_from_items(items)
+
+    service.learned.append({'merchant_name': 'Oatly', 'ticker': 'OTLY', 'company_name': 'Oatly Group',
+                            'category': 'Brand', 'mapping_data': {}})
+    assert service.refresh_learned_mappings() is False  # throttled
+    monkeypatch.setattr('services.receipt_processing_service.LEARNED_MAPPINGS_REFRESH_SECONDS', 0)
+    assert service.refresh_learned_mappings() is True
+    assert service._identify_brands_from_items(items) == [{'name': 'Oatly', 'stockSymbol': 'OTLY'}]
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+from database_manager import DatabaseManager
+from journal_ledger import InvalidCursor, JournalLedger
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '1')
+    db = DatabaseManager(str(tmp_path / 'journal.db'))
+    conn = sqlite3.connect(db.db_path)
+    for n in range(25):
+        entry_id = f'JE-{n:03d}'
+        conn.execute("INSERT INTO journal_entries (id, date, reference, description, transaction_type, amount, "
+                     "from_account, to_account, status, created_at, created_by) "
+                     "VALUES (?, ?, ?, 'Fee: card | refund', 'manual', ?, '10100', ?, 'posted', ?, '1')",
+                     (entry_id, f'2024-06-{n % 10 + 1:02d}', f'REF-{n}', float(n), '40100' if n % 2 else '23010',
+                      f'2024-06-{n // 5 + 1:02d}T10:00:00'))  # five entries share each created_at
+        conn.executemany("INSERT INTO journal_entry_lines (journal_entry_id, account_code, debit, credit, description, "
+                         "created_at) VALUES (?, ?, ?, ?, 'a:b|c', '2024-06-01')",
+                         [(entry_id, '10100', float(n), 0), (entry_id, '99999' if n == 7 else '40100', 0, float(n))])
+    conn.commit()
+    conn.close()
+    return JournalLedger(db)
+
+
+def test_keyset_pages_cover_every_entry_once_in_order(ledger):
+    seen, cursor = [], None
+    while True:
+        page = ledger.list_entries(limit=4, cursor=cursor)
+        seen.extend(page['entries'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    keys = [(e['created_at'], e['id']) for e in seen]
+    assert keys == sorted(keys, reverse=True) and len(set(keys)) == 25
+    assert seen[0]['lines'] == [
+        {'account_code': '10100', 'debit': 24.0, 'credit': 0.0, 'description': 'a:b|c'},
+        {'account_code': '40100', 'debit': 0.0, 'credit': 24.0, 'description': 'a:b|c'},
+    ]
+
+
+def test_filters_and_bad_cursor(ledger):
+    by_date = ledger.list_entries(date_from='2024-06-02', date_to='2024-06-03')['entries']
+    assert sorted(e['id'] for e in by_date) == ['JE-001', 'JE-002', 'JE-011', 'JE-012', 'JE-021', 'JE-022']
+    assert [e['id'] for e in ledger.list_entries(account='99999')['entries']] == ['JE-007']
+    assert len(ledger.list_entries(account='23010')['entries']) == 13  # to_account on even entries
+    with pytest.raises(InvalidCursor):
+        ledger.list_entries(cursor='not-a-cursor')
@@ -0,0 +1,47 @@
+import sys
+
+import pytest
+
+from benchmarks import startup
+from utils.lazy_import import LazyObject, is_loaded, lazy_module
+
+
+def test_lazy_module_loads_on_first_attribute(monkeypatch):
+    monkeypatch.delitem(sys.modules, 'colorsys', raising=False)
+    module = lazy_module('colorsys')
+    assert not is_loaded('colorsys')
+    assert module.rgb_to_hsv(1, 0, 0)[0] == 0
+    assert is_loaded('colorsys')
+
+    with pytest.raises(ImportError):
+        lazy_module('kamioi_not_a_module')
+
+
+def test_lazy_object_builds_once():
+    built = []
+
+    def factory():
+        built.append(1)
+        return {'ready': True}
+
+    service = LazyObject(factory)
+    assert not service.initialized and built == []
+    assert service.get('ready') and service.get('ready')
+    assert built == [1]
+
+
+def test_parse_importtime():
+    text = ("import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     numpy.core\n"
+            "import time:      2000 |       2120 |   numpy\n"
+            "import time:      5000 |       7120 | app\n")
+    modules = startup.parse_importtime(text)
+    assert [(m['module'], m['depth']) for m in modules] == [('numpy.core', 2), ('numpy', 1), ('app', 0)]
+    assert startup.summarize(modules, top=1)['top_self'][0]['module'] == 'app'
+    assert startup.summarize(modules)['total_ms'] == 7.1
+
+
+def test_app_startup_does_not_load_heavy_modules(tmp_path):
+    result = startup.time_to_first_request('/api/health', runs=1, db_path=str(tmp_path / 'startup.db'))
+    assert result['status'] == 200
+    assert result['heavy_modules_loaded'] == []
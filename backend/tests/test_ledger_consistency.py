@@ -0,0 +1,102 @@
+import sqlite3
+
+import pytest
+
+from database_manager import DatabaseManager
+from ledger_consistency import LedgerConsistencyChecker
+
+
+def _entry(conn, entry_id, day, lines):
+    conn.execute("INSERT INTO journal_entries (id, date, transaction_type, amount, from_account, to_account, "
+                 "created_at, created_by) VALUES (?, ?, 'manual', 0, '', '', ?, '1')", (entry_id, day, day))
+    conn.executemany("INSERT INTO journal_entry_lines (journal_entry_id, account_code, debit, credit, created_at) "
+                     "VALUES (?, ?, ?, ?, ?)", [(entry_id, account, debit, credit, day)
+                                                for account, debit, credit in lines])
+
+
+@pytest.fixture
+def checker(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '1')
+    db = DatabaseManager(str(tmp_path / 'ledger.db'))
+    conn = sqlite3.connect(db.db_path)
+    for month in ('2024-01', '2024-02', '2024-03'):
+        for n in range(5):
+            _entry(conn, f'JE-{month}-{n}', f'{month}-{n + 10}',
+                   [('10100', 10.0 + n, 0), ('40100', 0, 7.5 + n), ('23010', 0, 2.5)])
+    conn.commit()
+    conn.close()
+    return LedgerConsistencyChecker(db, workers=3)
+
+
+def test_only_changed_months_are_reverified(checker):
+    assert checker.run() == {'periods_verified': ['2024-01', '2024-02', '2024-03'], 'invalid_periods': []}
+    assert checker.run()['periods_verified'] == []
+
+    conn = sqlite3.connect(checker._get_db().db_path)
+    conn.execute("UPDATE journal_entry_lines SET debit = 11.0, account_code = '10150' "
+                 "WHERE journal_entry_id = 'JE-2024-02-0' AND account_code = '10100'")
+    conn.execute("UPDATE journal_entry_lines SET credit = 8.5 WHERE journal_entry_id = 'JE-2024-02-0' "
+                 "AND account_code = '40100'")
+    _entry(conn, 'JE-BAD', '2024-03-20', [('10100', 5.0, 0), ('40100', 0, 4.0)])
+    conn.commit()
+    conn.close()
+
+    assert checker.run() == {'periods_verified': ['2024-02', '2024-03'], 'invalid_periods': ['2024-03']}
+    report = checker.report()
+    march = report['periods'][0]
+    assert march['period'] == '2024-03' and march['line_count'] == 17
+    assert [issue['check'] for issue in march['issues']] == ['entry_balance', 'trial_balance']
+    assert 'JE-BAD' in march['issues'][0]['message']
+    assert report['pending_partitions'] == 0 and report['invalid_periods'] == ['2024-03']
+
+
+def test_moves_orphans_and_drift_are_caught(checker):
+    checker.run()
+    conn = sqlite3.connect(checker._get_db().db_path)
+    conn.execute("UPDATE journal_entries SET date = '2024-04-01' WHERE id = 'JE-2024-01-1'")
+    conn.execute("DELETE FROM journal_entries WHERE id = 'JE-2024-01-2'")  # its lines are left behind
+    conn.commit()
+    conn.close()
+
+    result = checker.run()
+    assert result['periods_verified'] == ['', '2024-01', '2024-04']
+    assert result['invalid_periods'] == ['']
+    issues = {p['period']: [i['check'] for i in p['issues']] for p in checker.report()['periods']}
+    assert issues[''] == ['orphan_lines']
+    assert issues['2024-01'] == issues['2024-04'] == []
+
+
+def test_changes_that_bypass_the_triggers_are_caught_by_the_recount(checker):
+    checker.run()
+    conn = sqlite3.connect(checker._get_db().db_path)
+    for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                   "AND tbl_name = 'journal_entry_lines'").fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("UPDATE journal_entry_lines SET debit = 999 "
+                 "WHERE journal_entry_id = 'JE-2024-02-0' AND account_code = '10100'")
+    conn.commit()
+    conn.close()
+
+    # The partition checksums did not move, so only the recount sees the month
+    assert checker.run(recount=False)['periods_verified'] == []
+    checker.recount_seconds = 0
+    assert checker.run() == {'periods_verified': ['2024-02'], 'invalid_periods': ['2024-02']}
+    february = next(p for p in checker.report()['periods'] if p['period'] == '2024-02')
+    assert [i['check'] for i in february['issues']] == ['partition_totals', 'entry_balance', 'trial_balance']
+    assert '10100' in february['issues'][0]['message']
+
+
+def test_transaction_checks(checker):
+    conn = sqlite3.connect(checker._get_db().db_path)
+    conn.executemany("INSERT INTO transactions (user_id, date, merchant, amount, category, description, total_debit) "
+                     "VALUES (1, ?, 'Shop', ?, 'Food', ?, 0)",
+                     [('2024-01-05', 12.5, 'Lunch'), ('2024-01-05', 12.5, 'Lunch'),
+                      ('2024-01-06', -4.0, 'Refund'), ('2999-01-01', 3.0, 'Later')])
+    conn.commit()
+    conn.close()
+
+    assert checker.transaction_checks() == {
+        'total_transactions': 4, 'total_income': 28.0, 'total_expenses': -4.0,
+        'issues': ['1 transactions with negative amounts', '1 potential duplicate transactions',
+                   '1 transactions with future dates']
+    }
@@ -0,0 +1,53 @@
+import io
+import logging
+import sys
+
+from utils.log import ProgressLogger, SamplingFilter, configure_logging, get_logger, shutdown_logging
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_records_are_written_by_background_listener():
+    stream = io.StringIO()
+    configure_logging(level='INFO', fmt='json', stream=stream)
+    try:
+        log = get_logger('test')
+        log.debug("hidden %s", 1)
+        log.info("visible %s", 2)
+        shutdown_logging()  # Drains the queue
+        output = stream.getvalue()
+        assert '"message": "visible 2"' in output
+        assert 'hidden' not in output
+    finally:
+        configure_logging(level='INFO', stream=sys.__stdout__)
+
+
+def test_progress_logger_is_rate_limited():
+    logger = logging.getLogger('kamioi-test-progress')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    progress = ProgressLogger(logger, 'Processed', total=1000, min_interval=60)
+    for _ in range(1000):
+        progress.update()
+    progress.done()
+
+    assert len(handler.messages) == 1
+    assert handler.messages[0].startswith('Processed 1000/1000 in')
+
+
+def test_sampling_filter_keeps_warnings():
+    sampler = SamplingFilter(rate=0.0)
+    debug = logging.LogRecord('x', logging.DEBUG, __file__, 1, 'd', None, None)
+    warning = logging.LogRecord('x', logging.WARNING, __file__, 1, 'w', None, None)
+    assert sampler.filter(debug) is False
+    assert sampler.filter(warning) is True
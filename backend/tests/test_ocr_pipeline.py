@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services import ocr_pipeline
+from services.ocr_pipeline import OCRCache, adaptive_threshold, choose_best, estimate_skew, run_passes, target_scale
+
+
+def _text_lines(angle_deg: float, size=(400, 600)):
+    """White page with dark horizontal text rows, sheared by `angle_deg`"""
+    h, w = size
+    page = np.full(size, 255.0)
+    slope = np.tan(np.radians(angle_deg))
+    for baseline in range(40, h - 40, 30):
+        for x in range(20, w - 20):
+            y = int(round(baseline - x * slope))
+            if 0 <= y < h - 3 and (x // 7) % 3:
+                page[y:y + 3, x] = 0
+    return page
+
+
+def test_target_scale_normalises_to_300_dpi():
+    assert target_scale((1275, 1650), dpi=150) == pytest.approx(2.0)
+    assert target_scale((4000, 6000), dpi=300) == pytest.approx(3500 / 6000)
+    assert target_scale((300, 500), dpi=300) == pytest.approx(1000 / 300)
+
+
+def test_estimate_skew_recovers_rotation():
+    assert estimate_skew(_text_lines(0)) == 0
+    assert estimate_skew(_text_lines(2.0)) == pytest.approx(2.0, abs=0.3)
+    assert estimate_skew(_text_lines(-3.0)) == pytest.approx(-3.0, abs=0.3)
+
+
+def test_adaptive_threshold_survives_uneven_lighting():
+    page = _text_lines(0)
+    shaded = page * np.linspace(0.45, 1.0, page.shape[1])[None, :]  # dark left edge
+    binary = adaptive_threshold(shaded)
+    assert set(np.unique(binary)) <= {0, 255}
+    ink = page == 0
+    assert (binary[ink] == 0).mean() > 0.9
+    assert (binary[~ink] == 255).mean() > 0.95
+
+
+def test_run_passes_exits_early_on_confident_pass():
+    release = threading.Event()
+
+    def fake_ocr(image, psm):
+        if psm == 6:
+            return 'TOTAL 12.99\nVISA 1234', 91.0
+        release.wait(2)
+        return 'x' * 40, 50.0
+
+    started = time.perf_counter()
+    result = run_passes('img', ocr=fake_ocr, psm_modes=(6, 4, 11, 12), threshold=80)
+    release.set()
+    assert result['psm'] == 6 and result['early_exit']
+    assert time.perf_counter() - started < 1.5
+
+
+def test_choose_best_prefers_confident_pass_with_enough_text():
+    results = {6: ('a' * 100, 70.0), 11: ('b' * 20, 95.0), 12: ('c' * 80, 75.0), 4: ('', 0.0)}
+    assert choose_best(results)[0] == 12
+    assert choose_best({7: ('', 0.0)}) == (None, ('', 0.0))
+
+
+def test_cache_hits_memory_then_disk(tmp_path):
+    cache = OCRCache(max_entries=2, directory=str(tmp_path))
+    key = cache.key_for(b'receipt-bytes')
+    assert cache.get(key) is None
+    cache.put(key, {'text': 'TOTAL 5.00', 'confidence': 88.0})
+
+    assert OCRCache(directory=str(tmp_path)).get(key)['text'] == 'TOTAL 5.00'  # another worker, from disk
+    assert cache.get(key)['confidence'] == 88.0
+    assert cache.stats == {'hits': 1, 'misses': 1}
+
+
+def test_cache_files_are_pruned_to_max_entries(tmp_path):
+    cache = OCRCache(max_entries=2, directory=str(tmp_path))
+    keys = [cache.key_for(bytes([n])) for n in range(3)]
+    for n, key in enumerate(keys[:2]):
+        cache.put(key, {'text': str(n)})
+        os.utime(cache._path(key), (1000 + n, 1000 + n))
+    OCRCache(max_entries=2, directory=str(tmp_path)).get(keys[0])  # read back: now the most recent
+    cache.put(keys[2], {'text': '2'})
+
+    assert sorted(os.listdir(tmp_path)) == sorted(f'{key}.json' for key in (keys[0], keys[2]))
+
+
+def test_extract_text_uses_cache(tmp_path, monkeypatch):
+    pytest.importorskip('PIL')
+    from PIL import Image
+
+    path = tmp_path / 'receipt.png'
+    Image.fromarray(_text_lines(1.0).astype(np.uint8)).save(path)
+    calls = []
+
+    def fake_ocr(image, psm):
+        calls.append(psm)
+        return 'STORE 42\nTOTAL 9.99', 90.0
+
+    cache = OCRCache(directory=str(tmp_path / 'cache'))
+    first = ocr_pipeline.extract_text(str(path), ocr=fake_ocr, cache=cache)
+    second = ocr_pipeline.extract_text(str(path), ocr=fake_ocr, cache=cache)
+    assert first['text'] == second['text'] == 'STORE 42\nTOTAL 9.99'
+    assert not first['cached'] and second['cached']
+    assert len(calls) <= len(ocr_pipeline.PSM_MODES)
+
+
+def test_extract_text_does_not_cache_failed_runs(tmp_path):
+    pytest.importorskip('PIL')
+    from PIL import Image
+
+    path = tmp_path / 'receipt.png'
+    Image.fromarray(_text_lines(1.0).astype(np.uint8)).save(path)
+    outcomes = iter([RuntimeError('tesseract missing')] * 2 * len(ocr_pipeline.PSM_MODES))
+
+    def flaky_ocr(image, psm):
+        outcome = next(outcomes, None)
+        if outcome is not None:
+            raise outcome
+        return 'STORE 42\nTOTAL 9.99', 90.0
+
+    cache = OCRCache(directory=str(tmp_path / 'cache'))
+    failed = ocr_pipeline.extract_text(str(path), ocr=flaky_ocr, cache=cache)
+    assert failed['passes'] == 0 and failed['text'] == ''
+    retried = ocr_pipeline.extract_text(str(path), ocr=flaky_ocr, cache=cache)
+    assert retried['text'] == 'STORE 42\nTOTAL 9.99' and not retried['cached']
@@ -0,0 +1,185 @@
+import threading
+
+import pytest
+
+from database_manager import DatabaseManager
+from order_netting import OrderNettingEngine
+from roundup_engine import RoundUpEngine
+
+
+class StubBroker:
+    """Local stand-in for AlpacaService's order API"""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.orders = []
+        self.placed = {}
+        self._lock = threading.Lock()
+
+    def buy_fractional_shares(self, account_id=None, symbol=None, dollar_amount=None, client_order_id=None):
+        with self._lock:
+            self.orders.append((symbol, dollar_amount))
+            if symbol not in self.prices or client_order_id in self.placed:
+                return None  # unknown symbol, or a duplicate client_order_id
+            price = self.prices[symbol]
+            order = {'id': f'order_{len(self.placed)}', 'client_order_id': client_order_id, 'status': 'filled',
+                     'filled_avg_price': str(price), 'filled_qty': str(dollar_amount / price)}
+            self.placed[client_order_id] = order
+            return order
+
+    def get_order_by_client_order_id(self, client_order_id, account_id=None):
+        return self.placed.get(client_order_id)
+
+    def get_stock_price(self, symbol):
+        return self.prices[symbol]
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'netting.db'))
+
+
+def _add_transaction(db, user_id, ticker):
+    conn = db.get_connection()
+    cur = conn.execute(
+        "INSERT INTO transactions (user_id, date, merchant, amount, total_debit, ticker, status) "
+        "VALUES (?, '2025-01-01', 'm', 5.0, 6.0, ?, 'mapped')", (user_id, ticker))
+    conn.commit()
+    tx_id = cur.lastrowid
+    conn.close()
+    return tx_id
+
+
+def test_net_orders_groups_by_ticker():
+    engine = OrderNettingEngine(broker=StubBroker({}))
+    netted = engine.net_orders([
+        {'user_id': 1, 'ticker': 'aapl', 'amount': 1.0},
+        {'user_id': 2, 'ticker': 'AAPL', 'amount': 2.0},
+        {'user_id': 1, 'ticker': 'MSFT', 'amount': 1.5},
+        {'user_id': 3, 'ticker': None, 'amount': 1.0},
+    ])
+    assert set(netted) == {'AAPL', 'MSFT'}
+    assert netted['AAPL']['total_amount'] == 3.0
+    assert len(netted['AAPL']['allocations']) == 2
+
+
+def test_allocate_fill_sums_to_filled_qty():
+    engine = OrderNettingEngine(broker=StubBroker({}))
+    allocations = [{'user_id': i, 'amount': 1.0} for i in range(3)]
+    result = engine.allocate_fill(allocations, 3.0, 0.1)
+    assert round(sum(a['shares'] for a in result), 6) == 0.1
+
+
+def test_drain_market_queue_submits_one_order_per_ticker(db):
+    broker = StubBroker({'AAPL': 200.0, 'MSFT': 400.0})
+    engine = OrderNettingEngine(broker=broker, db_manager=db, orders_per_minute=6000)
+    orders = []
+    for user_id, ticker in [(1, 'AAPL'), (2, 'AAPL'), (3, 'AAPL'), (1, 'MSFT'), (2, 'NOPE')]:
+        orders.append({'transaction_id': _add_transaction(db, user_id, ticker),
+                       'user_id': user_id, 'ticker': ticker, 'amount': 2.0})
+    assert engine.enqueue(orders) == 5
+
+    result = engine.drain_market_queue()
+    assert result['orders_submitted'] == 3
+    assert sorted(broker.orders) == [('AAPL', 6.0), ('MSFT', 2.0), ('NOPE', 2.0)]
+    assert result['filled'] == 4
+    assert [f['ticker'] for f in result['failed']] == ['NOPE']
+
+    conn = db.get_connection()
+    statuses = dict(conn.execute(
+        "SELECT ticker, GROUP_CONCAT(DISTINCT status) FROM market_queue GROUP BY ticker").fetchall())
+    shares = conn.execute(
+        "SELECT SUM(shares) FROM transactions WHERE ticker = 'AAPL' AND status = 'completed'").fetchone()[0]
+    conn.close()
+    assert statuses == {'AAPL': 'completed', 'MSFT': 'completed', 'NOPE': 'queued'}
+    assert shares == pytest.approx(6.0 / 200.0)
+    assert engine.position_store.get_total_value() == pytest.approx(8.0)
+    assert sorted(row[0] for row in engine.position_store.get_portfolio_rows(1)) == ['AAPL', 'MSFT']
+
+
+def test_sweep_roundups_enqueues_and_executes(db):
+    broker = StubBroker({'AAPL': 100.0})
+    roundups = RoundUpEngine(db_manager=db)
+    roundups.sweep_threshold = 100.0
+    for user_id in (1, 2):
+        tx_id = _add_transaction(db, user_id, 'AAPL')
+        roundups.process_transaction({'id': tx_id, 'user_id': user_id, 'amount': 5.0})
+
+    engine = OrderNettingEngine(broker=broker, db_manager=db, orders_per_minute=6000)
+    result = engine.sweep_roundups(roundups)
+    assert result['queued_orders'] == 2
+    assert broker.orders == [('AAPL', 2.0)]
+    assert roundups.get_users_with_pending() == []
+
+
+def test_claimed_rows_are_not_resubmitted_and_stale_claims_reuse_the_client_order_id(db):
+    broker = StubBroker({'AAPL': 200.0})
+    engine = OrderNettingEngine(broker=broker, db_manager=db, orders_per_minute=6000)
+    engine.enqueue([{'transaction_id': _add_transaction(db, user_id, 'AAPL'), 'user_id': user_id,
+                     'ticker': 'AAPL', 'amount': 2.0} for user_id in (1, 2)])
+
+    # A drain that claimed the rows and placed the order, then died before recording the fill
+    claimed = engine._claim_queued(None)
+    bucket = next(iter(engine.net_claimed(claimed).values()))
+    assert engine._submit_ticker(bucket)['success']
+    assert engine.drain_market_queue() == {'queued': 0, 'orders_submitted': 0, 'filled': 0, 'failed': []}
+
+    conn = db.get_connection()
+    conn.execute("UPDATE market_queue SET claimed_at = '2000-01-01T00:00:00'")
+    conn.commit()
+    conn.close()
+    result = engine.drain_market_queue()
+    assert result['filled'] == 2
+    assert result['fills'][0]['client_order_id'] == bucket['client_order_id']
+    assert len(broker.placed) == 1 and broker.orders == [('AAPL', 4.0), ('AAPL', 4.0)]
+    assert engine.position_store.get_total_value() == pytest.approx(4.0)
+
+
+class OpenOrderBroker(StubBroker):
+    """Accepts market orders without filling them; the test settles them later"""
+
+    def buy_fractional_shares(self, account_id=None, symbol=None, dollar_amount=None, client_order_id=None):
+        with self._lock:
+            self.orders.append((symbol, dollar_amount))
+            order = {'id': f'order_{len(self.placed)}', 'client_order_id': client_order_id, 'status': 'accepted',
+                     'filled_avg_price': None, 'filled_qty': '0'}
+            self.placed[client_order_id] = order
+            return order
+
+    def get_stock_price(self, symbol):
+        raise AssertionError('an unfilled order must not be valued at a quote')
+
+
+def test_unfilled_orders_wait_and_only_the_actual_fill_is_booked(db):
+    broker = OpenOrderBroker({})
+    engine = OrderNettingEngine(broker=broker, db_manager=db, orders_per_minute=6000)
+    tx_ids = [_add_transaction(db, user_id, 'AAPL') for user_id in (1, 2)]
+    engine.enqueue([{'transaction_id': tx_id, 'user_id': user_id, 'ticker': 'AAPL', 'amount': amount}
+                    for tx_id, user_id, amount in zip(tx_ids, (1, 2), (1.0, 3.0))])
+
+    result = engine.drain_market_queue()
+    assert result['filled'] == 0 and result['failed'] == []
+    assert [o['order_status'] for o in result['open_orders']] == ['accepted']
+    assert engine.position_store.get_total_value() == 0
+
+    # Still open: nothing is booked or resubmitted
+    result = engine.drain_market_queue()
+    assert result['orders_submitted'] == 0 and len(result['open_orders']) == 1
+    assert len(broker.orders) == 1
+
+    # The day order expires with half the dollars bought
+    order = next(iter(broker.placed.values()))
+    order.update(status='expired', filled_avg_price='200', filled_qty='0.01')
+    result = engine.drain_market_queue()
+    assert result['filled'] == 2 and result['fills'][0]['filled_qty'] == 0.01
+    assert engine.position_store.get_total_value() == pytest.approx(2.0)
+
+    conn = db.get_connection()
+    queue = conn.execute("SELECT user_id, status, amount, shares FROM market_queue ORDER BY id").fetchall()
+    tx_status = [row[0] for row in conn.execute(
+        f"SELECT status FROM transactions WHERE id IN ({tx_ids[0]}, {tx_ids[1]}) ORDER BY id").fetchall()]
+    conn.close()
+    assert [(u, s, a) for u, s, a, _ in queue] == [(1, 'completed', 0.5), (2, 'completed', 1.5),
+                                                   (1, 'queued', 0.5), (2, 'queued', 1.5)]
+    assert sum(row[3] for row in queue[:2]) == pytest.approx(0.01)
+    assert tx_status == ['mapped', 'mapped']  # the rest of their dollars are queued again
@@ -0,0 +1,100 @@
+import random
+import sqlite3
+
+import pytest
+
+from database_manager import DatabaseManager
+from period_balances import PeriodBalances
+
+ACCOUNTS = ['10100', '11000', '20000', '23010', '30000', '40100', '61000']
+
+
+def _post(conn, rng, entry_ids, month):
+    for entry_id in entry_ids:
+        amount = round(rng.uniform(1, 500), 2)
+        debit_account, credit_account = rng.sample(ACCOUNTS, 2)
+        conn.execute("INSERT INTO journal_entries (id, date, transaction_type, amount, from_account, to_account, "
+                     "status, created_at, created_by) VALUES (?, ?, 'manual', ?, ?, ?, 'posted', ?, '1')",
+                     (entry_id, f'{month}-{rng.randint(1, 28):02d}', amount, credit_account, debit_account, month))
+        conn.executemany("INSERT INTO journal_entry_lines (journal_entry_id, account_code, debit, credit, created_at) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         [(entry_id, debit_account, amount, 0, month), (entry_id, credit_account, 0, amount, month)])
+    conn.commit()
+
+
+def _raw_balances(path):
+    """Debit-positive balance per account straight from every journal line"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute("""
+        SELECT jel.account_code, SUM(jel.debit) - SUM(jel.credit) FROM journal_entry_lines jel
+        JOIN journal_entries je ON je.id = jel.journal_entry_id GROUP BY jel.account_code
+    """).fetchall()
+    conn.close()
+    return {code: pytest.approx(balance, abs=0.01) for code, balance in rows}
+
+
+def _debit_positive(store):
+    return {b['account_code']: b['balance'] * (-1 if b['normal_balance'] == 'Credit' else 1) for b in store.balances()}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '1')
+    return PeriodBalances(DatabaseManager(str(tmp_path / 'ledger.db')))
+
+
+def test_snapshots_plus_open_deltas_match_the_raw_lines(store):
+    rng = random.Random(11)
+    path = store._get_db().db_path
+    conn = sqlite3.connect(path)
+    _post(conn, rng, [f'JE-A{n}' for n in range(40)], '2024-01')
+    _post(conn, rng, [f'JE-B{n}' for n in range(40)], '2024-03')
+
+    assert store.close_period('2024-02')['periods_closed'] == ['2024-01', '2024-02']
+    assert store.close_period('2024-01')['periods_closed'] == []
+    _post(conn, rng, [f'JE-C{n}' for n in range(10)], '2024-02')  # backdated into a closed month
+    _post(conn, rng, [f'JE-D{n}' for n in range(10)], '2024-04')
+    assert _debit_positive(store) == _raw_balances(path)
+
+    assert store.close_period('2024-03')['periods_closed'] == ['2024-03']
+    march = conn.execute("SELECT SUM(period_debit), SUM(period_credit) FROM account_balance_snapshots "
+                         "WHERE period = '2024-03'").fetchone()
+    assert march[0] == pytest.approx(march[1])  # every entry balances
+    assert conn.execute("SELECT DISTINCT period FROM account_period_deltas").fetchall() == [('2024-04',)]
+    assert _debit_positive(store) == _raw_balances(path)
+    conn.close()
+
+    before = store.balances()
+    store.rebuild()
+    assert store.balances() == before
+
+
+def test_deletes_date_moves_and_late_low_ids_stay_consistent(store):
+    path = store._get_db().db_path
+    conn = sqlite3.connect(path)
+    _post(conn, random.Random(5), [f'JE-{n}' for n in range(20)], '2024-05')
+    store.close_period('2024-05')
+
+    conn.execute("DELETE FROM journal_entry_lines WHERE journal_entry_id = 'JE-3'")
+    conn.execute("DELETE FROM journal_entries WHERE id = 'JE-3'")
+    conn.execute("DELETE FROM journal_entries WHERE id = 'JE-5'")  # its lines are left without an entry
+    conn.execute("UPDATE journal_entries SET date = '2024-06-15' WHERE id = 'JE-4'")
+    conn.execute("UPDATE journal_entry_lines SET debit = debit + 1 WHERE journal_entry_id = 'JE-6' AND debit > 0")
+    conn.execute("UPDATE journal_entry_lines SET credit = credit + 1 WHERE journal_entry_id = 'JE-6' AND credit > 0")
+    # A line committed after higher ids (a sequence gap filled late) and one posted before its entry
+    conn.execute("INSERT INTO journal_entry_lines (id, journal_entry_id, account_code, debit, credit, created_at) "
+                 "VALUES (1000, 'JE-7', '10100', 4, 0, '2024-06'), (1001, 'JE-7', '40100', 0, 4, '2024-06'), "
+                 "(999, 'JE-LATE', '61000', 9, 0, '2024-06'), (998, 'JE-LATE', '10100', 0, 9, '2024-06')")
+    conn.execute("INSERT INTO journal_entries (id, date, transaction_type, amount, from_account, to_account, "
+                 "status, created_at, created_by) VALUES ('JE-LATE', '2024-06-02', 'manual', 9, '10100', '61000', "
+                 "'posted', '2024-06', '1')")
+    conn.commit()
+
+    assert _debit_positive(store) == _raw_balances(path)
+    store.rebuild()  # folds the backdated changes into May's snapshot
+    assert _debit_positive(store) == _raw_balances(path)
+    assert store._execute(conn, "SELECT COUNT(*) FROM account_period_deltas WHERE period <= '2024-05'"
+                          ).fetchone()[0] == 0
+    cash = store.movements('101')
+    assert [m['period'] for m in cash] == sorted({m['period'] for m in cash}, reverse=True)
+    conn.close()
@@ -0,0 +1,83 @@
+import pytest
+
+from database_manager import DatabaseManager
+from positions import PositionStore
+
+
+class StubPrices:
+    def __init__(self, prices):
+        self.prices = prices
+
+    def get_latest_prices(self, tickers):
+        return {t: self.prices[t] for t in tickers if t in self.prices}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'positions.db'))
+
+
+def _apply(store, db, fills):
+    conn = db.get_connection()
+    store.apply_fills(conn, fills)
+    conn.commit()
+    conn.close()
+
+
+def test_fills_accumulate_and_mark_to_market(db):
+    store = PositionStore(db_manager=db, price_source=StubPrices({'AAPL': 150.0}))
+    _apply(store, db, [
+        {'user_id': 1, 'ticker': 'aapl', 'shares': 0.01, 'cost': 1.0},
+        {'user_id': 1, 'ticker': 'AAPL', 'shares': 0.02, 'cost': 2.0},
+        {'user_id': 2, 'ticker': 'AAPL', 'shares': 0.05, 'cost': 5.0},
+    ])
+
+    ticker, shares, average_price, current_price, total_value, _ = store.get_portfolio_rows(1)[0]
+    assert (ticker, average_price, current_price) == ('AAPL', pytest.approx(100.0), pytest.approx(100.0))
+    assert shares == pytest.approx(0.03)
+    assert store.get_total_value() == pytest.approx(8.0)
+
+    assert store.mark_to_market() == {'tickers': 1, 'priced': 1}
+    assert store.get_total_value() == pytest.approx(12.0)
+    assert store.get_total_value(exclude_user_ids=[2]) == pytest.approx(4.5)
+
+
+def test_rebuild_backfills_from_transactions(db):
+    conn = db.get_connection()
+    conn.executemany(
+        "INSERT INTO transactions (user_id, date, merchant, amount, total_debit, ticker, shares, price_per_share, status) "
+        "VALUES (?, '2025-01-01', 'm', 5.0, 6.0, ?, ?, ?, 'completed')",
+        [(1, 'MSFT', 0.5, 400.0), (1, 'msft', 0.25, 420.0), (1, None, 1.0, 1.0), (2, 'AAPL', 1.0, 150.0)])
+    conn.commit()
+    conn.close()
+
+    store = PositionStore(db_manager=db, price_source=StubPrices({}))
+    assert store.ensure_backfilled() is True
+    assert store.ensure_backfilled() is False
+    rows = store.get_portfolio_rows(1)
+    assert [(r[0], r[1]) for r in rows] == [('MSFT', 0.75)]
+    assert rows[0][2] == pytest.approx((200.0 + 105.0) / 0.75)
+    assert store.get_total_value() == pytest.approx(455.0)
+
+
+def test_reverse_fills_matches_a_rebuild_after_deleting_transactions(db):
+    conn = db.get_connection()
+    conn.executemany(
+        "INSERT INTO transactions (user_id, date, merchant, amount, total_debit, ticker, shares, price_per_share, status) "
+        "VALUES (?, '2025-01-01', 'm', 5.0, 6.0, ?, ?, ?, 'completed')",
+        [(1, 'MSFT', 0.5, 400.0), (1, 'MSFT', 0.25, 420.0), (2, 'AAPL', 1.0, 150.0)])
+    conn.commit()
+    conn.close()
+    store = PositionStore(db_manager=db, price_source=StubPrices({}))
+    store.rebuild()
+
+    conn = db.get_connection()
+    store.reverse_fills(conn, 'user_id = :user_id AND shares < 0.3 OR user_id = 2', {'user_id': 1})
+    conn.execute("DELETE FROM transactions WHERE user_id = 1 AND shares < 0.3 OR user_id = 2")
+    conn.commit()
+    conn.close()
+
+    rows = store.get_portfolio_rows(1)
+    assert [(r[0], r[1], r[2]) for r in rows] == [('MSFT', pytest.approx(0.5), pytest.approx(400.0))]
+    assert store.get_portfolio_rows(2) == []
+    assert store.get_total_value() == pytest.approx(305.0 * 0.5 / 0.75)  # unpriced: value scales with shares
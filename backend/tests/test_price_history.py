@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database_manager import DatabaseManager
+from price_history import INTRADAY, PriceHistoryStore
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'prices.db'))
+
+
+def _today():
+    now = datetime.utcnow()
+    return datetime(now.year, now.month, now.day)
+
+
+def test_quotes_fold_into_daily_and_intraday_bars(db):
+    store = PriceHistoryStore(db_manager=db)
+    now = datetime.utcnow()
+    for price in (10.0, 12.0, 9.0, 11.0):
+        store.record_quotes({'aapl': {'price': price, 'timestamp': now, 'source': 'test'}})
+
+    bars = store.get_range('AAPL', start=_today())
+    assert len(bars) == 1
+    assert (bars[0]['open'], bars[0]['high'], bars[0]['low'], bars[0]['close']) == (10.0, 12.0, 9.0, 11.0)
+    assert len(store.get_range('AAPL', start=_today(), resolution=INTRADAY)) == 1
+
+    # A fresh store (e.g. after restart) reads the latest close from the table
+    assert PriceHistoryStore(db_manager=db).get_latest_prices(['aapl', 'MSFT']) == {'AAPL': 11.0}
+
+
+def test_daily_closes_and_volatility_use_cached_history(db, tmp_path):
+    store = PriceHistoryStore(db_manager=db, cache_dir=str(tmp_path / 'cache'))
+    today = _today()
+    closes = [100.0, 102.0, 101.0, 104.0, 103.0]
+    store.record_bars('SPY', [{'ts': today - timedelta(days=len(closes) - i), 'close': c}
+                              for i, c in enumerate(closes)])
+    store.record_quotes({'SPY': {'price': 105.0, 'timestamp': datetime.utcnow()}})
+
+    assert list(store.get_daily_closes('SPY', days=30)) == closes + [105.0]
+    assert list(store.get_daily_closes('SPY', days=2)) == closes[-2:] + [105.0]
+    assert store.get_volatility(['SPY']) > 0
+    assert store.get_volatility(['NOPE']) is None
+    assert store.get_tracked_tickers() == ['SPY']
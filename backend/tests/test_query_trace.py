@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+
+from query_trace import TracedConnection, fingerprint, query_tracer
+
+
+@pytest.fixture
+def conn(tmp_path):
+    query_tracer.reset()
+    conn = sqlite3.connect(str(tmp_path / 'trace.db'), factory=TracedConnection)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO users (id, name) VALUES (?, ?)", [(i, f'u{i}') for i in range(20)])
+    conn.commit()
+    yield conn
+    conn.close()
+    query_tracer.reset()
+
+
+def test_fingerprint_groups_literals():
+    assert fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'x'") == \
+        fingerprint("SELECT *  FROM t\n WHERE id = 12 AND name = 'y'")
+    assert fingerprint("SELECT * FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (...)"
+
+
+def test_per_row_lookups_are_flagged_as_n_plus_one(conn):
+    with query_tracer.trace('GET /api/users') as trace:
+        for user_id in range(12):
+            conn.cursor().execute("SELECT name FROM users WHERE id = ?", (user_id,)).fetchone()
+        conn.execute("SELECT COUNT(*) FROM users").fetchone()
+
+    assert trace.count == 13
+    # Only the parameterized statement is kept, never the bound values
+    assert {entry['sql'] for entry in trace.summary()['slowest']} <= \
+        {'SELECT name FROM users WHERE id = ?', 'SELECT COUNT(*) FROM users'}
+    flagged = query_tracer.snapshot()['n_plus_one']
+    assert [(f['route'], f['fingerprint'], f['max_count']) for f in flagged] == \
+        [('GET /api/users', 'SELECT name FROM users WHERE id = ?', 12)]
+
+
+def test_slow_queries_capture_query_plan(conn, monkeypatch):
+    monkeypatch.setattr(query_tracer, 'slow_ms', 0)
+    conn.execute("SELECT name FROM users WHERE id = ?", (3,)).fetchone()
+    conn.execute("SELECT name FROM users WHERE name = 'u7'").fetchone()
+
+    slow = query_tracer.snapshot()['slow_queries']
+    assert [entry['sql'] for entry in slow[-2:]] == ["SELECT name FROM users WHERE id = ?",
+                                                      "SELECT name FROM users WHERE name = ?"]
+    slow = slow[-2]
+    assert 'users' in slow['plan']
+
+
+def test_server_timing_header_reports_request_queries(conn):
+    app = Flask(__name__)
+    query_tracer.init_app(app)
+
+    @app.route('/names')
+    def names():
+        return {'names': [row[0] for row in conn.execute("SELECT name FROM users").fetchall()]}
+
+    response = app.test_client().get('/names')
+    assert 'desc="1 queries"' in response.headers['Server-Timing']
+    assert query_tracer.snapshot()['routes'][0]['route'] == 'GET /names'
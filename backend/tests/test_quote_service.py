@@ -0,0 +1,151 @@
+import threading
+import time
+
+from quote_service import QuoteProvider, QuoteService
+
+
+class StubProvider(QuoteProvider):
+    """Local provider that counts calls and can be made slow"""
+
+    def __init__(self, name='stub', prices=None, delay=0.0, batch=False):
+        super().__init__()
+        self.name = name
+        self.supports_batch = batch
+        self.prices = prices or {}
+        self.delay = delay
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def fetch(self, ticker):
+        return self.fetch_many([ticker]).get(ticker)
+
+    def fetch_many(self, tickers):
+        with self._calls_lock:
+            self.calls.append(list(tickers))
+        time.sleep(self.delay)
+        return {t: self._quote(t, self.prices[t]) for t in tickers if t in self.prices}
+
+
+def test_cache_hit_after_first_fetch():
+    provider = StubProvider(prices={'AAPL': 190.0})
+    service = QuoteService(providers=[provider], ttl=60)
+    assert service.get_price('aapl') == 190.0
+    quote = service.get_quote('AAPL')
+    assert quote['cached'] is True
+    assert len(provider.calls) == 1
+
+
+def test_concurrent_requests_coalesce():
+    provider = StubProvider(prices={'MSFT': 400.0}, delay=0.2)
+    service = QuoteService(providers=[provider], ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_price('MSFT'))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [400.0] * 8
+    assert len(provider.calls) == 1
+
+
+def test_fetch_many_uses_batch_and_falls_through():
+    batch = StubProvider(name='batch', prices={'AAPL': 1.0, 'MSFT': 2.0}, batch=True)
+    single = StubProvider(name='single', prices={'TSLA': 3.0})
+    service = QuoteService(providers=[batch, single], ttl=60)
+    prices = service.get_prices(['AAPL', 'MSFT', 'TSLA'])
+    assert prices == {'AAPL': 1.0, 'MSFT': 2.0, 'TSLA': 3.0}
+    assert batch.calls == [['AAPL', 'MSFT', 'TSLA']]
+    assert single.calls == [['TSLA']]
+
+
+def test_stale_quote_served_while_refreshing():
+    provider = StubProvider(prices={'KO': 60.0})
+    service = QuoteService(providers=[provider], ttl=0.05, stale_ttl=60)
+    service.get_price('KO')
+    time.sleep(0.1)
+    provider.prices['KO'] = 61.0
+    stale = service.get_quote('KO')
+    assert stale['price'] == 60.0 and stale['stale'] is True
+    deadline = time.time() + 2
+    while service.get_quote('KO')['price'] != 61.0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert service.get_price('KO') == 61.0
+
+
+def test_fallback_used_when_providers_fail():
+    service = QuoteService(providers=[StubProvider()], fallback=lambda t: {'ticker': t, 'price': 1.23})
+    assert service.get_price('ZZZZ') == 1.23
+
+
+class FailingProvider(StubProvider):
+    def fetch_many(self, tickers):
+        with self._calls_lock:
+            self.calls.append(list(tickers))
+        raise RuntimeError('provider down')
+
+
+def test_slow_primary_is_hedged():
+    slow = StubProvider(name='slow', prices={'AAPL': 1.0}, delay=1.0)
+    fast = StubProvider(name='fast', prices={'AAPL': 2.0})
+    service = QuoteService(providers=[slow, fast], default_hedge_delay=0.05, max_wait=3.0)
+    started = time.monotonic()
+    quote = service.get_quote('AAPL')
+    assert time.monotonic() - started < 0.5
+    assert quote['source'] == 'fast'
+    assert service.stats['hedged'] == 1
+
+
+def test_tail_latency_bounded_by_max_wait():
+    stuck = StubProvider(name='stuck', prices={'AAPL': 1.0}, delay=2.0)
+    service = QuoteService(providers=[stuck], max_wait=0.2,
+                           fallback=lambda t: {'ticker': t, 'price': 9.0, 'source': 'mock'})
+    started = time.monotonic()
+    assert service.get_price('AAPL') == 9.0
+    assert time.monotonic() - started < 1.0
+
+
+def test_circuit_breaker_opens_on_errors():
+    failing = FailingProvider(name='failing')
+    healthy = StubProvider(name='healthy', prices={'T%d' % i: float(i) for i in range(10)})
+    service = QuoteService(providers=[failing, healthy], ttl=60)
+    for i in range(10):
+        assert service.get_price('T%d' % i) == float(i)
+    assert failing.breaker.state == 'open'
+    assert len(failing.calls) == 5
+    status = service.get_status()['providers'][0]
+    assert status['circuit']['state'] == 'open'
+    assert status['latency']['count'] == 5
+
+
+def test_listeners_receive_fresh_quotes_only():
+    provider = StubProvider(prices={'AAPL': 190.0})
+    service = QuoteService(providers=[provider], ttl=60)
+    received = []
+    done = threading.Event()
+    service.add_listener(lambda quotes: (received.append(sorted(quotes)), done.set()))
+    service.get_price('AAPL')
+    service.get_price('AAPL')
+    assert done.wait(2)
+    time.sleep(0.05)
+    assert received == [['AAPL']]
+
+
+class ThrottledProvider(StubProvider):
+    def fetch_many(self, tickers):
+        with self._calls_lock:
+            self.calls.append(list(tickers))
+        return self._get_json('https://quotes.invalid/latest')
+
+
+def test_rate_limited_calls_are_not_counted_as_outcomes():
+    throttled = ThrottledProvider(name='throttled')
+    throttled.rate_limiter.try_acquire = lambda: False
+    healthy = StubProvider(name='healthy', prices={'T%d' % i: float(i) for i in range(10)})
+    service = QuoteService(providers=[throttled, healthy], ttl=60)
+    for i in range(10):
+        assert service.get_price('T%d' % i) == float(i)
+    assert len(throttled.calls) == 10
+    assert throttled.breaker.state == 'closed'
+    assert throttled.breaker.snapshot()['recent_calls'] == 0
+    assert throttled.latency.count == 0
+    assert service.stats['rate_limited'] == 10
@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+
+import pytest
+
+from database_manager import DatabaseManager
+from receipt_jobs import QueueFull, ReceiptJobQueue, resolve_round_up_amount
+
+
+class FakeReceiptService:
+    def parse_receipt_text(self, raw_text):
+        return {'retailer': {'name': raw_text.split()[0]}, 'items': [], 'totalAmount': 12.5}
+
+    def map_receipt(self, parsed_data, raw_text, skip_llm_enhancement=False):
+        return dict(parsed_data, brands=[{'name': 'Apple', 'stockSymbol': 'AAPL'}])
+
+    @staticmethod
+    def manual_entry_data():
+        return {'retailer': None, 'items': [], 'needs_manual_entry': True}
+
+
+class FakeAllocationService:
+    def allocate_receipt(self, parsed_data, round_up_amount):
+        return {'success': True, 'totalRoundUp': round_up_amount,
+                'allocations': [{'stockSymbol': 'AAPL', 'amount': round_up_amount}]}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '1')
+    db = DatabaseManager(str(tmp_path / 'jobs.db'))
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("INSERT INTO users (id, name, email, account_type, round_up_amount) "
+                 "VALUES (7, 'Ada', 'ada@example.com', 'individual', 2.5)")
+    conn.execute("INSERT INTO receipts (id, user_id, filename, file_path) VALUES ('r1', 7, 'a.png', '/tmp/a.png')")
+    conn.commit()
+    conn.close()
+    return db
+
+
+def _queue(db, **kwargs):
+    queue = ReceiptJobQueue(db, ocr_workers=0, threads=1, receipt_service=FakeReceiptService(),
+                            allocation_service=FakeAllocationService(), **kwargs)
+    queue._ocr = lambda path: 'Target 12.50'
+    return queue
+
+
+def test_job_runs_every_stage_and_records_timings(db):
+    queue = _queue(db)
+    job = queue.enqueue('r1', 7, '/tmp/a.png', allocate=True)
+    assert job['status'] == 'queued'
+    queue.shutdown()
+
+    done = queue.get(job['jobId'])
+    assert done['status'] == 'allocated' and done['done']
+    assert done['result']['data']['retailer']['name'] == 'Target'
+    assert done['result']['allocation']['totalRoundUp'] == 2.5
+    assert {'queue_wait_ms', 'ocr_ms', 'parse_ms', 'map_ms', 'allocate_ms', 'total_ms'} <= set(done['timings'])
+    assert queue.latest_for_receipt('r1')['jobId'] == job['jobId']
+
+    conn = sqlite3.connect(db.db_path)
+    status, allocation = conn.execute("SELECT status, allocation_data FROM receipts WHERE id = 'r1'").fetchone()
+    conn.close()
+    assert status == 'allocated' and allocation
+    assert queue.stats()['finished'] == 1
+
+
+def test_status_is_visible_while_job_runs(db):
+    release = threading.Event()
+    queue = _queue(db)
+    queue._ocr = lambda path: release.wait(5) and 'Target 12.50'
+    job = queue.enqueue('r1', 7, '/tmp/a.png')
+    for _ in range(200):
+        if queue.get(job['jobId'])['status'] == 'ocr':
+            break
+        threading.Event().wait(0.01)
+    assert queue.get(job['jobId'])['status'] == 'ocr'
+    release.set()
+    queue.shutdown()
+    assert queue.get(job['jobId'])['status'] == 'mapped'
+
+
+def test_empty_ocr_stops_before_allocation(db):
+    queue = _queue(db)
+    queue._ocr = lambda path: ''
+    job = queue.enqueue('r1', 7, '/tmp/a.png', allocate=True)
+    queue.shutdown()
+    done = queue.get(job['jobId'])
+    assert done['status'] == 'mapped'
+    assert done['result']['data']['needs_manual_entry']
+
+
+def test_failure_is_recorded(db):
+    queue = _queue(db)
+
+    def broken(path):
+        raise RuntimeError('tesseract missing')
+    queue._ocr = broken
+    job = queue.enqueue('r1', 7, '/tmp/a.png')
+    queue.shutdown()
+    done = queue.get(job['jobId'])
+    assert done['status'] == 'failed' and done['done']
+    assert 'tesseract missing' in done['error']
+
+
+def test_full_queue_rejects(db):
+    release = threading.Event()
+    queue = _queue(db, max_queued=1)
+    queue._ocr = lambda path: release.wait(5) and 'Target'
+    queue.enqueue('r1', 7, '/tmp/a.png')  # picked up by the only thread
+    for _ in range(200):
+        if queue.stats()['running']:
+            break
+        threading.Event().wait(0.01)
+    queue.enqueue('r1', 7, '/tmp/a.png')  # waits
+    with pytest.raises(QueueFull):
+        queue.enqueue('r1', 7, '/tmp/a.png')
+    release.set()
+    queue.shutdown()
+    assert queue.stats()['rejected'] == 1
+
+
+def test_recover_stranded_reruns_or_fails_unfinished_jobs(db, tmp_path):
+    image = tmp_path / 'b.png'
+    image.write_bytes(b'receipt')
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("INSERT INTO receipts (id, user_id, filename, file_path) VALUES ('r2', 7, 'b.png', ?)", (str(image),))
+    conn.executemany("INSERT INTO receipt_jobs (id, receipt_id, user_id, status, allocate, created_at, updated_at) "
+                     "VALUES (?, ?, 7, ?, 1, '2024-01-01', '2024-01-01')",
+                     [('j-ocr', 'r2', 'ocr'), ('j-gone', 'r1', 'queued')])
+    conn.commit()
+    conn.close()
+
+    queue, peer = _queue(db), _queue(db)  # two workers starting together
+    assert queue.recover_stranded() == {'requeued': 1, 'failed': 1}
+    assert peer.recover_stranded() == {'requeued': 0, 'failed': 0}
+    queue.shutdown()
+    assert queue.get('j-ocr')['status'] == 'allocated' and queue.get('j-ocr')['done']
+    gone = queue.get('j-gone')
+    assert gone['status'] == 'failed' and gone['done'] and 'restart' in gone['error']
+
+
+def test_resolve_round_up_amount(db):
+    conn = sqlite3.connect(db.db_path)
+    assert resolve_round_up_amount(conn, 7, 3.0) == 3.0
+    assert resolve_round_up_amount(conn, 7, None) == 2.5
+    assert resolve_round_up_amount(conn, 99, 0) == 1.0
+    conn.close()
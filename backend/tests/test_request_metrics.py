@@ -0,0 +1,57 @@
+from flask import Flask
+
+from request_metrics import RequestMetrics, SQLiteMetricsSink
+
+
+def test_middleware_records_per_route_latency_and_errors():
+    app = Flask(__name__)
+    metrics = RequestMetrics()
+    metrics.init_app(app)
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        return {'id': item_id}, (200 if item_id else 500)
+
+    client = app.test_client()
+    for item_id in (1, 2, 0):
+        client.get(f'/items/{item_id}')
+    client.get('/missing')
+
+    routes = {(r['method'], r['route']): r for r in metrics.snapshot()['routes']}
+    item_stats = routes[('GET', '/items/<int:item_id>')]
+    assert item_stats['requests'] == 3
+    assert item_stats['error_rate_5xx'] == round(1 / 3, 4)
+    assert item_stats['bytes_out'] > 0
+    assert item_stats['p99_ms'] is not None
+    assert routes[('GET', '<unmatched>')]['error_rate_4xx'] == 1.0
+
+
+def test_sink_merges_workers_and_renders_prometheus(tmp_path):
+    path = str(tmp_path / 'metrics.db')
+    worker_a = RequestMetrics(sink=SQLiteMetricsSink(path))
+    worker_b = RequestMetrics(sink=SQLiteMetricsSink(path))
+    worker_b.worker_id = worker_a.worker_id + '-b'
+
+    worker_a.record('GET', '/api/x', 200, 0.003)
+    worker_a.flush()
+    worker_a.flush()  # Cumulative upsert: flushing twice must not double count
+    worker_b.record('GET', '/api/x', 200, 0.2)
+
+    snapshot = worker_b.snapshot()
+    assert snapshot['workers_merged'] == 2
+    assert snapshot['routes'][0]['requests'] == 2
+
+    text = worker_b.render_prometheus()
+    assert 'kamioi_http_request_duration_seconds_count{method="GET",route="/api/x"} 2' in text
+    assert 'kamioi_http_request_duration_seconds_bucket{method="GET",route="/api/x",le="0.005"} 1' in text
+    assert 'kamioi_http_requests_total{method="GET",route="/api/x"} 2' in text
+
+
+def test_percentiles_interpolate_within_the_bucket():
+    from utils.latency_histogram import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    for ms in range(101, 201):  # 100 samples, all in the 100-250ms bucket
+        histogram.record(ms / 1000.0)
+    assert 100 < histogram.percentile(50) < 200
+    assert histogram.percentile(50) < histogram.percentile(95) < histogram.percentile(99) <= 200
@@ -0,0 +1,67 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from database_manager import DatabaseManager
+from services.subscription_accounting_service import SubscriptionAccountingService
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '1')
+    db = DatabaseManager(str(tmp_path / 'ledger.db'))
+    conn = sqlite3.connect(db.db_path)
+    conn.executemany("INSERT INTO subscription_plans (id, name, account_type, tier, price_monthly, price_yearly) "
+                     "VALUES (?, ?, ?, 'basic', ?, ?)",
+                     [(1, 'Solo', 'individual', 30, 300), (2, 'Team', 'Business', 62, 620), (3, 'Odd', 'partner', 10, 100)])
+    conn.executemany("INSERT INTO user_subscriptions (id, user_id, plan_id, status, billing_cycle, current_period_start, "
+                     "current_period_end, amount) VALUES (?, ?, ?, ?, 'monthly', ?, ?, ?)", [
+                         (1, 1, 1, 'active', '2024-06-01T09:30:00', '2024-06-30T09:30:00', 30.0),
+                         (2, 2, 2, 'active', '2024-06-10T00:00:00', '2024-07-10T00:00:00', 62.0),
+                         (3, 3, 1, 'cancelled', '2024-06-01T00:00:00', '2024-06-30T00:00:00', 30.0),
+                         (4, 4, 3, 'active', '2024-06-01T00:00:00', '2024-06-30T00:00:00', 10.0),
+                     ])
+    conn.commit()
+    conn.close()
+    return db
+
+
+def _ledger(db):
+    conn = sqlite3.connect(db.db_path)
+    entries = conn.execute("SELECT reference, date, amount, from_account, to_account FROM journal_entries "
+                           "ORDER BY date, reference").fetchall()
+    lines = conn.execute("SELECT SUM(debit), SUM(credit), COUNT(*) FROM journal_entry_lines").fetchone()
+    conn.close()
+    return entries, lines
+
+
+def test_range_backfills_every_active_subscription_day(db):
+    service = SubscriptionAccountingService(db)
+    result = service.recognize_revenue(date(2024, 6, 8), date(2024, 6, 11))
+
+    assert result['entries_created'] == 4 + 2  # Solo for 4 days, Team from the 10th
+    assert result['skipped'] == 4  # unknown account type
+    entries, (debits, credits, line_count) = _ledger(db)
+    assert entries[0] == ('SUB-REV-1-20240608', '2024-06-08', 1.0, '23010', '40100')
+    assert ('SUB-REV-2-20240610', '2024-06-10', 2.0, '23030', '40300') in entries
+    assert line_count == 12 and debits == credits == pytest.approx(result['total_amount']) == pytest.approx(8.0)
+
+
+def test_reruns_and_overlaps_never_recognize_a_day_twice(db):
+    service = SubscriptionAccountingService(db)
+    service.recognize_revenue(date(2024, 6, 1), date(2024, 6, 10))
+    assert service.recognize_revenue(date(2024, 6, 1), date(2024, 6, 10))['entries_created'] == 0
+
+    # Catch-up resumes the day after the last recognized one
+    result = service.recognize_revenue(end_date=date(2024, 6, 12))
+    assert (result['start_date'], result['entries_created']) == ('2024-06-11', 4)
+
+    entries, _ = _ledger(db)
+    assert len(entries) == len({e[0] for e in entries}) == 10 + 1 + 4
+
+    conn = sqlite3.connect(db.db_path)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO subscription_revenue_recognitions (subscription_id, recognition_date, "
+                     "journal_entry_id, amount) VALUES (1, '2024-06-05', 'dup', 1.0)")
+    conn.close()
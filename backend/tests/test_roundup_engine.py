@@ -0,0 +1,78 @@
+import pytest
+
+from database_manager import DatabaseManager
+from roundup_engine import RoundUpEngine
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / 'ledger.db'))
+
+
+def test_running_balances_and_sweep(db):
+    engine = RoundUpEngine(db_manager=db)
+    engine.sweep_threshold = 100.0
+    engine.set_user_preference(7, 2.00)
+    for i in range(3):
+        engine.process_transaction({'id': i + 1, 'user_id': 7, 'amount': 10.0})
+    engine.process_transaction({'id': 9, 'user_id': 8, 'amount': 5.0})
+
+    assert engine.get_pending_total(7) == 6.0
+    assert len(engine.get_pending_entries('7')) == 3
+    assert sorted(engine.get_users_with_pending()) == [7, 8]
+
+    result = engine.manual_sweep(7)
+    assert result['entries_swept'] == 3
+    assert result['total_swept'] == 6.0
+
+    stats = engine.get_user_stats(7)
+    assert stats['pending_roundups'] == 0
+    assert stats['swept_roundups'] == 6.0
+    assert stats['swept_count'] == 3
+    assert engine.get_admin_stats()['total_pending'] == 1.0
+    assert len(engine.get_ledger_entries(user_id='7', status='swept')) == 3
+
+
+def test_ledger_survives_restart(db):
+    engine = RoundUpEngine(db_manager=db)
+    engine.sweep_threshold = 100.0
+    engine.process_transaction({'id': 1, 'user_id': 3, 'amount': 4.0})
+    engine.process_transaction({'id': 2, 'user_id': 3, 'amount': 4.0})
+
+    restarted = RoundUpEngine(db_manager=db)
+    assert restarted.get_pending_total(3) == 2.0
+    assert restarted.get_user_stats(3)['total_transactions'] == 2
+    assert restarted.manual_sweep(3)['entries_swept'] == 2
+    assert restarted.get_ledger_entries(user_id=3, status='pending') == []
+
+
+def test_threshold_triggers_auto_sweep(db):
+    engine = RoundUpEngine(db_manager=db)
+    engine.sweep_threshold = 3.0
+    for i in range(3):
+        engine.process_transaction({'id': i + 1, 'user_id': 4, 'amount': 1.0})
+
+    assert engine.get_pending_total(4) == 0.0
+    assert engine.get_user_stats(4)['swept_count'] == 3
+
+
+def test_entries_without_a_transaction_store_null_and_deleted_users_are_forgotten(db, monkeypatch):
+    import roundup_engine as roundup_module
+
+    engine = RoundUpEngine(db_manager=db)
+    engine.sweep_threshold = 100.0
+    monkeypatch.setattr(roundup_module, 'roundup_engine', engine)
+    conn = db.get_connection()
+    conn.execute("INSERT INTO users (id, name, email, account_type) VALUES (5, 'Ada', 'ada@example.com', 'individual')")
+    conn.commit()
+    conn.close()
+
+    engine.process_transaction({'user_id': 5, 'amount': 3.0})
+    conn = db.get_connection()
+    assert conn.execute("SELECT transaction_id FROM roundup_ledger").fetchall() == [(None,)]
+    conn.close()
+    assert engine.get_pending_total(5) == 1.0
+
+    assert db.delete_user(5)
+    assert engine.get_pending_total(5) == 0.0
+    assert engine.get_users_with_pending() == []
@@ -0,0 +1,112 @@
+import sqlite3
+
+import pytest
+
+from database_manager import DatabaseManager
+from schema_migrations import MIGRATIONS, Migration, MigrationRunner, add_columns
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '1')
+    return DatabaseManager(str(tmp_path / 'schema.db'))
+
+
+def test_fresh_database_reaches_latest_version(fresh_db):
+    runner = MigrationRunner(fresh_db)
+    assert runner.current_version() == MIGRATIONS[-1].version
+    assert runner.pending() == []
+    assert 'invite_code' in fresh_db.table_columns('users')
+    assert 'mapping_data' in fresh_db.table_columns('llm_mappings')
+
+
+def test_restart_applies_nothing(fresh_db):
+    restarted = DatabaseManager(fresh_db.db_path)
+    assert MigrationRunner(restarted).migrate() == []
+    conn = sqlite3.connect(fresh_db.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(MIGRATIONS)
+    conn.close()
+
+
+def test_legacy_database_is_upgraded(tmp_path, monkeypatch):
+    # A database created before schema_version existed: baseline tables only
+    monkeypatch.setenv('SCHEMA_AUTO_MIGRATE', '0')
+    path = str(tmp_path / 'legacy.db')
+    MigrationRunner(DatabaseManager(path)).migrate(target=1)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE schema_version")
+    conn.execute("INSERT INTO users (id, name, email, account_type) VALUES (1, 'Ada', 'ada@example.com', 'individual')")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path)
+    assert [m.version for m in MigrationRunner(db).pending()] == [m.version for m in MIGRATIONS]
+    assert 'invite_code' not in db.table_columns('users')
+
+    MigrationRunner(db).migrate()
+    assert {'invite_code', 'company_name', 'city'} <= set(db.table_columns('users'))
+    assert 'source_type' in db.table_columns('llm_mappings')
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT name FROM users WHERE id = 1").fetchone()[0] == 'Ada'
+    conn.close()
+
+
+def test_failed_migration_rolls_back(fresh_db):
+    broken = Migration(MIGRATIONS[-1].version + 1, 'broken', sqlite=[
+        add_columns('users', [('nickname', 'TEXT', 'TEXT')]),
+        "SELECT * FROM no_such_table",
+    ])
+    runner = MigrationRunner(fresh_db, MIGRATIONS + [broken])
+    with pytest.raises(sqlite3.OperationalError):
+        runner.migrate()
+    assert runner.current_version() == MIGRATIONS[-1].version
+    assert 'nickname' not in fresh_db.table_columns('users')
+
+
+def test_table_columns_is_cached(fresh_db):
+    columns = fresh_db.table_columns('users')
+    conn = sqlite3.connect(fresh_db.db_path)
+    conn.execute("ALTER TABLE users ADD COLUMN nickname TEXT")
+    conn.commit()
+    conn.close()
+    assert fresh_db.table_columns('users') == columns
+    fresh_db._table_columns = {}
+    assert 'nickname' in fresh_db.table_columns('users')
+
+
+def test_ticker_assignment_marks_transaction_mapped(fresh_db):
+    conn = sqlite3.connect(fresh_db.db_path)
+    insert = ("INSERT INTO transactions (user_id, date, merchant, amount, total_debit, status, ticker) "
+              "VALUES (1, '2024-01-01', ?, 5, 5, 'pending', ?)")
+    conn.execute(insert, ('Apple Store', 'AAPL'))
+    conn.execute(insert, ('Corner Shop', None))
+    conn.commit()
+    statuses = dict(conn.execute("SELECT merchant, status FROM transactions").fetchall())
+    assert statuses == {'Apple Store': 'mapped', 'Corner Shop': 'pending'}
+
+    conn.execute("UPDATE transactions SET ticker = 'CSHP' WHERE merchant = 'Corner Shop'")
+    conn.commit()
+    assert conn.execute("SELECT status FROM transactions WHERE merchant = 'Corner Shop'").fetchone()[0] == 'mapped'
+    conn.close()
+
+
+def test_tables_added_after_the_baseline_reach_existing_databases(fresh_db):
+    # A database migrated to 16 before positions, price history, stress runs and the netting columns existed
+    conn = sqlite3.connect(fresh_db.db_path)
+    for table in ('positions', 'price_history', 'stress_test_runs'):
+        conn.execute(f"DROP TABLE {table}")
+    conn.execute("DROP INDEX idx_market_queue_order_id")
+    for column in ('order_id', 'fill_price', 'shares'):
+        conn.execute(f"ALTER TABLE market_queue DROP COLUMN {column}")
+    conn.execute("DELETE FROM schema_version WHERE version = 17")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(fresh_db.db_path)
+    assert MigrationRunner(db).current_version() == MIGRATIONS[-1].version
+    assert {'order_id', 'fill_price', 'shares'} <= set(db.table_columns('market_queue'))
+    assert {'entry_id', 'sweep_batch_id'} <= set(db.table_columns('roundup_ledger'))
+    conn = sqlite3.connect(db.db_path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert {'positions', 'price_history', 'stress_test_runs'} <= tables
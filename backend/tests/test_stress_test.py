@@ -0,0 +1,102 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+from flask import Flask, jsonify, request
+
+from database_manager import DatabaseManager
+from stress_test import StressTestConfig, StressTestRunner
+
+
+def _target_app(db):
+    """Stand-in for the API: reads return JSON, transaction inserts hit the database"""
+    app = Flask(__name__)
+
+    @app.route('/api/user/transactions', methods=['GET', 'POST'])
+    def transactions():
+        user_id = int(request.headers['Authorization'].rsplit('_', 1)[1])
+        if request.method == 'POST':
+            body = request.get_json()
+            conn = db.get_connection()
+            try:
+                cursor = conn.execute("""
+                    INSERT INTO transactions (user_id, date, merchant, amount, total_debit)
+                    VALUES (?, CURRENT_TIMESTAMP, ?, ?, ?)
+                """, (user_id, body['merchant'], body['amount'], body['amount']))
+                transaction_id = cursor.lastrowid
+                conn.execute("INSERT INTO roundup_ledger (user_id, transaction_id, round_up_amount) VALUES (?, ?, 1)",
+                             (user_id, transaction_id))
+                conn.execute("INSERT INTO market_queue (transaction_id, user_id, ticker, amount) VALUES (?, ?, 'SPY', 1)",
+                             (transaction_id, user_id))
+                entry_id = f'JE-STRESS-{transaction_id}'
+                now = datetime.now().isoformat()
+                conn.execute("INSERT INTO journal_entries (id, date, transaction_type, amount, from_account, "
+                             "to_account, created_at, created_by) VALUES (?, ?, 'roundup', 1, '10100', '12000', ?, ?)",
+                             (entry_id, now[:10], now, str(user_id)))
+                conn.execute("INSERT INTO journal_entry_lines (journal_entry_id, account_code, debit, credit, created_at) "
+                             "VALUES (?, '12000', 1, 0, ?), (?, '10100', 0, 1, ?)", (entry_id, now, entry_id, now))
+                conn.commit()
+            finally:
+                db.release_connection(conn)
+            return jsonify({'success': True}), 201
+        return jsonify({'success': True, 'data': []})
+
+    @app.route('/api/user/portfolio')
+    def portfolio():
+        return jsonify({'success': False}), 500
+
+    return app
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_TYPE', 'sqlite')
+    return DatabaseManager(str(tmp_path / 'stress.db'))
+
+
+def test_run_reports_stores_and_cleans_up(db):
+    runner = StressTestRunner(app=_target_app(db), db_manager=db)
+    result = runner.run(StressTestConfig(scenario='transaction_inserts', users=3, duration_seconds=0.5))['result']
+
+    assert result['requests'] > 0
+    assert result['operations']['insert_transaction']['p95_ms'] is not None
+    assert result['lock_waits']['probe_timeouts'] == 0
+    conn = sqlite3.connect(db.db_path)
+    try:
+        for table in ('transactions', 'roundup_ledger', 'market_queue', 'journal_entries', 'journal_entry_lines'):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0, table  # Stress rows removed
+    finally:
+        conn.close()
+
+    history = runner.history('transaction_inserts')
+    assert [run['id'] for run in history] == [result['id']]
+    categories = {c['key']: c for c in runner.category_summary()}
+    assert categories['transaction_inserts']['status'] == 'passed'
+    assert categories['mixed']['status'] == 'not_run'
+
+
+def test_errors_are_counted_per_operation(db):
+    runner = StressTestRunner(app=_target_app(db), db_manager=db)
+    result = runner.run(StressTestConfig(scenario='dashboard_reads', users=2, duration_seconds=0.3))['result']
+
+    assert result['operations']['user_portfolio']['error_rate'] == 1.0
+    assert result['operations']['user_transactions']['errors'] == 0
+    assert 'HTTP 500' in result['operations']['user_portfolio']['last_error']
+
+
+def test_config_validation_and_single_run(db):
+    with pytest.raises(ValueError):
+        StressTestConfig(scenario='nope').validate()
+    with pytest.raises(ValueError):
+        StressTestConfig(users=1000).validate()
+    with pytest.raises(ValueError):
+        StressTestConfig(mode='http', base_url='https://collector.example.com').validate()
+    StressTestConfig(mode='http', base_url='http://127.0.0.1:5111').validate()
+
+    runner = StressTestRunner(app=_target_app(db), db_manager=db)
+    runner.start(StressTestConfig(scenario='dashboard_reads', users=1, duration_seconds=1))
+    with pytest.raises(RuntimeError):
+        runner.start(StressTestConfig(scenario='dashboard_reads', users=1, duration_seconds=1))
+    runner.stop()
+    runner.wait()
+    assert runner.status()['status'] == 'completed'
@@ -0,0 +1,83 @@
+import random
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from tier_management import TierManagementSystem
+
+TIERS = {
+    'individual': [(1, 0, 10, 0.25), (2, 11, 25, 0.20), (3, 26, 50, 0.15), (4, 51, 100, 0.10), (5, 101, None, 0.05)],
+    'business': [(1, 0, 20, 0.10), (2, 21, 50, 0.08), (3, 51, 100, 0.06), (4, 101, None, 0.04)],
+}
+
+
+def _build(path, users=60, seed=5):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, account_type TEXT, current_tier INTEGER,
+                            monthly_transaction_count INTEGER, loyalty_score REAL,
+                            total_lifetime_transactions INTEGER, created_at TEXT, last_tier_check DATE);
+        CREATE TABLE fee_tiers (id INTEGER PRIMARY KEY, account_type TEXT, tier_level INTEGER,
+                                min_transactions INTEGER, max_transactions INTEGER, base_fee REAL,
+                                is_active BOOLEAN DEFAULT 1);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER, amount REAL, round_up REAL,
+                                   fee REAL, created_at TEXT);
+        CREATE TABLE ai_fee_history (id INTEGER PRIMARY KEY, user_id INTEGER, tier_at_time INTEGER, created_at TEXT);
+    """)
+    for account_type, tiers in TIERS.items():
+        conn.executemany("INSERT INTO fee_tiers (account_type, tier_level, min_transactions, max_transactions, base_fee) "
+                         "VALUES (?, ?, ?, ?, ?)", [(account_type,) + tier for tier in tiers])
+    start = datetime(2024, 1, 1)
+    for user_id in range(1, users + 1):
+        conn.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)", (
+            user_id, f'u{user_id}@example.com', rng.choice(list(TIERS)), rng.randint(1, 3),
+            rng.randint(0, 130), round(rng.random(), 2), rng.randint(0, 300), start.isoformat()))
+        for n in range(rng.randint(0, 30)):
+            conn.execute("INSERT INTO transactions (user_id, amount, round_up, fee, created_at) VALUES (?, ?, ?, ?, ?)",
+                         (user_id, 10.0 + n, rng.choice([0, 0.5, 1.0]), rng.choice([0.25, 0.3]),
+                          (start + timedelta(days=n, minutes=user_id)).isoformat()))
+    conn.commit()
+    conn.close()
+
+
+def _tiers(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT id, current_tier, last_tier_check IS NOT NULL FROM users ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def databases(tmp_path):
+    batch, per_user = str(tmp_path / 'batch.db'), str(tmp_path / 'per_user.db')
+    _build(batch)
+    shutil.copy(batch, per_user)
+    return batch, per_user
+
+
+def test_batch_matches_per_user_processing(databases):
+    batch, per_user = databases
+    batch_result = TierManagementSystem(batch).process_tier_updates()
+    per_user_result = TierManagementSystem(per_user).process_tier_updates(batch=False)
+
+    assert batch_result['success'] and per_user_result['success']
+    assert batch_result['tier_changes']
+    for key in ('tier_changes', 'recommendations', 'processed_users'):
+        assert batch_result[key] == per_user_result[key]
+    assert _tiers(batch) == _tiers(per_user)
+
+
+def test_second_batch_run_has_nothing_to_upgrade(databases):
+    batch, _ = databases
+    manager = TierManagementSystem(batch)
+    assert manager.process_tier_updates()['tier_changes']
+    assert manager.process_tier_updates()['tier_changes'] == []
+
+
+def test_benefits_tolerate_zero_and_missing_fees():
+    benefits = TierManagementSystem._benefits_from_transactions([(10, 1.0, None), (12, 1.0, 0.0)], 2, 0.2)
+    assert benefits['fee_reduction'] == '0%'
+    assert benefits['savings_per_transaction'] == 0
@@ -3,7 +3,6 @@ Ticker to Company Name Lookup Service
 Provides accurate company names for stock tickers to fix LLM mapping data integrity
 """
 import sqlite3
-import requests
 import json
 from typing import Optional, Dict
 
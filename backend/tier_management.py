@@ -8,19 +8,23 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 from ai_fee_engine import AIFeeEngine
+from config import sqlite_db_path
 
 class TierManagementSystem:
     """AI-powered tier management with automatic upgrades and optimizations"""
     
-    def __init__(self, db_path: str = 'kamioi.db'):
-        self.db_path = db_path
-        self.ai_engine = AIFeeEngine(db_path)
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or sqlite_db_path()
+        self.ai_engine = AIFeeEngine(self.db_path)
     
-    def process_tier_updates(self, user_id: int = None) -> Dict:
+    def process_tier_updates(self, user_id: int = None, batch: bool = True) -> Dict:
         """
         Process tier updates for all users or specific user
         Returns summary of tier changes and recommendations
+        (all users go through the set-based batch mode unless batch=False)
         """
+        if not user_id and batch:
+            return self.process_tier_updates_batch()
         try:
             if user_id:
                 users_to_process = [self._get_user_info(user_id)]
@@ -74,6 +78,129 @@ class TierManagementSystem:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def process_tier_updates_batch(self) -> Dict:
+        """
+        Set-based tier update for every user: eligible tiers come from one
+        grouped query, upgrades are applied with one UPDATE and upgrade
+        benefits from one windowed query over the upgraded users' history,
+        instead of several connections and queries per user
+        """
+        try:
+            users = self._get_all_users()
+            
+            conn = sqlite3.connect(self.db_path)
+            try:
+                upgrades = self._find_tier_upgrades(conn)
+                if upgrades:
+                    self._apply_tier_upgrades(conn, upgrades)
+                    conn.commit()
+                benefits = self._upgrade_benefits(conn) if upgrades else {}
+            finally:
+                conn.close()
+            
+            tier_changes = []
+            recommendations = []
+            for user in users:
+                upgrade = upgrades.get(user['id'])
+                if upgrade:
+                    new_tier, new_base_fee = upgrade
+                    tier_changes.append({
+                        'user_id': user['id'],
+                        'email': user['email'],
+                        'old_tier': user['current_tier'],
+                        'new_tier': new_tier,
+                        'upgrade_reason': f"Monthly transactions ({user['monthly_transaction_count']}) qualify for tier {new_tier}",
+                        'benefits': benefits.get(user['id']) or self._benefits_summary(0, 0, 0, new_tier, new_base_fee)
+                    })
+                recommendations.extend(self._recommendations_for(user))
+            
+            # Update tier statistics
+            self._update_tier_statistics()
+            
+            return {
+                'success': True,
+                'tier_changes': tier_changes,
+                'recommendations': recommendations,
+                'processed_users': len(users),
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def _find_tier_upgrades(self, conn) -> Dict[int, Tuple[int, float]]:
+        """
+        {user_id: (new_tier, new_base_fee)} for every user whose monthly
+        transactions qualify for a tier above their current one (the lowest
+        such tier, as _analyze_user_tier picks)
+        """
+        rows = conn.execute("""
+            WITH eligible AS (
+                SELECT u.id AS user_id, u.account_type, MIN(f.tier_level) AS new_tier
+                FROM users u
+                JOIN fee_tiers f
+                  ON f.account_type = u.account_type
+                 AND f.is_active = 1
+                 AND f.min_transactions <= u.monthly_transaction_count
+                 AND (f.max_transactions IS NULL OR u.monthly_transaction_count <= f.max_transactions)
+                 AND f.tier_level > u.current_tier
+                GROUP BY u.id, u.account_type
+            )
+            SELECT e.user_id, e.new_tier,
+                   (SELECT base_fee FROM fee_tiers f
+                    WHERE f.account_type = e.account_type AND f.tier_level = e.new_tier AND f.is_active = 1
+                    LIMIT 1)
+            FROM eligible e
+        """).fetchall()
+        return {user_id: (new_tier, base_fee) for user_id, new_tier, base_fee in rows}
+    
+    def _apply_tier_upgrades(self, conn, upgrades: Dict[int, Tuple[int, float]]):
+        """Apply all upgrades with a single UPDATE joined against a temp table"""
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS tier_upgrades (
+                user_id INTEGER PRIMARY KEY, new_tier INTEGER, new_base_fee REAL
+            )
+        """)
+        conn.execute("DELETE FROM tier_upgrades")
+        conn.executemany("INSERT INTO tier_upgrades (user_id, new_tier, new_base_fee) VALUES (?, ?, ?)",
+                         [(user_id, new_tier, base_fee) for user_id, (new_tier, base_fee) in upgrades.items()])
+        conn.execute("""
+            UPDATE users
+            SET current_tier = (SELECT new_tier FROM tier_upgrades WHERE user_id = users.id),
+                last_tier_check = CURRENT_DATE
+            WHERE id IN (SELECT user_id FROM tier_upgrades)
+        """)
+    
+    def _upgrade_benefits(self, conn, limit: int = 20) -> Dict[int, Dict]:
+        """
+        _calculate_tier_benefits for every row of tier_upgrades at once: the
+        savings over each user's latest `limit` transactions are summed in SQL
+        """
+        rows = conn.execute("""
+            SELECT user_id, new_tier, new_base_fee, COUNT(*),
+                   SUM(CASE WHEN round_up AND new_tier > 1 THEN MAX(0, COALESCE(fee, 0) -
+                       CASE WHEN new_base_fee < 1 THEN new_base_fee * round_up ELSE new_base_fee END)
+                       ELSE 0 END),
+                   MAX(CASE WHEN rn = last_rn THEN COALESCE(fee, 0) END)
+            FROM (
+                SELECT *, MAX(rn) OVER (PARTITION BY user_id) AS last_rn
+                FROM (
+                    SELECT t.user_id, u.new_tier, u.new_base_fee, t.round_up, t.fee,
+                           ROW_NUMBER() OVER (PARTITION BY t.user_id ORDER BY t.created_at DESC) AS rn
+                    FROM transactions t
+                    JOIN tier_upgrades u ON u.user_id = t.user_id
+                )
+                WHERE rn <= ?
+            )
+            GROUP BY user_id
+        """, (limit,)).fetchall()
+        return {user_id: self._benefits_summary(count, total_savings, oldest_fee, new_tier, new_base_fee)
+                for user_id, new_tier, new_base_fee, count, total_savings, oldest_fee in rows}
+    
     def _get_user_info(self, user_id: int) -> Dict:
         """Get user information for tier analysis"""
         conn = sqlite3.connect(self.db_path)
@@ -306,12 +433,16 @@ class TierManagementSystem:
         recent_transactions = cursor.fetchall()
         conn.close()
         
-        if not recent_transactions:
-            return {'savings_per_transaction': 0, 'monthly_savings': 0}
-        
+        return self._benefits_from_transactions(recent_transactions, new_tier, new_base_fee)
+    
+    @staticmethod
+    def _benefits_from_transactions(recent_transactions: List[Tuple], new_tier: int, new_base_fee: float) -> Dict:
+        """Savings estimate from (amount, round_up, fee) rows, newest first"""
         # Calculate average savings per transaction
         total_savings = 0
+        current_fee = 0
         for amount, round_up, current_fee in recent_transactions:
+            current_fee = current_fee or 0
             if round_up:
                 if new_tier > 1:  # Assuming percentage-based for business, fixed for others
                     old_fee = current_fee
@@ -319,22 +450,36 @@ class TierManagementSystem:
                     savings = max(0, old_fee - new_fee)
                     total_savings += savings
         
-        avg_savings_per_transaction = total_savings / len(recent_transactions) if recent_transactions else 0
+        return TierManagementSystem._benefits_summary(len(recent_transactions), total_savings, current_fee,
+                                                      new_tier, new_base_fee)
+    
+    @staticmethod
+    def _benefits_summary(count: int, total_savings: float, current_fee: float, new_tier: int,
+                          new_base_fee: float) -> Dict:
+        """Benefits dict from the transaction count, summed savings and the oldest transaction's fee"""
+        if not count:
+            return {'savings_per_transaction': 0, 'monthly_savings': 0}
+        
+        avg_savings_per_transaction = total_savings / count
         
         # Estimate monthly savings
-        monthly_transactions = len(recent_transactions) * 1.5  # Estimate based on recent activity
+        monthly_transactions = count * 1.5  # Estimate based on recent activity
         estimated_monthly_savings = avg_savings_per_transaction * monthly_transactions
         
         return {
             'savings_per_transaction': round(avg_savings_per_transaction, 2),
             'monthly_savings': round(estimated_monthly_savings, 2),
             'tier_level': new_tier,
-            'fee_reduction': f"{((current_fee - new_base_fee) / current_fee * 100):.1f}%" if recent_transactions else "0%"
+            'fee_reduction': f"{((current_fee - new_base_fee) / current_fee * 100):.1f}%" if current_fee else "0%"
         }
     
     def _generate_user_recommendations(self, user_id: int) -> List[Dict]:
         """Generate AI-powered recommendations for user"""
-        user = self._get_user_info(user_id)
+        return self._recommendations_for(self._get_user_info(user_id))
+    
+    @staticmethod
+    def _recommendations_for(user: Dict) -> List[Dict]:
+        """Recommendations from a user row (as returned by _get_user_info)"""
         recommendations = []
         
         # Transaction frequency recommendations
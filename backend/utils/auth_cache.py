@@ -0,0 +1,126 @@
+"""
+Verified-principal cache for request authentication.
+
+get_auth_user runs on nearly every request; without a cache each call opens
+a DB connection to look up the admin/user behind the bearer token. Verified
+principals are kept here, keyed by a SHA-256 of the token so raw tokens are
+never held as dict keys, with a TTL and LRU eviction. Entries are dropped on
+logout, password change, deactivation or deletion.
+
+JWT decodes are memoized the same way until the token's own `exp`.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class PrincipalCache:
+    """
+    TTL + LRU cache of authenticated principals.
+
+    Example:
+        principal = principal_cache.get(token)
+        if principal is None:
+            principal = lookup_in_db(token)
+            principal_cache.put(token, principal, kind='user')
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()  # token hash -> (principal, kind, expires_at)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, token: str) -> Optional[Dict]:
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return dict(entry[0])
+
+    def put(self, token: str, principal: Dict, kind: str = 'user', ttl: float = None):
+        if not principal:
+            return
+        key = token_key(token)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (dict(principal), kind, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, token: str):
+        with self._lock:
+            if self._entries.pop(token_key(token), None) is not None:
+                self.stats['invalidations'] += 1
+
+    def invalidate(self, kind: str = 'user', principal_id=None, email: str = None):
+        """Drop every cached token for a user/admin, matched by id or email"""
+        email = email.strip().lower() if email else None
+        with self._lock:
+            stale = [key for key, (principal, entry_kind, _) in self._entries.items()
+                     if entry_kind == kind and (
+                         (principal_id is not None and str(principal.get('id')) == str(principal_id)) or
+                         (email is not None and (principal.get('email') or '').lower() == email))]
+            for key in stale:
+                del self._entries[key]
+            self.stats['invalidations'] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> Dict:
+        return {'entries': len(self._entries), 'ttl_seconds': self.ttl, **self.stats}
+
+
+class JWTDecodeCache:
+    """Memoize successful jwt.decode results until the token expires"""
+
+    def __init__(self, max_entries: int = 10000, default_ttl: float = 300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: OrderedDict = OrderedDict()  # (token hash, secret hash, algorithms) -> (claims, expires_at)
+        self._lock = threading.Lock()
+
+    def decode(self, token: str, secret: str, algorithms=('HS256',)) -> Dict:
+        import jwt
+
+        key = (token_key(token), token_key(secret), tuple(algorithms))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                return dict(entry[0])
+
+        claims = jwt.decode(token, secret, algorithms=list(algorithms))  # Raises on invalid/expired tokens
+        expires_at = float(claims['exp']) if claims.get('exp') else now + self.default_ttl
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(claims)
+
+
+# Global caches shared by app.py and blueprints.auth.helpers
+principal_cache = PrincipalCache(
+    ttl=float(os.getenv('AUTH_CACHE_TTL', '60')),
+    max_entries=int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+)
+jwt_decode_cache = JWTDecodeCache()
@@ -0,0 +1,91 @@
+"""
+Circuit breaker for outbound dependencies.
+
+closed    -> calls flow; outcomes are tracked over a sliding window
+open      -> calls are rejected until reset_timeout elapses
+half_open -> a single probe call is let through; success closes the
+             breaker, failure (or a slow call) re-opens it
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate: float = 0.5, slow_call_rate: float = 0.5,
+                 slow_call_seconds: float = 2.0, window: int = 20, min_calls: int = 5,
+                 reset_timeout: float = 30.0):
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)  # (failed, slow)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, success: bool, latency: float):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if success and not slow:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append((not success, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, was_slow in self._outcomes if was_slow)
+            if (failures / len(self._outcomes) >= self.failure_rate or
+                    slow_calls / len(self._outcomes) >= self.slow_call_rate):
+                self._open()
+
+    def release(self):
+        """Give back a half-open probe slot for a call that never reached the dependency"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'times_opened': self.times_opened,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': sum(1 for failed, _ in self._outcomes if failed),
+                'recent_slow_calls': sum(1 for _, slow in self._outcomes if slow)
+            }
@@ -0,0 +1,98 @@
+"""
+Fixed-bucket latency histogram with percentile estimates.
+
+Buckets follow a roughly logarithmic 1-2.5-5 progression from 1ms to 60s, so
+memory is constant no matter how many samples are recorded. Percentiles are
+interpolated within a bucket, so they are off by at most that bucket's width
+(e.g. up to 150ms for a sample between 100ms and 250ms). A short window
+of raw samples is kept alongside for accurate recent percentiles (used e.g.
+to pick hedging delays).
+"""
+
+import bisect
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+BUCKET_BOUNDS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    def __init__(self, recent_window: int = 200):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)  # Last bucket is overflow
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recent = deque(maxlen=recent_window)
+
+    def record(self, seconds: float):
+        ms = seconds * 1000.0
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self._recent.append(ms)
+
+    def merge_counts(self, counts, count: int, total_ms: float, max_ms: float):
+        """Fold in another histogram's raw bucket counts (e.g. from another worker)"""
+        with self._lock:
+            for i, value in enumerate(counts):
+                self.counts[i] += value
+            self.count += count
+            self.total_ms += total_ms
+            self.max_ms = max(self.max_ms, max_ms)
+
+    def state(self):
+        """Raw (bucket counts, count, total_ms, max_ms), suitable for merge_counts elsewhere"""
+        with self._lock:
+            return list(self.counts), self.count, self.total_ms, self.max_ms
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Bucket-estimated percentile in milliseconds, interpolated linearly
+        inside the bucket holding the target rank (the overflow bucket spans
+        up to max_ms). The error is at most the width of that bucket.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            target = self.count * p / 100.0
+            running = 0
+            for i, value in enumerate(self.counts):
+                if value and running + value >= target:
+                    lower = BUCKET_BOUNDS_MS[i - 1] if i else 0.0
+                    upper = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+                    upper = min(upper, self.max_ms)
+                    lower = min(lower, upper)
+                    return round(lower + (upper - lower) * max(0.0, target - running) / value, 3)
+                running += value
+            return self.max_ms
+
+    def recent_percentile(self, p: float, min_samples: int = 1) -> Optional[float]:
+        """Exact percentile over the recent sample window, in milliseconds"""
+        with self._lock:
+            samples = sorted(self._recent)
+        if len(samples) < min_samples or not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict:
+        buckets = {}
+        with self._lock:
+            counts = list(self.counts)
+            count, total_ms, max_ms = self.count, self.total_ms, self.max_ms
+        for i, value in enumerate(counts):
+            label = f"le_{BUCKET_BOUNDS_MS[i]}ms" if i < len(BUCKET_BOUNDS_MS) else 'overflow'
+            buckets[label] = value
+        return {
+            'count': count,
+            'mean_ms': round(total_ms / count, 2) if count else None,
+            'max_ms': round(max_ms, 2),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': buckets
+        }
@@ -0,0 +1,81 @@
+"""
+Deferred imports and construction for heavy optional dependencies.
+
+Importing the app used to pull in numpy, stripe, requests and the OCR stack
+before the first request could be served, although most workers never touch
+them. `lazy_module` registers a module whose body only executes on first
+attribute access (importlib's LazyLoader); `LazyObject` postpones building a
+module-level service (and whatever it queries) until it is first used.
+
+    np = lazy_module('numpy')              # ImportError now if not installed
+    receipt_service = LazyObject(ReceiptProcessingService)
+"""
+
+import importlib.util
+import sys
+import threading
+from typing import Callable
+
+
+def lazy_module(name: str):
+    """
+    Return `name` as a lazily executed module.
+
+    Raises ImportError straight away when the module is not installed, so the
+    usual `try: ... except ImportError:` availability checks keep working.
+    Already-imported modules are returned as-is.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_loaded(name: str) -> bool:
+    """True once the module body has actually run (a lazy stub does not count)"""
+    module = sys.modules.get(name)
+    # type() rather than any attribute: touching a lazy module loads it
+    return module is not None and type(module).__name__ != '_LazyModule'
+
+
+class LazyObject:
+    """
+    Proxy that builds its target on first attribute access.
+
+    Example:
+        allocation_service = LazyObject(RoundUpAllocationService)
+        allocation_service.allocate(...)   # constructed here, once
+    """
+
+    def __init__(self, factory: Callable[[], object]):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get(self):
+        instance = object.__getattribute__(self, '_instance')
+        if instance is None:
+            with object.__getattribute__(self, '_lock'):
+                instance = object.__getattribute__(self, '_instance')
+                if instance is None:
+                    instance = object.__getattribute__(self, '_factory')()
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    @property
+    def initialized(self) -> bool:
+        return object.__getattribute__(self, '_instance') is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
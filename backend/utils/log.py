@@ -0,0 +1,161 @@
+"""
+Non-blocking logging for hot paths (uploads, auth, mapping, event bus).
+
+Loggers under the `kamioi` namespace hand records to a QueueHandler; a
+QueueListener thread does the actual stdout write, so request threads never
+block on terminal I/O. Configure with environment variables:
+
+    LOG_LEVEL=INFO            # DEBUG, INFO, WARNING, ERROR
+    LOG_FORMAT=text           # or 'json' for one JSON object per line
+    LOG_DEBUG_SAMPLE_RATE=1.0 # fraction of DEBUG records kept (0.0-1.0)
+
+Example:
+    from utils.log import get_logger, ProgressLogger
+
+    log = get_logger('upload')
+    log.info("Parsed %d rows", len(rows))
+    progress = ProgressLogger(log, 'Processed', total=len(rows))
+    for row in rows:
+        ...
+        progress.update()
+    progress.done()
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+ROOT_LOGGER = 'kamioi'
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records at or below `max_level` (WARNING and up always pass)"""
+
+    def __init__(self, rate: float = 1.0, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level: str = None, fmt: str = None, sample_rate: float = None, stream=None):
+    """Install the queue handler on the `kamioi` logger (idempotent unless arguments are given)"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None and level is None and fmt is None and sample_rate is None and stream is None:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+        fmt = fmt or os.getenv('LOG_FORMAT', 'text')
+        sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0')) if sample_rate is None else sample_rate
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        if fmt == 'json':
+            output.setFormatter(JSONFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+
+        records = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(records)
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the kamioi namespace, configuring the queue writer on first use"""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class ProgressLogger:
+    """
+    Rate-limited progress messages for loops over many rows.
+
+    Logs "<label> n/total" at most once every `min_interval` seconds
+    (and never more often than every `min_step` items).
+    """
+
+    def __init__(self, logger: logging.Logger, label: str, total: int = None,
+                 min_interval: float = 2.0, min_step: int = 1, level: int = logging.INFO):
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.min_interval = min_interval
+        self.min_step = max(1, min_step)
+        self.level = level
+        self.count = 0
+        self._started = time.monotonic()
+        self._last_logged_at = self._started
+        self._last_logged_count = 0
+
+    def update(self, n: int = 1):
+        self.count += n
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        if now - self._last_logged_at < self.min_interval or self.count - self._last_logged_count < self.min_step:
+            return
+        self._last_logged_at = now
+        self._last_logged_count = self.count
+        self._log()
+
+    def done(self):
+        elapsed = time.monotonic() - self._started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        self.logger.log(self.level, "%s %s in %.2fs (%.1f/s)", self.label, self._position(), elapsed, rate)
+
+    def _position(self) -> str:
+        return f"{self.count}/{self.total}" if self.total is not None else str(self.count)
+
+    def _log(self):
+        self.logger.log(self.level, "%s %s", self.label, self._position())
@@ -0,0 +1,60 @@
+"""
+Thread-safe token bucket for outbound API calls (brokers, market data providers).
+
+Unlike services/rate_limit_service.py, which limits *incoming* requests per
+client, this throttles calls we make to third parties so bursts of work stay
+under their published limits.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate_per_minute` calls with bursts up to `burst`.
+
+    Example:
+        bucket = TokenBucket(rate_per_minute=200, burst=10)
+        bucket.acquire()          # blocks until a token is available
+        bucket.try_acquire()      # returns False instead of blocking
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(rate_per_minute)))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available without waiting"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Block until tokens are available (or timeout seconds pass)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate_per_second if self.rate_per_second > 0 else 1.0
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
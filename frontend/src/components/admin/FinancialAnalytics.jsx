@@ -9,6 +9,23 @@ import * as XLSX from 'xlsx'
 import { useNotifications } from '../../hooks/useNotifications'
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query' // 🚀 PERFORMANCE FIX: Import React Query
 
+// /api/admin/journal-entries returns one page per call; follow pagination.next_cursor to the last page
+const fetchAllJournalEntries = async (apiBaseUrl, headers) => {
+  const entries = []
+  let cursor = null
+  do {
+    const params = new URLSearchParams({ limit: '1000' })
+    if (cursor) params.set('cursor', cursor)
+    const response = await fetch(`${apiBaseUrl}/api/admin/journal-entries?${params}`, { headers })
+    if (!response.ok) throw new Error(`Failed to load journal entries (${response.status})`)
+    const result = await response.json()
+    if (!result.success) throw new Error(result.error || 'Failed to load journal entries')
+    entries.push(...(result.data || []))
+    cursor = result.pagination?.next_cursor
+  } while (cursor)
+  return entries
+}
+
 const FinancialAnalytics = ({ user }) => {
   const { isLightMode, isDarkMode, isCloudMode } = useTheme()
   const { addNotification } = useNotifications()
@@ -409,16 +426,7 @@ const FinancialAnalytics = ({ user }) => {
       try {
         const token = localStorage.getItem('kamioi_admin_token') || localStorage.getItem('authToken') || 'admin_token_3'
         const apiUrl = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5111'
-        const response = await fetch(`${apiUrl}/api/admin/journal-entries`, {
-          headers: { 'Authorization': `Bearer ${token}` }
-        })
-        if (response.ok) {
-          const result = await response.json()
-          if (result.success) {
-            return result.data?.journal_entries || result.data || []
-          }
-        }
-        return []
+        return await fetchAllJournalEntries(apiUrl, { 'Authorization': `Bearer ${token}` })
       } catch (error) {
         console.error('Error fetching journal entries:', error)
         return []
@@ -1624,7 +1632,7 @@ const FinancialAnalytics = ({ user }) => {
       // OPTIMIZED: Parallelize API calls for better performance
       const [transactionsRes, journalRes, financialRes] = await Promise.allSettled([
         fetch(`${apiBaseUrl}/api/admin/transactions?limit=1000`, { headers }),
-        fetch(`${apiBaseUrl}/api/admin/journal-entries`, { headers }),
+        fetchAllJournalEntries(apiBaseUrl, headers),
         fetch(`${apiBaseUrl}/api/admin/financial-analytics`, { headers })
       ])
       
@@ -1632,12 +1640,12 @@ const FinancialAnalytics = ({ user }) => {
         ? await transactionsRes.value.json()
         : { data: [], transactions: [] }
       
-      const journalData = journalRes.status === 'fulfilled' && journalRes.value.ok
-        ? await journalRes.value.json()
-        : { data: { journal_entries: [] } }
+      if (journalRes.status === 'rejected') {
+        console.error('Error fetching journal entries:', journalRes.reason)
+      }
       
       // Calculate real financial metrics from GL
-      const journalEntriesArray = journalData.data?.journal_entries || journalData.journal_entries || []
+      const journalEntriesArray = journalRes.status === 'fulfilled' ? journalRes.value : []
       const realFinancialData = calculateFinancialMetrics(journalEntriesArray)
       
       // Process transactions
@@ -4822,12 +4830,13 @@ const FinancialAnalytics = ({ user }) => {
       const apiBaseUrl = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5111'
       
       // Fetch both financial transactions and journal entries
-      const [transactionsRes, journalRes] = await Promise.all([
+      const [transactionsRes, journalEntries] = await Promise.all([
         fetch(`${apiBaseUrl}/api/admin/financial/transactions`, {
           headers: { 'Authorization': `Bearer ${token}` }
         }),
-        fetch(`${apiBaseUrl}/api/admin/journal-entries`, {
-          headers: { 'Authorization': `Bearer ${token}` }
+        fetchAllJournalEntries(apiBaseUrl, { 'Authorization': `Bearer ${token}` }).catch(error => {
+          console.error('Error fetching journal entries:', error)
+          return []
         })
       ])
       
@@ -4842,10 +4851,7 @@ const FinancialAnalytics = ({ user }) => {
       }
       
       // Get journal entries and convert them to transaction format
-      if (journalRes.ok) {
-        const journalResult = await journalRes.json()
-        const journalEntries = journalResult.data || journalResult.data?.journal_entries || journalResult.journal_entries || []
-        
+      if (journalEntries.length > 0) {
         // Convert journal entries to transaction format for display
         // For each journal entry, create transactions from journal_entry_lines
         journalEntries.forEach(entry => {
@@ -1,6 +1,10 @@
 import React, { useState, useRef } from 'react'
 import { AlertCircle, Loader, Upload, FileText, Camera, CheckCircle, X } from 'lucide-react'
 
+// Stop polling a receipt job after this long and report a failure
+const RECEIPT_JOB_POLL_INTERVAL_MS = 1000
+const RECEIPT_JOB_TIMEOUT_MS = 3 * 60 * 1000
+
 // Company logo mapping - using popular logo APIs and CDNs
 const getCompanyLogo = (stockSymbol) => {
   const logoMap = {
@@ -71,6 +75,7 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
   const [, setIsUploading] = useState(false)
   const [uploadedFile, setUploadedFile] = useState(null)
   const [processingStatus, setProcessingStatus] = useState(null)
+  const [processingError, setProcessingError] = useState(null)
   const [extractedData, setExtractedData] = useState(null)
   const [allocationPreview, setAllocationPreview] = useState(null)
   const [showManualEntry, setShowManualEntry] = useState(false)
@@ -104,6 +109,7 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
 
     setIsUploading(true)
     setProcessingStatus('uploading')
+    setProcessingError(null)
     setUploadedFile(file)
 
     try {
@@ -141,7 +147,8 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
                   'Content-Type': 'application/json',
                   ...(token ? { 'Authorization': `Bearer ${token}` } : {})
                 },
-                body: JSON.stringify({})  // Can pass raw_text if available
+                // OCR, mapping and allocation run on the server's job queue; poll until the job is done
+                body: JSON.stringify({ allocate: true })
               })
 
       if (!processResponse.ok) throw new Error('Processing failed')
@@ -150,7 +157,26 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
       if (!processResult.success) {
         throw new Error(processResult.error || 'Processing failed')
       }
-      const processedData = processResult.data
+      let job = processResult
+      const deadline = Date.now() + RECEIPT_JOB_TIMEOUT_MS
+      while (!job.done) {
+        if (Date.now() >= deadline) {
+          throw new Error('Receipt processing is taking longer than expected. Please try again later.')
+        }
+        await new Promise(resolve => setTimeout(resolve, RECEIPT_JOB_POLL_INTERVAL_MS))
+        const jobResponse = await fetch(`${apiBaseUrl}${processResult.pollUrl}`, {
+          headers: {
+            ...(token ? { 'Authorization': `Bearer ${token}` } : {})
+          }
+        })
+        if (!jobResponse.ok) throw new Error('Processing failed')
+        job = (await jobResponse.json()).job
+        setProcessingStatus(job.status === 'queued' || job.status === 'ocr' ? 'extracting' : 'analyzing')
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Processing failed')
+      }
+      const processedData = job.result.data
       
       // Check if OCR truly failed - only show manual entry if we got NOTHING useful
       // If we got at least retailer OR items OR total, proceed with what we have
@@ -194,23 +220,9 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
                 return
               }
 
-              // Step 3: Calculate round-up allocation (show progress)
+              // Step 3: Round-up allocation was calculated by the same job
               setProcessingStatus('analyzing')
-              const allocationResponse = await fetch(`${apiBaseUrl}/api/receipts/${receiptId}/allocate`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          ...(token ? { 'Authorization': `Bearer ${token}` } : {})
-        }
-      })
-
-      if (!allocationResponse.ok) {
-        const errorData = await allocationResponse.json().catch(() => ({ error: 'Allocation failed' }))
-        console.error('Allocation API error:', errorData)
-        throw new Error(errorData.error || 'Allocation failed')
-      }
-
-      const allocationResult = await allocationResponse.json()
+      const allocationResult = job.result.allocation || { success: false, error: 'Allocation failed' }
       console.log('Allocation result:', allocationResult)
       
       if (!allocationResult.success) {
@@ -229,6 +241,7 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
 
     } catch (error) {
       console.error('Receipt processing error:', error)
+      setProcessingError(error.message || 'Processing failed')
       setProcessingStatus('error')
       // If processing fails, offer manual entry
       if (uploadedFile) {
@@ -257,6 +270,7 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
   const resetUpload = () => {
     setUploadedFile(null)
     setProcessingStatus(null)
+    setProcessingError(null)
     setExtractedData(null)
     setAllocationPreview(null)
     setShowManualEntry(false)
@@ -616,6 +630,11 @@ const ReceiptUpload = ({ onTransactionProcessed }) => {
                       Calculating round-up allocation across relevant stocks...
                     </p>
                   )}
+                  {processingStatus === 'error' && processingError && (
+                    <p className="text-red-300 text-sm">
+                      {processingError}
+                    </p>
+                  )}
                 </div>
               </div>
             )